@@ -0,0 +1,120 @@
+"""
+Benchmark suite entry point
+
+    python -m benchmarks corpus ./corpus --films 10000 --cues 1200
+    python -m benchmarks micro --out results/micro.json
+    python -m benchmarks load --concurrency 32 --requests 2000 --route lesson --route movies
+    python -m benchmarks startup --repeat 10
+    python -m benchmarks all --out results/run.json --baseline results/baseline.json
+
+With --baseline, the run is compared against a previous results file and
+exits non-zero when any tracked metric is worse by more than --threshold.
+The startup suite also exits non-zero when a worker's import or cold-start
+time is over budget, or the API imports an ingestion-only dependency.
+"""
+
+import argparse
+import json
+import logging
+import sys
+from typing import List, Optional
+
+from .baseline import DEFAULT_THRESHOLD, compare, load_results, save_results
+from .corpus import DEFAULT_CUES_PER_FILM, DEFAULT_SEED, write_corpus
+
+
+def cmd_corpus(args) -> int:
+    paths = write_corpus(args.out_dir, args.films, args.cues, args.seed, args.start)
+    print(f"✅ Wrote {len(paths)} films to {args.out_dir}")
+    return 0
+
+
+def cmd_run(args) -> int:
+    params = {key: value for key, value in vars(args).items() if key != "func"}
+    results = {}
+    failures = []
+    if args.command in ("startup", "all"):
+        from .startup import check_budgets, run_startup
+
+        results["startup"] = run_startup(repeat=args.startup_repeat)
+        failures.extend(check_budgets(results["startup"]))
+    if args.command in ("micro", "all"):
+        from .micro import run_micro
+
+        results["micro"] = run_micro(cues=args.cues, films=args.films, repeat=args.repeat)
+    if args.command in ("load", "all"):
+        from .load import run_load
+
+        results["load"] = run_load(
+            concurrency=args.concurrency,
+            requests=args.requests,
+            routes=args.route,
+            bcrypt_rounds=args.bcrypt_rounds,
+        )
+
+    if args.out:
+        document = save_results(args.out, results, params)
+    else:
+        document = {"results": results}
+    print(json.dumps(results, indent=2))
+    for failure in failures:
+        print(f"❌ {failure}", file=sys.stderr)
+
+    if not args.baseline:
+        return 1 if failures else 0
+    regressions = compare(document, load_results(args.baseline), args.threshold)
+    for regression in regressions:
+        print(f"❌ {regression}", file=sys.stderr)
+    if not regressions:
+        print(f"✅ No regressions beyond {args.threshold:.0%} of {args.baseline}")
+    return 1 if regressions or failures else 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="benchmarks", description=__doc__)
+    parser.add_argument("-v", "--verbose", action="store_true")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    corpus = sub.add_parser("corpus", help="Write a synthetic EN/DE subtitle corpus")
+    corpus.add_argument("out_dir")
+    corpus.add_argument("--films", type=int, default=1)
+    corpus.add_argument("--cues", type=int, default=DEFAULT_CUES_PER_FILM, help="Cues per film")
+    corpus.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    corpus.add_argument("--start", type=int, default=0, help="Index of the first film")
+    corpus.set_defaults(func=cmd_corpus)
+
+    for name, help_text in (
+        ("micro", "Time parsing, cleaning, alignment and ingestion"),
+        ("load", "Drive the API in-process at a given concurrency"),
+        ("startup", "Time a worker's cold start in fresh interpreters"),
+        ("all", "Run every suite"),
+    ):
+        run = sub.add_parser(name, help=help_text)
+        run.add_argument("--out", help="Write results (with run metadata) to this JSON file")
+        run.add_argument("--baseline", help="Results file to check for regressions against")
+        run.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                         help="Allowed relative slowdown (default: %(default)s)")
+        if name in ("micro", "all"):
+            run.add_argument("--cues", type=int, default=1500, help="Cues per synthetic film")
+            run.add_argument("--films", type=int, default=4, help="Films per ingestion run")
+            run.add_argument("--repeat", type=int, default=5)
+        if name in ("load", "all"):
+            run.add_argument("--concurrency", type=int, default=16)
+            run.add_argument("--requests", type=int, default=500, help="Requests per route")
+            run.add_argument("--route", action="append", help="Only these routes (repeatable)")
+            run.add_argument("--bcrypt-rounds", type=int, default=4)
+        if name in ("startup", "all"):
+            run.add_argument("--startup-repeat", type=int, default=5, help="Fresh interpreters to time")
+        run.set_defaults(func=cmd_run)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""
+JSON baselines and regression checks
+
+A results file holds run metadata plus results per suite and benchmark:
+
+    {"meta": {...}, "results": {"micro": {"align_subtitles": {"p50_ms": ...}}}}
+
+compare() flags every tracked metric that got worse than the baseline by
+more than the threshold fraction. Latencies regress upwards, throughput
+downwards; latencies too small to time reliably are skipped.
+"""
+
+import json
+import platform
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Union
+
+PathLike = Union[str, Path]
+
+DEFAULT_THRESHOLD = 0.25
+# Lower is better
+LATENCY_METRICS = ("p50_ms", "p95_ms", "p99_ms")
+# Higher is better
+THROUGHPUT_METRICS = ("throughput_per_s",)
+# Below this, timer resolution and scheduling noise dominate
+MIN_COMPARABLE_MS = 0.05
+
+
+@dataclass
+class Regression:
+    suite: str
+    benchmark: str
+    metric: str
+    baseline: float
+    current: float
+
+    @property
+    def change(self) -> float:
+        """Relative change, positive meaning worse"""
+        if self.metric in THROUGHPUT_METRICS:
+            return (self.baseline - self.current) / self.baseline
+        return (self.current - self.baseline) / self.baseline
+
+    def __str__(self):
+        return (
+            f"{self.suite}/{self.benchmark} {self.metric}: "
+            f"{self.baseline:g} -> {self.current:g} ({self.change:+.0%})"
+        )
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run_metadata(params: Dict) -> Dict:
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "params": params,
+    }
+
+
+def save_results(path: PathLike, results: Dict, params: Dict) -> Dict:
+    document = {"meta": run_metadata(params), "results": results}
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(document, indent=2, sort_keys=True) + "\n")
+    return document
+
+
+def load_results(path: PathLike) -> Dict:
+    return json.loads(Path(path).read_text())
+
+
+def compare(current: Dict, baseline: Dict, threshold: float = DEFAULT_THRESHOLD) -> List[Regression]:
+    """Regressions of current against baseline (both results documents)"""
+    regressions = []
+    for suite, benchmarks in current.get("results", {}).items():
+        base_suite = baseline.get("results", {}).get(suite, {})
+        for name, metrics in benchmarks.items():
+            base = base_suite.get(name)
+            if base is None:
+                continue
+            for metric in LATENCY_METRICS + THROUGHPUT_METRICS:
+                if metric not in metrics or metric not in base:
+                    continue
+                if metric in LATENCY_METRICS and base[metric] < MIN_COMPARABLE_MS:
+                    continue
+                if not base[metric]:
+                    continue
+                regression = Regression(suite, name, metric, base[metric], metrics[metric])
+                if regression.change > threshold:
+                    regressions.append(regression)
+    return regressions
@@ -0,0 +1,130 @@
+"""
+Synthetic bilingual subtitle corpus
+
+Writes EN/DE .srt pairs laid out the way discover_pairs() expects
+(<root>/<film>/<film>.en.srt and .de.srt). Lines are drawn from a small
+parallel vocabulary with a Zipf-like word distribution. The German track
+gets jittered timings, the occasional line split across two cues, dropped
+cues and inline markup, so parsing, cleaning and alignment all do real
+work. The German track can also be timed for another release, shifted by
+de_offset_ms and stretched by de_scale (e.g. 25 / 23.976). Every film is seeded separately, so any subset of a large corpus can
+be regenerated on its own.
+"""
+
+import random
+from pathlib import Path
+from typing import Iterator, List, Tuple, Union
+
+PathLike = Union[str, Path]
+
+DEFAULT_CUES_PER_FILM = 1200
+DEFAULT_SEED = 2154
+
+# Parallel EN/DE word list, most frequent first
+WORDS = [
+    ("the", "die"), ("I", "ich"), ("you", "du"), ("is", "ist"), ("not", "nicht"),
+    ("and", "und"), ("we", "wir"), ("it", "es"), ("what", "was"), ("here", "hier"),
+    ("now", "jetzt"), ("go", "geh"), ("come", "komm"), ("know", "weiß"), ("want", "will"),
+    ("have", "habe"), ("no", "nein"), ("yes", "ja"), ("all", "alle"), ("can", "kann"),
+    ("time", "Zeit"), ("home", "Hause"), ("way", "Weg"), ("man", "Mann"), ("life", "Leben"),
+    ("night", "Nacht"), ("day", "Tag"), ("world", "Welt"), ("friend", "Freund"), ("door", "Tür"),
+    ("money", "Geld"), ("car", "Auto"), ("house", "Haus"), ("city", "Stadt"), ("water", "Wasser"),
+    ("station", "Station"), ("space", "Weltraum"), ("earth", "Erde"), ("ship", "Schiff"),
+    ("sheriff", "Sheriff"), ("captain", "Kapitän"), ("doctor", "Arzt"), ("child", "Kind"),
+    ("mother", "Mutter"), ("father", "Vater"), ("brother", "Bruder"), ("sister", "Schwester"),
+    ("always", "immer"), ("never", "nie"), ("tomorrow", "morgen"), ("tonight", "heute Nacht"),
+    ("quickly", "schnell"), ("quietly", "leise"), ("together", "zusammen"), ("alone", "allein"),
+    ("dangerous", "gefährlich"), ("beautiful", "schön"), ("strange", "seltsam"),
+    ("remember", "erinnere"), ("believe", "glaube"), ("understand", "verstehe"),
+    ("promise", "verspreche"), ("forgive", "vergib"), ("listen", "hör zu"),
+]
+_WEIGHTS = [1 / rank for rank in range(1, len(WORDS) + 1)]
+_PUNCTUATION = [".", ".", ".", "?", "!", "..."]
+
+
+def _timestamp(ms: int) -> str:
+    hours, ms = divmod(ms, 3_600_000)
+    minutes, ms = divmod(ms, 60_000)
+    seconds, ms = divmod(ms, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{ms:03d}"
+
+
+def _srt_block(index: int, start_ms: int, end_ms: int, text: str) -> str:
+    return f"{index}\n{_timestamp(start_ms)} --> {_timestamp(end_ms)}\n{text}\n\n"
+
+
+def film_cues(rng: random.Random, cues: int) -> Iterator[Tuple[int, int, str, str]]:
+    """(start_ms, end_ms, en_text, de_text) for one film"""
+    clock = rng.randint(500, 5000)
+    for n in range(cues):
+        # Every so often the dialogue pauses long enough to start a new scene
+        clock += rng.randint(5000, 12000) if n and rng.random() < 0.05 else rng.randint(100, 1500)
+        duration = rng.randint(900, 4200)
+        picked = rng.choices(WORDS, weights=_WEIGHTS, k=rng.randint(3, 10))
+        mark = rng.choice(_PUNCTUATION)
+        en = " ".join(en for en, _ in picked)
+        de = " ".join(de for _, de in picked)
+        yield clock, clock + duration, en[0].upper() + en[1:] + mark, de[0].upper() + de[1:] + mark
+        clock += duration
+
+
+def film_tracks(
+    seed: int, cues: int = DEFAULT_CUES_PER_FILM, de_scale: float = 1.0, de_offset_ms: int = 0
+) -> Tuple[str, str]:
+    """EN and DE .srt text for one film"""
+    rng = random.Random(seed)
+    en: List[str] = []
+    de: List[str] = []
+
+    def de_block(start: int, end: int, text: str) -> str:
+        start, end = (max(0, round(ms * de_scale) + de_offset_ms) for ms in (start, end))
+        return _srt_block(len(de) + 1, start, end, text)
+
+    for start, end, en_text, de_text in film_cues(rng, cues):
+        if rng.random() < 0.1:
+            en_text = f"<i>{en_text}</i>"
+        en.append(_srt_block(len(en) + 1, start, end, en_text))
+
+        roll = rng.random()
+        if roll < 0.03:
+            continue  # no German line for this cue
+        jitter_start = max(0, start + rng.randint(-150, 150))
+        jitter_end = max(jitter_start + 300, end + rng.randint(-150, 150))
+        words = de_text.split()
+        if roll < 0.11 and len(words) >= 4:
+            # One line split across two cues
+            middle = (jitter_start + jitter_end) // 2
+            half = len(words) // 2
+            de.append(de_block(jitter_start, middle, " ".join(words[:half])))
+            de.append(de_block(middle + 40, jitter_end, " ".join(words[half:])))
+        else:
+            if rng.random() < 0.05:
+                de_text = "- " + de_text.replace(" ", "\n- ", 1)
+            de.append(de_block(jitter_start, jitter_end, de_text))
+    return "".join(en), "".join(de)
+
+
+def film_name(index: int) -> str:
+    return f"film_{index:05d}"
+
+
+def write_corpus(
+    root: PathLike,
+    films: int,
+    cues_per_film: int = DEFAULT_CUES_PER_FILM,
+    seed: int = DEFAULT_SEED,
+    start: int = 0,
+) -> List[Tuple[Path, Path]]:
+    """Write films [start, start + films) under root; returns their (en, de) paths"""
+    root = Path(root)
+    paths = []
+    for index in range(start, start + films):
+        name = film_name(index)
+        directory = root / name
+        directory.mkdir(parents=True, exist_ok=True)
+        en_text, de_text = film_tracks(seed + index, cues_per_film)
+        en_path, de_path = directory / f"{name}.en.srt", directory / f"{name}.de.srt"
+        en_path.write_text(en_text, encoding="utf-8")
+        de_path.write_text(de_text, encoding="utf-8")
+        paths.append((en_path, de_path))
+    return paths
@@ -0,0 +1,168 @@
+"""
+In-process load test of the API
+
+Drives an app from cinefluent.api.main.create_app() through httpx's ASGI
+transport, so no server or network is involved and the numbers reflect
+the app itself.
+The app runs against a scratch SQLite database seeded with one synthetic
+film. Each route is hit by `concurrency` concurrent clients, each signed
+in as its own user, and reported as per-request latency percentiles and
+overall throughput.
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import httpx
+from sqlalchemy import select
+
+from cinefluent.database_models import DatabaseManager, Scene
+from cinefluent.ingestion_service import IngestionService, MovieFiles
+
+from .corpus import write_corpus
+from .stats import summarize
+
+PASSWORD = "benchmark-password"
+
+
+@dataclass
+class Route:
+    name: str
+    method: str
+    path: str  # may use {lesson_id} and {movie_id}
+    json: Optional[Dict] = None
+    headers: Dict = field(default_factory=dict)
+    authenticated: bool = True
+
+
+ROUTES = [
+    Route("health", "GET", "/health", authenticated=False),
+    Route("movies", "GET", "/api/v1/movies"),
+    Route("movies_search", "GET", "/api/v1/movies?q=benchmrk"),
+    Route("cues", "GET", "/api/v1/movies/{movie_id}/cues?from=30000000&to=45000000"),
+    Route("pack", "GET", "/api/v1/movies/{movie_id}/pack"),
+    Route("lesson", "GET", "/api/v1/lessons/{lesson_id}", headers={"Accept-Encoding": "gzip"}),
+    Route("progress", "GET", "/api/v1/gamification/progress"),
+    Route("leaderboard", "GET", "/api/v1/gamification/leaderboard?limit=20"),
+    Route("review_due", "GET", "/api/v1/vocabulary/review"),
+    Route(
+        "quiz_answer", "POST", "/api/v1/quiz/7/answer",
+        json={"question_id": "q1", "answer": "Sheriff", "vocab_ids": []},
+    ),
+    Route("login", "POST", "/api/v1/auth/login", authenticated=False),
+]
+
+
+@contextmanager
+def _environ(**values: str) -> Iterator[None]:
+    saved = {key: os.environ.get(key) for key in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def seed_database(root: Path, cues: int) -> str:
+    """Create a SQLite database holding one synthetic film; returns its URL"""
+    url = f"sqlite:///{root / 'bench.db'}"
+    db = DatabaseManager(url)
+    db.create_tables()
+    (en_path, de_path), = write_corpus(root / "corpus", 1, cues)
+    IngestionService(db).ingest_movies([MovieFiles("Benchmark", en_path, de_path)])
+    db.engine.dispose()
+    return url
+
+
+async def _drive(
+    client: httpx.AsyncClient,
+    route: Route,
+    tokens: Sequence[str],
+    emails: Sequence[str],
+    requests: int,
+    ids: Dict[str, str],
+) -> Dict:
+    latencies: List[float] = []
+    errors = 0
+    remaining = requests
+
+    async def worker(n: int):
+        nonlocal remaining, errors
+        headers = dict(route.headers)
+        if route.authenticated:
+            headers["Authorization"] = f"Bearer {tokens[n]}"
+        body = route.json
+        if route.name == "login":
+            body = {"email": emails[n], "password": PASSWORD}
+        path = route.path.format(**ids)
+        while remaining > 0:
+            remaining -= 1
+            t0 = time.perf_counter()
+            response = await client.request(route.method, path, json=body, headers=headers)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(len(tokens))))
+    summary = summarize(latencies, time.perf_counter() - started)
+    summary["errors"] = errors
+    return summary
+
+
+async def run_load_async(
+    concurrency: int = 16,
+    requests: int = 500,
+    routes: Optional[Sequence[str]] = None,
+    cues: int = 600,
+    bcrypt_rounds: int = 4,
+) -> Dict:
+    """Results keyed by route name"""
+    selected = [route for route in ROUTES if routes is None or route.name in routes]
+    with tempfile.TemporaryDirectory() as tmp:
+        url = seed_database(Path(tmp), cues)
+        lesson_db = DatabaseManager(url)
+        with lesson_db.get_session() as session:
+            lesson, movie = session.execute(select(Scene.id, Scene.movie_id).limit(1)).first()
+        ids = {"lesson_id": str(lesson), "movie_id": str(movie)}
+        lesson_db.engine.dispose()
+
+        # Low bcrypt cost keeps login about the app rather than the hash, unless asked otherwise
+        with _environ(DATABASE_URL=url, CINEFLUENT_BCRYPT_ROUNDS=str(bcrypt_rounds)):
+            from cinefluent.api.main import create_app
+
+            app = create_app()
+            async with app.router.lifespan_context(app):
+                transport = httpx.ASGITransport(app=app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                    emails = [f"bench{n}@example.com" for n in range(concurrency)]
+                    tokens = []
+                    for email in emails:
+                        response = await client.post(
+                            "/api/v1/auth/register",
+                            json={"email": email, "password": PASSWORD, "confirm_password": PASSWORD},
+                        )
+                        tokens.append(response.json()["access_token"])
+
+                    results = {}
+                    for route in selected:
+                        results[route.name] = await _drive(
+                            client, route, tokens, emails, requests, ids
+                        )
+                        results[route.name]["concurrency"] = concurrency
+    return results
+
+
+def run_load(**kwargs) -> Dict:
+    return asyncio.run(run_load_async(**kwargs))
+
@@ -0,0 +1,83 @@
+"""
+Micro-benchmarks for the subtitle pipeline
+
+Times parse_subtitle_file, TextCleaner.clean_text (cold and warm cache),
+align_subtitles, retiming a German track timed for 25 fps video onto a
+23.976 fps English one, and a bulk ingestion into a scratch SQLite
+database, all on synthetic films from benchmarks.corpus.
+"""
+
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict
+
+from cinefluent.database_models import DatabaseManager
+from cinefluent.ingestion_service import IngestionService, MovieFiles
+from cinefluent.subtitle_processor import SubtitleProcessor, TextCleaner
+
+from .corpus import DEFAULT_SEED, film_tracks, write_corpus
+from .stats import measure
+
+
+def run_micro(cues: int = 1500, films: int = 4, repeat: int = 5) -> Dict:
+    """Results keyed by benchmark name; cues is the size of one film's track"""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        (en_path, de_path), = write_corpus(root / "single", 1, cues)
+        processor = SubtitleProcessor()
+
+        results["parse_subtitle_file"] = measure(lambda: processor.parse_subtitle_file(en_path), repeat)
+        results["stream_subtitle_file"] = measure(
+            lambda: list(processor.stream_subtitle_file(en_path)), repeat
+        )
+
+        en_cues = processor.parse_subtitle_file(en_path)
+        de_cues = processor.parse_subtitle_file(de_path)
+        lines = [cue.text for cue in en_cues] + [cue.text for cue in de_cues]
+
+        def clean_cold():
+            cleaner = TextCleaner()
+            for line in lines:
+                cleaner.clean_text(line)
+
+        warm = TextCleaner()
+        results["clean_text_cold"] = measure(clean_cold, repeat)
+        results["clean_text_warm"] = measure(lambda: [warm.clean_text(line) for line in lines], repeat)
+        results["align_subtitles"] = measure(
+            lambda: processor.align_subtitles(en_cues, de_cues), repeat
+        )
+
+        drifted_path = root / "drifted.de.srt"
+        drifted_path.write_text(
+            film_tracks(DEFAULT_SEED, cues, de_scale=23.976 / 25, de_offset_ms=1800)[1], encoding="utf-8"
+        )
+        drifted = processor.parse_subtitle_file(drifted_path)
+        results["retime_subtitles"] = measure(lambda: processor.retime(en_cues, drifted), repeat)
+        retimed, _ = processor.retime(en_cues, drifted)
+        results["align_retimed"] = measure(
+            lambda: processor.align_subtitles(en_cues, retimed), repeat
+        )
+
+        pairs = write_corpus(root / "batch", films, cues)
+        movies = [MovieFiles(en.parent.name, en, de) for en, de in pairs]
+        runs = iter(range(repeat + 1))
+
+        def ingest():
+            # A fresh database per run, so every run inserts into empty tables
+            db_path = root / f"ingest_{next(runs)}.db"
+            db = DatabaseManager(f"sqlite:///{db_path}")
+            db.create_tables()
+            try:
+                IngestionService(db).ingest_movies(movies)
+            finally:
+                db.engine.dispose()
+                os.unlink(db_path)
+
+        results["ingest_movies"] = measure(ingest, repeat)
+        results["ingest_movies"]["films"] = films
+
+    for name in results:
+        results[name]["cues"] = cues
+    return results
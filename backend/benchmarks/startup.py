@@ -0,0 +1,112 @@
+"""
+Cold-start benchmark and budgets for an API worker
+
+Every run is a fresh interpreter, so nothing is already in sys.modules,
+timing the phases a new worker goes through before it can serve:
+
+    import_api     importing cinefluent.api.main
+    create_app     building the app and its routers
+    lifespan       opening pools, the hasher and background loops
+    first_request  answering /health
+    cold_start     all of the above
+
+The child also reports which HEAVY_MODULES it loaded; the API should load
+none of them. check_budgets() turns both into a list of violations.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, List
+
+from cinefluent.database_models import DatabaseManager
+
+from .stats import summarize
+
+# p50 budgets, generous enough for a small container
+IMPORT_BUDGET_MS = 1500.0
+COLD_START_BUDGET_MS = 3000.0
+# Ingestion-only dependencies the API must not import
+HEAVY_MODULES = ("pysubs2", "Levenshtein", "numpy", "sqlalchemy")
+
+PHASES = ("import_api", "create_app", "lifespan", "first_request", "cold_start")
+
+CHILD = """
+import asyncio, json, sys, time
+import httpx  # the client is not part of start-up
+
+t0 = time.perf_counter()
+from cinefluent.api.main import create_app
+t1 = time.perf_counter()
+app = create_app()
+t2 = time.perf_counter()
+
+async def serve():
+    async with app.router.lifespan_context(app):
+        t3 = time.perf_counter()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://startup") as client:
+            response = await client.get("/health")
+            response.raise_for_status()
+        return t3, time.perf_counter()
+
+t3, t4 = asyncio.run(serve())
+print(json.dumps({
+    "import_api": (t1 - t0) * 1000,
+    "create_app": (t2 - t1) * 1000,
+    "lifespan": (t3 - t2) * 1000,
+    "first_request": (t4 - t3) * 1000,
+    "cold_start": (t4 - t0) * 1000,
+    "heavy_modules": sorted(m for m in HEAVY if m in sys.modules),
+}))
+"""
+
+
+def _run_child(env: Dict[str, str]) -> Dict:
+    script = f"HEAVY = {HEAVY_MODULES!r}\n{CHILD}"
+    output = subprocess.run(
+        [sys.executable, "-c", script],
+        env=env,
+        cwd=Path(__file__).resolve().parent.parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_startup(repeat: int = 5) -> Dict:
+    """Results keyed by phase, plus the heavy modules any run loaded"""
+    samples: Dict[str, List[float]] = {phase: [] for phase in PHASES}
+    heavy = set()
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{Path(tmp) / 'startup.db'}"
+        db = DatabaseManager(url)
+        db.create_tables()
+        db.engine.dispose()
+        env = {**os.environ, "DATABASE_URL": url}
+        env.pop("REDIS_URL", None)
+        for _ in range(repeat):
+            run = _run_child(env)
+            for phase in PHASES:
+                samples[phase].append(run[phase])
+            heavy.update(run["heavy_modules"])
+
+    results = {phase: summarize(values) for phase, values in samples.items()}
+    results["heavy_modules"] = sorted(heavy)
+    return results
+
+
+def check_budgets(results: Dict) -> List[str]:
+    """Human-readable budget violations of a run_startup() result"""
+    violations = []
+    for phase, budget in (("import_api", IMPORT_BUDGET_MS), ("cold_start", COLD_START_BUDGET_MS)):
+        p50 = results[phase]["p50_ms"]
+        if p50 > budget:
+            violations.append(f"{phase} p50 {p50:.0f} ms exceeds the {budget:.0f} ms budget")
+    if results["heavy_modules"]:
+        violations.append("API imported " + ", ".join(results["heavy_modules"]))
+    return violations
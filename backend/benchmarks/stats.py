@@ -0,0 +1,40 @@
+"""
+Timing summaries shared by the benchmark suites
+"""
+
+import time
+from typing import Callable, Dict, Sequence
+
+import numpy as np
+
+
+def summarize(samples_ms: Sequence[float], elapsed_s: float = 0.0) -> Dict:
+    """Percentiles of per-operation times, plus throughput when elapsed_s is given"""
+    values = np.asarray(samples_ms, dtype=np.float64)
+    if not len(values):
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    summary = {
+        "count": int(len(values)),
+        "mean_ms": round(float(values.mean()), 4),
+        "p50_ms": round(float(p50), 4),
+        "p95_ms": round(float(p95), 4),
+        "p99_ms": round(float(p99), 4),
+        "max_ms": round(float(values.max()), 4),
+    }
+    if elapsed_s > 0:
+        summary["throughput_per_s"] = round(len(values) / elapsed_s, 2)
+    return summary
+
+
+def measure(fn: Callable[[], object], repeat: int = 5, warmup: int = 1) -> Dict:
+    """Run fn warmup + repeat times and summarize the timed runs"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return summarize(samples, time.perf_counter() - started)
@@ -0,0 +1,279 @@
+"""
+Monotonic subtitle alignment engine
+
+Two passes over time-sorted cues:
+
+1. A two-pointer sweep proposes, for each EN cue, the DE cues whose time
+   ranges overlap it (with a small slack). This is O(n + m + candidates).
+2. A banded dynamic-programming pass picks the best monotonic path through
+   those candidates, allowing 1:1, 1:2 and 2:1 groups so a line split
+   across two cues in the other language is merged rather than dropped.
+   Only cells near a candidate are evaluated, so the band keeps the DP
+   linear in the number of cues.
+
+Scores use the same formula as the original pairwise matcher (time-overlap
+IoU blended with text length similarity) so they stay compatible with
+SubtitleValidator.validate_alignment.
+"""
+
+from typing import List, Optional, Sequence, Tuple
+
+# Minimum score for a group to be kept
+MIN_ALIGNMENT_SCORE = 0.3
+# Weight of time overlap vs. text length similarity in the pair score
+OVERLAP_WEIGHT = 0.8
+# Text similarity is only trusted up to this score when cues do not overlap
+TEXT_FALLBACK_WEIGHT = 0.5
+# Cues this close in time (ms) are still proposed as candidates
+DEFAULT_SLACK_MS = 500
+# Maximum DE candidates proposed per EN cue
+DEFAULT_MAX_CANDIDATES = 8
+
+# (EN cues, DE cues) consumed by one DP match step
+GROUP_SHAPES = ((1, 1), (1, 2), (2, 1))
+
+_NEG_INF = float("-inf")
+
+
+def cue_ms(cue) -> Tuple[int, int]:
+    """Return (start_ms, end_ms) for a SubtitleCue or CompactCue"""
+    start_ms = getattr(cue, "start_ms", None)
+    if start_ms is not None:
+        return start_ms, cue.end_ms
+    return int(cue.start_time * 1000), int(cue.end_time * 1000)
+
+
+def alignment_score(
+    en_start: int,
+    en_end: int,
+    en_text: str,
+    de_start: int,
+    de_end: int,
+    de_text: str,
+) -> float:
+    """Score a (possibly merged) EN/DE group from its span and normalized text"""
+    overlap = min(en_end, de_end) - max(en_start, de_start)
+    union = max(en_end, de_end) - min(en_start, de_start)
+
+    if overlap > 0 and union > 0:
+        iou = overlap / union
+        if en_text and de_text:
+            length_ratio = min(len(en_text), len(de_text)) / max(len(en_text), len(de_text))
+        else:
+            length_ratio = 0.0
+        return OVERLAP_WEIGHT * iou + (1 - OVERLAP_WEIGHT) * length_ratio
+
+    # No time overlap: fall back to text similarity (names, numbers)
+    if en_text and de_text:
+        # Imported on first use, so importing this module (e.g. from the API) stays cheap
+        import Levenshtein
+
+        return TEXT_FALLBACK_WEIGHT * Levenshtein.ratio(en_text, de_text)
+    return 0.0
+
+
+class _Track:
+    """Time-sorted view of one language's cues"""
+
+    __slots__ = ("cues", "starts", "ends", "texts")
+
+    def __init__(self, cues: Sequence):
+        spans = [cue_ms(cue) for cue in cues]
+        self._fill(cues, spans, [cue.text_normalized or cue.text for cue in cues])
+
+    @classmethod
+    def from_spans(
+        cls, starts: Sequence[int], ends: Sequence[int], texts: Sequence[str]
+    ) -> "_Track":
+        """Track over parallel arrays; its cues are the original positions"""
+        track = cls.__new__(cls)
+        track._fill(range(len(starts)), list(zip(starts, ends)), texts)
+        return track
+
+    def _fill(self, cues: Sequence, spans: List[Tuple[int, int]], texts: Sequence[str]):
+        order = list(range(len(spans)))
+        if any(spans[k][0] > spans[k + 1][0] for k in range(len(spans) - 1)):
+            order.sort(key=lambda k: spans[k])
+
+        self.cues = [cues[k] for k in order]
+        self.starts = [spans[k][0] for k in order]
+        self.ends = [spans[k][1] for k in order]
+        self.texts = [texts[k] for k in order]
+
+    def __len__(self):
+        return len(self.cues)
+
+    def span(self, first: int, count: int) -> Tuple[int, int, str]:
+        if count == 1:
+            return self.starts[first], self.ends[first], self.texts[first]
+        last = first + count
+        return (
+            min(self.starts[first:last]),
+            max(self.ends[first:last]),
+            " ".join(self.texts[first:last]),
+        )
+
+
+class MonotonicAligner:
+    """Sweep + banded DP aligner producing (en, de, score) tuples"""
+
+    def __init__(
+        self,
+        min_score: float = MIN_ALIGNMENT_SCORE,
+        slack_ms: int = DEFAULT_SLACK_MS,
+        max_candidates: int = DEFAULT_MAX_CANDIDATES,
+    ):
+        self.min_score = min_score
+        self.slack_ms = slack_ms
+        self.max_candidates = max_candidates
+
+    def align(self, en_cues: Sequence, de_cues: Sequence) -> List[Tuple]:
+        if not en_cues or not de_cues:
+            return []
+        return self._align_tracks(_Track(en_cues), _Track(de_cues))
+
+    def align_spans(
+        self,
+        en: Tuple[Sequence[int], Sequence[int], Sequence[str]],
+        de: Tuple[Sequence[int], Sequence[int], Sequence[str]],
+    ) -> List[Tuple[int, int, float]]:
+        """align() over (starts_ms, ends_ms, normalized texts) arrays.
+
+        Returns (en_position, de_position, score) tuples instead of cues.
+        """
+        if not len(en[0]) or not len(de[0]):
+            return []
+        return self._align_tracks(_Track.from_spans(*en), _Track.from_spans(*de))
+
+    def _align_tracks(self, en: _Track, de: _Track) -> List[Tuple]:
+        candidates = self._sweep(en, de)
+        lo, hi = self._band(candidates, len(en), len(de))
+        path = self._solve(en, de, lo, hi)
+
+        aligned = []
+        for i, j, k, l, score in path:
+            for en_cue in en.cues[i:i + k]:
+                for de_cue in de.cues[j:j + l]:
+                    aligned.append((en_cue, de_cue, round(score, 4)))
+        return aligned
+
+    def _sweep(self, en: _Track, de: _Track) -> List[Optional[Tuple[int, int]]]:
+        """Two-pointer pass returning the (first, last) candidate DE index per EN cue"""
+        slack = self.slack_ms
+        m = len(de)
+        candidates: List[Optional[Tuple[int, int]]] = []
+        j_lo = 0
+
+        for i in range(len(en)):
+            window_start = en.starts[i] - slack
+            window_end = en.ends[i] + slack
+            while j_lo < m and de.ends[j_lo] <= window_start:
+                j_lo += 1
+
+            first = last = None
+            j = j_lo
+            while j < m and de.starts[j] < window_end and j - j_lo < self.max_candidates:
+                if de.ends[j] > window_start:
+                    if first is None:
+                        first = j
+                    last = j
+                j += 1
+            candidates.append((first, last) if first is not None else None)
+
+        return candidates
+
+    def _band(
+        self, candidates: List[Optional[Tuple[int, int]]], n: int, m: int
+    ) -> Tuple[List[int], List[int]]:
+        """Per-row [lo, hi] ranges of DE positions the DP may visit.
+
+        Row r means r EN cues have been consumed. A row must cover the cells
+        its own matches start from and the cells the previous row's matches
+        land on; the ranges are then made monotone and chained so skip moves
+        can always bridge from one row to the next.
+        """
+        lo = [m] * (n + 1)
+        hi = [0] * (n + 1)
+        lo[0] = 0
+
+        for r, cand in enumerate(candidates):
+            if cand is None:
+                continue
+            first, last = cand
+            lo[r] = min(lo[r], first)
+            hi[r] = max(hi[r], last)
+            lo[r + 1] = min(lo[r + 1], first + 1)
+            hi[r + 1] = max(hi[r + 1], min(last + 2, m))
+        hi[n] = m
+
+        for r in range(1, n + 1):
+            hi[r] = max(hi[r], hi[r - 1])
+        for r in range(n - 1, -1, -1):
+            lo[r] = min(lo[r], lo[r + 1])
+        for r in range(n + 1):
+            if lo[r] > hi[r]:
+                lo[r] = hi[r]
+        for r in range(n):
+            hi[r] = max(hi[r], lo[r + 1])
+
+        return lo, hi
+
+    def _solve(self, en: _Track, de: _Track, lo: List[int], hi: List[int]) -> List[Tuple]:
+        n, m = len(en), len(de)
+        min_score = self.min_score
+        score_rows = [[_NEG_INF] * (hi[r] - lo[r] + 1) for r in range(n + 1)]
+        back_rows: List[List[Optional[Tuple]]] = [
+            [None] * (hi[r] - lo[r] + 1) for r in range(n + 1)
+        ]
+        score_rows[0][0 - lo[0]] = 0.0
+
+        def relax(r, j, value, back):
+            if r > n or j < lo[r] or j > hi[r]:
+                return
+            offset = j - lo[r]
+            if value > score_rows[r][offset]:
+                score_rows[r][offset] = value
+                back_rows[r][offset] = back
+
+        for r in range(n + 1):
+            row_lo = lo[r]
+            row = score_rows[r]
+            for offset in range(len(row)):
+                current = row[offset]
+                if current == _NEG_INF:
+                    continue
+                j = row_lo + offset
+
+                if r < n and j < m:
+                    for k, l in GROUP_SHAPES:
+                        if r + k > n or j + l > m:
+                            continue
+                        en_start, en_end, en_text = en.span(r, k)
+                        de_start, de_end, de_text = de.span(j, l)
+                        if en_end <= de_start - self.slack_ms or de_end <= en_start - self.slack_ms:
+                            continue
+                        score = alignment_score(
+                            en_start, en_end, en_text, de_start, de_end, de_text
+                        )
+                        if score < min_score:
+                            continue
+                        gain = score * (k + l) / 2
+                        relax(r + k, j + l, current + gain, (r, j, k, l, score))
+
+                relax(r, j + 1, current, (r, j, 0, 1, 0.0))
+                relax(r + 1, j, current, (r, j, 1, 0, 0.0))
+
+        # Backtrack from the end cell
+        path = []
+        r, j = n, m
+        while (r, j) != (0, 0):
+            back = back_rows[r][j - lo[r]]
+            if back is None:
+                break
+            prev_r, prev_j, k, l, score = back
+            if k and l:
+                path.append(back)
+            r, j = prev_r, prev_j
+
+        path.reverse()
+        return path
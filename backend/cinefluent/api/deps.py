@@ -0,0 +1,164 @@
+"""
+Shared dependencies for the API routers
+
+Per-process components live on app.state (opened by the lifespan in
+cinefluent.api.main) and reach endpoints through the get_* dependencies
+below. Nothing here holds request or user state between requests, which
+is what lets the app run as several worker processes.
+"""
+
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Optional
+
+import jwt
+from fastapi import Depends, HTTPException, Request, Response, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+from ..auth.passwords import PasswordHasher
+from ..auth.principal_cache import PrincipalCache
+from ..gamification.activity import ActivityStore
+from ..gamification.leaderboard import LeaderboardService
+from ..learning.answer_buffer import AnswerBuffer
+from ..learning.lessons import LessonStore
+from ..learning.reviews import ReviewStore
+from ..metrics import timer
+from ..movies.catalog import MovieCatalog
+from ..movies.cues import CueStore
+from ..movies.packs import PackStore
+from ..response_cache import CachedBody, ResponseCache, encode_json
+from ..settings import secret_key
+from ..users.repository import UserRecord, UserRepository
+
+security = HTTPBearer()
+# Read once per process; all workers must be started with the same key
+SECRET_KEY = secret_key()
+ALGORITHM = "HS256"
+ACCESS_TOKEN_MINUTES = 30
+REFRESH_TOKEN_DAYS = 7
+
+
+def get_user_repository(request: Request) -> UserRepository:
+    return request.app.state.users
+
+
+def get_password_hasher(request: Request) -> PasswordHasher:
+    return request.app.state.hasher
+
+
+def get_principal_cache(request: Request) -> PrincipalCache:
+    return request.app.state.principals
+
+
+def get_response_cache(request: Request) -> ResponseCache:
+    return request.app.state.responses
+
+
+def get_review_store(request: Request) -> ReviewStore:
+    return request.app.state.reviews
+
+
+def get_movie_catalog(request: Request) -> MovieCatalog:
+    return request.app.state.catalog
+
+
+def get_cue_store(request: Request) -> CueStore:
+    return request.app.state.cues
+
+
+def get_pack_store(request: Request) -> PackStore:
+    return request.app.state.packs
+
+
+def get_lesson_store(request: Request) -> LessonStore:
+    return request.app.state.lessons
+
+
+def get_answer_buffer(request: Request) -> AnswerBuffer:
+    return request.app.state.answers
+
+
+def get_leaderboard(request: Request) -> LeaderboardService:
+    return request.app.state.leaderboard
+
+
+def get_activity_store(request: Request) -> ActivityStore:
+    return request.app.state.activity
+
+
+def utc_naive(value: Optional[datetime]) -> Optional[datetime]:
+    """Timestamps are stored as naive UTC"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+async def cached_response(request: Request, build: Callable[[], Any]) -> Response:
+    """Serve build()'s JSON from the response cache, answering conditional GETs with 304"""
+    cache: ResponseCache = request.app.state.responses
+    key = request.url.path + ("?" + request.url.query if request.url.query else "")
+    entry = await cache.get(key)
+    if entry is None:
+        entry = await cache.set(key, encode_json(build()))
+    return conditional_response(request, entry)
+
+
+def conditional_response(request: Request, entry: CachedBody) -> Response:
+    """entry as JSON with its ETag, or 304 when the client already has it"""
+    # Bodies are behind auth, so only the client may keep them, and must revalidate
+    headers = {"ETag": entry.etag, "Cache-Control": "private, no-cache"}
+    if entry.matches(request.headers.get("if-none-match")):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(entry.body, media_type="application/json", headers=headers)
+
+
+def create_access_token(data: dict):
+    to_encode = data.copy()
+    expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_MINUTES)
+    to_encode.update({"exp": expire, "type": "access"})
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def create_refresh_token(data: dict):
+    to_encode = data.copy()
+    expire = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_DAYS)
+    to_encode.update({"exp": expire, "type": "refresh"})
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def verify_token(token: str):
+    try:
+        with timer("jwt_decode"):
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        return payload
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token expired")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    users: UserRepository = Depends(get_user_repository),
+    principals: PrincipalCache = Depends(get_principal_cache),
+) -> UserRecord:
+    token = credentials.credentials
+    # Fast path: token already verified and resolved
+    user = await principals.get(token)
+    if user is not None:
+        return user
+
+    payload = verify_token(token)
+    if await principals.is_revoked(token):
+        raise HTTPException(status_code=401, detail="Token revoked")
+    try:
+        user_id = uuid.UUID(payload.get("sub") or "")
+    except ValueError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    user = await users.get_by_id(user_id)
+    if user is None:
+        raise HTTPException(status_code=401, detail="User not found")
+
+    await principals.put(token, user, payload["exp"])
+    return user
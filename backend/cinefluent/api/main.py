@@ -0,0 +1,262 @@
+"""
+CineFluent API application factory and server entry point
+
+    python -m cinefluent.api.main --workers 4
+    uvicorn --factory cinefluent.api.main:create_app --workers 4
+
+Each worker process builds its own app with create_app() and opens its own
+database pool, password hasher and background loops in the lifespan.
+Workers share nothing in memory: users, reviews, activity, lessons and packs live
+in the database, and with REDIS_URL set the principal and response caches,
+token revocations and the leaderboard live in Redis. Without Redis every
+worker keeps its own caches and leaderboard, which is fine for one worker
+and eventually consistent (until the next rebuild) for several.
+
+Only FastAPI, the stores and their small dependencies are imported here;
+subtitle parsing and alignment (pysubs2, Levenshtein, numpy, SQLAlchemy)
+are never loaded by the API, which keeps worker start-up short.
+"""
+
+import argparse
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, FastAPI, Request, Response
+from fastapi.middleware.cors import CORSMiddleware
+
+from .. import settings
+from ..auth.passwords import PasswordHasher
+from ..auth.principal_cache import PrincipalCache
+from ..auth.routes import router as auth_router
+from ..gamification.activity import ActivityAggregator, create_activity_store
+from ..gamification.leaderboard import create_leaderboard_service
+from ..gamification.routes import router as gamification_router
+from ..learning.answer_buffer import AnswerBuffer
+from ..learning.lessons import create_lesson_store
+from ..learning.reviews import create_review_store
+from ..learning.routes import router as learning_router
+from ..log_queue import QueueLogging
+from ..metrics import CONTENT_TYPE, REGISTRY, MetricFamily, timer
+from ..movies.catalog import create_movie_catalog
+from ..movies.cues import create_cue_store
+from ..movies.packs import create_pack_store
+from ..movies.routes import router as movies_router
+from ..response_cache import ResponseCache
+from ..users.repository import UserRepository, create_user_repository
+from .deps import get_password_hasher, get_principal_cache, get_user_repository
+from .middleware import MetricsMiddleware
+
+logger = logging.getLogger("cinefluent.api")
+
+VERSION = "2.0.0"
+
+CORS_ORIGINS = [
+    "http://localhost:19006",  # Expo web
+    "http://localhost:8081",   # Expo dev server
+    "http://localhost:3000",   # React dev server
+    "http://localhost:19000",  # Expo tunnel
+    "http://192.168.1.100:19000",  # Expo LAN (adjust IP as needed)
+]
+
+
+def app_metrics(state):
+    """Scrape-time view of the per-process components on app.state"""
+    hasher: PasswordHasher = state.hasher
+    yield MetricFamily("password_hashes_pending", "gauge", "Password hashes running or queued").add(
+        hasher.pending
+    )
+    yield MetricFamily(
+        "password_hashes_rejected_total", "counter", "Password hashes refused as busy"
+    ).add(hasher.rejected)
+
+    lookups = MetricFamily("cache_lookups_total", "counter", "Cache lookups by cache and result")
+    for name, stats in (
+        ("principal", state.principals.stats()),
+        ("response", state.responses.stats()),
+        ("cue_index", state.cues.stats()),
+    ):
+        lookups.add(stats["hits"], cache=name, result="hit")
+        lookups.add(stats["misses"], cache=name, result="miss")
+    yield lookups
+    yield MetricFamily("cue_indexes", "gauge", "Per-movie cue indexes held in memory").add(
+        state.cues.stats()["movies"]
+    )
+
+    answers: AnswerBuffer = state.answers
+    yield MetricFamily("quiz_answers_pending", "gauge", "Quiz answers buffered, not yet written").add(
+        answers.pending
+    )
+    yield MetricFamily("quiz_answer_flushes_total", "counter", "Quiz answer buffer flushes").add(
+        answers.flushes
+    ).add(answers.failed_flushes, result="failed")
+    yield MetricFamily(
+        "activity_aggregations_total", "counter", "Activity aggregation batches"
+    ).add(state.aggregator.batches).add(state.aggregator.failures, result="failed")
+    yield MetricFamily("log_records_dropped_total", "counter", "Log records dropped, queue full").add(
+        state.logging.dropped
+    )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.logging = QueueLogging()
+    app.state.logging.start()
+    # One pool per worker process, opened before the first request
+    app.state.users = create_user_repository()
+    app.state.hasher = PasswordHasher()
+    app.state.principals = PrincipalCache()
+    app.state.responses = ResponseCache()
+    await app.state.users.connect()
+    app.state.reviews = create_review_store(app.state.users)
+    app.state.lessons = create_lesson_store(app.state.users)
+    app.state.catalog = create_movie_catalog(app.state.users)
+    app.state.cues = create_cue_store(app.state.users)
+    app.state.packs = create_pack_store(app.state.users)
+    app.state.leaderboard = create_leaderboard_service(app.state.users)
+    await app.state.leaderboard.start()
+    app.state.answers = AnswerBuffer(app.state.reviews, on_flush=app.state.leaderboard.refresh)
+    app.state.answers.start()
+    app.state.activity = create_activity_store(app.state.users)
+
+    async def activity_folded(user_ids):
+        # Streaks changed: the leaderboard and cached principals carry them
+        await app.state.leaderboard.refresh(user_ids)
+        for user_id in user_ids:
+            await app.state.principals.invalidate_user(user_id)
+
+    app.state.aggregator = ActivityAggregator(app.state.activity, on_fold=activity_folded)
+    app.state.aggregator.start()
+    await app.state.principals.connect()
+    await app.state.responses.connect()
+    REGISTRY.register_collector("app", lambda: app_metrics(app.state))
+    try:
+        yield
+    finally:
+        # Flush buffered quiz answers and pending activity while the pool is still open
+        await app.state.answers.close()
+        await app.state.aggregator.close()
+        await app.state.leaderboard.close()
+        await app.state.responses.close()
+        await app.state.principals.close()
+        await app.state.users.close()
+        app.state.hasher.close()
+        REGISTRY.unregister_collector("app")
+        app.state.logging.stop()
+
+
+system = APIRouter(tags=["system"])
+
+
+@system.get("/")
+def root():
+    return {
+        "message": "CineFluent API - Stage 3 Ready!",
+        "status": "running",
+        "version": VERSION,
+        "docs": "/docs",
+    }
+
+
+@system.get("/health")
+async def health(
+    request: Request,
+    hasher: PasswordHasher = Depends(get_password_hasher),
+    principals: PrincipalCache = Depends(get_principal_cache),
+    users: UserRepository = Depends(get_user_repository),
+):
+    try:
+        with timer("db_ping"):
+            await users.ping()
+        database_status = "connected"
+    except Exception:
+        logger.exception("Database health check failed")
+        database_status = "unreachable"
+    responses: ResponseCache = request.app.state.responses
+    if responses.redis is None:
+        redis_status = "disabled"
+    else:
+        redis_status = "connected" if await responses.ping() else "unreachable"
+    return {
+        "status": "healthy" if database_status == "connected" else "degraded",
+        "version": VERSION,
+        "timestamp": datetime.utcnow().isoformat(),
+        "database": {"status": database_status},
+        "redis": {"status": redis_status},
+        "password_hasher": hasher.metrics(),
+        "principal_cache": principals.stats(),
+        "response_cache": responses.stats(),
+        "cue_index": request.app.state.cues.stats(),
+        "quiz_answer_buffer": request.app.state.answers.metrics(),
+        "leaderboard": {"last_rebuild": request.app.state.leaderboard.last_rebuild},
+        "activity_aggregator": {
+            "batches": request.app.state.aggregator.batches,
+            "failures": request.app.state.aggregator.failures,
+        },
+    }
+
+
+@system.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus scrape target; each worker process reports its own series"""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+def create_app() -> FastAPI:
+    """A fresh app; state is opened by its lifespan, so building one is cheap"""
+    app = FastAPI(
+        title="CineFluent API - Stage 3",
+        description="Language learning API with proper authentication",
+        version=VERSION,
+        lifespan=lifespan,
+    )
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=CORS_ORIGINS,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    # Outermost, so the latency covers CORS and error handling too
+    app.add_middleware(MetricsMiddleware)
+
+    for router in (system, auth_router, movies_router, learning_router, gamification_router):
+        app.include_router(router)
+    return app
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog="cinefluent.api.main", description="Run the CineFluent API")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers", type=int, default=settings.worker_count(),
+        help="Worker processes (default: $WEB_CONCURRENCY or 1)",
+    )
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper())
+    if args.workers > 1 and settings.redis_url() is None:
+        logger.warning(
+            "Running %d workers without REDIS_URL: caches, token revocation and the "
+            "leaderboard are per worker", args.workers,
+        )
+    if settings.secret_key() == settings.DEFAULT_SECRET_KEY:
+        logger.warning("Using the development JWT secret; set %s", settings.SECRET_KEY_ENV)
+
+    import uvicorn
+
+    uvicorn.run(
+        "cinefluent.api.main:create_app",
+        factory=True,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        log_level=args.log_level,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Per-route request metrics
+
+A plain ASGI middleware (no BaseHTTPMiddleware, so responses are never
+buffered) that records, for every HTTP request:
+
+    http_requests_in_flight                 gauge
+    http_request_duration_seconds{method, route}   histogram
+    http_requests_total{method, route, status}     counter
+
+route is the matched path template ("/api/v1/lessons/{lesson_id}"), which
+the router leaves in the scope, so label cardinality stays bounded by the
+number of routes. Requests that match nothing are labelled "unmatched".
+"""
+
+import time
+from typing import Optional
+
+from ..metrics import REGISTRY, MetricsRegistry
+
+UNMATCHED_ROUTE = "unmatched"
+
+
+def route_template(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    def __init__(self, app, registry: Optional[MetricsRegistry] = None):
+        self.app = app
+        self.registry = registry or REGISTRY
+        self.in_flight = self.registry.gauge(
+            "http_requests_in_flight", "HTTP requests currently being served"
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500  # unless a response starts, the client saw a failure
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        self.in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.in_flight.dec()
+            method, route = scope["method"], route_template(scope)
+            self.registry.histogram(
+                "http_request_duration_seconds", "HTTP request latency by route",
+                method=method, route=route,
+            ).observe(elapsed)
+            self.registry.counter(
+                "http_requests_total", "HTTP responses by route and status",
+                method=method, route=route, status=str(status_code),
+            ).inc()
@@ -0,0 +1,118 @@
+"""
+Password hashing off the request path
+
+bcrypt runs on a dedicated, bounded thread pool (bcrypt releases the GIL
+while hashing), so a burst of logins cannot take over the threadpool that
+serves every other sync endpoint. Work beyond the pool plus a fixed queue
+depth is refused immediately with HasherBusy instead of waiting in line.
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, TypeVar
+
+import bcrypt
+
+from ..metrics import REGISTRY, LatencyStats
+
+T = TypeVar("T")
+
+ROUNDS_ENV = "CINEFLUENT_BCRYPT_ROUNDS"
+WORKERS_ENV = "CINEFLUENT_HASH_WORKERS"
+QUEUE_ENV = "CINEFLUENT_HASH_QUEUE"
+
+DEFAULT_ROUNDS = 12
+
+
+class HasherBusy(Exception):
+    """Raised when the hashing queue is full"""
+
+
+def hash_cost(hashed: str) -> Optional[int]:
+    """Work factor of a "$2b$12$..." bcrypt hash"""
+    parts = hashed.split("$")
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+class PasswordHasher:
+    """Bounded bcrypt executor with admission control.
+
+    At most workers + max_queue operations are admitted at once; the rest
+    raise HasherBusy straight away so the caller can answer 503.
+    """
+
+    def __init__(
+        self,
+        rounds: Optional[int] = None,
+        workers: Optional[int] = None,
+        max_queue: Optional[int] = None,
+    ):
+        self.rounds = rounds or int(os.getenv(ROUNDS_ENV, DEFAULT_ROUNDS))
+        self.workers = workers or int(os.getenv(WORKERS_ENV, 0)) or os.cpu_count() or 1
+        if max_queue is None:
+            max_queue = int(os.getenv(QUEUE_ENV, self.workers * 8))
+        self.max_queue = max_queue
+        self.limit = self.workers + self.max_queue
+
+        self.pending = 0
+        self.rejected = 0
+        self.hash_latency = LatencyStats()
+        self.queue_wait = LatencyStats()
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="bcrypt")
+        self._timers = {name: REGISTRY.timer(name) for name in ("bcrypt_hash", "bcrypt_verify")}
+
+    async def _submit(self, fn: Callable[..., T], *args, operation: str = "bcrypt_verify") -> T:
+        # Only the event loop thread touches pending, so no lock is needed
+        if self.pending >= self.limit:
+            self.rejected += 1
+            raise HasherBusy(f"{self.pending} password hashes already queued")
+        self.pending += 1
+        submitted = time.perf_counter()
+        histogram = self._timers[operation]
+
+        def timed():
+            started = time.perf_counter()
+            self.queue_wait.observe(started - submitted)
+            try:
+                return fn(*args)
+            finally:
+                elapsed = time.perf_counter() - started
+                self.hash_latency.observe(elapsed)
+                histogram.observe(elapsed)
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, timed)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        hashed = await self._submit(
+            bcrypt.hashpw, password.encode("utf-8"), bcrypt.gensalt(self.rounds),
+            operation="bcrypt_hash",
+        )
+        return hashed.decode("utf-8")
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._submit(bcrypt.checkpw, password.encode("utf-8"), hashed.encode("utf-8"))
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """True when the stored hash was made with a different work factor"""
+        return hash_cost(hashed) != self.rounds
+
+    def metrics(self) -> Dict:
+        return {
+            "rounds": self.rounds,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "pending": self.pending,
+            "rejected": self.rejected,
+            "hash_latency": self.hash_latency.snapshot(),
+            "queue_wait": self.queue_wait.snapshot(),
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,242 @@
+"""
+Cache from bearer token to resolved user
+
+A hit skips the JWT verify and the user lookup entirely. Entries never
+outlive the token's exp, the cache is LRU-bounded, and logout or a user
+update invalidates them explicitly. With REDIS_URL set, a Redis tier
+shares principals and revocations between workers, and invalidations are
+broadcast so every worker drops its local copy. A Redis error is logged
+and the call falls back to the local tier.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Dict, Optional, Set, Tuple
+
+from .. import settings
+from ..users.repository import UserRecord
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 10000
+# Upper bound on how stale a cached principal (e.g. its streak) can get
+DEFAULT_TTL = 60
+KEY_PREFIX = "cinefluent:auth:"
+CHANNEL = KEY_PREFIX + "invalidate"
+
+
+def token_digest(token: str) -> str:
+    """Tokens are stored and broadcast by digest, never in the clear"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _dump(user: UserRecord, expires_at: float) -> str:
+    data = user.as_dict()
+    # Principals are only read for identity; the hash never leaves the database
+    del data["password_hash"]
+    data["id"] = str(user.id)
+    data["created_at"] = user.created_at.isoformat()
+    data["last_active"] = user.last_active.isoformat() if user.last_active else None
+    return json.dumps({"expires_at": expires_at, "user": data})
+
+
+def _load(raw) -> Tuple[float, UserRecord]:
+    entry = json.loads(raw)
+    data = entry["user"]
+    data["id"] = uuid.UUID(data["id"])
+    data["password_hash"] = ""
+    data["created_at"] = datetime.fromisoformat(data["created_at"])
+    if data["last_active"]:
+        data["last_active"] = date.fromisoformat(data["last_active"])
+    return entry["expires_at"], UserRecord(**data)
+
+
+class PrincipalCache:
+    """Bounded, TTL-aware token -> UserRecord cache with an optional Redis tier"""
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl: float = DEFAULT_TTL,
+        redis_url: Optional[str] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.redis_url = redis_url if redis_url is not None else settings.redis_url()
+        self.redis = None
+        # digest -> (expires_at, user); ordered oldest-used first
+        self._entries: "OrderedDict[str, Tuple[float, UserRecord]]" = OrderedDict()
+        self._by_user: Dict[uuid.UUID, Set[str]] = {}
+        # digest -> token exp, for logged-out tokens that are still unexpired
+        self._revoked: Dict[str, float] = {}
+        self._listener: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.redis_errors = 0
+
+    def _redis_failed(self, error: Exception):
+        self.redis_errors += 1
+        logger.warning("Principal cache falling back to the local tier: %s", error)
+
+    async def connect(self):
+        if not self.redis_url:
+            return
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(self.redis_url)
+        pubsub = self.redis.pubsub()
+        try:
+            await pubsub.subscribe(CHANNEL)
+        except Exception as e:
+            # Without the invalidation channel a shared tier would serve stale principals
+            self._redis_failed(e)
+            await pubsub.aclose()
+            await self.redis.aclose()
+            self.redis = None
+            return
+        self._listener = asyncio.create_task(self._listen(pubsub))
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        if self.redis is not None:
+            await self.redis.aclose()
+            self.redis = None
+
+    async def _listen(self, pubsub):
+        try:
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                kind, _, value = message["data"].decode().partition(":")
+                if kind == "token":
+                    self._drop(value)
+                elif kind == "user":
+                    self._drop_user(uuid.UUID(value))
+        except asyncio.CancelledError:
+            await pubsub.aclose()
+            raise
+
+    def _drop(self, digest: str):
+        entry = self._entries.pop(digest, None)
+        if entry is not None:
+            tokens = self._by_user.get(entry[1].id)
+            if tokens is not None:
+                tokens.discard(digest)
+                if not tokens:
+                    del self._by_user[entry[1].id]
+
+    def _drop_user(self, user_id: uuid.UUID):
+        for digest in list(self._by_user.get(user_id, ())):
+            self._drop(digest)
+
+    def _store(self, digest: str, user: UserRecord, expires_at: float):
+        self._drop(digest)
+        self._entries[digest] = (expires_at, user)
+        self._by_user.setdefault(user.id, set()).add(digest)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+
+    async def get(self, token: str) -> Optional[UserRecord]:
+        digest = token_digest(token)
+        entry = self._entries.get(digest)
+        if entry is not None:
+            if entry[0] > time.time():
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return entry[1]
+            self._drop(digest)
+
+        self.misses += 1
+        if self.redis is not None:
+            try:
+                raw = await self.redis.get(KEY_PREFIX + "principal:" + digest)
+            except Exception as e:
+                self._redis_failed(e)
+                raw = None
+            if raw is not None:
+                expires_at, user = _load(raw)
+                self._store(digest, user, expires_at)
+                return user
+        return None
+
+    async def put(self, token: str, user: UserRecord, exp: float):
+        """Cache a principal resolved from a verified token expiring at exp"""
+        now = time.time()
+        expires_at = min(now + self.ttl, exp)
+        if expires_at <= now:
+            return
+        digest = token_digest(token)
+        self._store(digest, user, expires_at)
+        if self.redis is not None:
+            ttl_ms = int((expires_at - now) * 1000)
+            user_key = f"{KEY_PREFIX}user:{user.id}"
+            try:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    pipe.set(KEY_PREFIX + "principal:" + digest, _dump(user, expires_at), px=ttl_ms)
+                    pipe.sadd(user_key, digest)
+                    pipe.pexpire(user_key, int(self.ttl * 1000))
+                    await pipe.execute()
+            except Exception as e:
+                self._redis_failed(e)
+
+    async def is_revoked(self, token: str) -> bool:
+        digest = token_digest(token)
+        exp = self._revoked.get(digest)
+        if exp is not None:
+            if exp > time.time():
+                return True
+            del self._revoked[digest]
+        if self.redis is not None:
+            # Fails open: tokens revoked on other workers pass until Redis is back
+            try:
+                return bool(await self.redis.exists(KEY_PREFIX + "revoked:" + digest))
+            except Exception as e:
+                self._redis_failed(e)
+        return False
+
+    async def revoke(self, token: str, exp: float):
+        """Log a token out until it expires"""
+        digest = token_digest(token)
+        now = time.time()
+        self._drop(digest)
+        self._revoked = {d: e for d, e in self._revoked.items() if e > now}
+        self._revoked[digest] = exp
+        if self.redis is not None and exp > now:
+            try:
+                await self.redis.delete(KEY_PREFIX + "principal:" + digest)
+                await self.redis.set(KEY_PREFIX + "revoked:" + digest, 1, px=int((exp - now) * 1000))
+                await self.redis.publish(CHANNEL, "token:" + digest)
+            except Exception as e:
+                self._redis_failed(e)
+
+    async def invalidate_user(self, user_id: uuid.UUID):
+        """Drop every cached principal of a user whose row changed"""
+        self._drop_user(user_id)
+        if self.redis is not None:
+            user_key = f"{KEY_PREFIX}user:{user_id}"
+            try:
+                digests = [d.decode() for d in await self.redis.smembers(user_key)]
+                await self.redis.delete(user_key, *(KEY_PREFIX + "principal:" + d for d in digests))
+                await self.redis.publish(CHANNEL, f"user:{user_id}")
+            except Exception as e:
+                self._redis_failed(e)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "redis": self.redis is not None,
+            "redis_errors": self.redis_errors,
+        }
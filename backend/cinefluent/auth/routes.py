@@ -0,0 +1,175 @@
+"""
+Registration, sign-in and the current user
+"""
+
+import logging
+
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials
+from pydantic import BaseModel, EmailStr
+
+from ..api.deps import (
+    ACCESS_TOKEN_MINUTES,
+    create_access_token,
+    create_refresh_token,
+    get_current_user,
+    get_leaderboard,
+    get_password_hasher,
+    get_principal_cache,
+    get_user_repository,
+    security,
+    verify_token,
+)
+from ..gamification.leaderboard import LeaderboardService
+from ..users.repository import DuplicateEmailError, UserRecord, UserRepository
+from .passwords import HasherBusy, PasswordHasher
+from .principal_cache import PrincipalCache
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/v1/auth", tags=["auth"])
+
+MIN_PASSWORD_LENGTH = 8
+
+
+class LoginRequest(BaseModel):
+    email: EmailStr
+    password: str
+
+
+class RegisterRequest(BaseModel):
+    email: EmailStr
+    password: str
+    confirm_password: str
+
+
+class TokenResponse(BaseModel):
+    access_token: str
+    refresh_token: str
+    token_type: str = "bearer"
+    expires_in: int = ACCESS_TOKEN_MINUTES * 60
+
+
+class UserResponse(BaseModel):
+    id: str
+    email: str
+    is_premium: bool = False
+    words_learned: int = 347
+    current_streak: int = 23
+    longest_streak: int = 45
+
+
+def hasher_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many sign-in attempts in progress, please retry",
+        headers={"Retry-After": "1"},
+    )
+
+
+def issue_tokens(user: UserRecord) -> TokenResponse:
+    user_id = str(user.id)
+    return TokenResponse(
+        access_token=create_access_token({"sub": user_id, "email": user.email}),
+        refresh_token=create_refresh_token({"sub": user_id}),
+    )
+
+
+async def rehash_password(
+    users: UserRepository,
+    hasher: PasswordHasher,
+    principals: PrincipalCache,
+    user: UserRecord,
+    password: str,
+):
+    """Upgrade a hash made with an older work factor; skipped when the hasher is busy"""
+    try:
+        new_hash = await hasher.hash(password)
+    except HasherBusy:
+        return
+    if await users.update_password_hash(user.id, user.password_hash, new_hash):
+        await principals.invalidate_user(user.id)
+
+
+@router.post("/register", response_model=TokenResponse)
+async def register(
+    request: RegisterRequest,
+    users: UserRepository = Depends(get_user_repository),
+    hasher: PasswordHasher = Depends(get_password_hasher),
+    leaderboard: LeaderboardService = Depends(get_leaderboard),
+):
+    logger.debug("Registration attempt: %s", request.email)
+
+    if request.password != request.confirm_password:
+        raise HTTPException(status_code=400, detail="Passwords do not match")
+
+    if len(request.password) < MIN_PASSWORD_LENGTH:
+        raise HTTPException(
+            status_code=400, detail=f"Password must be at least {MIN_PASSWORD_LENGTH} characters"
+        )
+
+    # Create user; the unique email index rejects duplicates in the same round trip
+    try:
+        hashed_password = await hasher.hash(request.password)
+    except HasherBusy:
+        raise hasher_busy()
+    try:
+        user = await users.create(request.email, hashed_password)
+    except DuplicateEmailError:
+        raise HTTPException(status_code=400, detail="Email already registered")
+    await leaderboard.refresh([user.id])
+    return issue_tokens(user)
+
+
+@router.post("/login", response_model=TokenResponse)
+async def login(
+    request: LoginRequest,
+    background_tasks: BackgroundTasks,
+    users: UserRepository = Depends(get_user_repository),
+    hasher: PasswordHasher = Depends(get_password_hasher),
+    principals: PrincipalCache = Depends(get_principal_cache),
+):
+    logger.debug("Login attempt: %s", request.email)
+
+    # Find user by email (indexed lookup)
+    user = await users.get_by_email(request.email)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+
+    try:
+        password_ok = await hasher.verify(request.password, user.password_hash)
+    except HasherBusy:
+        raise hasher_busy()
+    if not password_ok:
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+
+    # Work factor changed since this hash was made: upgrade after responding
+    if hasher.needs_rehash(user.password_hash):
+        background_tasks.add_task(rehash_password, users, hasher, principals, user, request.password)
+    return issue_tokens(user)
+
+
+@router.get("/me", response_model=UserResponse)
+async def get_current_user_profile(
+    current_user: UserRecord = Depends(get_current_user),
+    users: UserRepository = Depends(get_user_repository),
+):
+    return UserResponse(
+        id=str(current_user.id),
+        email=current_user.email,
+        is_premium=current_user.is_premium,
+        words_learned=await users.count_words(current_user.id),
+        current_streak=current_user.current_streak,
+        longest_streak=current_user.longest_streak,
+    )
+
+
+@router.post("/logout")
+async def logout(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    current_user: UserRecord = Depends(get_current_user),
+    principals: PrincipalCache = Depends(get_principal_cache),
+):
+    payload = verify_token(credentials.credentials)
+    await principals.revoke(credentials.credentials, payload["exp"])
+    return {"message": "Logged out successfully"}
@@ -0,0 +1,290 @@
+"""
+Bulk writer for subtitles and subtitle_pairs
+
+Cues are streamed into a temporary staging table (PostgreSQL COPY, or
+executemany on SQLite) while they are parsed. Aligned pairs are staged by
+cue index and resolved to en_id/de_id with one set-based INSERT ... SELECT,
+so a movie costs a handful of statements instead of one per row.
+"""
+
+import csv
+import io
+import uuid
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Tuple
+
+from sqlalchemy.engine import Connection
+
+from .alignment import cue_ms
+from .database_models import Subtitle, SubtitlePair
+
+# Secondary indexes that can be dropped during large loads
+DEFERRABLE_INDEXES = tuple(Subtitle.__table__.indexes) + tuple(SubtitlePair.__table__.indexes)
+
+STAGE_SUBTITLE_COLUMNS = (
+    "id", "movie_id", "lang", "cue_index", "start_ts", "end_ts", "text", "text_normalized"
+)
+STAGE_PAIR_COLUMNS = ("movie_id", "en_index", "de_index", "alignment_score")
+
+RESOLVE_SUBTITLES_SQL = """
+    INSERT INTO subtitles (id, movie_id, lang, start_ts, end_ts, text, text_normalized, created_at)
+    SELECT id, movie_id, lang, start_ts, end_ts, text, text_normalized, CURRENT_TIMESTAMP
+    FROM stage_subtitles
+"""
+
+RESOLVE_PAIRS_SQL = """
+    INSERT INTO subtitle_pairs (id, movie_id, en_id, de_id, alignment_score, created_at)
+    SELECT {pair_id}, p.movie_id, e.id, d.id, p.alignment_score, CURRENT_TIMESTAMP
+    FROM stage_pairs p
+    JOIN stage_subtitles e
+      ON e.movie_id = p.movie_id AND e.lang = 'en' AND e.cue_index = p.en_index
+    JOIN stage_subtitles d
+      ON d.movie_id = p.movie_id AND d.lang = 'de' AND d.cue_index = p.de_index
+"""
+
+
+def format_ms(ms: int) -> str:
+    """Render integer milliseconds as an exact DECIMAL(10, 3) seconds string"""
+    return f"{ms // 1000}.{ms % 1000:03d}"
+
+
+class _IterFile(io.RawIOBase):
+    """Read-only file object over an iterator of str chunks, for COPY FROM STDIN"""
+
+    def __init__(self, chunks: Iterator[str]):
+        self._chunks = chunks
+        self._buffer = b""
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk.encode("utf-8")
+        if size < 0:
+            data, self._buffer = self._buffer, b""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def _csv_lines(rows: Iterable[Tuple]) -> Iterator[str]:
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    for row in rows:
+        writer.writerow(row)
+        yield out.getvalue()
+        out.seek(0)
+        out.truncate()
+
+
+class BulkWriter:
+    """Base class; one instance per transaction.
+
+    Several movies can be staged before a single finish() call.
+    """
+
+    dialect = None
+    new_id_sql = None
+    placeholder = None
+
+    def __init__(self, connection: Connection):
+        self.conn = connection
+        self.subtitle_count = 0
+        self.pair_count = 0
+
+    def format_id(self, value: uuid.UUID) -> str:
+        return str(value)
+
+    def begin(self):
+        raise NotImplementedError
+
+    def _copy(self, table: str, columns: Tuple[str, ...], rows: Iterable[Tuple]):
+        raise NotImplementedError
+
+    def _drop_staging(self):
+        pass
+
+    def copy_subtitles(self, movie_id: uuid.UUID, lang: str, cues: Iterable) -> int:
+        """Stream cues into the staging table; returns the number of rows"""
+        movie = self.format_id(movie_id)
+        counter = [0]
+
+        def rows():
+            for cue in cues:
+                start_ms, end_ms = cue_ms(cue)
+                counter[0] += 1
+                yield (
+                    self.format_id(uuid.uuid4()),
+                    movie,
+                    lang,
+                    cue.index,
+                    format_ms(start_ms),
+                    format_ms(end_ms),
+                    cue.text,
+                    cue.text_normalized,
+                )
+
+        self._copy("stage_subtitles", STAGE_SUBTITLE_COLUMNS, rows())
+        self.subtitle_count += counter[0]
+        return counter[0]
+
+    def copy_pairs(self, movie_id: uuid.UUID, aligned: Iterable[Tuple]) -> int:
+        """Stage (en, de, score) tuples by cue index"""
+        movie = self.format_id(movie_id)
+        rows = [(movie, en.index, de.index, round(score, 2)) for en, de, score in aligned]
+        self._copy("stage_pairs", STAGE_PAIR_COLUMNS, rows)
+        self.pair_count += len(rows)
+        return len(rows)
+
+    def discard(self, movie_id: uuid.UUID):
+        """Drop everything staged for one movie"""
+        movie = self.format_id(movie_id)
+        for table in ("stage_pairs", "stage_subtitles"):
+            self.conn.exec_driver_sql(
+                f"DELETE FROM {table} WHERE movie_id = {self.placeholder}", (movie,)
+            )
+
+    @contextmanager
+    def staging(self, movie_id: uuid.UUID):
+        """Stage one movie; if the block raises, its staged rows are discarded"""
+        try:
+            yield
+        except Exception:
+            self.discard(movie_id)
+            raise
+
+    def finish(self):
+        """Move staged rows into subtitles/subtitle_pairs"""
+        self.conn.exec_driver_sql(RESOLVE_SUBTITLES_SQL)
+        self.conn.exec_driver_sql(RESOLVE_PAIRS_SQL.format(pair_id=self.new_id_sql))
+        self._drop_staging()
+
+
+class PostgresCopyWriter(BulkWriter):
+    """COPY ... FROM STDIN into ON COMMIT DROP temp tables"""
+
+    dialect = "postgresql"
+    new_id_sql = "uuid_generate_v4()"
+    placeholder = "%s"
+
+    def begin(self):
+        self.conn.exec_driver_sql(
+            """
+            CREATE TEMP TABLE stage_subtitles (
+                id UUID, movie_id UUID, lang VARCHAR(5), cue_index INTEGER,
+                start_ts DECIMAL(10, 3), end_ts DECIMAL(10, 3),
+                text TEXT, text_normalized TEXT
+            ) ON COMMIT DROP
+            """
+        )
+        self.conn.exec_driver_sql(
+            """
+            CREATE TEMP TABLE stage_pairs (
+                movie_id UUID, en_index INTEGER, de_index INTEGER,
+                alignment_score DECIMAL(3, 2)
+            ) ON COMMIT DROP
+            """
+        )
+        self.conn.exec_driver_sql("CREATE INDEX ON stage_subtitles (movie_id, lang, cue_index)")
+
+    def _copy(self, table, columns, rows):
+        cursor = self.conn.connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+                _IterFile(_csv_lines(rows)),
+            )
+        finally:
+            cursor.close()
+
+    @contextmanager
+    def staging(self, movie_id):
+        # A COPY that fails midway aborts the transaction, so each movie gets a savepoint
+        with self.conn.begin_nested():
+            yield
+
+    def finish(self):
+        self.conn.exec_driver_sql("ANALYZE stage_subtitles")
+        super().finish()
+
+    def _drop_staging(self):
+        self.conn.exec_driver_sql("DROP TABLE stage_pairs, stage_subtitles")
+
+
+class SQLiteBulkWriter(BulkWriter):
+    """Local stand-in using executemany into temp tables"""
+
+    dialect = "sqlite"
+    # Matches SQLAlchemy's CHAR(32) hex storage for Uuid on SQLite
+    new_id_sql = "lower(hex(randomblob(16)))"
+    placeholder = "?"
+
+    def format_id(self, value: uuid.UUID) -> str:
+        return value.hex
+
+    def begin(self):
+        self.conn.exec_driver_sql(
+            """
+            CREATE TEMP TABLE stage_subtitles (
+                id CHAR(32), movie_id CHAR(32), lang VARCHAR(5), cue_index INTEGER,
+                start_ts NUMERIC, end_ts NUMERIC, text TEXT, text_normalized TEXT
+            )
+            """
+        )
+        self.conn.exec_driver_sql(
+            """
+            CREATE TEMP TABLE stage_pairs (
+                movie_id CHAR(32), en_index INTEGER, de_index INTEGER,
+                alignment_score NUMERIC
+            )
+            """
+        )
+        self.conn.exec_driver_sql(
+            "CREATE INDEX temp.stage_subtitles_lookup ON stage_subtitles (movie_id, lang, cue_index)"
+        )
+
+    def _copy(self, table, columns, rows):
+        placeholders = ", ".join("?" for _ in columns)
+        cursor = self.conn.connection.cursor()
+        try:
+            cursor.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows
+            )
+        finally:
+            cursor.close()
+
+    def _drop_staging(self):
+        self.conn.exec_driver_sql("DROP TABLE temp.stage_pairs")
+        self.conn.exec_driver_sql("DROP TABLE temp.stage_subtitles")
+
+
+WRITERS = {writer.dialect: writer for writer in (PostgresCopyWriter, SQLiteBulkWriter)}
+
+
+def get_bulk_writer(connection: Connection) -> BulkWriter:
+    """Pick the bulk writer for the connection's database backend"""
+    writer_class = WRITERS.get(connection.dialect.name)
+    if writer_class is None:
+        raise ValueError(f"No bulk writer for {connection.dialect.name} databases")
+    return writer_class(connection)
+
+
+@contextmanager
+def deferred_indexes(connection: Connection):
+    """Drop secondary subtitle indexes for the duration of a large load.
+
+    The indexes are rebuilt once on exit instead of being maintained per
+    row. Only use this for offline or catalog-scale loads: queries running
+    concurrently lose the indexes until the load finishes. DDL is
+    transactional on both backends, so a failed load restores the indexes
+    on rollback.
+    """
+    for index in DEFERRABLE_INDEXES:
+        index.drop(connection, checkfirst=True)
+    yield
+    for index in DEFERRABLE_INDEXES:
+        index.create(connection, checkfirst=True)
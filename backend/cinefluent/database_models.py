@@ -0,0 +1,295 @@
+"""
+SQLAlchemy models mirroring sql/init.sql
+"""
+
+import os
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator, Optional
+
+from sqlalchemy import (
+    DDL,
+    Boolean,
+    Column,
+    Date,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    Numeric,
+    String,
+    Text,
+    UniqueConstraint,
+    Uuid,
+    create_engine,
+    event,
+    text,
+)
+from sqlalchemy.orm import Session, declarative_base, relationship, sessionmaker
+
+from .movies.catalog import title_key
+from .settings import DEFAULT_DATABASE_URL
+
+Base = declarative_base()
+
+
+def _title_key_default(context) -> str:
+    return title_key(context.get_current_parameters()["title"])
+
+
+class Movie(Base):
+    __tablename__ = "movies"
+    __table_args__ = (
+        # Catalog pages walk (title_key, id), optionally within a language and difficulty
+        Index("idx_movies_title_key", "title_key", "id"),
+        Index("idx_movies_filters", "language", "difficulty", "title_key", "id"),
+    )
+
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    title = Column(String(255), nullable=False)
+    year = Column(Integer)
+    imdb_id = Column(String(20))
+    # Language being learned, i.e. the non-English track
+    language = Column(String(5), nullable=False, default="de", server_default="de")
+    difficulty = Column(String(16))  # set at ingest, see cinefluent.movies.metadata
+    title_key = Column(String(255), nullable=False, default=_title_key_default)
+    vocab_size = Column(Integer, nullable=False, default=0, server_default="0")
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    subtitles = relationship("Subtitle", back_populates="movie", cascade="all, delete-orphan")
+    pairs = relationship("SubtitlePair", back_populates="movie", cascade="all, delete-orphan")
+
+
+# Typo-tolerant title search (pg_trgm word_similarity); SQLite uses an in-process index
+event.listen(
+    Movie.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+event.listen(
+    Movie.__table__,
+    "after_create",
+    DDL(
+        "CREATE INDEX idx_movies_title_trgm ON movies USING gin (title_key gin_trgm_ops)"
+    ).execute_if(dialect="postgresql"),
+)
+
+
+class Subtitle(Base):
+    __tablename__ = "subtitles"
+    __table_args__ = (
+        Index("idx_subtitles_movie_lang", "movie_id", "lang"),
+        Index("idx_subtitles_timestamps", "start_ts", "end_ts"),
+    )
+
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    movie_id = Column(Uuid, ForeignKey("movies.id", ondelete="CASCADE"), nullable=False)
+    lang = Column(String(5), nullable=False)
+    start_ts = Column(Numeric(10, 3), nullable=False)
+    end_ts = Column(Numeric(10, 3), nullable=False)
+    text = Column(Text, nullable=False)
+    text_normalized = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    movie = relationship("Movie", back_populates="subtitles")
+
+
+class SubtitlePair(Base):
+    __tablename__ = "subtitle_pairs"
+    __table_args__ = (
+        UniqueConstraint("en_id", "de_id"),
+        Index("idx_subtitle_pairs_movie", "movie_id"),
+    )
+
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    movie_id = Column(Uuid, ForeignKey("movies.id", ondelete="CASCADE"), nullable=False)
+    en_id = Column(Uuid, ForeignKey("subtitles.id", ondelete="CASCADE"), nullable=False)
+    de_id = Column(Uuid, ForeignKey("subtitles.id", ondelete="CASCADE"), nullable=False)
+    alignment_score = Column(Numeric(3, 2), default=1.0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    movie = relationship("Movie", back_populates="pairs")
+    en_subtitle = relationship("Subtitle", foreign_keys=[en_id])
+    de_subtitle = relationship("Subtitle", foreign_keys=[de_id])
+
+
+class User(Base):
+    __tablename__ = "users"
+
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    email = Column(String(255), unique=True, nullable=False)
+    password_hash = Column(String(255), nullable=False)
+    is_premium = Column(Boolean, default=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class Vocab(Base):
+    __tablename__ = "vocab"
+    __table_args__ = (UniqueConstraint("word", "lang"),)
+
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    word = Column(String(100), nullable=False)
+    lang = Column(String(5), nullable=False)
+    definition = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class MovieVocab(Base):
+    __tablename__ = "movie_vocab"
+    __table_args__ = (Index("idx_movie_vocab_rank", "movie_id", "lang", "rank"),)
+
+    movie_id = Column(Uuid, ForeignKey("movies.id", ondelete="CASCADE"), primary_key=True)
+    vocab_id = Column(Uuid, ForeignKey("vocab.id", ondelete="CASCADE"), primary_key=True)
+    lang = Column(String(5), nullable=False)
+    frequency = Column(Integer, nullable=False)
+    rank = Column(Integer, nullable=False)
+
+
+class Scene(Base):
+    """A run of subtitle pairs without long pauses, served as one lesson"""
+
+    __tablename__ = "scenes"
+    __table_args__ = (UniqueConstraint("movie_id", "ordinal"),)
+
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    movie_id = Column(Uuid, ForeignKey("movies.id", ondelete="CASCADE"), nullable=False)
+    ordinal = Column(Integer, nullable=False)  # 1-based position in the movie
+    start_ts = Column(Numeric(10, 3), nullable=False)
+    end_ts = Column(Numeric(10, 3), nullable=False)
+    pair_count = Column(Integer, nullable=False)
+    # gzip-compressed JSON lesson, served as stored (see cinefluent.scenes)
+    bundle = Column(LargeBinary, nullable=False)
+    etag = Column(String(64), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class MoviePack(Base):
+    """A movie's pairs as an offline download: the full pack or a delta from base_version"""
+
+    __tablename__ = "movie_packs"
+
+    movie_id = Column(Uuid, ForeignKey("movies.id", ondelete="CASCADE"), primary_key=True)
+    version = Column(Integer, primary_key=True)  # bumped whenever the pairs change
+    base_version = Column(Integer, primary_key=True)  # 0 for the full pack
+    pair_count = Column(Integer, nullable=False)
+    # Binary pack, served as stored (see cinefluent.offline_packs)
+    body = Column(LargeBinary, nullable=False)
+    etag = Column(String(64), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class UserVocab(Base):
+    __tablename__ = "user_vocab"
+    __table_args__ = (
+        UniqueConstraint("user_id", "vocab_id"),
+        Index("idx_user_vocab_due", "user_id", "due_at"),
+    )
+
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    user_id = Column(Uuid, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    vocab_id = Column(Uuid, ForeignKey("vocab.id", ondelete="CASCADE"), nullable=False)
+    seen_count = Column(Integer, default=0)
+    mastered = Column(Boolean, default=False)
+    first_seen = Column(DateTime, default=datetime.utcnow)
+    last_seen = Column(DateTime, default=datetime.utcnow)
+    # Review scheduler state (see cinefluent.learning.scheduler)
+    stability = Column(Float, nullable=False, default=0.0)
+    difficulty = Column(Float, nullable=False, default=0.0)
+    reps = Column(Integer, nullable=False, default=0)
+    lapses = Column(Integer, nullable=False, default=0)
+    due_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_review = Column(DateTime)
+
+
+class Streak(Base):
+    __tablename__ = "streaks"
+
+    user_id = Column(Uuid, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    current_streak = Column(Integer, default=0)
+    longest_streak = Column(Integer, default=0)
+    last_active = Column(Date)
+    # IANA zone deciding when the user's day rolls over
+    timezone = Column(String(64), nullable=False, server_default="UTC")
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ActivityEvent(Base):
+    """Append-only activity stream, folded into the rollup tables below"""
+
+    __tablename__ = "activity_events"
+    __table_args__ = (
+        Index(
+            "idx_activity_events_pending",
+            "id",
+            postgresql_where=text("NOT rolled_up"),
+            sqlite_where=text("NOT rolled_up"),
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Uuid, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    kind = Column(String(32), nullable=False)
+    amount = Column(Integer, nullable=False)
+    occurred_at = Column(DateTime, nullable=False)
+    rolled_up = Column(Boolean, nullable=False, default=False)
+
+
+class ActivityCounters:
+    """Counters shared by the activity rollup tables"""
+
+    lessons_completed = Column(Integer, nullable=False, default=0)
+    study_seconds = Column(Integer, nullable=False, default=0)
+    words_learned = Column(Integer, nullable=False, default=0)
+    movies_started = Column(Integer, nullable=False, default=0)
+    movies_completed = Column(Integer, nullable=False, default=0)
+
+
+class UserDailyActivity(ActivityCounters, Base):
+    __tablename__ = "user_daily_activity"
+
+    user_id = Column(Uuid, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)  # in the user's timezone
+
+
+class UserWeeklyActivity(ActivityCounters, Base):
+    __tablename__ = "user_weekly_activity"
+
+    user_id = Column(Uuid, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    week_start = Column(Date, primary_key=True)  # Monday, in the user's timezone
+
+
+class UserProgress(ActivityCounters, Base):
+    __tablename__ = "user_progress"
+
+    user_id = Column(Uuid, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class DatabaseManager:
+    """Owns the engine and hands out sessions"""
+
+    def __init__(self, database_url: Optional[str] = None, echo: bool = False):
+        self.database_url = database_url or os.getenv("DATABASE_URL", DEFAULT_DATABASE_URL)
+        self.engine = create_engine(self.database_url, echo=echo, future=True)
+        self.SessionLocal = sessionmaker(bind=self.engine, expire_on_commit=False)
+
+    def create_tables(self):
+        Base.metadata.create_all(self.engine)
+
+    def drop_tables(self):
+        Base.metadata.drop_all(self.engine)
+
+    @contextmanager
+    def get_session(self) -> Iterator[Session]:
+        session = self.SessionLocal()
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
@@ -0,0 +1,227 @@
+"""
+Parallel ingestion of a subtitle directory tree
+
+Finds EN/DE subtitle pairs, skips pairs whose content hash matches the
+manifest from the previous run, parses/validates/aligns the rest in a
+process pool and bulk-writes the results in batches.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from .ingestion_service import (
+    IngestionError,
+    IngestionService,
+    MovieFiles,
+    ProcessedMovie,
+    process_subtitle_files,
+)
+from .subtitle_processor import SUPPORTED_FORMATS
+
+logger = logging.getLogger(__name__)
+
+PathLike = Union[str, Path]
+
+MANIFEST_NAME = ".cinefluent-manifest.json"
+DEFAULT_BATCH_SIZE = 50
+HASH_CHUNK_SIZE = 1 << 20
+
+# "<stem>.en.srt", "<stem>_de.srt", "<stem>-en.vtt", or just "en.srt"
+_LANG_RE = re.compile(r"^(?P<stem>.*?)(?:^|[._ -])(?P<lang>en|de)$", re.IGNORECASE)
+
+
+def discover_pairs(root: PathLike) -> List[Tuple[str, MovieFiles]]:
+    """Find EN/DE subtitle pairs below root.
+
+    Returns (key, MovieFiles) tuples where key is the pair's path relative
+    to root without the language suffix. Files without a partner are
+    ignored.
+    """
+    root = Path(root)
+    found: Dict[Tuple[Path, str], Dict[str, Path]] = {}
+
+    for path in sorted(root.rglob("*")):
+        if not path.is_file() or path.suffix.lower() not in SUPPORTED_FORMATS:
+            continue
+        match = _LANG_RE.match(path.stem)
+        if not match:
+            continue
+        key = (path.parent, match.group("stem"))
+        found.setdefault(key, {}).setdefault(match.group("lang").lower(), path)
+
+    pairs = []
+    for (parent, stem), files in found.items():
+        if "en" not in files or "de" not in files:
+            continue
+        name = stem or parent.name
+        title = re.sub(r"[._]+", " ", name).strip() or parent.name
+        key = str((parent / (stem or "_")).relative_to(root))
+        pairs.append((key, MovieFiles(title, files["en"], files["de"])))
+    return pairs
+
+
+def file_digest(path: PathLike) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SubtitleManifest:
+    """Content-hash record of what was ingested on previous runs.
+
+    Size and mtime are stored next to the hash so unchanged files are
+    recognised without being read again; the hash only decides when the
+    stat data differs (e.g. a file that was touched but not edited).
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: PathLike):
+        self.path = Path(path)
+        self.entries: Dict[str, Dict] = {}
+        if self.path.exists():
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            if data.get("version") == self.VERSION:
+                self.entries = data.get("entries", {})
+
+    def _file_state(self, path: Path, previous: Optional[Dict]) -> Dict:
+        stat = path.stat()
+        if (
+            previous
+            and previous["size"] == stat.st_size
+            and previous["mtime_ns"] == stat.st_mtime_ns
+        ):
+            return previous
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": file_digest(path)}
+
+    def check(self, key: str, movie: MovieFiles) -> Tuple[bool, Dict]:
+        """Return (unchanged, new_state) for a discovered pair"""
+        entry = self.entries.get(key, {})
+        state = {
+            lang: self._file_state(Path(path), entry.get(lang))
+            for lang, path in (("en", movie.en_file), ("de", movie.de_file))
+        }
+        unchanged = bool(entry) and all(
+            entry[lang]["sha256"] == state[lang]["sha256"] for lang in ("en", "de")
+        )
+        return unchanged, state
+
+    def movie_id(self, key: str) -> Optional[uuid.UUID]:
+        movie_id = self.entries.get(key, {}).get("movie_id")
+        return uuid.UUID(movie_id) if movie_id else None
+
+    def record(self, key: str, state: Dict, movie_id: Optional[str] = None):
+        entry = dict(state)
+        entry["movie_id"] = movie_id or self.entries.get(key, {}).get("movie_id")
+        self.entries[key] = entry
+
+    def save(self):
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(
+            json.dumps({"version": self.VERSION, "entries": self.entries}, indent=1),
+            encoding="utf-8",
+        )
+        os.replace(tmp, self.path)
+
+
+def _process(movie: MovieFiles) -> ProcessedMovie:
+    return process_subtitle_files(movie.en_file, movie.de_file)
+
+
+def _iter_processed(
+    jobs: List[Tuple[str, MovieFiles, Dict]], workers: int
+) -> Iterator[Tuple[str, MovieFiles, Dict, Optional[ProcessedMovie], Optional[str]]]:
+    if workers <= 1:
+        for key, movie, state in jobs:
+            try:
+                yield key, movie, state, _process(movie), None
+            except (IngestionError, ValueError, OSError) as e:
+                yield key, movie, state, None, str(e)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_process, movie): (key, movie, state) for key, movie, state in jobs}
+        for future in as_completed(futures):
+            key, movie, state = futures[future]
+            try:
+                yield key, movie, state, future.result(), None
+            except (IngestionError, ValueError, OSError) as e:
+                yield key, movie, state, None, str(e)
+
+
+def ingest_directory(
+    service: IngestionService,
+    root: PathLike,
+    workers: Optional[int] = None,
+    manifest_path: Optional[PathLike] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    defer_indexes: bool = False,
+    force: bool = False,
+) -> Dict:
+    """Ingest every changed EN/DE pair below root.
+
+    A pair whose files match the manifest is skipped without being parsed.
+    A changed pair that was ingested before replaces its old movie rows.
+    The manifest is saved after each committed batch, so an interrupted run
+    resumes where it stopped.
+    """
+    root = Path(root)
+    manifest = SubtitleManifest(manifest_path or root / MANIFEST_NAME)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    summary = {"discovered": 0, "skipped": 0, "ingested": 0, "failed": 0, "errors": {}}
+    jobs = []
+    for key, movie in discover_pairs(root):
+        summary["discovered"] += 1
+        unchanged, state = manifest.check(key, movie)
+        if unchanged and not force:
+            manifest.record(key, state)
+            summary["skipped"] += 1
+        else:
+            jobs.append((key, movie, state))
+
+    batch: List[Tuple[str, MovieFiles, Dict, ProcessedMovie]] = []
+
+    def flush():
+        replace_ids = [i for i in (manifest.movie_id(key) for key, *_ in batch) if i]
+        results = service.ingest_processed(
+            [(movie, processed) for _, movie, _, processed in batch],
+            replace_ids=replace_ids,
+            defer_indexes=defer_indexes,
+        )
+        for (key, _, state, _), result in zip(batch, results):
+            manifest.record(key, state, result["movie_id"])
+        manifest.save()
+        summary["ingested"] += len(batch)
+        batch.clear()
+
+    for key, movie, state, processed, error in _iter_processed(jobs, workers):
+        if error is not None:
+            logger.warning("Failed %s: %s", key, error)
+            summary["failed"] += 1
+            summary["errors"][key] = error
+            continue
+        batch.append((key, movie, state, processed))
+        if len(batch) >= batch_size:
+            flush()
+
+    if batch:
+        flush()
+    else:
+        manifest.save()
+
+    logger.info(
+        "upload-dir %s: %d ingested, %d unchanged, %d failed",
+        root, summary["ingested"], summary["skipped"], summary["failed"],
+    )
+    return summary
@@ -0,0 +1,528 @@
+"""
+Activity event log and progress rollups
+
+Lessons completed, study time, words learned and movie milestones are
+appended to activity_events in batches. A background aggregator folds
+new events into per-user daily, weekly and all-time rollup rows and
+advances the streak, so progress and streak reads are a primary-key
+lookup however long the user's history is. Days and weeks (starting
+Monday) are taken in the user's own timezone, stored on their streak row.
+"""
+
+import asyncio
+import logging
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass, field, replace
+from datetime import date, datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from ..users.repository import PostgresUserRepository, SQLiteUserRepository, UserRepository
+
+logger = logging.getLogger(__name__)
+
+# Event kind -> rollup column it adds its amount to
+EVENT_COUNTERS = {
+    "lesson_completed": "lessons_completed",
+    "study_time": "study_seconds",
+    "words_learned": "words_learned",
+    "movie_started": "movies_started",
+    "movie_completed": "movies_completed",
+}
+COUNTERS = tuple(EVENT_COUNTERS.values())
+
+MAX_EVENT_BATCH = 500
+DEFAULT_AGGREGATE_INTERVAL = 2.0
+DEFAULT_AGGREGATE_BATCH = 5000
+RECENT_DAYS = 7
+WEEKLY_GOAL_MINUTES = 150
+# How far back a client may date events it queued while offline
+OFFLINE_WINDOW = timedelta(hours=48)
+# Serialises aggregators across workers on Postgres
+AGGREGATE_LOCK_ID = 0x63666C01
+
+PENDING_EVENTS_SQL = """
+    SELECT id, user_id, kind, amount, occurred_at
+    FROM activity_events
+    WHERE NOT rolled_up
+    ORDER BY id
+    LIMIT {p1}
+"""
+
+STREAK_COLUMNS = (
+    "COALESCE(s.current_streak, 0), COALESCE(s.longest_streak, 0), s.last_active, "
+    "COALESCE(s.timezone, 'UTC')"
+)
+
+PROGRESS_SQL = """
+    SELECT {streak}, {totals}, w.week_start, {week}
+    FROM users u
+    LEFT JOIN streaks s ON s.user_id = u.id
+    LEFT JOIN user_progress p ON p.user_id = u.id
+    LEFT JOIN user_weekly_activity w ON w.user_id = u.id AND w.week_start = (
+        SELECT MAX(week_start) FROM user_weekly_activity WHERE user_id = u.id
+    )
+    WHERE u.id = {p1}
+""".format(
+    streak=STREAK_COLUMNS,
+    totals=", ".join(f"COALESCE(p.{c}, 0)" for c in COUNTERS),
+    week=", ".join(f"COALESCE(w.{c}, 0)" for c in COUNTERS),
+    p1="{p1}",
+)
+
+RECENT_SQL = f"""
+    SELECT day, {", ".join(COUNTERS)}
+    FROM user_daily_activity
+    WHERE user_id = {{p1}}
+    ORDER BY day DESC
+    LIMIT {{p2}}
+"""
+
+
+def _upsert_sql(table: str, keys: Sequence[str], extra: Sequence[str], placeholders: Sequence[str]) -> str:
+    """Insert a rollup row, or add its counters onto the existing one"""
+    columns = list(keys) + list(COUNTERS) + list(extra)
+    updates = [f"{c} = {table}.{c} + excluded.{c}" for c in COUNTERS]
+    updates += [f"{c} = excluded.{c}" for c in extra]
+    return (
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(placeholders[:len(columns)])}) "
+        f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {', '.join(updates)}"
+    )
+
+
+def _rollup_sql(placeholders: Sequence[str]) -> Tuple[str, str, str]:
+    return (
+        _upsert_sql("user_daily_activity", ("user_id", "day"), (), placeholders),
+        _upsert_sql("user_weekly_activity", ("user_id", "week_start"), (), placeholders),
+        _upsert_sql("user_progress", ("user_id",), ("updated_at",), placeholders),
+    )
+
+
+STREAK_UPSERT_SQL = """
+    INSERT INTO streaks (user_id, current_streak, longest_streak, last_active, created_at)
+    VALUES ({p1}, {p2}, {p3}, {p4}, {p5})
+    ON CONFLICT (user_id) DO UPDATE SET
+        current_streak = excluded.current_streak,
+        longest_streak = excluded.longest_streak,
+        last_active = excluded.last_active
+"""
+
+
+class InvalidTimezoneError(ValueError):
+    """Raised for names that are not IANA timezones"""
+
+
+def zone(name: str) -> ZoneInfo:
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise InvalidTimezoneError(name)
+
+
+def local_date(moment: datetime, tz: ZoneInfo) -> date:
+    """Calendar day of a naive UTC timestamp in tz"""
+    return moment.replace(tzinfo=timezone.utc).astimezone(tz).date()
+
+
+def week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+@dataclass
+class ActivityEvent:
+    kind: str
+    amount: int
+    occurred_at: datetime  # naive UTC
+
+
+@dataclass(frozen=True)
+class StreakState:
+    current: int = 0
+    longest: int = 0
+    last_active: Optional[date] = None
+    timezone: str = "UTC"
+
+    def advance(self, day: date) -> "StreakState":
+        """State after activity on day (a local date)"""
+        if self.last_active is None or day > self.last_active + timedelta(days=1):
+            current = 1
+        elif day == self.last_active + timedelta(days=1):
+            current = self.current + 1
+        else:
+            # Same day, or a late event for a day already counted
+            return self
+        return replace(self, current=current, longest=max(self.longest, current), last_active=day)
+
+    def current_on(self, today: date) -> int:
+        """Streak as seen on today: it lapses once a whole local day passes without activity"""
+        if self.last_active is None or today > self.last_active + timedelta(days=1):
+            return 0
+        return self.current
+
+    def folded_since(self) -> Optional[datetime]:
+        """Start of last_active as naive UTC; days before it can no longer change the streak"""
+        if self.last_active is None:
+            return None
+        try:
+            tz = zone(self.timezone)
+        except InvalidTimezoneError:
+            tz = ZoneInfo("UTC")
+        start = datetime.combine(self.last_active, datetime.min.time(), tzinfo=tz)
+        return start.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _counters() -> Dict[str, int]:
+    return dict.fromkeys(COUNTERS, 0)
+
+
+def _counter_table() -> Dict:
+    return defaultdict(_counters)
+
+
+@dataclass
+class Rollup:
+    """Counter deltas and new streak states from one batch of events"""
+
+    daily: Dict[Tuple[uuid.UUID, date], Dict[str, int]] = field(default_factory=_counter_table)
+    weekly: Dict[Tuple[uuid.UUID, date], Dict[str, int]] = field(default_factory=_counter_table)
+    totals: Dict[uuid.UUID, Dict[str, int]] = field(default_factory=_counter_table)
+    streaks: Dict[uuid.UUID, StreakState] = field(default_factory=dict)
+
+
+def fold_events(
+    events: Iterable[Tuple[uuid.UUID, ActivityEvent]], streaks: Dict[uuid.UUID, StreakState]
+) -> Rollup:
+    """Fold (user_id, event) pairs into rollup deltas, advancing the given streaks"""
+    rollup = Rollup(streaks=dict(streaks))
+    zones: Dict[str, ZoneInfo] = {}
+    for user_id, event in sorted(events, key=lambda pair: pair[1].occurred_at):
+        counter = EVENT_COUNTERS.get(event.kind)
+        if counter is None:
+            continue
+        streak = rollup.streaks.get(user_id) or StreakState()
+        if streak.timezone not in zones:
+            try:
+                zones[streak.timezone] = zone(streak.timezone)
+            except InvalidTimezoneError:
+                zones[streak.timezone] = ZoneInfo("UTC")
+        day = local_date(event.occurred_at, zones[streak.timezone])
+
+        rollup.daily[user_id, day][counter] += event.amount
+        rollup.weekly[user_id, week_start(day)][counter] += event.amount
+        rollup.totals[user_id][counter] += event.amount
+        rollup.streaks[user_id] = streak.advance(day)
+    return rollup
+
+
+@dataclass
+class Progress:
+    """A user's rollups as read in one lookup"""
+
+    streak: StreakState
+    totals: Dict[str, int]
+    week_start: Optional[date]
+    week: Dict[str, int]
+    recent: List[Tuple[date, Dict[str, int]]] = field(default_factory=list)
+
+    def today(self, now: datetime) -> date:
+        try:
+            return local_date(now, zone(self.streak.timezone))
+        except InvalidTimezoneError:
+            return now.date()
+
+    def this_week(self, now: datetime) -> Dict[str, int]:
+        """Counters for the current local week; the stored row may be from an earlier one"""
+        if self.week_start is not None and self.week_start == week_start(self.today(now)):
+            return self.week
+        return _counters()
+
+
+class ActivityStore:
+    """Base class; dialect subclasses share the user repository's pool"""
+
+    async def append(self, user_id: uuid.UUID, events: Sequence[ActivityEvent]):
+        """Append a batch of events in one statement"""
+        raise NotImplementedError
+
+    async def set_timezone(self, user_id: uuid.UUID, name: str):
+        raise NotImplementedError
+
+    async def progress(self, user_id: uuid.UUID, recent_days: int = RECENT_DAYS) -> Optional[Progress]:
+        raise NotImplementedError
+
+    async def aggregate(self, limit: int = DEFAULT_AGGREGATE_BATCH) -> Set[uuid.UUID]:
+        """Fold up to limit pending events into the rollups; returns the users touched"""
+        raise NotImplementedError
+
+    @staticmethod
+    def _progress(row: Sequence, recent: Sequence[Sequence]) -> Progress:
+        n = len(COUNTERS)
+        return Progress(
+            streak=StreakState(*row[:4]),
+            totals=dict(zip(COUNTERS, row[4:4 + n])),
+            week_start=row[4 + n],
+            week=dict(zip(COUNTERS, row[5 + n:5 + 2 * n])),
+            recent=[(r[0], dict(zip(COUNTERS, r[1:]))) for r in recent],
+        )
+
+    @staticmethod
+    def _rollup_params(rollup: Rollup, now: datetime, key: Callable, day: Callable):
+        daily = [(key(u), day(d)) + tuple(c.values()) for (u, d), c in rollup.daily.items()]
+        weekly = [(key(u), day(w)) + tuple(c.values()) for (u, w), c in rollup.weekly.items()]
+        totals = [(key(u),) + tuple(c.values()) + (now,) for u, c in rollup.totals.items()]
+        streaks = [
+            (key(u), s.current, s.longest, day(s.last_active), now) for u, s in rollup.streaks.items()
+        ]
+        return daily, weekly, totals, streaks
+
+
+class PostgresActivityStore(ActivityStore):
+    def __init__(self, users: PostgresUserRepository):
+        self.users = users
+        placeholders = [f"${i}" for i in range(1, 10)]
+        self._daily_sql, self._weekly_sql, self._totals_sql = _rollup_sql(placeholders)
+        self._streak_sql = STREAK_UPSERT_SQL.format(p1="$1", p2="$2", p3="$3", p4="$4", p5="$5")
+
+    async def append(self, user_id, events):
+        if not events:
+            return
+        await self.users.pool.execute(
+            """
+            INSERT INTO activity_events (user_id, kind, amount, occurred_at, rolled_up)
+            SELECT $1, e.kind, e.amount, e.occurred_at, FALSE
+            FROM unnest($2::text[], $3::int[], $4::timestamp[]) AS e(kind, amount, occurred_at)
+            """,
+            user_id,
+            [e.kind for e in events],
+            [e.amount for e in events],
+            [e.occurred_at for e in events],
+        )
+
+    async def set_timezone(self, user_id, name):
+        zone(name)
+        await self.users.pool.execute("UPDATE streaks SET timezone = $1 WHERE user_id = $2", name, user_id)
+
+    async def progress(self, user_id, recent_days=RECENT_DAYS):
+        async with self.users.pool.acquire() as conn:
+            row = await conn.fetchrow(PROGRESS_SQL.format(p1="$1"), user_id)
+            if row is None:
+                return None
+            recent = []
+            if recent_days:
+                recent = await conn.fetch(RECENT_SQL.format(p1="$1", p2="$2"), user_id, recent_days)
+        return self._progress(row, recent)
+
+    async def aggregate(self, limit=DEFAULT_AGGREGATE_BATCH):
+        async with self.users.pool.acquire() as conn:
+            async with conn.transaction():
+                # Another worker is already folding; its batch covers ours
+                if not await conn.fetchval("SELECT pg_try_advisory_xact_lock($1)", AGGREGATE_LOCK_ID):
+                    return set()
+                rows = await conn.fetch(PENDING_EVENTS_SQL.format(p1="$1"), limit)
+                if not rows:
+                    return set()
+                user_ids = list({row[1] for row in rows})
+                states = await conn.fetch(
+                    f"SELECT u.id, {STREAK_COLUMNS} FROM users u"
+                    " LEFT JOIN streaks s ON s.user_id = u.id WHERE u.id = ANY($1::uuid[])",
+                    user_ids,
+                )
+                rollup = fold_events(
+                    [(row[1], ActivityEvent(row[2], row[3], row[4])) for row in rows],
+                    {row[0]: StreakState(*row[1:]) for row in states},
+                )
+                daily, weekly, totals, streaks = self._rollup_params(
+                    rollup, datetime.utcnow(), lambda u: u, lambda d: d
+                )
+                await conn.executemany(self._daily_sql, daily)
+                await conn.executemany(self._weekly_sql, weekly)
+                await conn.executemany(self._totals_sql, totals)
+                await conn.executemany(self._streak_sql, streaks)
+                await conn.execute(
+                    "UPDATE activity_events SET rolled_up = TRUE WHERE id = ANY($1::bigint[])",
+                    [row[0] for row in rows],
+                )
+        return set(rollup.totals)
+
+
+def _sqlite_date(value: Optional[str]) -> Optional[date]:
+    return date.fromisoformat(value) if value else None
+
+
+def _sqlite_day(value: Optional[date]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+class SQLiteActivityStore(ActivityStore):
+    def __init__(self, users: SQLiteUserRepository):
+        self.users = users
+        placeholders = ["?"] * 9
+        self._daily_sql, self._weekly_sql, self._totals_sql = _rollup_sql(placeholders)
+        self._streak_sql = STREAK_UPSERT_SQL.format(p1="?", p2="?", p3="?", p4="?", p5="?")
+
+    async def append(self, user_id, events):
+        if not events:
+            return
+        params = [
+            (user_id.hex, e.kind, e.amount, e.occurred_at.isoformat(" ")) for e in events
+        ]
+
+        def insert(conn):
+            with conn:
+                conn.executemany(
+                    "INSERT INTO activity_events (user_id, kind, amount, occurred_at, rolled_up)"
+                    " VALUES (?, ?, ?, ?, 0)",
+                    params,
+                )
+
+        await self.users.run(insert)
+
+    async def set_timezone(self, user_id, name):
+        zone(name)
+
+        def update(conn):
+            with conn:
+                conn.execute("UPDATE streaks SET timezone = ? WHERE user_id = ?", (name, user_id.hex))
+
+        await self.users.run(update)
+
+    async def progress(self, user_id, recent_days=RECENT_DAYS):
+        def read(conn):
+            row = conn.execute(PROGRESS_SQL.format(p1="?"), (user_id.hex,)).fetchone()
+            if row is None or not recent_days:
+                return row, []
+            recent = conn.execute(RECENT_SQL.format(p1="?", p2="?"), (user_id.hex, recent_days))
+            return row, recent.fetchall()
+
+        row, recent = await self.users.run(read)
+        if row is None:
+            return None
+        n = len(COUNTERS)
+        row = list(row)
+        row[2] = _sqlite_date(row[2])
+        row[4 + n] = _sqlite_date(row[4 + n])
+        return self._progress(row, [(_sqlite_date(r[0]),) + tuple(r[1:]) for r in recent])
+
+    async def aggregate(self, limit=DEFAULT_AGGREGATE_BATCH):
+        now = datetime.utcnow()
+
+        def fold(conn):
+            with conn:
+                # Take the write lock up front so concurrent aggregators queue behind us
+                conn.execute("BEGIN IMMEDIATE")
+                rows = conn.execute(PENDING_EVENTS_SQL.format(p1="?"), (limit,)).fetchall()
+                if not rows:
+                    return set()
+                user_ids = list({row[1] for row in rows})
+                states = conn.execute(
+                    f"SELECT u.id, {STREAK_COLUMNS} FROM users u LEFT JOIN streaks s ON s.user_id = u.id"
+                    f" WHERE u.id IN ({', '.join('?' for _ in user_ids)})",
+                    user_ids,
+                ).fetchall()
+                rollup = fold_events(
+                    [
+                        (uuid.UUID(row[1]), ActivityEvent(row[2], row[3], datetime.fromisoformat(row[4])))
+                        for row in rows
+                    ],
+                    {
+                        uuid.UUID(row[0]): StreakState(row[1], row[2], _sqlite_date(row[3]), row[4])
+                        for row in states
+                    },
+                )
+                daily, weekly, totals, streaks = self._rollup_params(
+                    rollup, now.isoformat(" "), lambda u: u.hex, _sqlite_day
+                )
+                conn.executemany(self._daily_sql, daily)
+                conn.executemany(self._weekly_sql, weekly)
+                conn.executemany(self._totals_sql, totals)
+                conn.executemany(self._streak_sql, streaks)
+                # The write lock is held, so no other event can have been rolled up meanwhile
+                conn.execute(
+                    "UPDATE activity_events SET rolled_up = 1 WHERE NOT rolled_up AND id <= ?",
+                    (rows[-1][0],),
+                )
+                return set(rollup.totals)
+
+        return await self.users.run(fold)
+
+
+def create_activity_store(users: UserRepository) -> ActivityStore:
+    """Activity store sharing the user repository's pool"""
+    if isinstance(users, PostgresUserRepository):
+        return PostgresActivityStore(users)
+    if isinstance(users, SQLiteUserRepository):
+        return SQLiteActivityStore(users)
+    raise ValueError(f"No activity store for {users.dialect} repositories")
+
+
+class ActivityAggregator:
+    """Background loop folding new activity events into the rollups.
+
+    Each pass drains pending events batch_size at a time, then sleeps for
+    interval seconds. on_fold is called with the users whose rollups or
+    streaks changed.
+    """
+
+    def __init__(
+        self,
+        store: ActivityStore,
+        interval: float = DEFAULT_AGGREGATE_INTERVAL,
+        batch_size: int = DEFAULT_AGGREGATE_BATCH,
+        on_fold: Optional[Callable[[Set[uuid.UUID]], Awaitable[None]]] = None,
+    ):
+        self.store = store
+        self.interval = interval
+        self.batch_size = batch_size
+        self.on_fold = on_fold
+        self.batches = 0
+        self.failures = 0
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._closing = False
+
+    async def run_once(self) -> Set[uuid.UUID]:
+        """Fold everything pending; returns the users touched"""
+        touched: Set[uuid.UUID] = set()
+        while True:
+            users = await self.store.aggregate(self.batch_size)
+            if not users:
+                break
+            self.batches += 1
+            touched |= users
+            if self.on_fold is not None:
+                try:
+                    await self.on_fold(users)
+                except Exception:
+                    logger.exception("Activity fold listener failed")
+        return touched
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await self.run_once()
+            except Exception:
+                self.failures += 1
+                logger.exception("Activity aggregation failed")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self._task is None:
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Stop the loop and fold whatever is still pending.
+
+        Like AnswerBuffer.close(), the loop is asked to finish rather than
+        cancelled, so a fold in progress commits or rolls back on its own.
+        """
+        if self._task is not None:
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.run_once()
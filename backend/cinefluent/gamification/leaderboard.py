@@ -0,0 +1,460 @@
+"""
+Incrementally maintained leaderboard
+
+Users are ranked by longest streak, then by number of mastered words,
+the same order as the leaderboard view in sql/init.sql. Instead of
+aggregating user_vocab on every read, scores are kept in a ranked
+structure that is updated when a user's streak or mastery changes:
+a Redis sorted set when REDIS_URL is set (shared by all workers), or an
+in-process order-statistic treap otherwise. Top-K pages, "my rank" and
+"around me" are all O(log n + k). A periodic rebuild from SQL reconciles
+any updates that were missed.
+"""
+
+import asyncio
+import logging
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .. import settings
+from ..users.repository import PostgresUserRepository, SQLiteUserRepository, UserRepository
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "cinefluent:leaderboard:"
+DEFAULT_REBUILD_INTERVAL = 300
+MAX_PAGE_SIZE = 100
+# Mastered counts stay far below this, so both parts fit exactly in a double
+SCORE_BASE = 10 ** 8
+
+SCORES_SQL = """
+    SELECT u.id, u.email, COALESCE(s.longest_streak, 0),
+           (SELECT COUNT(*) FROM user_vocab v WHERE v.user_id = u.id AND v.mastered = TRUE)
+    FROM users u
+    LEFT JOIN streaks s ON s.user_id = u.id
+"""
+
+
+def encode_score(longest_streak: int, mastered: int) -> int:
+    return longest_streak * SCORE_BASE + min(mastered, SCORE_BASE - 1)
+
+
+def display_name(email: str) -> str:
+    """Public name for an account; the address itself is never shown"""
+    return email.split("@", 1)[0]
+
+
+@dataclass
+class LeaderboardEntry:
+    rank: int  # 1-based
+    user_id: uuid.UUID
+    name: str
+    score: int
+
+    @property
+    def longest_streak(self) -> int:
+        return self.score // SCORE_BASE
+
+    @property
+    def mastered(self) -> int:
+        return self.score % SCORE_BASE
+
+    def as_dict(self) -> Dict:
+        return {
+            "rank": self.rank,
+            "user_id": str(self.user_id),
+            "name": self.name,
+            "longest_streak": self.longest_streak,
+            "words_mastered": self.mastered,
+        }
+
+
+# (user_id, name, score)
+ScoreRow = Tuple[uuid.UUID, str, int]
+
+
+class _Node:
+    __slots__ = ("key", "priority", "left", "right", "size")
+
+    def __init__(self, key):
+        self.key = key
+        self.priority = random.random()
+        self.left = None
+        self.right = None
+        self.size = 1
+
+
+def _size(node: Optional[_Node]) -> int:
+    return node.size if node is not None else 0
+
+
+def _update(node: _Node):
+    node.size = 1 + _size(node.left) + _size(node.right)
+
+
+def _split(node: Optional[_Node], key) -> Tuple[Optional[_Node], Optional[_Node]]:
+    """Split into (keys < key, keys >= key)"""
+    if node is None:
+        return None, None
+    if node.key < key:
+        node.right, right = _split(node.right, key)
+        _update(node)
+        return node, right
+    left, node.left = _split(node.left, key)
+    _update(node)
+    return left, node
+
+
+def _merge(left: Optional[_Node], right: Optional[_Node]) -> Optional[_Node]:
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        _update(left)
+        return left
+    right.left = _merge(left, right.left)
+    _update(right)
+    return right
+
+
+def _delete(node: Optional[_Node], key) -> Optional[_Node]:
+    if node is None:
+        return None
+    if key < node.key:
+        node.left = _delete(node.left, key)
+    elif node.key < key:
+        node.right = _delete(node.right, key)
+    else:
+        return _merge(node.left, node.right)
+    _update(node)
+    return node
+
+
+class OrderStatisticTree:
+    """Treap with subtree sizes: insert, remove, rank and select in O(log n) expected"""
+
+    def __init__(self):
+        self.root: Optional[_Node] = None
+
+    def __len__(self) -> int:
+        return _size(self.root)
+
+    def insert(self, key):
+        left, right = _split(self.root, key)
+        self.root = _merge(_merge(left, _Node(key)), right)
+
+    def remove(self, key):
+        self.root = _delete(self.root, key)
+
+    def rank(self, key) -> int:
+        """Number of keys smaller than key"""
+        node, rank = self.root, 0
+        while node is not None:
+            if node.key < key:
+                rank += _size(node.left) + 1
+                node = node.right
+            else:
+                node = node.left
+        return rank
+
+    def select(self, index: int):
+        """Key at 0-based position index"""
+        node = self.root
+        while node is not None:
+            left = _size(node.left)
+            if index < left:
+                node = node.left
+            elif index == left:
+                return node.key
+            else:
+                index -= left + 1
+                node = node.right
+        raise IndexError(index)
+
+
+class Leaderboard:
+    """Base class for the ranked score store"""
+
+    async def connect(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def update(self, rows: Iterable[ScoreRow]):
+        raise NotImplementedError
+
+    async def remove(self, user_id: uuid.UUID):
+        raise NotImplementedError
+
+    async def replace_all(self, rows: Iterable[ScoreRow]):
+        raise NotImplementedError
+
+    async def size(self) -> int:
+        raise NotImplementedError
+
+    async def top(self, offset: int, limit: int) -> List[LeaderboardEntry]:
+        raise NotImplementedError
+
+    async def rank(self, user_id: uuid.UUID) -> Optional[LeaderboardEntry]:
+        raise NotImplementedError
+
+    async def around(self, user_id: uuid.UUID, radius: int) -> List[LeaderboardEntry]:
+        """Entries within radius places of the user, the user included"""
+        entry = await self.rank(user_id)
+        if entry is None:
+            return []
+        start = max(entry.rank - 1 - radius, 0)
+        return await self.top(start, entry.rank - start + radius)
+
+
+class LocalLeaderboard(Leaderboard):
+    """Per-process board on an order-statistic tree; each worker keeps its own"""
+
+    def __init__(self):
+        self._tree = OrderStatisticTree()
+        # user -> (sort key, name); sort key (-score, -user id) puts the best first and
+        # breaks ties by descending id, as ZREVRANGE does on the Redis board
+        self._users: Dict[uuid.UUID, Tuple[Tuple[int, int], str]] = {}
+
+    def _set(self, user_id: uuid.UUID, name: str, score: int):
+        key = (-score, -user_id.int)
+        current = self._users.get(user_id)
+        if current is not None:
+            if current[0] == key:
+                self._users[user_id] = (key, name)
+                return
+            self._tree.remove(current[0])
+        self._tree.insert(key)
+        self._users[user_id] = (key, name)
+
+    def _entry(self, index: int, key: Tuple[int, int]) -> LeaderboardEntry:
+        user_id = uuid.UUID(int=-key[1])
+        return LeaderboardEntry(index + 1, user_id, self._users[user_id][1], -key[0])
+
+    async def update(self, rows):
+        for user_id, name, score in rows:
+            self._set(user_id, name, score)
+
+    async def remove(self, user_id):
+        current = self._users.pop(user_id, None)
+        if current is not None:
+            self._tree.remove(current[0])
+
+    async def replace_all(self, rows):
+        self._tree = OrderStatisticTree()
+        self._users = {}
+        await self.update(rows)
+
+    async def size(self):
+        return len(self._tree)
+
+    async def top(self, offset, limit):
+        end = min(offset + limit, len(self._tree))
+        return [self._entry(i, self._tree.select(i)) for i in range(max(offset, 0), end)]
+
+    async def rank(self, user_id):
+        current = self._users.get(user_id)
+        if current is None:
+            return None
+        return self._entry(self._tree.rank(current[0]), current[0])
+
+
+class RedisLeaderboard(Leaderboard):
+    """Sorted set shared by every worker, with names in a hash next to it"""
+
+    def __init__(self, redis_url: str, key: str = KEY_PREFIX + "scores"):
+        self.redis_url = redis_url
+        self.key = key
+        self.names_key = key + ":names"
+        self.redis = None
+
+    async def connect(self):
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(self.redis_url)
+
+    async def close(self):
+        if self.redis is not None:
+            await self.redis.aclose()
+            self.redis = None
+
+    async def _entries(self, start: int, members: Sequence[Tuple[bytes, float]]) -> List[LeaderboardEntry]:
+        if not members:
+            return []
+        names = await self.redis.hmget(self.names_key, [member for member, _ in members])
+        return [
+            LeaderboardEntry(start + i + 1, uuid.UUID(member.decode()), (name or b"").decode(), int(score))
+            for i, ((member, score), name) in enumerate(zip(members, names))
+        ]
+
+    async def update(self, rows):
+        rows = list(rows)
+        if not rows:
+            return
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zadd(self.key, {str(user_id): score for user_id, _, score in rows})
+            pipe.hset(self.names_key, mapping={str(user_id): name for user_id, name, _ in rows})
+            await pipe.execute()
+
+    async def remove(self, user_id):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zrem(self.key, str(user_id))
+            pipe.hdel(self.names_key, str(user_id))
+            await pipe.execute()
+
+    async def replace_all(self, rows):
+        """Build the new board under temporary keys and swap it in atomically"""
+        rows = list(rows)
+        staging = f"{self.key}:rebuild:{uuid.uuid4().hex}"
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for start in range(0, len(rows), 10000):
+                chunk = rows[start:start + 10000]
+                pipe.zadd(staging, {str(user_id): score for user_id, _, score in chunk})
+                pipe.hset(staging + ":names", mapping={str(u): name for u, name, _ in chunk})
+            await pipe.execute()
+        async with self.redis.pipeline(transaction=True) as pipe:
+            if rows:
+                pipe.rename(staging, self.key)
+                pipe.rename(staging + ":names", self.names_key)
+            else:
+                pipe.delete(self.key, self.names_key)
+            await pipe.execute()
+
+    async def size(self):
+        return int(await self.redis.zcard(self.key))
+
+    async def top(self, offset, limit):
+        offset = max(offset, 0)
+        members = await self.redis.zrevrange(self.key, offset, offset + limit - 1, withscores=True)
+        return await self._entries(offset, members)
+
+    async def rank(self, user_id):
+        member = str(user_id)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zrevrank(self.key, member)
+            pipe.zscore(self.key, member)
+            pipe.hget(self.names_key, member)
+            rank, score, name = await pipe.execute()
+        if rank is None:
+            return None
+        return LeaderboardEntry(rank + 1, user_id, (name or b"").decode(), int(score))
+
+
+class ScoreSource:
+    """Reads leaderboard scores from SQL; shares the user repository's pool"""
+
+    async def scores(self, user_ids: Optional[Sequence[uuid.UUID]] = None) -> List[ScoreRow]:
+        raise NotImplementedError
+
+
+class PostgresScoreSource(ScoreSource):
+    def __init__(self, users: PostgresUserRepository):
+        self.users = users
+
+    async def scores(self, user_ids=None):
+        if user_ids is None:
+            rows = await self.users.pool.fetch(SCORES_SQL)
+        else:
+            rows = await self.users.pool.fetch(SCORES_SQL + " WHERE u.id = ANY($1::uuid[])", list(user_ids))
+        return [(row[0], display_name(row[1]), encode_score(row[2], row[3])) for row in rows]
+
+
+class SQLiteScoreSource(ScoreSource):
+    def __init__(self, users: SQLiteUserRepository):
+        self.users = users
+
+    async def scores(self, user_ids=None):
+        sql, params = SCORES_SQL, []
+        if user_ids is not None:
+            user_ids = list(user_ids)
+            sql += f" WHERE u.id IN ({', '.join('?' for _ in user_ids)})"
+            params = [user_id.hex for user_id in user_ids]
+        rows = await self.users.run(lambda conn: conn.execute(sql, params).fetchall())
+        return [
+            (uuid.UUID(row[0]), display_name(row[1]), encode_score(row[2], row[3])) for row in rows
+        ]
+
+
+class LeaderboardService:
+    """Keeps a Leaderboard in step with SQL.
+
+    refresh() re-reads the scores of users whose streak or mastery just
+    changed; a background loop rebuilds the whole board every
+    rebuild_interval seconds. With Redis, a short-lived lock makes sure only
+    one worker rebuilds per interval.
+    """
+
+    def __init__(
+        self,
+        board: Leaderboard,
+        source: ScoreSource,
+        rebuild_interval: float = DEFAULT_REBUILD_INTERVAL,
+    ):
+        self.board = board
+        self.source = source
+        self.rebuild_interval = rebuild_interval
+        self.last_rebuild: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def refresh(self, user_ids: Iterable[uuid.UUID]):
+        user_ids = list(set(user_ids))
+        if user_ids:
+            await self.board.update(await self.source.scores(user_ids))
+
+    async def rebuild(self) -> int:
+        rows = await self.source.scores()
+        await self.board.replace_all(rows)
+        self.last_rebuild = time.time()
+        return len(rows)
+
+    async def _claim_rebuild(self) -> bool:
+        redis = getattr(self.board, "redis", None)
+        if redis is None:
+            return True
+        lock_ttl = max(int(self.rebuild_interval) - 1, 1)
+        return bool(await redis.set(KEY_PREFIX + "rebuild-lock", 1, nx=True, ex=lock_ttl))
+
+    async def _run(self):
+        while True:
+            try:
+                if await self._claim_rebuild():
+                    count = await self.rebuild()
+                    logger.info("Leaderboard rebuilt with %d users", count)
+            except Exception:
+                logger.exception("Leaderboard rebuild failed")
+            await asyncio.sleep(self.rebuild_interval)
+
+    async def start(self):
+        await self.board.connect()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.board.close()
+
+
+def create_leaderboard_service(
+    users: UserRepository, redis_url: Optional[str] = None, **kwargs
+) -> LeaderboardService:
+    """Redis board when REDIS_URL is set, in-process otherwise; scores come from users' pool"""
+    redis_url = redis_url if redis_url is not None else settings.redis_url()
+    board = RedisLeaderboard(redis_url) if redis_url else LocalLeaderboard()
+    if isinstance(users, PostgresUserRepository):
+        source = PostgresScoreSource(users)
+    elif isinstance(users, SQLiteUserRepository):
+        source = SQLiteScoreSource(users)
+    else:
+        raise ValueError(f"No leaderboard source for {users.dialect} repositories")
+    return LeaderboardService(board, source, **kwargs)
@@ -0,0 +1,166 @@
+"""
+Streaks, progress rollups, activity events and the leaderboard
+"""
+
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from pydantic import BaseModel, Field, field_validator
+
+from ..api.deps import get_activity_store, get_current_user, get_leaderboard, utc_naive
+from ..users.repository import UserRecord
+from .activity import (
+    EVENT_COUNTERS,
+    MAX_EVENT_BATCH,
+    OFFLINE_WINDOW,
+    WEEKLY_GOAL_MINUTES,
+    ActivityEvent,
+    ActivityStore,
+    InvalidTimezoneError,
+)
+from .leaderboard import MAX_PAGE_SIZE, LeaderboardService
+
+router = APIRouter(prefix="/api/v1/gamification", tags=["gamification"])
+
+
+class ActivityEventIn(BaseModel):
+    kind: str
+    amount: int = Field(default=1, ge=1, le=86400)  # seconds for study_time, a count otherwise
+    occurred_at: Optional[datetime] = None
+
+    @field_validator("kind")
+    @classmethod
+    def known_kind(cls, kind: str) -> str:
+        if kind not in EVENT_COUNTERS:
+            raise ValueError(f"kind must be one of {', '.join(EVENT_COUNTERS)}")
+        return kind
+
+
+class ActivityBatch(BaseModel):
+    events: List[ActivityEventIn] = Field(min_length=1, max_length=MAX_EVENT_BATCH)
+
+
+class TimezoneUpdate(BaseModel):
+    timezone: str = Field(max_length=64)
+
+
+@router.get("/streak")
+async def get_user_streak(
+    current_user: UserRecord = Depends(get_current_user),
+    activity: ActivityStore = Depends(get_activity_store),
+):
+    progress = await activity.progress(current_user.id, recent_days=0)
+    streak = progress.streak
+    return {
+        "user_id": str(current_user.id),
+        "current_streak": streak.current_on(progress.today(datetime.utcnow())),
+        "longest_streak": streak.longest,
+        "last_active": streak.last_active.isoformat() if streak.last_active else None,
+        "timezone": streak.timezone,
+    }
+
+
+@router.get("/progress")
+async def get_user_progress(
+    current_user: UserRecord = Depends(get_current_user),
+    activity: ActivityStore = Depends(get_activity_store),
+    leaderboard: LeaderboardService = Depends(get_leaderboard),
+):
+    now = datetime.utcnow()
+    progress = await activity.progress(current_user.id)
+    totals = progress.totals
+    ranked = await leaderboard.board.rank(current_user.id)
+    return {
+        "user_id": str(current_user.id),
+        "current_streak": progress.streak.current_on(progress.today(now)),
+        "longest_streak": progress.streak.longest,
+        "words_learned": totals["words_learned"],
+        "words_mastered": ranked.mastered if ranked else 0,
+        "total_lessons_completed": totals["lessons_completed"],
+        "total_study_time_minutes": totals["study_seconds"] // 60,
+        "movies_started": totals["movies_started"],
+        "movies_completed": totals["movies_completed"],
+        "weekly_goal": WEEKLY_GOAL_MINUTES,
+        "weekly_progress": progress.this_week(now)["study_seconds"] // 60,
+        "recent_activity": [
+            {
+                "date": day.isoformat(),
+                "lessons_completed": counters["lessons_completed"],
+                "study_time_minutes": counters["study_seconds"] // 60,
+                "words_learned": counters["words_learned"],
+            }
+            for day, counters in progress.recent
+        ],
+    }
+
+
+@router.post("/activity", status_code=status.HTTP_202_ACCEPTED)
+async def record_activity(
+    batch: ActivityBatch,
+    current_user: UserRecord = Depends(get_current_user),
+    activity: ActivityStore = Depends(get_activity_store),
+):
+    now = datetime.utcnow()
+    stamps = [min(utc_naive(event.occurred_at) or now, now) for event in batch.events]
+    if min(stamps) < now - OFFLINE_WINDOW:
+        raise HTTPException(status_code=422, detail="occurred_at is outside the offline window")
+    # Backdated events may not land before the last day the streak already counts
+    progress = await activity.progress(current_user.id, recent_days=0)
+    floor = progress.streak.folded_since() if progress else None
+    events = [
+        ActivityEvent(event.kind, event.amount, max(stamp, floor) if floor else stamp)
+        for event, stamp in zip(batch.events, stamps)
+    ]
+    # Rollups and streaks catch up on the aggregator's next pass
+    await activity.append(current_user.id, events)
+    return {"accepted": len(events)}
+
+
+@router.put("/timezone")
+async def set_timezone(
+    update: TimezoneUpdate,
+    current_user: UserRecord = Depends(get_current_user),
+    activity: ActivityStore = Depends(get_activity_store),
+):
+    try:
+        await activity.set_timezone(current_user.id, update.timezone)
+    except InvalidTimezoneError:
+        raise HTTPException(status_code=422, detail="Unknown timezone")
+    return {"timezone": update.timezone}
+
+
+@router.get("/leaderboard")
+async def get_leaderboard_page(
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    current_user: UserRecord = Depends(get_current_user),
+    leaderboard: LeaderboardService = Depends(get_leaderboard),
+):
+    entries = await leaderboard.board.top(offset, limit)
+    return {
+        "total": await leaderboard.board.size(),
+        "offset": offset,
+        "entries": [entry.as_dict() for entry in entries],
+    }
+
+
+@router.get("/leaderboard/me")
+async def get_my_rank(
+    radius: int = Query(0, ge=0, le=MAX_PAGE_SIZE // 2),
+    current_user: UserRecord = Depends(get_current_user),
+    leaderboard: LeaderboardService = Depends(get_leaderboard),
+):
+    entry = await leaderboard.board.rank(current_user.id)
+    if entry is None:
+        # Not on this board yet, e.g. registered through another worker before a rebuild
+        await leaderboard.refresh([current_user.id])
+        entry = await leaderboard.board.rank(current_user.id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Not on the leaderboard")
+    around = await leaderboard.board.around(current_user.id, radius) if radius else [entry]
+    return {
+        "total": await leaderboard.board.size(),
+        "me": entry.as_dict(),
+        "around": [item.as_dict() for item in around],
+    }
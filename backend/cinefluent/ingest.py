@@ -0,0 +1,167 @@
+"""
+Command line entry point for subtitle ingestion
+
+    python -m cinefluent.ingest init-db
+    python -m cinefluent.ingest upload "Movie Title" --en-file en.srt --de-file de.srt
+    python -m cinefluent.ingest upload-dir ./subtitles --workers 8
+    python -m cinefluent.ingest update-track <movie-id> --lang de corrected.de.srt
+    python -m cinefluent.ingest realign --all --workers 8
+    python -m cinefluent.ingest build-index --index-dir /var/lib/cinefluent/index
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import uuid
+from typing import List, Optional
+
+from dotenv import load_dotenv
+
+from .database_models import DatabaseManager
+from .directory_ingest import DEFAULT_BATCH_SIZE as DEFAULT_UPLOAD_BATCH_SIZE
+from .directory_ingest import ingest_directory
+from .ingestion_service import IngestionError, IngestionService
+from .realign import DEFAULT_BATCH_SIZE, realign_catalog
+from .response_cache import bump_content_generation
+from .word_index import INDEX_DIR_ENV, WordIndex, rebuild_index
+
+
+def cmd_init_db(args) -> int:
+    db = DatabaseManager(args.database_url)
+    db.create_tables()
+    print("✅ Database tables created")
+    return 0
+
+
+def cmd_upload(args) -> int:
+    service = IngestionService(DatabaseManager(args.database_url))
+    try:
+        summary = service.ingest_movie(
+            args.title, args.en_file, args.de_file, year=args.year, imdb_id=args.imdb_id
+        )
+    except IngestionError as e:
+        print(f"❌ Ingestion failed: {e}", file=sys.stderr)
+        return 1
+    print(json.dumps(summary, indent=2, default=str))
+    return 0
+
+
+def cmd_update_track(args) -> int:
+    service = IngestionService(DatabaseManager(args.database_url))
+    try:
+        summary = service.update_track(uuid.UUID(args.movie_id), args.lang, args.file)
+    except IngestionError as e:
+        print(f"❌ Update failed: {e}", file=sys.stderr)
+        return 1
+    print(json.dumps(summary, indent=2, default=str))
+    return 0
+
+
+def cmd_upload_dir(args) -> int:
+    service = IngestionService(DatabaseManager(args.database_url))
+    summary = ingest_directory(
+        service,
+        args.directory,
+        workers=args.workers,
+        manifest_path=args.manifest,
+        batch_size=args.batch_size,
+        defer_indexes=args.defer_indexes,
+        force=args.force,
+    )
+    print(json.dumps(summary, indent=2))
+    return 1 if summary["failed"] else 0
+
+
+def cmd_realign(args) -> int:
+    db = DatabaseManager(args.database_url)
+    movie_ids = None if args.all else [uuid.UUID(movie_id) for movie_id in args.movie_id]
+    summary = realign_catalog(
+        db, movie_ids, workers=args.workers, batch_size=args.batch_size
+    )
+    print(json.dumps(summary, indent=2))
+    # Inserted and deleted pairs change the word index's postings
+    if os.getenv(INDEX_DIR_ENV):
+        with db.engine.connect() as conn:
+            rebuild_index(conn, os.environ[INDEX_DIR_ENV]).close()
+    bump_content_generation()
+    return 0
+
+
+def cmd_build_index(args) -> int:
+    index_dir = args.index_dir or os.getenv(INDEX_DIR_ENV)
+    if not index_dir:
+        print(f"❌ Pass --index-dir or set {INDEX_DIR_ENV}", file=sys.stderr)
+        return 1
+    if args.compact:
+        WordIndex(index_dir).compact()
+    else:
+        db = DatabaseManager(args.database_url)
+        with db.engine.connect() as conn:
+            rebuild_index(conn, index_dir).close()
+    print(f"✅ Word index written to {index_dir}")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="cinefluent.ingest", description=__doc__)
+    parser.add_argument("--database-url", default=None, help="Overrides DATABASE_URL")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    init_db = sub.add_parser("init-db", help="Create database tables")
+    init_db.set_defaults(func=cmd_init_db)
+
+    upload = sub.add_parser("upload", help="Ingest one EN/DE subtitle pair")
+    upload.add_argument("title")
+    upload.add_argument("--en-file", required=True)
+    upload.add_argument("--de-file", required=True)
+    upload.add_argument("--year", type=int)
+    upload.add_argument("--imdb-id")
+    upload.set_defaults(func=cmd_upload)
+
+    update_track = sub.add_parser(
+        "update-track", help="Replace one language track of a movie, keeping unchanged pairs"
+    )
+    update_track.add_argument("movie_id")
+    update_track.add_argument("file")
+    update_track.add_argument("--lang", required=True, choices=("en", "de"))
+    update_track.set_defaults(func=cmd_update_track)
+
+    upload_dir = sub.add_parser("upload-dir", help="Ingest every EN/DE pair in a directory")
+    upload_dir.add_argument("directory")
+    upload_dir.add_argument("--workers", type=int, default=None, help="Default: CPU count")
+    upload_dir.add_argument("--manifest", help="Default: <directory>/.cinefluent-manifest.json")
+    upload_dir.add_argument("--batch-size", type=int, default=DEFAULT_UPLOAD_BATCH_SIZE)
+    upload_dir.add_argument("--defer-indexes", action="store_true")
+    upload_dir.add_argument("--force", action="store_true", help="Ignore the manifest")
+    upload_dir.set_defaults(func=cmd_upload_dir)
+
+    realign = sub.add_parser("realign", help="Rebuild subtitle_pairs from stored cues")
+    target = realign.add_mutually_exclusive_group(required=True)
+    target.add_argument("--all", action="store_true", help="Realign every movie")
+    target.add_argument("--movie-id", action="append", help="Movie UUID (repeatable)")
+    realign.add_argument("--workers", type=int, default=None, help="Default: CPU count")
+    realign.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    realign.set_defaults(func=cmd_realign)
+
+    build_index = sub.add_parser("build-index", help="Rebuild the word -> pair index")
+    build_index.add_argument("--index-dir", help=f"Default: ${INDEX_DIR_ENV}")
+    build_index.add_argument(
+        "--compact", action="store_true", help="Merge existing segments instead of rebuilding"
+    )
+    build_index.set_defaults(func=cmd_build_index)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    load_dotenv()
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
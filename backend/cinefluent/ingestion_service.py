@@ -0,0 +1,375 @@
+"""
+Ingestion service - parses, validates, aligns and stores a movie's subtitles
+"""
+
+import logging
+import os
+import uuid
+from contextlib import nullcontext
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from sqlalchemy import delete, insert, select
+
+from .bulk_loader import BulkWriter, deferred_indexes, get_bulk_writer
+from .database_models import DatabaseManager, Movie, MovieVocab, Scene, Subtitle, SubtitlePair
+from .movies.metadata import CatalogStage
+from .offline_packs import PackStage
+from .response_cache import bump_content_generation
+from .scenes import SceneStage
+from .subtitle_processor import CompactCue, SubtitleProcessor, SubtitleValidator
+from .track_update import apply_update, load_pairs, load_track, plan_update
+from .vocabulary import VocabularyStage
+from .word_index import INDEX_DIR_ENV, WordIndexStage
+
+logger = logging.getLogger(__name__)
+
+PathLike = Union[str, Path]
+
+
+class IngestionError(Exception):
+    """Raised when subtitle files fail validation"""
+
+
+@dataclass
+class MovieFiles:
+    """One movie's subtitle files plus catalog metadata"""
+
+    title: str
+    en_file: PathLike
+    de_file: PathLike
+    year: Optional[int] = None
+    imdb_id: Optional[str] = None
+
+
+@dataclass
+class ProcessedMovie:
+    """Parsed, validated and aligned tracks ready to be written"""
+
+    en_cues: List[CompactCue]
+    de_cues: List[CompactCue]
+    aligned: List[Tuple]
+    alignment: Dict
+
+
+@dataclass
+class StagedMovie:
+    """A movie written in the current load, handed to post-load stages"""
+
+    movie_id: uuid.UUID
+    files: MovieFiles
+    processed: ProcessedMovie
+
+
+def default_stages() -> List:
+    """Post-load stages in run order; the word index only if CINEFLUENT_INDEX_DIR is set"""
+    stages = [VocabularyStage(), CatalogStage(), SceneStage(), PackStage()]
+    index_dir = os.getenv(INDEX_DIR_ENV)
+    if index_dir:
+        stages.append(WordIndexStage(index_dir))
+    return stages
+
+
+def _collect(cues: Iterable, sink: List) -> Iterator:
+    for cue in cues:
+        sink.append(cue)
+        yield cue
+
+
+def _check_cues(validator: SubtitleValidator, lang: str, cues: List):
+    result = validator.validate_cues(cues)
+    if not result["valid"]:
+        raise IngestionError(
+            f"{lang} subtitles invalid: {result.get('error') or result['issues'][:5]}"
+        )
+
+
+def process_subtitle_files(
+    en_file: PathLike,
+    de_file: PathLike,
+    processor: Optional[SubtitleProcessor] = None,
+    validator: Optional[SubtitleValidator] = None,
+) -> ProcessedMovie:
+    """Parse, clean, validate and align one EN/DE pair.
+
+    Has no database dependency so it can run in a worker process.
+    """
+    processor = processor or SubtitleProcessor()
+    validator = validator or SubtitleValidator()
+
+    en_cues = list(processor.stream_subtitle_file(en_file))
+    de_cues = list(processor.stream_subtitle_file(de_file))
+    _check_cues(validator, "en", en_cues)
+    _check_cues(validator, "de", de_cues)
+
+    de_cues, retiming = processor.retime(en_cues, de_cues)
+    aligned = processor.align_subtitles(en_cues, de_cues)
+    return ProcessedMovie(
+        en_cues, de_cues, aligned, validator.validate_alignment(aligned, retiming)
+    )
+
+
+class IngestionService:
+    """Runs the subtitle pipeline for a movie and persists the results"""
+
+    def __init__(
+        self,
+        db_manager: DatabaseManager,
+        processor: Optional[SubtitleProcessor] = None,
+        validator: Optional[SubtitleValidator] = None,
+        stages: Optional[List] = None,
+    ):
+        self.db = db_manager
+        self.processor = processor or SubtitleProcessor()
+        self.validator = validator or SubtitleValidator()
+        # Run in the load transaction once staged rows are in place
+        self.stages = default_stages() if stages is None else stages
+
+    def process_files(self, en_file: PathLike, de_file: PathLike) -> ProcessedMovie:
+        """Parse, validate and align both tracks without touching the database"""
+        return process_subtitle_files(en_file, de_file, self.processor, self.validator)
+
+    def _insert_movie(self, writer: BulkWriter, movie: MovieFiles) -> uuid.UUID:
+        movie_id = uuid.uuid4()
+        writer.conn.execute(
+            insert(Movie).values(
+                id=movie_id, title=movie.title, year=movie.year, imdb_id=movie.imdb_id
+            )
+        )
+        return movie_id
+
+    def _stage_movie(self, writer: BulkWriter, movie: MovieFiles) -> StagedMovie:
+        """Stream one movie's cues into the staging tables and stage its pairs"""
+        movie_id = self._insert_movie(writer, movie)
+
+        en_cues: List = []
+        try:
+            with writer.staging(movie_id):
+                en_stream = self.processor.stream_subtitle_file(movie.en_file)
+                writer.copy_subtitles(movie_id, "en", _collect(en_stream, en_cues))
+                _check_cues(self.validator, "en", en_cues)
+                # DE may be retimed onto the EN timeline, so it is read in full before it is stored
+                de_cues = list(self.processor.stream_subtitle_file(movie.de_file))
+                _check_cues(self.validator, "de", de_cues)
+
+                de_cues, retiming = self.processor.retime(en_cues, de_cues)
+                writer.copy_subtitles(movie_id, "de", de_cues)
+                aligned = self.processor.align_subtitles(en_cues, de_cues)
+                processed = ProcessedMovie(
+                    en_cues, de_cues, aligned, self.validator.validate_alignment(aligned, retiming)
+                )
+                writer.copy_pairs(movie_id, aligned)
+        except (IngestionError, ValueError, OSError):
+            writer.conn.execute(delete(Movie).where(Movie.id == movie_id))
+            raise
+        return StagedMovie(movie_id, movie, processed)
+
+    def _stage_processed(
+        self, writer: BulkWriter, movie: MovieFiles, processed: ProcessedMovie
+    ) -> StagedMovie:
+        """Stage a movie that was already parsed and aligned (e.g. by a worker)"""
+        movie_id = self._insert_movie(writer, movie)
+        writer.copy_subtitles(movie_id, "en", processed.en_cues)
+        writer.copy_subtitles(movie_id, "de", processed.de_cues)
+        writer.copy_pairs(movie_id, processed.aligned)
+        return StagedMovie(movie_id, movie, processed)
+
+    def _finish(self, conn, writer: BulkWriter, staged: List[StagedMovie], defer_indexes: bool):
+        with deferred_indexes(conn) if defer_indexes else nullcontext():
+            writer.finish()
+        if staged:
+            for stage in self.stages:
+                stage.run(conn, staged)
+
+    def _summary(self, staged: StagedMovie) -> Dict:
+        movie, processed = staged.files, staged.processed
+        alignment = processed.alignment
+        logger.info(
+            "Ingested %s: %d pairs (%s)", movie.title, len(processed.aligned), alignment["quality"]
+        )
+        retiming = alignment.get("retiming")
+        if retiming and retiming["applied"]:
+            logger.info(
+                "Retimed %s DE track: x%s %+.0f ms", movie.title, retiming["scale"], retiming["offset_ms"]
+            )
+        return {
+            "movie_id": str(staged.movie_id),
+            "title": movie.title,
+            "en_cues": len(processed.en_cues),
+            "de_cues": len(processed.de_cues),
+            "pairs": len(processed.aligned),
+            "alignment": alignment,
+        }
+
+    def _refresh(self, conn, staged: List[StagedMovie]):
+        """Bring post-load stages up to date for movies changed in place"""
+        for stage in self.stages:
+            if hasattr(stage, "refresh"):
+                stage.refresh(conn, staged)
+            else:
+                stage.run(conn, staged)
+
+    def delete_movies(self, conn, movie_ids: List[uuid.UUID]):
+        """Remove movies with their subtitles and pairs.
+
+        Deletes children explicitly so it does not rely on ON DELETE CASCADE
+        being enforced (SQLite leaves foreign keys off by default).
+        """
+        if not movie_ids:
+            return
+        for stage in self.stages:
+            if hasattr(stage, "delete"):
+                stage.delete(conn, movie_ids)
+        conn.execute(delete(Scene).where(Scene.movie_id.in_(movie_ids)))
+        conn.execute(delete(MovieVocab).where(MovieVocab.movie_id.in_(movie_ids)))
+        conn.execute(delete(SubtitlePair).where(SubtitlePair.movie_id.in_(movie_ids)))
+        conn.execute(delete(Subtitle).where(Subtitle.movie_id.in_(movie_ids)))
+        conn.execute(delete(Movie).where(Movie.id.in_(movie_ids)))
+
+    def ingest_processed(
+        self,
+        items: Iterable[Tuple[MovieFiles, ProcessedMovie]],
+        replace_ids: Optional[List[uuid.UUID]] = None,
+        defer_indexes: bool = False,
+    ) -> List[Dict]:
+        """Bulk-load movies parsed elsewhere, replacing replace_ids in the same transaction"""
+        with self.db.engine.begin() as conn:
+            self.delete_movies(conn, replace_ids or [])
+            writer = get_bulk_writer(conn)
+            writer.begin()
+            staged = [self._stage_processed(writer, movie, processed) for movie, processed in items]
+            self._finish(conn, writer, staged, defer_indexes)
+        if staged or replace_ids:
+            bump_content_generation()
+        return [self._summary(item) for item in staged]
+
+    def ingest_movies(
+        self, movies: Iterable[MovieFiles], defer_indexes: bool = False
+    ) -> List[Dict]:
+        """Bulk-load several movies in one transaction.
+
+        Cues are streamed from the parser into staging tables and moved into
+        subtitles/subtitle_pairs with set-based inserts once every movie is
+        staged. Movies that fail validation or cannot be read are skipped and
+        reported with an "error" key. With defer_indexes, secondary indexes are dropped for
+        the load and rebuilt once at the end.
+        """
+        outcomes = []
+        with self.db.engine.begin() as conn:
+            writer = get_bulk_writer(conn)
+            writer.begin()
+            for movie in movies:
+                try:
+                    outcomes.append(self._stage_movie(writer, movie))
+                except (IngestionError, ValueError, OSError) as e:
+                    logger.warning("Skipping %s: %s", movie.title, e)
+                    outcomes.append({"title": movie.title, "error": str(e)})
+
+            staged = [item for item in outcomes if isinstance(item, StagedMovie)]
+            self._finish(conn, writer, staged, defer_indexes)
+
+        if staged:
+            bump_content_generation()
+        logger.info("Text cleaner cache: %s", self.processor.cleaner.cache_info())
+        return [
+            self._summary(item) if isinstance(item, StagedMovie) else item for item in outcomes
+        ]
+
+    def update_track(self, movie_id: uuid.UUID, lang: str, path: PathLike) -> Dict:
+        """Replace one language track of a stored movie with a corrected file.
+
+        The new file is first retimed onto the stored track, then diffed
+        against it; only the changed cues and the pairs in the windows
+        around them are rewritten, so unchanged lines keep their subtitle
+        and pair ids (see cinefluent.track_update). Scenes and the offline
+        pack are rebuilt, the pack as a new version with deltas.
+        """
+        if lang not in ("en", "de"):
+            raise ValueError(f"Unsupported language: {lang}")
+        cues = list(self.processor.stream_subtitle_file(path))
+        _check_cues(self.validator, lang, cues)
+
+        with self.db.engine.begin() as conn:
+            movie = conn.execute(
+                select(Movie.title, Movie.year, Movie.imdb_id).where(Movie.id == movie_id)
+            ).first()
+            if movie is None:
+                raise IngestionError(f"No movie {movie_id}")
+            tracks = {track: load_track(conn, movie_id, track) for track in ("en", "de")}
+            # A file from another release is moved onto the stored timeline first
+            cues, retiming = self.processor.retime(tracks[lang].cues, cues)
+            plan = plan_update(
+                tracks, lang, cues, load_pairs(conn, movie_id), self.processor.align_subtitles
+            )
+
+            after = {**tracks, lang: plan.diff.track}
+            by_id = {
+                cue_id: cue
+                for track in after.values()
+                for cue_id, cue in zip(track.ids, track.cues)
+            }
+            aligned = [(by_id[en_id], by_id[de_id], score) for _, en_id, de_id, score in plan.pairs]
+            aligned.sort(key=lambda pair: (pair[0].start_ms, pair[1].start_ms))
+            processed = ProcessedMovie(
+                after["en"].cues,
+                after["de"].cues,
+                aligned,
+                self.validator.validate_alignment(aligned, retiming),
+            )
+            if plan.changed:
+                apply_update(conn, movie_id, lang, plan)
+                files = MovieFiles(
+                    movie.title,
+                    path if lang == "en" else "",
+                    path if lang == "de" else "",
+                    movie.year,
+                    movie.imdb_id,
+                )
+                self._refresh(conn, [StagedMovie(movie_id, files, processed)])
+
+        if plan.changed:
+            bump_content_generation()
+        diff = plan.diff
+        logger.info(
+            "Updated %s %s track: %d cues changed, %d of %d pairs rewritten",
+            movie.title,
+            lang,
+            len(diff.updated) + len(diff.inserted) + len(diff.deleted),
+            len(plan.inserted_pairs) + len(plan.deleted_pairs) + len(plan.rescored_pairs),
+            len(plan.pairs),
+        )
+        return {
+            "movie_id": str(movie_id),
+            "title": movie.title,
+            "lang": lang,
+            "cues": {
+                "kept": diff.kept,
+                "updated": len(diff.updated),
+                "inserted": len(diff.inserted),
+                "deleted": len(diff.deleted),
+            },
+            "pairs": {
+                "kept": plan.kept_pairs,
+                "rescored": len(plan.rescored_pairs),
+                "inserted": len(plan.inserted_pairs),
+                "deleted": len(plan.deleted_pairs),
+            },
+            "windows": len(plan.windows),
+            "realigned_cues": plan.realigned_cues,
+            "alignment": processed.alignment,
+        }
+
+    def ingest_movie(
+        self,
+        title: str,
+        en_file: PathLike,
+        de_file: PathLike,
+        year: Optional[int] = None,
+        imdb_id: Optional[str] = None,
+    ) -> Dict:
+        """Ingest one movie and return a summary of what was stored"""
+        result = self.ingest_movies([MovieFiles(title, en_file, de_file, year, imdb_id)])[0]
+        if "error" in result:
+            raise IngestionError(result["error"])
+        return result
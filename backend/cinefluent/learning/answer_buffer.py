@@ -0,0 +1,169 @@
+"""
+Write-behind buffer for quiz answers
+
+Quiz endpoints record which words a user just saw instead of writing
+user_vocab themselves. Events for the same (user, vocab) pair are
+coalesced in memory and flushed as one multi-row upsert every
+flush_interval seconds, or sooner once max_pending pairs are waiting.
+Closing the buffer flushes whatever is left, so a graceful shutdown loses
+nothing; a crash loses at most one interval of answers.
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple
+
+from ..metrics import Distribution, LatencyStats
+from .reviews import ReviewStore, SeenUpdate
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL = 0.25
+DEFAULT_MAX_PENDING = 500
+
+
+class AnswerBuffer:
+    """Coalescing write-behind buffer in front of ReviewStore.record_seen()"""
+
+    def __init__(
+        self,
+        store: ReviewStore,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        on_flush: Optional[Callable[[Set[uuid.UUID]], Awaitable[None]]] = None,
+    ):
+        self.store = store
+        # Called with the ids of users whose answers were just written
+        self.on_flush = on_flush
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: Dict[Tuple[uuid.UUID, uuid.UUID], SeenUpdate] = {}
+        # Monotonic time of the oldest unflushed event
+        self._oldest: Optional[float] = None
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+        self.events = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.flush_size = Distribution()
+        self.flush_lag = LatencyStats()
+        self.flush_time = LatencyStats()
+
+    def record(
+        self,
+        user_id: uuid.UUID,
+        vocab_ids: Iterable[uuid.UUID],
+        correct: bool,
+        seen_at: Optional[datetime] = None,
+    ):
+        """Queue one answer touching vocab_ids; never blocks on the database"""
+        seen_at = seen_at or datetime.utcnow()
+        for vocab_id in vocab_ids:
+            self.events += 1
+            key = (user_id, vocab_id)
+            update = self._pending.get(key)
+            if update is None:
+                self._pending[key] = SeenUpdate(user_id, vocab_id, 1, correct, seen_at, seen_at)
+                continue
+            update.seen += 1
+            # The most recent answer decides whether this batch counts towards mastery
+            if seen_at >= update.last_seen:
+                update.correct = correct
+                update.last_seen = seen_at
+            update.first_seen = min(update.first_seen, seen_at)
+
+        if self._pending and self._oldest is None:
+            self._oldest = time.monotonic()
+        if len(self._pending) >= self.max_pending:
+            self._wakeup.set()
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def flush(self) -> int:
+        """Write everything queued so far; returns the number of rows written"""
+        async with self._lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            oldest, self._oldest = self._oldest, None
+
+            started = time.monotonic()
+            try:
+                await self.store.record_seen(list(batch.values()))
+            except Exception:
+                self.failed_flushes += 1
+                # Put the batch back so the next flush retries it
+                for key, update in batch.items():
+                    newer = self._pending.get(key)
+                    if newer is not None:
+                        update.seen += newer.seen
+                        update.correct = newer.correct
+                        update.first_seen = min(update.first_seen, newer.first_seen)
+                        update.last_seen = max(update.last_seen, newer.last_seen)
+                    self._pending[key] = update
+                self._oldest = oldest
+                raise
+
+            finished = time.monotonic()
+            self.flushes += 1
+            self.flush_size.observe(len(batch))
+            self.flush_time.observe(finished - started)
+            if oldest is not None:
+                self.flush_lag.observe(finished - oldest)
+            if self.on_flush is not None:
+                try:
+                    await self.on_flush({user_id for user_id, _ in batch})
+                except Exception:
+                    logger.exception("Quiz answer flush listener failed")
+            return len(batch)
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Quiz answer flush failed; %d rows kept for retry", self.pending)
+
+    def start(self):
+        if self._task is None:
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Stop the flush loop and write out everything still queued.
+
+        The loop is asked to finish rather than cancelled, so a flush that
+        is already running completes instead of being cut off mid-write.
+        """
+        if self._task is not None:
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def metrics(self) -> Dict:
+        lag = (time.monotonic() - self._oldest) * 1000 if self._oldest is not None else 0.0
+        return {
+            "pending": self.pending,
+            "oldest_pending_ms": round(lag, 2),
+            "events": self.events,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "flush_size": self.flush_size.snapshot(),
+            "flush_lag": self.flush_lag.snapshot(),
+            "flush_time": self.flush_time.snapshot(),
+        }
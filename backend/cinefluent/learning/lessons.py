@@ -0,0 +1,66 @@
+"""
+Lesson bundles as stored bytes
+
+Lessons are built at ingest time (see cinefluent.scenes); serving one is a
+primary-key read of the compressed bundle and its ETag, with no decoding or
+model validation on the request path.
+"""
+
+import gzip
+import uuid
+from dataclasses import dataclass
+from typing import Optional
+
+from ..users.repository import PostgresUserRepository, SQLiteUserRepository, UserRepository
+
+
+@dataclass
+class LessonBundle:
+    body: bytes  # gzip-compressed JSON
+    etag: str  # strong ETag of body
+
+    @property
+    def identity_etag(self) -> str:
+        """ETag for the uncompressed representation"""
+        return self.etag[:-1] + '-identity"'
+
+    def decompressed(self) -> bytes:
+        return gzip.decompress(self.body)
+
+
+class LessonStore:
+    """Base class; dialect subclasses share the user repository's pool"""
+
+    async def get(self, lesson_id: uuid.UUID) -> Optional[LessonBundle]:
+        raise NotImplementedError
+
+
+class PostgresLessonStore(LessonStore):
+    def __init__(self, users: PostgresUserRepository):
+        self.users = users
+
+    async def get(self, lesson_id):
+        row = await self.users.pool.fetchrow("SELECT bundle, etag FROM scenes WHERE id = $1", lesson_id)
+        return LessonBundle(bytes(row[0]), row[1]) if row else None
+
+
+class SQLiteLessonStore(LessonStore):
+    def __init__(self, users: SQLiteUserRepository):
+        self.users = users
+
+    async def get(self, lesson_id):
+        row = await self.users.run(
+            lambda conn: conn.execute(
+                "SELECT bundle, etag FROM scenes WHERE id = ?", (lesson_id.hex,)
+            ).fetchone()
+        )
+        return LessonBundle(bytes(row[0]), row[1]) if row else None
+
+
+def create_lesson_store(users: UserRepository) -> LessonStore:
+    """Lesson store sharing the user repository's pool"""
+    if isinstance(users, PostgresUserRepository):
+        return PostgresLessonStore(users)
+    if isinstance(users, SQLiteUserRepository):
+        return SQLiteLessonStore(users)
+    raise ValueError(f"No lesson store for {users.dialect} repositories")
@@ -0,0 +1,342 @@
+"""
+Review queue over user_vocab
+
+The next due cards come from a range scan of idx_user_vocab_due
+(user_id, due_at) that stops after limit rows, so the cost does not depend
+on how many cards a user owns. Review batches are applied with one read of
+the touched cards and one upsert. The stores share the user repository's
+connection pool.
+"""
+
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+
+from ..users.repository import PostgresUserRepository, SQLiteUserRepository, UserRepository
+from .scheduler import CardState, review
+
+DEFAULT_DUE_LIMIT = 20
+MAX_DUE_LIMIT = 100
+MAX_REVIEW_BATCH = 500
+# A quiz answered correctly marks a word mastered once it has been seen this often
+MASTERED_SEEN_COUNT = 5
+# Rows per statement on SQLite, keeping bound parameters under its limit
+SQLITE_SEEN_CHUNK = 1000
+
+CARD_COLUMNS = "uv.stability, uv.difficulty, uv.reps, uv.lapses, uv.due_at, uv.last_review"
+
+DUE_SQL = """
+    SELECT uv.vocab_id, v.word, v.lang, {columns}
+    FROM user_vocab uv
+    JOIN vocab v ON v.id = uv.vocab_id
+    WHERE uv.user_id = {p1} AND uv.due_at <= {p2}
+    ORDER BY uv.due_at
+    LIMIT {p3}
+"""
+
+# mastered is sticky, as in SEEN_SQL: a lapse reschedules the card but keeps the flag
+UPSERT_SQL = """
+    INSERT INTO user_vocab (
+        id, user_id, vocab_id, seen_count, mastered, first_seen, last_seen,
+        stability, difficulty, reps, lapses, due_at, last_review
+    )
+    VALUES ({params})
+    ON CONFLICT (user_id, vocab_id) DO UPDATE SET
+        seen_count = user_vocab.seen_count + excluded.seen_count,
+        mastered = user_vocab.mastered OR excluded.mastered,
+        last_seen = excluded.last_seen,
+        stability = excluded.stability,
+        difficulty = excluded.difficulty,
+        reps = excluded.reps,
+        lapses = excluded.lapses,
+        due_at = excluded.due_at,
+        last_review = excluded.last_review
+"""
+
+
+# One statement per flush. The batch CTE is read a second time in DO UPDATE
+# because excluded only carries the inserted values, and mastery of an
+# existing row depends on whether this batch's answers were correct.
+# Rows for vocab or users that no longer exist are dropped by the joins.
+SEEN_SQL = """
+    WITH batch (user_id, vocab_id, seen, correct, first_seen, last_seen) AS ({batch})
+    INSERT INTO user_vocab (
+        id, user_id, vocab_id, seen_count, mastered, first_seen, last_seen,
+        stability, difficulty, reps, lapses, due_at
+    )
+    SELECT {new_id}, b.user_id, b.vocab_id, b.seen, b.correct AND b.seen >= {threshold},
+           b.first_seen, b.last_seen, 0, 0, 0, 0, b.first_seen
+    FROM batch b
+    JOIN vocab v ON v.id = b.vocab_id
+    JOIN users u ON u.id = b.user_id
+    WHERE TRUE
+    ON CONFLICT (user_id, vocab_id) DO UPDATE SET
+        seen_count = user_vocab.seen_count + excluded.seen_count,
+        last_seen = {greatest}(user_vocab.last_seen, excluded.last_seen),
+        mastered = user_vocab.mastered OR excluded.mastered OR (
+            user_vocab.seen_count + excluded.seen_count >= {threshold}
+            AND (
+                SELECT b.correct FROM batch b
+                WHERE b.user_id = excluded.user_id AND b.vocab_id = excluded.vocab_id
+            )
+        )
+"""
+
+PG_SEEN_SQL = SEEN_SQL.format(
+    batch="""
+        SELECT * FROM unnest(
+            $1::uuid[], $2::uuid[], $3::int[], $4::bool[], $5::timestamp[], $6::timestamp[]
+        )
+    """,
+    new_id="uuid_generate_v4()",
+    threshold=MASTERED_SEEN_COUNT,
+    greatest="GREATEST",
+)
+
+
+@dataclass
+class SeenUpdate:
+    """Coalesced quiz activity for one (user, vocab) pair"""
+
+    user_id: uuid.UUID
+    vocab_id: uuid.UUID
+    seen: int
+    correct: bool
+    first_seen: datetime
+    last_seen: datetime
+
+
+class UnknownVocabError(Exception):
+    """Raised when a review names vocab ids that do not exist"""
+
+
+@dataclass
+class DueCard:
+    vocab_id: uuid.UUID
+    word: str
+    lang: str
+    state: CardState
+
+
+@dataclass
+class ReviewItem:
+    vocab_id: uuid.UUID
+    rating: int
+    reviewed_at: Optional[datetime] = None
+
+
+@dataclass
+class ReviewResult:
+    """New card states of a batch, with the stored mastered flags after it"""
+
+    states: Dict[uuid.UUID, CardState]
+    mastered: Set[uuid.UUID]
+    newly_mastered: Set[uuid.UUID]
+
+
+class ReviewStore:
+    """Base class; dialect subclasses implement due(), _load() and _save()"""
+
+    async def due(self, user_id: uuid.UUID, now: datetime, limit: int) -> List[DueCard]:
+        raise NotImplementedError
+
+    async def _load(self, user_id: uuid.UUID, vocab_ids: Sequence[uuid.UUID]) -> Dict:
+        """vocab_id -> (CardState, stored mastered flag); None for cards the user has no row for yet"""
+        raise NotImplementedError
+
+    async def _save(self, user_id: uuid.UUID, rows: List[Dict]):
+        raise NotImplementedError
+
+    async def record_seen(self, updates: Sequence[SeenUpdate]):
+        """Apply coalesced quiz activity in one multi-row upsert"""
+        raise NotImplementedError
+
+    async def apply_reviews(
+        self, user_id: uuid.UUID, items: Iterable[ReviewItem], now: datetime
+    ) -> ReviewResult:
+        """Apply a batch of ratings in review order"""
+        items = sorted(items, key=lambda item: item.reviewed_at or now)
+        if len(items) > MAX_REVIEW_BATCH:
+            raise ValueError(f"At most {MAX_REVIEW_BATCH} reviews per batch")
+        if not items:
+            return ReviewResult({}, set(), set())
+
+        loaded = await self._load(user_id, list({item.vocab_id for item in items}))
+        missing = {item.vocab_id for item in items} - set(loaded)
+        if missing:
+            raise UnknownVocabError(sorted(str(vocab_id) for vocab_id in missing))
+
+        cards = {vocab_id: row[0] if row else CardState() for vocab_id, row in loaded.items()}
+        states: Dict[uuid.UUID, CardState] = {}
+        counts: Dict[uuid.UUID, int] = {}
+        for item in items:
+            current = states.get(item.vocab_id) or cards[item.vocab_id]
+            states[item.vocab_id] = review(current, item.rating, min(item.reviewed_at or now, now))
+            counts[item.vocab_id] = counts.get(item.vocab_id, 0) + 1
+
+        await self._save(
+            user_id,
+            [
+                {"vocab_id": vocab_id, "state": state, "seen": counts[vocab_id]}
+                for vocab_id, state in states.items()
+            ],
+        )
+        was_mastered = {vocab_id for vocab_id, row in loaded.items() if row and row[1]}
+        mastered = was_mastered | {vocab_id for vocab_id, state in states.items() if state.mastered}
+        return ReviewResult(states, mastered, mastered - was_mastered)
+
+
+class PostgresReviewStore(ReviewStore):
+    def __init__(self, users: PostgresUserRepository):
+        self.users = users
+
+    async def due(self, user_id, now, limit):
+        rows = await self.users.pool.fetch(
+            DUE_SQL.format(columns=CARD_COLUMNS, p1="$1", p2="$2", p3="$3"), user_id, now, limit
+        )
+        return [DueCard(row[0], row[1], row[2], CardState(*row[3:])) for row in rows]
+
+    async def _load(self, user_id, vocab_ids):
+        rows = await self.users.pool.fetch(
+            f"""
+            SELECT v.id, uv.id IS NOT NULL, uv.mastered, {CARD_COLUMNS}
+            FROM vocab v
+            LEFT JOIN user_vocab uv ON uv.vocab_id = v.id AND uv.user_id = $1
+            WHERE v.id = ANY($2::uuid[])
+            """,
+            user_id, vocab_ids,
+        )
+        return {row[0]: (CardState(*row[3:]), row[2]) if row[1] else None for row in rows}
+
+    async def _save(self, user_id, rows):
+        params = ", ".join(f"${i}" for i in range(1, 14))
+        async with self.users.pool.acquire() as conn:
+            await conn.executemany(
+                UPSERT_SQL.format(params=params),
+                [
+                    (
+                        uuid.uuid4(), user_id, row["vocab_id"], row["seen"], row["state"].mastered,
+                        row["state"].last_review, row["state"].last_review,
+                        row["state"].stability, row["state"].difficulty, row["state"].reps,
+                        row["state"].lapses, row["state"].due_at, row["state"].last_review,
+                    )
+                    for row in rows
+                ],
+            )
+
+    async def record_seen(self, updates):
+        if not updates:
+            return
+        await self.users.pool.execute(
+            PG_SEEN_SQL,
+            [u.user_id for u in updates],
+            [u.vocab_id for u in updates],
+            [u.seen for u in updates],
+            [u.correct for u in updates],
+            [u.first_seen for u in updates],
+            [u.last_seen for u in updates],
+        )
+
+
+def _sqlite_ts(value: Optional[datetime]) -> Optional[str]:
+    """SQLAlchemy's DateTime storage format, which sorts correctly as text"""
+    return value.strftime("%Y-%m-%d %H:%M:%S.%f") if value is not None else None
+
+
+def _sqlite_state(row: Sequence) -> CardState:
+    stability, difficulty, reps, lapses, due_at, last_review = row
+    return CardState(
+        stability,
+        difficulty,
+        reps,
+        lapses,
+        datetime.fromisoformat(due_at),
+        datetime.fromisoformat(last_review) if last_review else None,
+    )
+
+
+class SQLiteReviewStore(ReviewStore):
+    def __init__(self, users: SQLiteUserRepository):
+        self.users = users
+
+    async def due(self, user_id, now, limit):
+        sql = DUE_SQL.format(columns=CARD_COLUMNS, p1="?", p2="?", p3="?")
+        rows = await self.users.run(
+            lambda conn: conn.execute(sql, (user_id.hex, _sqlite_ts(now), limit)).fetchall()
+        )
+        return [
+            DueCard(uuid.UUID(row[0]), row[1], row[2], _sqlite_state(row[3:])) for row in rows
+        ]
+
+    async def _load(self, user_id, vocab_ids):
+        placeholders = ", ".join("?" for _ in vocab_ids)
+        sql = f"""
+            SELECT v.id, uv.id IS NOT NULL, uv.mastered, {CARD_COLUMNS}
+            FROM vocab v
+            LEFT JOIN user_vocab uv ON uv.vocab_id = v.id AND uv.user_id = ?
+            WHERE v.id IN ({placeholders})
+        """
+        rows = await self.users.run(
+            lambda conn: conn.execute(sql, [user_id.hex] + [v.hex for v in vocab_ids]).fetchall()
+        )
+        return {
+            uuid.UUID(row[0]): (_sqlite_state(row[3:]), bool(row[2])) if row[1] else None
+            for row in rows
+        }
+
+    async def _save(self, user_id, rows):
+        sql = UPSERT_SQL.format(params=", ".join("?" for _ in range(13)))
+        params = [
+            (
+                uuid.uuid4().hex, user_id.hex, row["vocab_id"].hex, row["seen"],
+                row["state"].mastered,
+                _sqlite_ts(row["state"].last_review), _sqlite_ts(row["state"].last_review),
+                row["state"].stability, row["state"].difficulty, row["state"].reps,
+                row["state"].lapses, _sqlite_ts(row["state"].due_at),
+                _sqlite_ts(row["state"].last_review),
+            )
+            for row in rows
+        ]
+
+        def save(conn):
+            with conn:
+                conn.executemany(sql, params)
+
+        await self.users.run(save)
+
+    async def record_seen(self, updates):
+        if not updates:
+            return
+        chunks = []
+        for start in range(0, len(updates), SQLITE_SEEN_CHUNK):
+            chunk = updates[start:start + SQLITE_SEEN_CHUNK]
+            sql = SEEN_SQL.format(
+                batch="VALUES " + ", ".join("(?, ?, ?, ?, ?, ?)" for _ in chunk),
+                new_id="lower(hex(randomblob(16)))",
+                threshold=MASTERED_SEEN_COUNT,
+                greatest="MAX",
+            )
+            params = []
+            for u in chunk:
+                params += [
+                    u.user_id.hex, u.vocab_id.hex, u.seen, u.correct,
+                    _sqlite_ts(u.first_seen), _sqlite_ts(u.last_seen),
+                ]
+            chunks.append((sql, params))
+
+        def save(conn):
+            with conn:
+                for sql, params in chunks:
+                    conn.execute(sql, params)
+
+        await self.users.run(save)
+
+
+def create_review_store(users: UserRepository) -> ReviewStore:
+    """Review store sharing the user repository's pool"""
+    if isinstance(users, PostgresUserRepository):
+        return PostgresReviewStore(users)
+    if isinstance(users, SQLiteUserRepository):
+        return SQLiteReviewStore(users)
+    raise ValueError(f"No review store for {users.dialect} repositories")
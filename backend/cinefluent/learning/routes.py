@@ -1,4 +1,268 @@
-# backend/cinefluent/learning/routes.py - Add these endpoints:
+"""
+Lessons, quizzes and spaced-repetition review
+"""
+
+import uuid
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from pydantic import BaseModel, Field
+
+from ..api.deps import (
+    cached_response,
+    get_activity_store,
+    get_answer_buffer,
+    get_current_user,
+    get_leaderboard,
+    get_lesson_store,
+    get_review_store,
+    utc_naive,
+)
+from ..gamification.activity import ActivityEvent, ActivityStore
+from ..gamification.leaderboard import LeaderboardService
+from ..response_cache import etag_matches
+from ..users.repository import UserRecord
+from .answer_buffer import AnswerBuffer
+from .lessons import LessonStore
+from .reviews import (
+    DEFAULT_DUE_LIMIT,
+    MAX_DUE_LIMIT,
+    MAX_REVIEW_BATCH,
+    ReviewItem,
+    ReviewStore,
+    UnknownVocabError,
+)
+
+router = APIRouter(prefix="/api/v1", tags=["learning"])
+
+
+class MovieProgress(BaseModel):
+    movie_id: str
+    movie_title: str
+    total_scenes: int
+    completed_scenes: int
+    progress_percentage: float
+    current_scene: int
+    estimated_time_remaining_minutes: int
+    difficulty_level: str
+
+
+class ContinueLearning(BaseModel):
+    has_active_session: bool
+    recommended_movie: Optional[MovieProgress]
+    recent_movies: list
+    new_movie_suggestions: list
+
+
+class ReviewAnswer(BaseModel):
+    vocab_id: uuid.UUID
+    rating: int = Field(ge=1, le=4)  # 1 again, 2 hard, 3 good, 4 easy
+    reviewed_at: Optional[datetime] = None
+
+
+class ReviewBatch(BaseModel):
+    reviews: List[ReviewAnswer] = Field(max_length=MAX_REVIEW_BATCH)
+
+
+class QuizAnswer(BaseModel):
+    question_id: str
+    answer: str
+    vocab_ids: List[uuid.UUID] = Field(default_factory=list, max_length=50)
+
+
+@router.get("/learning/continue", response_model=ContinueLearning)
+def get_continue_learning(current_user: UserRecord = Depends(get_current_user)):
+    recommended_movie = MovieProgress(
+        movie_id="1",
+        movie_title="Toy Story",
+        total_scenes=12,
+        completed_scenes=8,
+        progress_percentage=65.0,
+        current_scene=9,
+        estimated_time_remaining_minutes=15,
+        difficulty_level="beginner",
+    )
+    return ContinueLearning(
+        has_active_session=True,
+        recommended_movie=recommended_movie,
+        recent_movies=[],
+        new_movie_suggestions=[],
+    )
+
+
+@router.get("/lessons/{lesson_id}")
+async def get_lesson(
+    lesson_id: str,
+    request: Request,
+    current_user: UserRecord = Depends(get_current_user),
+    lessons: LessonStore = Depends(get_lesson_store),
+):
+    try:
+        bundle = await lessons.get(uuid.UUID(lesson_id))
+    except ValueError:
+        bundle = None
+    if bundle is None:
+        raise HTTPException(status_code=404, detail="Lesson not found")
+
+    # The bundle is stored gzip-compressed; only clients that cannot take gzip cost a decompress
+    gzip_ok = "gzip" in request.headers.get("accept-encoding", "")
+    etag = bundle.etag if gzip_ok else bundle.identity_etag
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Accept-Encoding"}
+    if etag_matches(etag, request.headers.get("if-none-match")):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if gzip_ok:
+        return Response(
+            bundle.body, media_type="application/json", headers={**headers, "Content-Encoding": "gzip"}
+        )
+    return Response(bundle.decompressed(), media_type="application/json", headers=headers)
+
+
+def quiz_payload(lesson_id: str):
+    return {
+        "quiz_id": f"quiz_{lesson_id}",
+        "lesson_id": lesson_id,
+        "questions": [
+            {
+                "id": "q1",
+                "question": "What does 'sheriff' mean in English?",
+                "type": "multiple_choice",
+                "options": ["Teacher", "Sheriff", "Doctor", "Friend"],
+                "correct_answer": "Sheriff",
+            },
+            {
+                "id": "q2",
+                "question": "How do you say 'Hello' in Spanish?",
+                "type": "multiple_choice",
+                "options": ["Adiós", "Hola", "Gracias", "Por favor"],
+                "correct_answer": "Hola",
+            },
+        ],
+    }
+
+
+def quiz_answer_key(lesson_id: str) -> dict:
+    return {q["id"]: q["correct_answer"] for q in quiz_payload(lesson_id)["questions"]}
+
+
 @router.get("/quiz/{lesson_id}")
+async def get_quiz(lesson_id: str, request: Request, current_user: UserRecord = Depends(get_current_user)):
+    return await cached_response(request, lambda: quiz_payload(lesson_id))
+
+
 @router.post("/quiz/{lesson_id}/answer")
-@router.get("/vocabulary/review")
\ No newline at end of file
+async def answer_question(
+    lesson_id: str,
+    answer: QuizAnswer,
+    current_user: UserRecord = Depends(get_current_user),
+    buffer: AnswerBuffer = Depends(get_answer_buffer),
+):
+    correct_answer = quiz_answer_key(lesson_id).get(answer.question_id)
+    if correct_answer is None:
+        raise HTTPException(status_code=404, detail="Unknown question")
+    correct = answer.answer == correct_answer
+    # user_vocab is updated by the buffer's next flush; record() must run on the event loop
+    buffer.record(current_user.id, answer.vocab_ids, correct)
+    return {
+        "question_id": answer.question_id,
+        "correct": correct,
+        "correct_answer": correct_answer,
+    }
+
+
+@router.post("/quiz/{lesson_id}/submit")
+async def submit_quiz(
+    lesson_id: str,
+    answers: dict,
+    current_user: UserRecord = Depends(get_current_user),
+    buffer: AnswerBuffer = Depends(get_answer_buffer),
+    activity: ActivityStore = Depends(get_activity_store),
+):
+    answer_key = quiz_answer_key(lesson_id)
+    # Check every entry before buffering any, so a rejected submission records nothing
+    graded = []
+    for answer in answers.get("answers", []):
+        correct_answer = answer_key.get(answer.get("question_id"))
+        if correct_answer is None:
+            raise HTTPException(status_code=404, detail="Unknown question")
+        try:
+            vocab_ids = [uuid.UUID(str(v)) for v in answer.get("vocab_ids", [])]
+        except ValueError:
+            raise HTTPException(status_code=422, detail="Invalid vocab id")
+        graded.append((answer.get("answer") == correct_answer, vocab_ids))
+
+    correct_answers = sum(correct for correct, _ in graded)
+    total_questions = len(graded)
+    for correct, vocab_ids in graded:
+        buffer.record(current_user.id, vocab_ids, correct)
+
+    score_percentage = (correct_answers / total_questions * 100) if total_questions > 0 else 0
+    # Which words are new to the user is only known once the buffer flushes into
+    # user_vocab, so a submission logs the lesson and nothing else
+    await activity.append(current_user.id, [ActivityEvent("lesson_completed", 1, datetime.utcnow())])
+
+    return {
+        "lesson_id": lesson_id,
+        "score_percentage": score_percentage,
+        "correct_answers": correct_answers,
+        "total_questions": total_questions,
+        "passed": score_percentage >= 70,
+        "xp_earned": correct_answers * 10,
+    }
+
+
+@router.get("/vocabulary/review")
+async def get_due_reviews(
+    limit: int = Query(DEFAULT_DUE_LIMIT, ge=1, le=MAX_DUE_LIMIT),
+    current_user: UserRecord = Depends(get_current_user),
+    reviews: ReviewStore = Depends(get_review_store),
+):
+    cards = await reviews.due(current_user.id, datetime.utcnow(), limit)
+    return {
+        "count": len(cards),
+        "cards": [
+            {
+                "vocab_id": str(card.vocab_id),
+                "word": card.word,
+                "lang": card.lang,
+                "due_at": card.state.due_at.isoformat(),
+                "stability": round(card.state.stability, 2),
+                "difficulty": round(card.state.difficulty, 2),
+                "reps": card.state.reps,
+            }
+            for card in cards
+        ],
+    }
+
+
+@router.post("/vocabulary/review")
+async def submit_reviews(
+    batch: ReviewBatch,
+    current_user: UserRecord = Depends(get_current_user),
+    reviews: ReviewStore = Depends(get_review_store),
+    leaderboard: LeaderboardService = Depends(get_leaderboard),
+):
+    items = [
+        ReviewItem(answer.vocab_id, answer.rating, utc_naive(answer.reviewed_at))
+        for answer in batch.reviews
+    ]
+    try:
+        result = await reviews.apply_reviews(current_user.id, items, datetime.utcnow())
+    except UnknownVocabError as e:
+        raise HTTPException(status_code=404, detail={"unknown_vocab_ids": e.args[0]})
+    # Only a card that just became mastered moves the user on the leaderboard
+    if result.newly_mastered:
+        await leaderboard.refresh([current_user.id])
+    return {
+        "reviewed": len(items),
+        "cards": [
+            {
+                "vocab_id": str(vocab_id),
+                "due_at": state.due_at.isoformat(),
+                "stability": round(state.stability, 2),
+                "difficulty": round(state.difficulty, 2),
+                "mastered": vocab_id in result.mastered,
+            }
+            for vocab_id, state in result.states.items()
+        ],
+    }
@@ -0,0 +1,128 @@
+"""
+FSRS-style spaced-repetition scheduler
+
+Each card carries a stability (days until recall probability falls to the
+target retention) and a difficulty in [1, 10]. A review rating updates
+both using the FSRS-4.5 model with its published default weights; the
+next due time is the interval at which recall is predicted to drop to
+DESIRED_RETENTION.
+"""
+
+import math
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta
+from typing import Optional
+
+AGAIN, HARD, GOOD, EASY = 1, 2, 3, 4
+RATINGS = (AGAIN, HARD, GOOD, EASY)
+
+WEIGHTS = (
+    0.4872, 1.4003, 3.7145, 13.8206, 5.1618, 1.2298, 0.8975, 0.031, 1.6474,
+    0.1367, 1.0461, 2.1072, 0.0793, 0.3246, 1.587, 0.2272, 2.8755,
+)
+DECAY = -0.5
+FACTOR = 19 / 81  # makes R(S, S) == 0.9
+DESIRED_RETENTION = 0.9
+MAX_INTERVAL_DAYS = 36500
+# A card whose next interval reaches three weeks counts as mastered
+MASTERED_STABILITY = 21.0
+# Failed cards come back within the same session
+RELEARN_DELAY = timedelta(minutes=10)
+
+
+@dataclass(frozen=True)
+class CardState:
+    """Scheduler state of one user_vocab row"""
+
+    stability: float = 0.0
+    difficulty: float = 0.0
+    reps: int = 0
+    lapses: int = 0
+    due_at: Optional[datetime] = None
+    last_review: Optional[datetime] = None
+
+    @property
+    def mastered(self) -> bool:
+        return self.stability >= MASTERED_STABILITY
+
+
+def retrievability(elapsed_days: float, stability: float) -> float:
+    """Predicted recall probability after elapsed_days"""
+    if stability <= 0:
+        return 0.0
+    return (1 + FACTOR * elapsed_days / stability) ** DECAY
+
+
+def next_interval(stability: float, retention: float = DESIRED_RETENTION) -> float:
+    """Days until recall probability drops to retention"""
+    days = stability / FACTOR * (retention ** (1 / DECAY) - 1)
+    return min(max(days, 1.0), MAX_INTERVAL_DAYS)
+
+
+def _clamp_difficulty(d: float) -> float:
+    return min(max(d, 1.0), 10.0)
+
+
+def _initial_difficulty(rating: int) -> float:
+    w = WEIGHTS
+    return w[4] - w[5] * (rating - 3)
+
+
+def _next_difficulty(d: float, rating: int) -> float:
+    w = WEIGHTS
+    d = d - w[6] * (rating - 3)
+    # Mean reversion towards the difficulty of an "easy" first review
+    return _clamp_difficulty(w[7] * _initial_difficulty(EASY) + (1 - w[7]) * d)
+
+
+def _recall_stability(d: float, s: float, r: float, rating: int) -> float:
+    w = WEIGHTS
+    hard_penalty = w[15] if rating == HARD else 1.0
+    easy_bonus = w[16] if rating == EASY else 1.0
+    growth = (
+        math.exp(w[8]) * (11 - d) * s ** -w[9] * (math.exp(w[10] * (1 - r)) - 1)
+    )
+    return s * (growth * hard_penalty * easy_bonus + 1)
+
+
+def _forget_stability(d: float, s: float, r: float) -> float:
+    w = WEIGHTS
+    new_s = w[11] * d ** -w[12] * ((s + 1) ** w[13] - 1) * math.exp(w[14] * (1 - r))
+    return min(new_s, s)
+
+
+def review(card: CardState, rating: int, now: datetime) -> CardState:
+    """Apply one rating (AGAIN..EASY) and schedule the next review"""
+    if rating not in RATINGS:
+        raise ValueError(f"rating must be one of {RATINGS}, got {rating!r}")
+
+    if card.reps == 0 or card.stability <= 0:
+        stability = WEIGHTS[rating - 1]
+        difficulty = _clamp_difficulty(_initial_difficulty(rating))
+        lapses = card.lapses + (rating == AGAIN)
+    else:
+        last = card.last_review or now
+        elapsed = max((now - last).total_seconds() / 86400, 0.0)
+        r = retrievability(elapsed, card.stability)
+        difficulty = _next_difficulty(card.difficulty, rating)
+        if rating == AGAIN:
+            stability = _forget_stability(card.difficulty, card.stability, r)
+            lapses = card.lapses + 1
+        else:
+            stability = _recall_stability(card.difficulty, card.stability, r, rating)
+            lapses = card.lapses
+
+    if rating == AGAIN:
+        due_at = now + RELEARN_DELAY
+    else:
+        due_at = now + timedelta(days=round(next_interval(stability)))
+
+    return replace(
+        card,
+        stability=stability,
+        difficulty=difficulty,
+        reps=card.reps + 1,
+        lapses=lapses,
+        due_at=due_at,
+        last_review=now,
+    )
@@ -0,0 +1,79 @@
+"""
+Non-blocking logging
+
+Log records are put on a bounded in-memory queue by a QueueHandler on the
+root logger and written out by a QueueListener thread, so a slow stderr or
+log collector never stalls the event loop. When the queue is full, records
+are dropped and counted rather than blocking the caller.
+"""
+
+import logging
+import logging.handlers
+import os
+import queue
+from typing import List, Optional
+
+LEVEL_ENV = "CINEFLUENT_LOG_LEVEL"
+DEFAULT_QUEUE_SIZE = 10000
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class QueueLogging:
+    """Route the root logger through a queue while started.
+
+    Handlers already on the root logger (e.g. uvicorn's or pytest's) move
+    behind the queue; with none, records go to stderr.
+    """
+
+    def __init__(self, level: Optional[str] = None, max_size: int = DEFAULT_QUEUE_SIZE):
+        self.level = (level or os.getenv(LEVEL_ENV, "INFO")).upper()
+        self.handler = DroppingQueueHandler(queue.Queue(max_size))
+        self.listener: Optional[logging.handlers.QueueListener] = None
+        self._previous: List[logging.Handler] = []
+        self._previous_level = logging.NOTSET
+
+    @property
+    def dropped(self) -> int:
+        return self.handler.dropped
+
+    def start(self):
+        root = logging.getLogger()
+        self._previous = list(root.handlers)
+        self._previous_level = root.level
+        targets = self._previous
+        if not targets:
+            stream = logging.StreamHandler()
+            stream.setFormatter(logging.Formatter(LOG_FORMAT))
+            targets = [stream]
+        self.listener = logging.handlers.QueueListener(
+            self.handler.queue, *targets, respect_handler_level=True
+        )
+        for handler in self._previous:
+            root.removeHandler(handler)
+        root.addHandler(self.handler)
+        root.setLevel(self.level)
+        self.listener.start()
+
+    def stop(self):
+        """Drain the queue and put the original handlers back"""
+        if self.listener is None:
+            return
+        root = logging.getLogger()
+        root.removeHandler(self.handler)
+        for handler in self._previous:
+            root.addHandler(handler)
+        root.setLevel(self._previous_level)
+        self.listener.stop()
+        self.listener = None
@@ -0,0 +1,291 @@
+"""
+In-process metric summaries and Prometheus exposition
+
+Distribution and LatencyStats back the JSON summaries on /health. The
+registry below holds cumulative counters, gauges and fixed-bucket
+histograms that /metrics renders in the Prometheus text format, so a
+scraper can aggregate them across workers and over time. Recording is a
+lock and a bisect: cheap enough for every request and every hot call.
+
+    with timer("jwt_decode"):
+        payload = jwt.decode(...)
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Recent samples kept for percentiles
+SAMPLE_WINDOW = 1024
+
+NAMESPACE = "cinefluent"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; spans a cached lookup through a bcrypt hash at production cost
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Distribution:
+    """Count, mean, max and recent percentiles of an observed value"""
+
+    suffix = ""
+
+    def __init__(self, window: int = SAMPLE_WINDOW):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.count += 1
+            self.total += value
+            self.max = max(self.max, value)
+            self.samples.append(value)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            ordered = sorted(self.samples)
+            count, total, peak = self.count, self.total, self.max
+
+        def pct(p):
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 2) if ordered else 0.0
+
+        suffix = self.suffix
+        return {
+            "count": count,
+            "mean" + suffix: round(total / count, 2) if count else 0.0,
+            "p50" + suffix: pct(0.50),
+            "p95" + suffix: pct(0.95),
+            "max" + suffix: round(peak, 2),
+        }
+
+
+class LatencyStats(Distribution):
+    """Distribution of durations, observed in seconds and reported in milliseconds"""
+
+    suffix = "_ms"
+
+    def observe(self, seconds: float):
+        super().observe(seconds * 1000)
+
+
+def _format_labels(labels: Labels, extra: Labels = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    escaped = (
+        '{}="{}"'.format(
+            key, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        )
+        for key, value in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count"""
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+class Gauge:
+    """Value that goes up and down, e.g. requests in flight"""
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    def set(self, value: float):
+        with self._lock:
+            self.value = value
+
+
+class Histogram:
+    """Cumulative fixed-bucket histogram, as Prometheus expects"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        # One slot per bound plus the +Inf overflow
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """(upper bound, observations at or below it), ending with +Inf"""
+        with self._lock:
+            counts = list(self.counts)
+        running, result = 0, []
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            running += count
+            result.append((bound, running))
+        return result
+
+
+@dataclass
+class Sample:
+    labels: Dict[str, str]
+    value: float
+
+
+@dataclass
+class MetricFamily:
+    """A metric computed at scrape time by a collector"""
+
+    name: str
+    type: str  # "counter" or "gauge"
+    help: str
+    samples: List[Sample] = field(default_factory=list)
+
+    def add(self, value: float, **labels: str) -> "MetricFamily":
+        self.samples.append(Sample(labels, value))
+        return self
+
+
+Collector = Callable[[], Iterable[MetricFamily]]
+
+
+class MetricsRegistry:
+    """Named metric families, each holding one child per label set.
+
+    Children are created on first use and kept for the life of the
+    process, so label values must come from a small fixed set (route
+    templates, status codes, timer names), never from user input.
+    """
+
+    def __init__(self, namespace: str = NAMESPACE):
+        self.namespace = namespace
+        self._families: Dict[str, Tuple[str, str, Callable[[], object], Dict[Labels, object]]] = {}
+        self._collectors: Dict[str, Collector] = {}
+        self._lock = threading.Lock()
+
+    def _child(self, kind: str, name: str, help_text: str, factory, labels: Dict[str, str]):
+        key: Labels = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        family = self._families.get(name)
+        if family is None:
+            with self._lock:
+                family = self._families.setdefault(name, (kind, help_text, factory, {}))
+        if family[0] != kind:
+            raise ValueError(f"{name} is already registered as a {family[0]}")
+        children = family[3]
+        child = children.get(key)
+        if child is None:
+            with self._lock:
+                child = children.setdefault(key, family[2]())
+        return child
+
+    def counter(self, name: str, help_text: str = "", **labels: str) -> Counter:
+        return self._child("counter", name, help_text, Counter, labels)
+
+    def gauge(self, name: str, help_text: str = "", **labels: str) -> Gauge:
+        return self._child("gauge", name, help_text, Gauge, labels)
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str = "",
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        **labels: str,
+    ) -> Histogram:
+        return self._child("histogram", name, help_text, lambda: Histogram(buckets), labels)
+
+    def timer(self, name: str) -> Histogram:
+        """Histogram of how long the named internal operation takes, in seconds"""
+        return self.histogram(
+            "operation_duration_seconds", "Time spent in named internal operations", operation=name
+        )
+
+    def register_collector(self, name: str, collector: Collector):
+        """Add (or replace) a callable producing metrics at scrape time"""
+        with self._lock:
+            self._collectors[name] = collector
+
+    def unregister_collector(self, name: str):
+        with self._lock:
+            self._collectors.pop(name, None)
+
+    def render(self) -> str:
+        """Everything in the Prometheus text exposition format (0.0.4)"""
+        lines: List[str] = []
+        with self._lock:
+            families = sorted(self._families.items())
+            collectors = list(self._collectors.values())
+
+        for name, (kind, help_text, _, children) in families:
+            full = f"{self.namespace}_{name}"
+            lines.append(f"# HELP {full} {help_text}")
+            lines.append(f"# TYPE {full} {kind}")
+            for labels, child in sorted(children.items()):
+                if kind == "histogram":
+                    for bound, count in child.cumulative():
+                        le = (("le", _format_value(bound)),)
+                        lines.append(f"{full}_bucket{_format_labels(labels, le)} {count}")
+                    lines.append(f"{full}_sum{_format_labels(labels)} {_format_value(child.sum)}")
+                    lines.append(f"{full}_count{_format_labels(labels)} {child.count}")
+                else:
+                    lines.append(f"{full}{_format_labels(labels)} {_format_value(child.value)}")
+
+        for collector in collectors:
+            for family in collector():
+                full = f"{self.namespace}_{family.name}"
+                lines.append(f"# HELP {full} {family.help}")
+                lines.append(f"# TYPE {full} {family.type}")
+                for sample in family.samples:
+                    labels = tuple(sorted(sample.labels.items()))
+                    lines.append(f"{full}{_format_labels(labels)} {_format_value(sample.value)}")
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide, like the logging module: instrumented code needs no plumbing
+REGISTRY = MetricsRegistry()
+
+
+@contextmanager
+def timer(name: str, registry: Optional[MetricsRegistry] = None) -> Iterator[None]:
+    """Time the block into the named operation histogram"""
+    with (registry or REGISTRY).timer(name).time():
+        yield
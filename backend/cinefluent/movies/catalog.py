@@ -0,0 +1,352 @@
+"""
+Movie catalog: keyset pages, filters and typo-tolerant title search
+
+Browsing walks movies in (title_key, id) order and hands out an opaque
+cursor holding the last row's key, so every page is one index range scan
+no matter how deep the client scrolls. Search ranks titles by trigram word
+similarity, which forgives typos ("findng nemo"), and pages on (score, id):
+
+  - PostgreSQL uses pg_trgm's word_similarity and the GIN trigram index on
+    movies.title_key;
+  - SQLite keeps an in-process TrigramIndex of all titles, rebuilt when the
+    movies table changes.
+
+The requesting user's progress (scene count and how much of the movie's
+vocabulary they have seen) comes from correlated subqueries in the page
+query itself, so it is only computed for the rows being returned.
+"""
+
+import base64
+import binascii
+import json
+import threading
+import time
+import unicodedata
+import uuid
+from collections import Counter
+from dataclasses import asdict, dataclass
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+from ..users.repository import PostgresUserRepository, SQLiteUserRepository, UserRepository
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 50
+MAX_QUERY_LENGTH = 100
+DIFFICULTIES = ("beginner", "intermediate", "advanced")
+# Share of the query's trigrams a title must contain (pg_trgm's default word_similarity_threshold)
+MIN_SIMILARITY = 0.6
+# How often the SQLite index checks whether the movies table changed
+INDEX_CHECK_INTERVAL = 5.0
+
+
+class InvalidCursorError(ValueError):
+    """Raised for a cursor that was not issued by this catalog"""
+
+
+def title_key(title: str) -> str:
+    """Title folded for sorting and matching: no accents, no case, no punctuation"""
+    decomposed = unicodedata.normalize("NFKD", title or "")
+    letters = "".join(
+        ch if ch.isalnum() else " " for ch in decomposed if not unicodedata.combining(ch)
+    )
+    return " ".join(letters.casefold().split())
+
+
+def trigrams(text: str) -> FrozenSet[str]:
+    """pg_trgm-style trigrams of each word, padded with two spaces in front and one behind"""
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+@dataclass
+class CatalogEntry:
+    id: uuid.UUID
+    title: str
+    year: Optional[int]
+    language: str
+    difficulty: Optional[str]
+    scene_count: int
+    vocab_size: int
+    words_known: int
+
+    @property
+    def progress(self) -> int:
+        """Percentage of the movie's vocabulary the user has met"""
+        return round(100 * self.words_known / self.vocab_size) if self.vocab_size else 0
+
+    def as_dict(self) -> Dict:
+        data = asdict(self)
+        data["id"] = str(self.id)
+        data["progress"] = self.progress
+        return data
+
+
+@dataclass
+class CatalogPage:
+    entries: List[CatalogEntry]
+    next_cursor: Optional[str]
+
+
+def encode_cursor(kind: str, key, movie_id: uuid.UUID) -> str:
+    raw = json.dumps([kind, key, movie_id.hex], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, kind: str) -> Tuple[object, uuid.UUID]:
+    """(key, movie id) of a cursor issued for the same kind of listing"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        found, key, movie_hex = json.loads(raw)
+        movie_id = uuid.UUID(hex=movie_hex)
+    except (binascii.Error, ValueError, TypeError):
+        raise InvalidCursorError(cursor)
+    if found != kind:
+        raise InvalidCursorError(cursor)
+    if kind == "search" and not isinstance(key, (int, float)):
+        raise InvalidCursorError(cursor)
+    if kind == "browse" and not isinstance(key, str):
+        raise InvalidCursorError(cursor)
+    return key, movie_id
+
+
+class TrigramIndex:
+    """In-memory trigram postings over movie titles, for databases without pg_trgm"""
+
+    def __init__(self, rows: Sequence[Tuple[uuid.UUID, str, str, Optional[str]]] = ()):
+        # movie id -> (language, difficulty)
+        self.movies: Dict[uuid.UUID, Tuple[str, Optional[str]]] = {}
+        self.postings: Dict[str, List[uuid.UUID]] = {}
+        for movie_id, key, language, difficulty in rows:
+            self.movies[movie_id] = (language, difficulty)
+            for gram in trigrams(key):
+                self.postings.setdefault(gram, []).append(movie_id)
+
+    def search(
+        self,
+        query: str,
+        language: Optional[str] = None,
+        difficulty: Optional[str] = None,
+        min_similarity: float = MIN_SIMILARITY,
+    ) -> List[Tuple[float, uuid.UUID]]:
+        """(score, id) of matching movies, best first, then by id"""
+        grams = trigrams(title_key(query))
+        if not grams:
+            return []
+        hits: Counter = Counter()
+        for gram in grams:
+            hits.update(self.postings.get(gram, ()))
+        matches = []
+        for movie_id, count in hits.items():
+            score = count / len(grams)
+            if score < min_similarity:
+                continue
+            movie_language, movie_difficulty = self.movies[movie_id]
+            if language is not None and movie_language != language:
+                continue
+            if difficulty is not None and movie_difficulty != difficulty:
+                continue
+            matches.append((round(score, 6), movie_id))
+        matches.sort(key=lambda match: (-match[0], match[1].hex))
+        return matches
+
+
+class MovieCatalog:
+    """Base class; one instance per process, sharing the user repository's pool"""
+
+    async def page(
+        self,
+        user_id: uuid.UUID,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        language: Optional[str] = None,
+        difficulty: Optional[str] = None,
+        query: Optional[str] = None,
+    ) -> CatalogPage:
+        """One page of the catalog; with query, search results instead of title order"""
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        query = title_key(query or "")[:MAX_QUERY_LENGTH]
+        if query:
+            after = decode_cursor(cursor, "search") if cursor else None
+            rows = await self._search(user_id, query, limit + 1, after, language, difficulty)
+            return self._paginate(rows, limit, "search")
+        after = decode_cursor(cursor, "browse") if cursor else None
+        rows = await self._browse(user_id, limit + 1, after, language, difficulty)
+        return self._paginate(rows, limit, "browse")
+
+    @staticmethod
+    def _paginate(rows: List[Tuple], limit: int, kind: str) -> CatalogPage:
+        # rows are (sort key, entry); one extra row says whether there is a next page
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            key, last = rows[-1]
+            next_cursor = encode_cursor(kind, key, last.id)
+        return CatalogPage([entry for _, entry in rows], next_cursor)
+
+    async def _browse(self, user_id, limit, after, language, difficulty) -> List[Tuple]:
+        raise NotImplementedError
+
+    async def _search(self, user_id, query, limit, after, language, difficulty) -> List[Tuple]:
+        raise NotImplementedError
+
+
+# Correlated subqueries run only for the rows that survive LIMIT
+ENTRY_COLUMNS = """
+    m.id, m.title, m.year, m.language, m.difficulty,
+    (SELECT COUNT(*) FROM scenes s WHERE s.movie_id = m.id),
+    m.vocab_size,
+    (SELECT COUNT(*) FROM movie_vocab mv
+       JOIN user_vocab uv ON uv.vocab_id = mv.vocab_id AND uv.user_id = {user}
+      WHERE mv.movie_id = m.id AND mv.lang = m.language)
+"""
+
+
+def _filters(language, difficulty, param) -> Tuple[List[str], List]:
+    clauses, args = [], []
+    if language is not None:
+        args.append(language)
+        clauses.append(f"m.language = {param(len(args))}")
+    if difficulty is not None:
+        args.append(difficulty)
+        clauses.append(f"m.difficulty = {param(len(args))}")
+    return clauses, args
+
+
+class PostgresMovieCatalog(MovieCatalog):
+    def __init__(self, users: PostgresUserRepository):
+        self.users = users
+
+    @staticmethod
+    def _entry(row) -> CatalogEntry:
+        return CatalogEntry(*row[:8])
+
+    async def _browse(self, user_id, limit, after, language, difficulty):
+        clauses, args = _filters(language, difficulty, lambda n: f"${n + 1}")
+        args = [user_id] + args
+        if after is not None:
+            args += [after[0], after[1]]
+            clauses.append(f"(m.title_key, m.id) > (${len(args) - 1}, ${len(args)})")
+        args.append(limit)
+        where = "WHERE " + " AND ".join(clauses) if clauses else ""
+        rows = await self.users.pool.fetch(
+            f"""
+            SELECT {ENTRY_COLUMNS.format(user="$1")}, m.title_key
+            FROM movies m {where}
+            ORDER BY m.title_key, m.id
+            LIMIT ${len(args)}
+            """,
+            *args,
+        )
+        return [(row[8], self._entry(row)) for row in rows]
+
+    async def _search(self, user_id, query, limit, after, language, difficulty):
+        clauses, args = _filters(language, difficulty, lambda n: f"${n + 2}")
+        args = [user_id, query] + args
+        # <% is the GIN-indexable form of word_similarity(query, title_key) >= threshold
+        clauses.insert(0, "$2 <% m.title_key")
+        score = "word_similarity($2, m.title_key)::float8"
+        if after is not None:
+            args += [after[0], after[1]]
+            a, b = len(args) - 1, len(args)
+            clauses.append(f"({score} < ${a} OR ({score} = ${a} AND m.id > ${b}))")
+        args.append(limit)
+        rows = await self.users.pool.fetch(
+            f"""
+            SELECT {ENTRY_COLUMNS.format(user="$1")}, {score} AS score
+            FROM movies m
+            WHERE {" AND ".join(clauses)}
+            ORDER BY score DESC, m.id
+            LIMIT ${len(args)}
+            """,
+            *args,
+        )
+        return [(row[8], self._entry(row)) for row in rows]
+
+
+class SQLiteMovieCatalog(MovieCatalog):
+    def __init__(self, users: SQLiteUserRepository, check_interval: float = INDEX_CHECK_INTERVAL):
+        self.users = users
+        self.check_interval = check_interval
+        self._index: Optional[TrigramIndex] = None
+        self._signature = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _entry(row) -> CatalogEntry:
+        values = list(row[:8])
+        values[0] = uuid.UUID(values[0])
+        return CatalogEntry(*values)
+
+    def _current_index(self, conn) -> TrigramIndex:
+        """The title index, rebuilt if the movies table changed since it was built"""
+        with self._lock:
+            now = time.monotonic()
+            if self._index is not None and now - self._checked_at < self.check_interval:
+                return self._index
+            signature = conn.execute("SELECT COUNT(*), MAX(created_at) FROM movies").fetchone()
+            if self._index is None or signature != self._signature:
+                rows = conn.execute(
+                    "SELECT id, title_key, language, difficulty FROM movies"
+                ).fetchall()
+                self._index = TrigramIndex(
+                    [(uuid.UUID(row[0]), row[1], row[2], row[3]) for row in rows]
+                )
+                self._signature = signature
+            self._checked_at = now
+            return self._index
+
+    async def _browse(self, user_id, limit, after, language, difficulty):
+        clauses, args = _filters(language, difficulty, lambda n: "?")
+        if after is not None:
+            args += [after[0], after[1].hex]
+            clauses.append("(m.title_key, m.id) > (?, ?)")
+        where = "WHERE " + " AND ".join(clauses) if clauses else ""
+        sql = f"""
+            SELECT {ENTRY_COLUMNS.format(user="?")}, m.title_key
+            FROM movies m {where}
+            ORDER BY m.title_key, m.id
+            LIMIT ?
+        """
+        rows = await self.users.run(
+            lambda conn: conn.execute(sql, [user_id.hex] + args + [limit]).fetchall()
+        )
+        return [(row[8], self._entry(row)) for row in rows]
+
+    async def _search(self, user_id, query, limit, after, language, difficulty):
+        def search(conn):
+            matches = self._current_index(conn).search(query, language, difficulty)
+            if after is not None:
+                score, movie_id = after
+                matches = [
+                    m for m in matches
+                    if m[0] < score or (m[0] == score and m[1].hex > movie_id.hex)
+                ]
+            matches = matches[:limit]
+            if not matches:
+                return []
+            marks = ", ".join("?" * len(matches))
+            rows = conn.execute(
+                f"SELECT {ENTRY_COLUMNS.format(user='?')} FROM movies m WHERE m.id IN ({marks})",
+                [user_id.hex] + [movie_id.hex for _, movie_id in matches],
+            ).fetchall()
+            by_id = {row[0]: row for row in rows}
+            # A movie deleted since the index was built has no row
+            return [
+                (score, self._entry(by_id[movie_id.hex]))
+                for score, movie_id in matches
+                if movie_id.hex in by_id
+            ]
+
+        return await self.users.run(search)
+
+
+def create_movie_catalog(users: UserRepository) -> MovieCatalog:
+    if isinstance(users, PostgresUserRepository):
+        return PostgresMovieCatalog(users)
+    if isinstance(users, SQLiteUserRepository):
+        return SQLiteMovieCatalog(users)
+    raise ValueError(f"No movie catalog for {type(users).__name__}")
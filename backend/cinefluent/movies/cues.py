@@ -0,0 +1,203 @@
+"""
+Playback-window cue queries
+
+The player asks for the aligned EN/DE pairs overlapping the current
+playback window as it plays, scrubs and seeks. Each movie's pairs are
+loaded once into a CueIndex, an interval index over sorted start times
+with a running maximum of end times, so a window is two bisects and a
+short scan. Every cue is encoded to JSON when the index is built; a
+window response is a join of stored fragments.
+
+Indexes are built lazily on first request, one load per movie however
+many requests arrive at once, and kept in an LRU of max_movies. They are
+dropped when the content generation changes (see
+cinefluent.response_cache) and otherwise age out after ttl seconds.
+Unknown movie ids are not cached, so requests for made-up ids cannot push
+real indexes out of the LRU.
+"""
+
+import asyncio
+import time
+import uuid
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from ..response_cache import encode_json
+from ..users.repository import PostgresUserRepository, SQLiteUserRepository, UserRepository
+
+MICROSECONDS = 1_000_000
+# Longest window a single request may ask for
+MAX_WINDOW_US = 10 * 60 * MICROSECONDS
+DEFAULT_MAX_MOVIES = 32
+DEFAULT_TTL = 300
+
+PAIRS_SQL = (
+    "SELECT p.id, en.start_ts, en.end_ts, de.start_ts, de.end_ts, en.text, de.text"
+    " FROM subtitle_pairs p"
+    " JOIN subtitles en ON en.id = p.en_id"
+    " JOIN subtitles de ON de.id = p.de_id"
+    " WHERE p.movie_id = {param}"
+)
+
+
+def to_microseconds(seconds) -> int:
+    """A stored start_ts/end_ts (float or Decimal seconds) in whole microseconds"""
+    return int(round(seconds * MICROSECONDS))
+
+
+class CueIndex:
+    """One movie's pairs, answering overlap queries on [start_us, end_us)"""
+
+    __slots__ = ("starts", "ends", "reach", "fragments")
+
+    def __init__(self, cues: Sequence[Tuple[int, int, bytes]]):
+        """cues are (start_us, end_us, encoded JSON) in any order"""
+        cues = sorted(cues, key=lambda cue: (cue[0], cue[1]))
+        self.starts = array("q", (cue[0] for cue in cues))
+        self.ends = array("q", (cue[1] for cue in cues))
+        # reach[i] is the latest end among the first i + 1 cues, so it never decreases
+        self.reach = array("q")
+        latest = -1
+        for end in self.ends:
+            latest = max(latest, end)
+            self.reach.append(latest)
+        self.fragments = [cue[2] for cue in cues]
+
+    def __len__(self):
+        return len(self.starts)
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Tuple]) -> "CueIndex":
+        """Build from (pair_id, en_start, en_end, de_start, de_end, en_text, de_text) rows"""
+        cues = []
+        for pair_id, en_start, en_end, de_start, de_end, english, german in rows:
+            if not isinstance(pair_id, uuid.UUID):
+                pair_id = uuid.UUID(pair_id)
+            # A pair spans both of its cues, as in the lesson bundles
+            start = min(to_microseconds(en_start), to_microseconds(de_start))
+            end = max(to_microseconds(en_end), to_microseconds(de_end))
+            fragment = encode_json({
+                "pair_id": str(pair_id),
+                "start_us": start,
+                "end_us": end,
+                "english": english,
+                "german": german,
+            })
+            cues.append((start, end, fragment))
+        return cls(cues)
+
+    def overlapping(self, start_us: int, end_us: int) -> List[bytes]:
+        """Encoded cues that overlap [start_us, end_us), by start time"""
+        # Cues before lo all ended by start_us; cues from hi on start at or after end_us
+        lo = bisect_right(self.reach, start_us)
+        hi = bisect_left(self.starts, end_us)
+        ends, fragments = self.ends, self.fragments
+        return [fragments[i] for i in range(lo, hi) if ends[i] > start_us]
+
+
+def encode_window(movie_id: uuid.UUID, start_us: int, end_us: int, fragments: List[bytes]) -> bytes:
+    """Response body for a window, without re-encoding the cues"""
+    head = encode_json({"movie_id": str(movie_id), "from": start_us, "to": end_us})
+    return head[:-1] + b',"cues":[' + b",".join(fragments) + b"]}"
+
+
+class CueStore:
+    """Base class; LRU of per-movie indexes, dialect subclasses load the pairs"""
+
+    def __init__(self, users, max_movies: int = DEFAULT_MAX_MOVIES, ttl: float = DEFAULT_TTL):
+        self.users = users
+        self.max_movies = max_movies
+        self.ttl = ttl
+        self._indexes: "OrderedDict[uuid.UUID, Tuple[float, int, CueIndex]]" = OrderedDict()
+        self._loading: Dict[uuid.UUID, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def _load(self, movie_id: uuid.UUID) -> Optional[List[Tuple]]:
+        """The movie's pair rows, or None when there is no such movie"""
+        raise NotImplementedError
+
+    async def index(self, movie_id: uuid.UUID, generation: int = 0) -> Optional[CueIndex]:
+        """The movie's index, building it on a miss; None for unknown movies"""
+        item = self._indexes.get(movie_id)
+        if item is not None:
+            expires, built_for, index = item
+            if built_for == generation and expires > time.monotonic():
+                self._indexes.move_to_end(movie_id)
+                self.hits += 1
+                return index
+            del self._indexes[movie_id]
+
+        self.misses += 1
+        # Requests for a movie that is being loaded wait for that load
+        pending = self._loading.get(movie_id)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        pending = asyncio.get_running_loop().create_future()
+        self._loading[movie_id] = pending
+        try:
+            rows = await self._load(movie_id)
+            index = None if rows is None else CueIndex.from_rows(rows)
+        except asyncio.CancelledError:
+            pending.cancel()
+            raise
+        except Exception as e:
+            pending.set_exception(e)
+            # Waiters see the error; retrieve it so an unawaited future does not warn
+            pending.exception()
+            raise
+        finally:
+            del self._loading[movie_id]
+
+        pending.set_result(index)
+        if index is not None:
+            self._indexes[movie_id] = (time.monotonic() + self.ttl, generation, index)
+            while len(self._indexes) > self.max_movies:
+                self._indexes.popitem(last=False)
+        return index
+
+    async def window(
+        self, movie_id: uuid.UUID, start_us: int, end_us: int, generation: int = 0
+    ) -> Optional[List[bytes]]:
+        """Encoded cues overlapping [start_us, end_us); None for unknown movies"""
+        index = await self.index(movie_id, generation)
+        return None if index is None else index.overlapping(start_us, end_us)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "movies": len(self._indexes),
+            "cues": sum(len(item[2]) for item in self._indexes.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class PostgresCueStore(CueStore):
+    async def _load(self, movie_id):
+        pool = self.users.pool
+        if await pool.fetchval("SELECT 1 FROM movies WHERE id = $1", movie_id) is None:
+            return None
+        return [tuple(row) for row in await pool.fetch(PAIRS_SQL.format(param="$1"), movie_id)]
+
+
+class SQLiteCueStore(CueStore):
+    async def _load(self, movie_id):
+        def load(conn):
+            if conn.execute("SELECT 1 FROM movies WHERE id = ?", (movie_id.hex,)).fetchone() is None:
+                return None
+            return conn.execute(PAIRS_SQL.format(param="?"), (movie_id.hex,)).fetchall()
+
+        return await self.users.run(load)
+
+
+def create_cue_store(users: UserRepository, **kwargs) -> CueStore:
+    """Cue store sharing the user repository's pool"""
+    if isinstance(users, PostgresUserRepository):
+        return PostgresCueStore(users, **kwargs)
+    if isinstance(users, SQLiteUserRepository):
+        return SQLiteCueStore(users, **kwargs)
+    raise ValueError(f"No cue store for {users.dialect} repositories")
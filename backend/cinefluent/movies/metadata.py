@@ -0,0 +1,76 @@
+"""
+Ingest-time catalog metadata
+
+Rates each new movie's difficulty and records its vocabulary size, so the
+catalog can filter on difficulty and report progress without touching
+movie_vocab for every listed movie.
+
+Difficulty is lexical: the share of all word occurrences in the learned
+language's track that its COMMON_WORDS most frequent words cover. Films
+that keep reusing a small vocabulary read as easier than films that
+rarely repeat themselves.
+"""
+
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Sequence
+
+from sqlalchemy import bindparam, select, update
+
+from ..database_models import Movie, MovieVocab
+from .catalog import DIFFICULTIES
+
+COMMON_WORDS = 200
+# Minimum coverage by the common words for beginner and intermediate
+DIFFICULTY_COVERAGE = (0.75, 0.6)
+
+
+def rate_difficulty(frequencies: Sequence[int], common_words: int = COMMON_WORDS) -> str:
+    """Difficulty from a track's word frequencies in rank order"""
+    total = sum(frequencies)
+    coverage = sum(frequencies[:common_words]) / total if total else 1.0
+    for difficulty, threshold in zip(DIFFICULTIES, DIFFICULTY_COVERAGE):
+        if coverage >= threshold:
+            return difficulty
+    return DIFFICULTIES[-1]
+
+
+def update_metadata(conn, movie_ids: List[uuid.UUID]) -> None:
+    """Set difficulty and vocab_size from movie_vocab for the given movies"""
+    languages = dict(
+        conn.execute(select(Movie.id, Movie.language).where(Movie.id.in_(movie_ids))).all()
+    )
+    frequencies: Dict[uuid.UUID, List[int]] = defaultdict(list)
+    rows = conn.execute(
+        select(MovieVocab.movie_id, MovieVocab.lang, MovieVocab.frequency)
+        .where(MovieVocab.movie_id.in_(movie_ids))
+        .order_by(MovieVocab.movie_id, MovieVocab.rank)
+    )
+    for movie_id, lang, frequency in rows:
+        if lang == languages.get(movie_id):
+            frequencies[movie_id].append(frequency)
+
+    params = [
+        {
+            "movie_id": movie_id,
+            "rated": rate_difficulty(frequencies[movie_id]),
+            "size": len(frequencies[movie_id]),
+        }
+        for movie_id in languages
+    ]
+    if params:
+        conn.execute(
+            update(Movie)
+            .where(Movie.id == bindparam("movie_id"))
+            .values(difficulty=bindparam("rated"), vocab_size=bindparam("size")),
+            params,
+        )
+
+
+class CatalogStage:
+    """Post-load ingestion stage; runs after VocabularyStage has filled movie_vocab"""
+
+    name = "catalog"
+
+    def run(self, conn, staged: Sequence) -> None:
+        update_metadata(conn, [item.movie_id for item in staged])
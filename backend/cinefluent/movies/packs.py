@@ -0,0 +1,100 @@
+"""
+Offline pack downloads as stored bytes
+
+Packs are built at ingest (see cinefluent.offline_packs); serving one is an
+indexed read of the stored body and its ETag. A client that already holds
+version N asks with since=N and gets the delta from N when one is stored,
+or the full pack otherwise.
+"""
+
+import uuid
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from ..users.repository import PostgresUserRepository, SQLiteUserRepository, UserRepository
+
+MEDIA_TYPE = "application/vnd.cinefluent.pack"
+
+# Latest version first; at that version, the delta from since before the full pack
+PACK_SQL = (
+    "SELECT version, base_version, body, etag FROM movie_packs"
+    " WHERE movie_id = {movie} AND base_version IN (0, {since})"
+    " ORDER BY version DESC, base_version DESC LIMIT 1"
+)
+
+
+@dataclass
+class PackBlob:
+    version: int
+    base_version: int  # 0 for the full pack
+    body: bytes
+    etag: str
+
+
+class RangeNotSatisfiable(ValueError):
+    """A Range header that selects no bytes of the body"""
+
+
+def byte_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """The [start, end] bytes a single-range Range header selects, or None to send everything.
+
+    Multiple ranges and other units are answered with the whole body,
+    which RFC 9110 allows.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, sep, last = header[6:].strip().partition("-")
+    if not sep or not (first or last):
+        return None
+    try:
+        start = int(first) if first else None
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start is None:
+        # bytes=-N: the last N bytes
+        if end <= 0:
+            raise RangeNotSatisfiable(header)
+        return max(0, size - end), size - 1
+    if start >= size or end < start:
+        raise RangeNotSatisfiable(header)
+    return start, min(end, size - 1)
+
+
+class PackStore:
+    """Base class; dialect subclasses share the user repository's pool"""
+
+    async def get(self, movie_id: uuid.UUID, since: int = 0) -> Optional[PackBlob]:
+        """The latest pack, as a delta from since when one is stored"""
+        raise NotImplementedError
+
+
+class PostgresPackStore(PackStore):
+    def __init__(self, users: PostgresUserRepository):
+        self.users = users
+
+    async def get(self, movie_id, since=0):
+        row = await self.users.pool.fetchrow(PACK_SQL.format(movie="$1", since="$2"), movie_id, since)
+        return PackBlob(row[0], row[1], bytes(row[2]), row[3]) if row else None
+
+
+class SQLitePackStore(PackStore):
+    def __init__(self, users: SQLiteUserRepository):
+        self.users = users
+
+    async def get(self, movie_id, since=0):
+        row = await self.users.run(
+            lambda conn: conn.execute(
+                PACK_SQL.format(movie="?", since="?"), (movie_id.hex, since)
+            ).fetchone()
+        )
+        return PackBlob(row[0], row[1], bytes(row[2]), row[3]) if row else None
+
+
+def create_pack_store(users: UserRepository) -> PackStore:
+    """Pack store sharing the user repository's pool"""
+    if isinstance(users, PostgresUserRepository):
+        return PostgresPackStore(users)
+    if isinstance(users, SQLiteUserRepository):
+        return SQLitePackStore(users)
+    raise ValueError(f"No pack store for {users.dialect} repositories")
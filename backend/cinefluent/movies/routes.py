@@ -0,0 +1,131 @@
+"""
+Movie catalog, playback-window cues and offline packs
+"""
+
+import uuid
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+
+from ..api.deps import (
+    conditional_response,
+    get_cue_store,
+    get_current_user,
+    get_movie_catalog,
+    get_pack_store,
+    get_response_cache,
+)
+from ..response_cache import CachedBody, ResponseCache, encode_json, etag_matches
+from ..users.repository import UserRecord
+from .catalog import (
+    DEFAULT_PAGE_SIZE,
+    DIFFICULTIES,
+    MAX_PAGE_SIZE,
+    MAX_QUERY_LENGTH,
+    InvalidCursorError,
+    MovieCatalog,
+)
+from .cues import MAX_WINDOW_US, CueStore, encode_window
+from .packs import MEDIA_TYPE, PackStore, RangeNotSatisfiable, byte_range
+
+router = APIRouter(prefix="/api/v1/movies", tags=["movies"])
+
+
+@router.get("")
+async def list_movies(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, max_length=512),
+    language: Optional[str] = Query(None, min_length=2, max_length=5),
+    difficulty: Optional[str] = Query(None, pattern="^(" + "|".join(DIFFICULTIES) + ")$"),
+    q: Optional[str] = Query(None, max_length=MAX_QUERY_LENGTH),
+    current_user: UserRecord = Depends(get_current_user),
+    catalog: MovieCatalog = Depends(get_movie_catalog),
+):
+    try:
+        page = await catalog.page(current_user.id, limit, cursor, language, difficulty, q)
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # Progress makes the page per-user, so it is not shared through the response cache
+    body = CachedBody(encode_json({
+        "movies": [entry.as_dict() for entry in page.entries],
+        "next_cursor": page.next_cursor,
+    }))
+    return conditional_response(request, body)
+
+
+@router.get("/{movie_id}/cues")
+async def movie_cues(
+    movie_id: str,
+    request: Request,
+    start_us: int = Query(..., alias="from", ge=0),
+    end_us: int = Query(..., alias="to", ge=1),
+    current_user: UserRecord = Depends(get_current_user),
+    cues: CueStore = Depends(get_cue_store),
+    responses: ResponseCache = Depends(get_response_cache),
+):
+    """Aligned pairs overlapping the playback window [from, to), in microseconds"""
+    if end_us <= start_us:
+        raise HTTPException(status_code=400, detail="'to' must be after 'from'")
+    if end_us - start_us > MAX_WINDOW_US:
+        raise HTTPException(status_code=400, detail=f"Window longer than {MAX_WINDOW_US} microseconds")
+    try:
+        movie_uuid = uuid.UUID(movie_id)
+    except ValueError:
+        movie_uuid = None
+    fragments = None
+    if movie_uuid is not None:
+        # Same generation as cached responses, so an ingest drops stale indexes too
+        fragments = await cues.window(movie_uuid, start_us, end_us, await responses.generation())
+    if fragments is None:
+        raise HTTPException(status_code=404, detail="Movie not found")
+    return conditional_response(request, CachedBody(encode_window(movie_uuid, start_us, end_us, fragments)))
+
+
+@router.get("/{movie_id}/pack")
+async def movie_pack(
+    movie_id: str,
+    request: Request,
+    since: int = Query(0, ge=0),
+    current_user: UserRecord = Depends(get_current_user),
+    packs: PackStore = Depends(get_pack_store),
+):
+    """The movie's offline pack, or the delta from version since; supports Range for resuming"""
+    try:
+        pack = await packs.get(uuid.UUID(movie_id), since)
+    except ValueError:
+        pack = None
+    if pack is None:
+        raise HTTPException(status_code=404, detail="Offline pack not found")
+
+    headers = {
+        "ETag": pack.etag,
+        "Cache-Control": "private, no-cache",
+        "Accept-Ranges": "bytes",
+        "X-Pack-Version": str(pack.version),
+        "X-Pack-Base-Version": str(pack.base_version),
+    }
+    if since == pack.version:
+        return Response(status_code=status.HTTP_204_NO_CONTENT, headers=headers)
+    if etag_matches(pack.etag, request.headers.get("if-none-match")):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    size = len(pack.body)
+    if_range = request.headers.get("if-range")
+    try:
+        # A resumed download only continues if the pack is still the one it started
+        selected = byte_range(request.headers.get("range"), size) if if_range in (None, pack.etag) else None
+    except RangeNotSatisfiable:
+        return Response(
+            status_code=status.HTTP_416_RANGE_NOT_SATISFIABLE,
+            headers={**headers, "Content-Range": f"bytes */{size}"},
+        )
+    if selected is None:
+        return Response(pack.body, media_type=MEDIA_TYPE, headers=headers)
+    start, end = selected
+    return Response(
+        pack.body[start:end + 1],
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        media_type=MEDIA_TYPE,
+        headers={**headers, "Content-Range": f"bytes {start}-{end}/{size}"},
+    )
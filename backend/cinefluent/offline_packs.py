@@ -0,0 +1,327 @@
+"""
+Offline packs: a movie's aligned pairs as one compact binary download
+
+Built at ingest (and whenever a movie's pairs are rebuilt) from subtitles
+and subtitle_pairs, stored on movie_packs with a strong ETag and served
+as stored. Layout:
+
+    header   "CFPK", format u8, kind u8 (0 full, 1 delta), reserved u16,
+             version u32, base_version u32             (little-endian)
+    payload  zlib-compressed columns:
+             strings   count, then length + UTF-8 bytes each (deduplicated)
+             removed   count, then 16-byte pair ids    (deltas only)
+             pairs     count, then one column at a time:
+                       16-byte pair ids
+                       en start, delta from the previous pair's (zigzag)
+                       en duration (zigzag)
+                       de start, relative to en start (zigzag)
+                       de duration (zigzag)
+                       en text, de text as string table indexes
+                       alignment score in percent, one byte each
+
+All integers in the payload are unsigned LEB128 varints and all times
+are milliseconds. Pairs are ordered by EN start time.
+
+Every rebuild that changes a movie's pairs stores a new full pack with
+the next version, plus a delta from each of the DELTA_BASES previous
+versions. A delta lists the pair ids to drop and the pairs to add or
+replace, so a client holding version N downloads only what changed.
+"""
+
+import hashlib
+import logging
+import struct
+import uuid
+import zlib
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import aliased
+
+from .database_models import MoviePack, Subtitle, SubtitlePair
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"CFPK"
+FORMAT_VERSION = 1
+FULL, DELTA = 0, 1
+HEADER = struct.Struct("<4sBBHII")
+# Previous versions each new pack keeps a delta from
+DELTA_BASES = 3
+COMPRESSION_LEVEL = 9
+
+
+class PackFormatError(ValueError):
+    """Raised for bytes that are not a pack this module can read"""
+
+
+@dataclass(frozen=True)
+class PackPair:
+    pair_id: uuid.UUID
+    en_start: int  # ms
+    en_end: int
+    de_start: int
+    de_end: int
+    english: str
+    german: str
+    score: int  # alignment score in percent
+
+
+@dataclass
+class Pack:
+    version: int
+    pairs: List[PackPair]
+    base_version: int = 0  # 0 for a full pack
+    removed: List[uuid.UUID] = field(default_factory=list)
+
+    @property
+    def kind(self) -> int:
+        return DELTA if self.base_version else FULL
+
+
+def _sort_key(pair: PackPair):
+    return pair.en_start, pair.de_start, pair.pair_id.bytes
+
+
+def _varint(out: bytearray, value: int):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _zigzag(value: int) -> int:
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def _unzigzag(value: int) -> int:
+    return value >> 1 if not value & 1 else -(value >> 1) - 1
+
+
+class _Reader:
+    __slots__ = ("data", "pos")
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def varint(self) -> int:
+        value = shift = 0
+        data = self.data
+        while True:
+            try:
+                byte = data[self.pos]
+            except IndexError:
+                raise PackFormatError("Truncated pack") from None
+            self.pos += 1
+            value |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return value
+            shift += 7
+
+    def take(self, size: int) -> bytes:
+        chunk = self.data[self.pos:self.pos + size]
+        if len(chunk) != size:
+            raise PackFormatError("Truncated pack")
+        self.pos += size
+        return chunk
+
+    def varints(self, count: int) -> List[int]:
+        return [self.varint() for _ in range(count)]
+
+
+def encode_pack(pack: Pack) -> bytes:
+    """The pack's bytes; its pairs are written in EN start order"""
+    pairs = sorted(pack.pairs, key=_sort_key)
+    strings: Dict[str, int] = {}
+    for pair in pairs:
+        strings.setdefault(pair.english, len(strings))
+        strings.setdefault(pair.german, len(strings))
+
+    out = bytearray()
+    _varint(out, len(strings))
+    for text in strings:
+        encoded = text.encode("utf-8")
+        _varint(out, len(encoded))
+        out += encoded
+
+    _varint(out, len(pack.removed))
+    for pair_id in pack.removed:
+        out += pair_id.bytes
+
+    _varint(out, len(pairs))
+    for pair in pairs:
+        out += pair.pair_id.bytes
+    previous = 0
+    for pair in pairs:
+        _varint(out, _zigzag(pair.en_start - previous))
+        previous = pair.en_start
+    for pair in pairs:
+        _varint(out, _zigzag(pair.en_end - pair.en_start))
+    for pair in pairs:
+        _varint(out, _zigzag(pair.de_start - pair.en_start))
+    for pair in pairs:
+        _varint(out, _zigzag(pair.de_end - pair.de_start))
+    for pair in pairs:
+        _varint(out, strings[pair.english])
+    for pair in pairs:
+        _varint(out, strings[pair.german])
+    out += bytes(pair.score for pair in pairs)
+
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, pack.kind, 0, pack.version, pack.base_version)
+    return header + zlib.compress(bytes(out), COMPRESSION_LEVEL)
+
+
+def decode_pack(body: bytes) -> Pack:
+    """Inverse of encode_pack()"""
+    try:
+        magic, fmt, kind, _, version, base_version = HEADER.unpack_from(body)
+    except struct.error:
+        raise PackFormatError("Truncated pack header") from None
+    if magic != MAGIC or fmt != FORMAT_VERSION or kind not in (FULL, DELTA):
+        raise PackFormatError("Not a version 1 pack")
+    try:
+        reader = _Reader(zlib.decompress(body[HEADER.size:]))
+    except zlib.error as e:
+        raise PackFormatError(f"Corrupt pack payload: {e}") from None
+
+    strings = [reader.take(reader.varint()).decode("utf-8") for _ in range(reader.varint())]
+    removed = [uuid.UUID(bytes=reader.take(16)) for _ in range(reader.varint())]
+    count = reader.varint()
+    ids = [uuid.UUID(bytes=reader.take(16)) for _ in range(count)]
+
+    en_starts, previous = [], 0
+    for step in reader.varints(count):
+        previous += _unzigzag(step)
+        en_starts.append(previous)
+    en_lengths = [_unzigzag(value) for value in reader.varints(count)]
+    de_offsets = [_unzigzag(value) for value in reader.varints(count)]
+    de_lengths = [_unzigzag(value) for value in reader.varints(count)]
+    english = reader.varints(count)
+    german = reader.varints(count)
+    scores = reader.take(count)
+    try:
+        pairs = [
+            PackPair(
+                ids[i], en_starts[i], en_starts[i] + en_lengths[i],
+                en_starts[i] + de_offsets[i], en_starts[i] + de_offsets[i] + de_lengths[i],
+                strings[english[i]], strings[german[i]], scores[i],
+            )
+            for i in range(count)
+        ]
+    except IndexError:
+        raise PackFormatError("String index out of range") from None
+    return Pack(version, pairs, base_version, removed)
+
+
+def diff_pairs(
+    old: Sequence[PackPair], new: Sequence[PackPair]
+) -> Tuple[List[PackPair], List[uuid.UUID]]:
+    """(pairs to add or replace, pair ids to drop) turning old into new"""
+    previous = {pair.pair_id: pair for pair in old}
+    current = {pair.pair_id for pair in new}
+    upserts = [pair for pair in new if previous.get(pair.pair_id) != pair]
+    removed = [pair_id for pair_id in previous if pair_id not in current]
+    removed.sort(key=lambda pair_id: pair_id.bytes)
+    return upserts, removed
+
+
+def apply_delta(pairs: Iterable[PackPair], delta: Pack) -> List[PackPair]:
+    """The pairs of delta.version, given the pairs of delta.base_version"""
+    replaced = set(delta.removed) | {pair.pair_id for pair in delta.pairs}
+    kept = [pair for pair in pairs if pair.pair_id not in replaced]
+    return sorted(kept + list(delta.pairs), key=_sort_key)
+
+
+def load_pack_pairs(conn, movie_id: uuid.UUID) -> List[PackPair]:
+    """The movie's current pairs in pack order"""
+    en = aliased(Subtitle)
+    de = aliased(Subtitle)
+    result = conn.execute(
+        select(
+            SubtitlePair.id, en.start_ts, en.end_ts, de.start_ts, de.end_ts,
+            en.text, de.text, SubtitlePair.alignment_score,
+        )
+        .join(en, en.id == SubtitlePair.en_id)
+        .join(de, de.id == SubtitlePair.de_id)
+        .where(SubtitlePair.movie_id == movie_id)
+    )
+    pairs = [
+        PackPair(
+            row[0],
+            int(round(row[1] * 1000)), int(round(row[2] * 1000)),
+            int(round(row[3] * 1000)), int(round(row[4] * 1000)),
+            row[5], row[6],
+            max(0, min(100, int(round((row[7] if row[7] is not None else 1) * 100)))),
+        )
+        for row in result
+    ]
+    pairs.sort(key=_sort_key)
+    return pairs
+
+
+def _pack_row(movie_id: uuid.UUID, pack: Pack) -> Dict:
+    body = encode_pack(pack)
+    return {
+        "movie_id": movie_id,
+        "version": pack.version,
+        "base_version": pack.base_version,
+        "pair_count": len(pack.pairs),
+        "body": body,
+        "etag": '"' + hashlib.sha256(body).hexdigest()[:32] + '"',
+    }
+
+
+def build_pack(conn, movie_id: uuid.UUID, delta_bases: int = DELTA_BASES) -> Optional[int]:
+    """Store a new pack version if the movie's pairs changed; returns it, or None if unchanged"""
+    pairs = load_pack_pairs(conn, movie_id)
+    previous = conn.execute(
+        select(MoviePack.version, MoviePack.body)
+        .where(MoviePack.movie_id == movie_id, MoviePack.base_version == 0)
+        .order_by(MoviePack.version.desc())
+        .limit(delta_bases)
+    ).all()
+    bases = [(version, decode_pack(body).pairs) for version, body in previous]
+    if bases and bases[0][1] == pairs:
+        return None
+
+    version = bases[0][0] + 1 if bases else 1
+    rows = [_pack_row(movie_id, Pack(version, pairs))]
+    for base_version, base_pairs in bases:
+        upserts, removed = diff_pairs(base_pairs, pairs)
+        rows.append(_pack_row(movie_id, Pack(version, upserts, base_version, removed)))
+    conn.execute(insert(MoviePack), rows)
+
+    # Deltas to older versions are superseded; full packs are kept only as future bases
+    conn.execute(
+        delete(MoviePack).where(
+            MoviePack.movie_id == movie_id,
+            MoviePack.version < version,
+            (MoviePack.base_version != 0) | (MoviePack.version <= version - delta_bases),
+        )
+    )
+    return version
+
+
+def build_packs(conn, movie_ids: Sequence[uuid.UUID], delta_bases: int = DELTA_BASES) -> int:
+    """Refresh the packs of movie_ids from their current pairs; returns how many were rebuilt"""
+    movie_ids = list(movie_ids)
+    rebuilt = sum(build_pack(conn, movie_id, delta_bases) is not None for movie_id in movie_ids)
+    logger.info("Rebuilt offline packs for %d of %d movies", rebuilt, len(movie_ids))
+    return rebuilt
+
+
+class PackStage:
+    """Post-load ingestion stage writing each new movie's offline pack"""
+
+    name = "packs"
+
+    def __init__(self, delta_bases: int = DELTA_BASES):
+        self.delta_bases = delta_bases
+
+    def run(self, conn, staged: Sequence) -> None:
+        build_packs(conn, [item.movie_id for item in staged], self.delta_bases)
+
+    def delete(self, conn, movie_ids: List[uuid.UUID]) -> None:
+        conn.execute(delete(MoviePack).where(MoviePack.movie_id.in_(movie_ids)))
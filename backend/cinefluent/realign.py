@@ -0,0 +1,194 @@
+"""
+Catalog-wide batch realignment
+
+Rebuilds subtitle_pairs for many movies at once. Each movie's cues are
+loaded as start/end/text spans and aligned with the same MonotonicAligner
+DP as ingestion; movies are spread across a ProcessPoolExecutor and the
+resulting pairs are written back in batches as workers finish.
+"""
+
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import bindparam, delete, func, insert, select, update
+
+from .alignment import MIN_ALIGNMENT_SCORE, MonotonicAligner
+from .database_models import DatabaseManager, Movie, Subtitle, SubtitlePair
+from .offline_packs import build_packs
+from .scenes import refresh_scenes
+from .track_update import load_pairs
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 5000
+
+
+# (ids, starts_ms, ends_ms, texts) of one language track, sorted by start
+TrackSpans = Tuple[List, List[int], List[int], List[str]]
+
+
+def align_tracks(
+    en: TrackSpans, de: TrackSpans, min_score: float = MIN_ALIGNMENT_SCORE
+) -> List[Tuple[object, object, float]]:
+    """Align two stored tracks with the MonotonicAligner DP.
+
+    Runs the same sweep and 1:1 / 1:2 / 2:1 group search as
+    align_subtitles(), so pairs and scores match what ingestion stores.
+    Returns (en_id, de_id, score) tuples.
+    """
+    aligned = MonotonicAligner(min_score=min_score).align_spans(en[1:], de[1:])
+    return [(en[0][i], de[0][j], score) for i, j, score in aligned]
+
+
+def load_movie_tracks(session, movie_id) -> Dict[str, TrackSpans]:
+    """Load a movie's EN and DE cues, texts normalized where available"""
+    text = func.coalesce(func.nullif(Subtitle.text_normalized, ""), Subtitle.text)
+    result = session.execute(
+        select(Subtitle.lang, Subtitle.id, Subtitle.start_ts, Subtitle.end_ts, text)
+        .where(Subtitle.movie_id == movie_id)
+        .order_by(Subtitle.lang, Subtitle.start_ts)
+    )
+
+    rows: Dict[str, List[Tuple]] = {"en": [], "de": []}
+    for lang, sub_id, start, end, text in result:
+        if lang in rows:
+            rows[lang].append(
+                (sub_id, int(round(float(start) * 1000)), int(round(float(end) * 1000)), text or "")
+            )
+    tracks = {}
+    for lang, lang_rows in rows.items():
+        ids, starts, ends, texts = zip(*lang_rows) if lang_rows else ((), (), (), ())
+        tracks[lang] = (list(ids), list(starts), list(ends), list(texts))
+    return tracks
+
+
+def realign_movie(db: DatabaseManager, movie_id) -> List[Dict]:
+    """Compute fresh subtitle_pairs rows for one movie"""
+    with db.get_session() as session:
+        tracks = load_movie_tracks(session, movie_id)
+
+    return [
+        {
+            "movie_id": movie_id,
+            "en_id": en_id,
+            "de_id": de_id,
+            "alignment_score": round(float(score), 2),
+        }
+        for en_id, de_id, score in align_tracks(tracks["en"], tracks["de"])
+    ]
+
+
+# Per-process database handle for pool workers
+_worker_db: Optional[DatabaseManager] = None
+
+
+def _init_worker(database_url: str):
+    global _worker_db
+    _worker_db = DatabaseManager(database_url)
+
+
+def _realign_in_worker(movie_id) -> Tuple[object, List[Dict]]:
+    return movie_id, realign_movie(_worker_db, movie_id)
+
+
+def _write_batch(db: DatabaseManager, movie_ids: List, rows: List[Dict]) -> Dict[str, int]:
+    """Write realigned pairs, keeping the id of every (en_id, de_id) pair that survives"""
+    fresh = {(row["movie_id"], row["en_id"], row["de_id"]): row for row in rows}
+    counts = {"kept": 0, "rescored": 0, "inserted": 0, "deleted": 0}
+    with db.get_session() as session:
+        conn = session.connection()
+        deleted, rescored = [], []
+        for movie_id in movie_ids:
+            for pair_id, en_id, de_id, score in load_pairs(conn, movie_id):
+                row = fresh.pop((movie_id, en_id, de_id), None)
+                if row is None:
+                    deleted.append(pair_id)
+                elif row["alignment_score"] != score:
+                    rescored.append({"pair_id": pair_id, "score": row["alignment_score"]})
+                else:
+                    counts["kept"] += 1
+
+        if deleted:
+            conn.execute(delete(SubtitlePair).where(SubtitlePair.id.in_(deleted)))
+        if rescored:
+            conn.execute(
+                update(SubtitlePair)
+                .where(SubtitlePair.id == bindparam("pair_id"))
+                .values(alignment_score=bindparam("score")),
+                rescored,
+            )
+        if fresh:
+            conn.execute(insert(SubtitlePair), list(fresh.values()))
+        counts.update(rescored=len(rescored), inserted=len(fresh), deleted=len(deleted))
+
+        # Lesson bundles and offline packs name pair ids; both rewrite only what changed
+        refresh_scenes(conn, movie_ids)
+        build_packs(conn, movie_ids)
+    return counts
+
+
+def _iter_results(db: DatabaseManager, movie_ids: Sequence, workers: int) -> Iterator[Tuple]:
+    if workers <= 1:
+        for movie_id in movie_ids:
+            yield movie_id, realign_movie(db, movie_id)
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(db.database_url,)
+    ) as pool:
+        futures = [pool.submit(_realign_in_worker, movie_id) for movie_id in movie_ids]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def realign_catalog(
+    db: DatabaseManager,
+    movie_ids: Optional[Iterable] = None,
+    workers: Optional[int] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> Dict:
+    """Rebuild subtitle_pairs for the given movies (all movies by default).
+
+    Results are flushed whenever batch_size pair rows have accumulated, so
+    memory stays bounded regardless of catalog size.
+    """
+    if movie_ids is None:
+        with db.get_session() as session:
+            movie_ids = session.scalars(select(Movie.id)).all()
+    movie_ids = list(movie_ids)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    pending_movies: List = []
+    pending_rows: List[Dict] = []
+    total_pairs = 0
+    changes = {"kept": 0, "rescored": 0, "inserted": 0, "deleted": 0}
+
+    def flush():
+        nonlocal total_pairs
+        for key, count in _write_batch(db, pending_movies, pending_rows).items():
+            changes[key] += count
+        total_pairs += len(pending_rows)
+
+    for movie_id, rows in _iter_results(db, movie_ids, workers):
+        pending_movies.append(movie_id)
+        pending_rows.extend(rows)
+        if len(pending_rows) >= batch_size:
+            flush()
+            pending_movies, pending_rows = [], []
+
+    if pending_movies:
+        flush()
+
+    logger.info(
+        "Realigned %d movies into %d pairs: %d kept, %d rescored, %d inserted, %d deleted",
+        len(movie_ids),
+        total_pairs,
+        changes["kept"],
+        changes["rescored"],
+        changes["inserted"],
+        changes["deleted"],
+    )
+    return {"movies": len(movie_ids), "pairs": total_pairs, "workers": workers, "changes": changes}
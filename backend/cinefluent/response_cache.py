@@ -0,0 +1,202 @@
+"""
+Two-tier cache of encoded response bodies
+
+Catalog, lesson and quiz payloads only change when subtitles are
+ingested, so their JSON is encoded once and served from an in-process LRU,
+backed by Redis when REDIS_URL is set. Every key is scoped by a content
+generation; ingestion bumps the generation in Redis, which orphans all
+cached bodies at once instead of deleting them one by one. Without Redis
+the cache is in-process only and entries age out after ttl seconds. A
+Redis error is logged and counted, and the request is served from the
+in-process tier as if Redis were not configured.
+"""
+
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from . import settings
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "cinefluent:response:"
+GENERATION_KEY = "cinefluent:content:generation"
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL = 300
+# How often a worker re-reads the generation from Redis
+GENERATION_CHECK_INTERVAL = 1.0
+
+
+def encode_json(content: Any) -> bytes:
+    """Same encoding as FastAPI's JSONResponse"""
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+    """Whether an If-None-Match header names etag"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+class CachedBody:
+    """An encoded body with its strong ETag"""
+
+    __slots__ = ("body", "etag")
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """Whether an If-None-Match header names this body"""
+        return etag_matches(self.etag, if_none_match)
+
+
+class ResponseCache:
+    """In-process LRU in front of an optional Redis tier"""
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl: float = DEFAULT_TTL,
+        redis_url: Optional[str] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.redis_url = redis_url if redis_url is not None else settings.redis_url()
+        self.redis = None
+        self._entries: "OrderedDict[str, Tuple[float, CachedBody]]" = OrderedDict()
+        self._generation = 0
+        self._generation_checked = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.redis_errors = 0
+
+    def _redis_failed(self, error: Exception):
+        self.redis_errors += 1
+        logger.warning("Response cache falling back to the local tier: %s", error)
+
+    async def connect(self):
+        if self.redis_url:
+            import redis.asyncio as redis
+
+            self.redis = redis.from_url(self.redis_url)
+
+    async def close(self):
+        if self.redis is not None:
+            await self.redis.aclose()
+            self.redis = None
+
+    async def ping(self) -> bool:
+        if self.redis is None:
+            return False
+        try:
+            return bool(await self.redis.ping())
+        except Exception:
+            return False
+
+    async def generation(self) -> int:
+        if self.redis is not None:
+            now = time.monotonic()
+            if now - self._generation_checked >= GENERATION_CHECK_INTERVAL:
+                # On failure the last known generation is kept until the next check
+                try:
+                    self._generation = int(await self.redis.get(GENERATION_KEY) or 0)
+                except Exception as e:
+                    self._redis_failed(e)
+                self._generation_checked = now
+        return self._generation
+
+    def _store(self, key: str, entry: CachedBody):
+        self._entries[key] = (time.monotonic() + self.ttl, entry)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[CachedBody]:
+        full_key = f"{await self.generation()}:{key}"
+        item = self._entries.get(full_key)
+        if item is not None:
+            if item[0] > time.monotonic():
+                self._entries.move_to_end(full_key)
+                self.hits += 1
+                return item[1]
+            del self._entries[full_key]
+
+        if self.redis is not None:
+            try:
+                body = await self.redis.get(KEY_PREFIX + full_key)
+            except Exception as e:
+                self._redis_failed(e)
+                body = None
+            if body is not None:
+                entry = CachedBody(body)
+                self._store(full_key, entry)
+                self.hits += 1
+                return entry
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, body: bytes) -> CachedBody:
+        full_key = f"{await self.generation()}:{key}"
+        entry = CachedBody(body)
+        self._store(full_key, entry)
+        if self.redis is not None:
+            try:
+                await self.redis.set(KEY_PREFIX + full_key, body, ex=int(self.ttl))
+            except Exception as e:
+                self._redis_failed(e)
+        return entry
+
+    async def invalidate(self):
+        """Start a new generation, orphaning every cached body"""
+        self._entries.clear()
+        if self.redis is not None:
+            try:
+                self._generation = int(await self.redis.incr(GENERATION_KEY))
+                self._generation_checked = time.monotonic()
+                return
+            except Exception as e:
+                self._redis_failed(e)
+        self._generation += 1
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "generation": self._generation,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "redis": self.redis is not None,
+            "redis_errors": self.redis_errors,
+        }
+
+
+def bump_content_generation(redis_url: Optional[str] = None) -> Optional[int]:
+    """Invalidate every API worker's cached responses after an ingest.
+
+    Called once the load has committed. A no-op without Redis; a Redis
+    failure is logged rather than raised since the data is already stored.
+    """
+    redis_url = redis_url or settings.redis_url()
+    if not redis_url:
+        return None
+    import redis
+
+    try:
+        client = redis.Redis.from_url(redis_url)
+        try:
+            return int(client.incr(GENERATION_KEY))
+        finally:
+            client.close()
+    except redis.RedisError as e:
+        logger.warning("Could not bump content generation: %s", e)
+        return None
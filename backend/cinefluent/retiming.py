@@ -0,0 +1,190 @@
+"""
+Time-offset and framerate-drift estimation between two subtitle tracks
+
+EN and DE files often come from different releases: one starts a few
+seconds later, or was timed for 25 fps video while the other was timed
+for 23.976 fps, so the gap grows along the film. Time-overlap matching
+then fails and the aligner falls back to text comparison.
+
+estimate_retiming() finds the linear map de_ms * scale + offset_ms that
+puts the DE track on the EN timeline:
+
+1. Both tracks become cue-onset signals on a BIN_MS grid: an impulse at
+   each cue start, blurred by a small triangle so near misses still count.
+2. For each candidate framerate ratio, the DE onsets are rescaled and the
+   offset is read off the peak of the FFT cross-correlation with EN. The
+   ratio with the sharpest peak wins.
+3. DE onsets mapped by that estimate are paired with their nearest EN
+   onset, and scale and offset are refit on those pairs with outliers
+   (translated lines with no counterpart, merged cues) trimmed by MAD.
+
+The correction is only applied when enough onsets agree with it and it
+moves some cue by more than MIN_CORRECTION_MS.
+"""
+
+from dataclasses import asdict, dataclass, replace
+from decimal import Decimal
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+# Coarse grid for the correlation; the fit in step 3 restores ms precision
+BIN_MS = 200
+# Half-width of the triangle each onset is blurred with
+SMOOTH_BINS = 2
+DEFAULT_MAX_OFFSET_MS = 60_000
+# Video framerates releases are commonly timed for; 23.976 is 24000/1001
+FRAMERATES = (24000 / 1001, 24.0, 25.0)
+SCALES = tuple(sorted({round(a / b, 6) for a in FRAMERATES for b in FRAMERATES}))
+# A DE onset this close to an EN onset after the coarse estimate is a match
+MATCH_TOLERANCE_MS = 1000
+MIN_CUES = 10
+# Share of DE onsets that must fit the correction for it to be applied
+MIN_CONFIDENCE = 0.3
+MIN_CORRECTION_MS = 150
+FIT_ITERATIONS = 3
+# Residuals within this many ms always count as inliers
+FIT_TOLERANCE_MS = 100
+
+
+@dataclass(frozen=True)
+class Retiming:
+    """de_ms * scale + offset_ms is the DE time on the EN timeline"""
+
+    scale: float = 1.0
+    offset_ms: float = 0.0
+    confidence: float = 0.0  # share of DE onsets within tolerance of the fit
+    matched: int = 0
+    applied: bool = False
+
+    def map_ms(self, ms: int) -> int:
+        return int(round(ms * self.scale + self.offset_ms))
+
+    def as_dict(self) -> Dict:
+        values = asdict(self)
+        values["scale"] = round(self.scale, 6)
+        values["offset_ms"] = round(self.offset_ms, 1)
+        values["confidence"] = round(self.confidence, 3)
+        return values
+
+
+IDENTITY = Retiming()
+
+
+def onset_signal(
+    starts_ms: np.ndarray, bins: int, bin_ms: int = BIN_MS, smooth_bins: int = SMOOTH_BINS
+) -> np.ndarray:
+    """Blurred impulses at each onset, on a grid of bins"""
+    index = np.rint(np.asarray(starts_ms, dtype=np.float64) / bin_ms).astype(np.int64)
+    signal = np.bincount(index[(index >= 0) & (index < bins)], minlength=bins).astype(np.float64)
+    kernel = np.concatenate([np.arange(1, smooth_bins + 1), np.arange(smooth_bins - 1, 0, -1)])
+    return np.convolve(signal, kernel / smooth_bins, mode="same")
+
+
+class _Correlator:
+    """FFT cross-correlation against a fixed reference signal"""
+
+    def __init__(self, reference: np.ndarray, max_lag: int):
+        # Zero-padded to twice the length so the correlation does not wrap around
+        self.size = 1 << int(2 * len(reference) - 1).bit_length()
+        self.spectrum = np.conj(np.fft.rfft(reference, self.size))
+        self.energy = float(np.dot(reference, reference))
+        self.max_lag = max_lag
+
+    def best_lag(self, other: np.ndarray) -> Tuple[int, float]:
+        """(lag, score) of the shift of other that best matches the reference.
+
+        A positive lag means other is early. score is the correlation at the
+        peak normalized by both signals' energy.
+        """
+        correlation = np.fft.irfft(np.fft.rfft(other, self.size) * self.spectrum, self.size)
+        # Lags 0..max_lag sit at the start, negative lags wrap to the end
+        window = np.concatenate([correlation[-self.max_lag:], correlation[:self.max_lag + 1]])
+        best = int(np.argmax(window))
+        energy = np.sqrt(self.energy * float(np.dot(other, other)))
+        return self.max_lag - best, float(window[best] / energy) if energy else 0.0
+
+
+def _robust_fit(de: np.ndarray, en: np.ndarray) -> Tuple[float, float, np.ndarray]:
+    """(scale, offset, inlier mask) of en ~ de * scale + offset with MAD trimming"""
+    keep = np.ones(len(de), dtype=bool)
+    scale, offset = 1.0, float(np.median(en - de))
+    for _ in range(FIT_ITERATIONS):
+        if keep.sum() < 2:
+            break
+        if np.ptp(de[keep]) > 0:
+            scale, offset = np.polyfit(de[keep], en[keep], 1)
+        else:
+            offset = float(np.median(en[keep] - de[keep]))
+        residuals = en - (de * scale + offset)
+        spread = 1.4826 * np.median(np.abs(residuals[keep] - np.median(residuals[keep])))
+        keep = np.abs(residuals) <= max(3 * spread, FIT_TOLERANCE_MS)
+    return float(scale), float(offset), keep
+
+
+def estimate_retiming(
+    en_starts: Sequence[int],
+    de_starts: Sequence[int],
+    max_offset_ms: int = DEFAULT_MAX_OFFSET_MS,
+    scales: Sequence[float] = SCALES,
+    bin_ms: int = BIN_MS,
+    smooth_bins: int = SMOOTH_BINS,
+) -> Retiming:
+    """Estimate the map from DE onsets (ms) onto EN onsets (ms)"""
+    en = np.sort(np.asarray(en_starts, dtype=np.float64))
+    de = np.sort(np.asarray(de_starts, dtype=np.float64))
+    if len(en) < MIN_CUES or len(de) < MIN_CUES:
+        return IDENTITY
+
+    bins = int(max(en[-1], de[-1] * max(scales)) // bin_ms) + smooth_bins + 1
+    max_lag = max(1, min(max_offset_ms // bin_ms, bins - 1))
+    correlator = _Correlator(onset_signal(en, bins, bin_ms, smooth_bins), max_lag)
+    best = None
+    for scale in scales:
+        lag, score = correlator.best_lag(onset_signal(de * scale, bins, bin_ms, smooth_bins))
+        if best is None or score > best[2]:
+            best = (scale, lag * bin_ms, score)
+    scale, offset, _ = best
+
+    # Pair each mapped DE onset with the nearest EN onset, then refit
+    mapped = de * scale + offset
+    nearest = np.clip(np.searchsorted(en, mapped), 1, len(en) - 1)
+    nearest = np.where(mapped - en[nearest - 1] < en[nearest] - mapped, nearest - 1, nearest)
+    close = np.abs(en[nearest] - mapped) <= MATCH_TOLERANCE_MS
+    if close.sum() >= MIN_CUES:
+        scale, offset, inliers = _robust_fit(de[close], en[nearest[close]])
+        matched = int(inliers.sum())
+    else:
+        matched = int(close.sum())
+
+    confidence = matched / len(de)
+    # Largest shift the correction makes anywhere in the track
+    correction = max(abs(de[0] * (scale - 1) + offset), abs(de[-1] * (scale - 1) + offset))
+    applied = confidence >= MIN_CONFIDENCE and correction > MIN_CORRECTION_MS
+    return Retiming(scale, offset, float(confidence), matched, bool(applied))
+
+
+def retime_cues(cues: Sequence, retiming: Retiming) -> List:
+    """Copies of cues moved by retiming, or cues itself when it was not applied.
+
+    CompactCues stay CompactCues; SubtitleCues keep Decimal seconds.
+    """
+    if not retiming.applied:
+        return list(cues)
+    retimed = []
+    for cue in cues:
+        if getattr(cue, "start_ms", None) is not None:
+            retimed.append(type(cue)(
+                max(0, retiming.map_ms(cue.start_ms)),
+                max(0, retiming.map_ms(cue.end_ms)),
+                cue.text,
+                cue.text_normalized,
+                cue.index,
+            ))
+        else:
+            start = max(0, retiming.map_ms(int(cue.start_time * 1000)))
+            end = max(0, retiming.map_ms(int(cue.end_time * 1000)))
+            retimed.append(replace(
+                cue, start_time=Decimal(start) / 1000, end_time=Decimal(end) / 1000
+            ))
+    return retimed
@@ -0,0 +1,260 @@
+"""
+Scene segmentation and pre-built lesson bundles
+
+Splits each movie's subtitle_pairs into scenes wherever the dialogue pauses
+for at least gap_ms, and materializes one lesson per scene: its pairs with
+timings and the scene's most useful words (ranked by movie_vocab). Each
+lesson is encoded to JSON once, gzip-compressed and stored on the scene
+row with its ETag, so the lesson endpoint returns the stored bytes as they
+are. A scene's id is derived from its first pair, so when a track update
+rebuilds the scenes, lessons whose pairs survived keep their ids and only
+changed bundles are rewritten.
+"""
+
+import gzip
+import hashlib
+import logging
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import aliased
+
+from .database_models import Movie, MovieVocab, Scene, Subtitle, SubtitlePair, Vocab
+from .response_cache import encode_json
+from .vocabulary import tokenize
+
+logger = logging.getLogger(__name__)
+
+# A pause this long between pairs starts a new scene
+SCENE_GAP_MS = 4000
+# Longer runs are split into even parts so a lesson stays short
+MAX_SCENE_PAIRS = 40
+# Words listed per language in a lesson
+LESSON_VOCAB_SIZE = 10
+LANGS = ("en", "de")
+
+
+def segment_scenes(
+    starts: np.ndarray, ends: np.ndarray, gap_ms: int = SCENE_GAP_MS, max_pairs: int = MAX_SCENE_PAIRS
+) -> List[Tuple[int, int]]:
+    """[start, stop) index ranges of scenes over pairs sorted by start time"""
+    n = len(starts)
+    if not n:
+        return []
+    # A pair may end after later ones, so measure each gap from the furthest end so far
+    reach = np.maximum.accumulate(ends)
+    breaks = np.nonzero(starts[1:] - reach[:-1] >= gap_ms)[0] + 1
+    bounds = [0] + breaks.tolist() + [n]
+
+    scenes = []
+    for first, stop in zip(bounds, bounds[1:]):
+        size = stop - first
+        parts = -(-size // max_pairs)
+        scenes.extend(
+            (first + size * k // parts, first + size * (k + 1) // parts) for k in range(parts)
+        )
+    return scenes
+
+
+def load_scene_pairs(conn, movie_id: uuid.UUID) -> List[Tuple]:
+    """(pair_id, start_ms, end_ms, en_text, de_text, en_normalized, de_normalized), by start"""
+    en = aliased(Subtitle)
+    de = aliased(Subtitle)
+    result = conn.execute(
+        select(
+            SubtitlePair.id, en.start_ts, en.end_ts, de.start_ts, de.end_ts,
+            en.text, de.text, en.text_normalized, de.text_normalized,
+        )
+        .join(en, en.id == SubtitlePair.en_id)
+        .join(de, de.id == SubtitlePair.de_id)
+        .where(SubtitlePair.movie_id == movie_id)
+    )
+    pairs = [
+        (
+            row[0],
+            int(round(min(row[1], row[3]) * 1000)),
+            int(round(max(row[2], row[4]) * 1000)),
+            row[5], row[6], row[7] or "", row[8] or "",
+        )
+        for row in result
+    ]
+    pairs.sort(key=lambda pair: (pair[1], pair[2]))
+    return pairs
+
+
+def load_vocab_ranks(conn, movie_id: uuid.UUID) -> Dict[Tuple[str, str], Tuple[uuid.UUID, int]]:
+    """(lang, word) -> (vocab id, frequency rank in the movie)"""
+    result = conn.execute(
+        select(MovieVocab.lang, Vocab.word, MovieVocab.vocab_id, MovieVocab.rank)
+        .join(Vocab, Vocab.id == MovieVocab.vocab_id)
+        .where(MovieVocab.movie_id == movie_id)
+    )
+    return {(lang, word): (vocab_id, rank) for lang, word, vocab_id, rank in result}
+
+
+def scene_vocabulary(pairs: Sequence[Tuple], ranks: Dict, size: int = LESSON_VOCAB_SIZE) -> List[Dict]:
+    """The scene's words that are most frequent across the whole movie, per language"""
+    words = defaultdict(set)
+    for pair in pairs:
+        words["en"].update(tokenize(pair[5]))
+        words["de"].update(tokenize(pair[6]))
+
+    entries = []
+    for lang in LANGS:
+        ranked = sorted(
+            (ranks[lang, word][1], word) for word in words[lang] if (lang, word) in ranks
+        )
+        entries.extend(
+            {"vocab_id": str(ranks[lang, word][0]), "word": word, "lang": lang, "movie_rank": rank}
+            for rank, word in ranked[:size]
+        )
+    return entries
+
+
+def encode_bundle(lesson: Dict) -> Tuple[bytes, str]:
+    """gzip-compressed JSON and the strong ETag of the compressed bytes"""
+    body = gzip.compress(encode_json(lesson), compresslevel=9, mtime=0)
+    return body, '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def scene_id(movie_id: uuid.UUID, first_pair_id: uuid.UUID) -> uuid.UUID:
+    """Stable lesson id of the scene starting with first_pair_id"""
+    return uuid.uuid5(movie_id, str(first_pair_id))
+
+
+def build_scene_rows(
+    movie_id: uuid.UUID,
+    title: str,
+    pairs: Sequence[Tuple],
+    ranks: Dict,
+    gap_ms: int = SCENE_GAP_MS,
+    max_pairs: int = MAX_SCENE_PAIRS,
+) -> List[Dict]:
+    """scenes rows, lesson bundles included, for one movie's sorted pairs"""
+    starts = np.fromiter((pair[1] for pair in pairs), dtype=np.int64, count=len(pairs))
+    ends = np.fromiter((pair[2] for pair in pairs), dtype=np.int64, count=len(pairs))
+    bounds = segment_scenes(starts, ends, gap_ms, max_pairs)
+
+    rows = []
+    for ordinal, (first, stop) in enumerate(bounds, start=1):
+        scene_pairs = pairs[first:stop]
+        lesson_id = scene_id(movie_id, scene_pairs[0][0])
+        start_ms, end_ms = int(starts[first]), int(ends[first:stop].max())
+        lesson = {
+            "lesson_id": str(lesson_id),
+            "movie_id": str(movie_id),
+            "movie_title": title,
+            "scene_number": ordinal,
+            "total_scenes": len(bounds),
+            "start_time": start_ms / 1000,
+            "end_time": end_ms / 1000,
+            "subtitle_pairs": [
+                {
+                    "pair_id": str(pair[0]),
+                    "english": pair[3],
+                    "german": pair[4],
+                    "start_time": pair[1] / 1000,
+                    "end_time": pair[2] / 1000,
+                }
+                for pair in scene_pairs
+            ],
+            "vocabulary": scene_vocabulary(scene_pairs, ranks),
+        }
+        bundle, etag = encode_bundle(lesson)
+        rows.append({
+            "id": lesson_id,
+            "movie_id": movie_id,
+            "ordinal": ordinal,
+            "start_ts": start_ms / 1000,
+            "end_ts": end_ms / 1000,
+            "pair_count": len(scene_pairs),
+            "bundle": bundle,
+            "etag": etag,
+        })
+    return rows
+
+
+def build_scenes(
+    conn,
+    movie_ids: Sequence[uuid.UUID],
+    gap_ms: int = SCENE_GAP_MS,
+    max_pairs: int = MAX_SCENE_PAIRS,
+) -> int:
+    """Replace the scenes of movie_ids from their current pairs; returns the scene count"""
+    movie_ids = list(movie_ids)
+    if not movie_ids:
+        return 0
+    titles = dict(conn.execute(select(Movie.id, Movie.title).where(Movie.id.in_(movie_ids))).all())
+    conn.execute(delete(Scene).where(Scene.movie_id.in_(movie_ids)))
+
+    total = 0
+    for movie_id in movie_ids:
+        rows = _movie_scene_rows(conn, movie_id, titles.get(movie_id, ""), gap_ms, max_pairs)
+        if rows:
+            conn.execute(insert(Scene), rows)
+        total += len(rows)
+    logger.info("Built %d scenes for %d movies", total, len(movie_ids))
+    return total
+
+
+def refresh_scenes(
+    conn,
+    movie_ids: Sequence[uuid.UUID],
+    gap_ms: int = SCENE_GAP_MS,
+    max_pairs: int = MAX_SCENE_PAIRS,
+) -> int:
+    """Rebuild scenes of movies changed in place, writing only rows whose bundle changed"""
+    movie_ids = list(movie_ids)
+    if not movie_ids:
+        return 0
+    titles = dict(conn.execute(select(Movie.id, Movie.title).where(Movie.id.in_(movie_ids))).all())
+
+    written = 0
+    for movie_id in movie_ids:
+        stored = dict(conn.execute(select(Scene.id, Scene.etag).where(Scene.movie_id == movie_id)).all())
+        rows = _movie_scene_rows(conn, movie_id, titles.get(movie_id, ""), gap_ms, max_pairs)
+        etags = {row["id"]: row["etag"] for row in rows}
+        # Changed rows are deleted and re-inserted, so a shifted ordinal never collides
+        stale = [sid for sid, etag in stored.items() if etags.get(sid) != etag]
+        if stale:
+            conn.execute(delete(Scene).where(Scene.id.in_(stale)))
+        rows = [row for row in rows if stored.get(row["id"]) != row["etag"]]
+        if rows:
+            conn.execute(insert(Scene), rows)
+        written += len(rows)
+    logger.info("Rewrote %d scenes for %d movies", written, len(movie_ids))
+    return written
+
+
+def _movie_scene_rows(conn, movie_id: uuid.UUID, title: str, gap_ms: int, max_pairs: int) -> List[Dict]:
+    return build_scene_rows(
+        movie_id,
+        title,
+        load_scene_pairs(conn, movie_id),
+        load_vocab_ranks(conn, movie_id),
+        gap_ms,
+        max_pairs,
+    )
+
+
+class SceneStage:
+    """Post-load ingestion stage segmenting new movies into lesson scenes.
+
+    Runs after VocabularyStage, whose movie_vocab ranks pick each lesson's words.
+    """
+
+    name = "scenes"
+
+    def __init__(self, gap_ms: int = SCENE_GAP_MS, max_pairs: int = MAX_SCENE_PAIRS):
+        self.gap_ms = gap_ms
+        self.max_pairs = max_pairs
+
+    def run(self, conn, staged: Sequence) -> None:
+        build_scenes(conn, [item.movie_id for item in staged], self.gap_ms, self.max_pairs)
+
+    def refresh(self, conn, staged: Sequence) -> None:
+        """Rewrite only the lessons of movies changed in place whose bundles differ"""
+        refresh_scenes(conn, [item.movie_id for item in staged], self.gap_ms, self.max_pairs)
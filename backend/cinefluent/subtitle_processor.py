@@ -0,0 +1,499 @@
+"""
+Stage 1 - Subtitle Processing Engine
+
+Parses SRT/ASS/VTT subtitle files, cleans cue text, aligns EN/DE tracks
+and validates the results before ingestion.
+"""
+
+import codecs
+import mmap
+import re
+from array import array
+from dataclasses import dataclass
+from decimal import Decimal
+from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from .alignment import MIN_ALIGNMENT_SCORE, MonotonicAligner, cue_ms
+
+if TYPE_CHECKING:
+    from .retiming import Retiming
+
+
+PathLike = Union[str, Path]
+
+SUPPORTED_FORMATS = {".srt", ".ass", ".ssa", ".vtt"}
+
+
+@dataclass
+class SubtitleCue:
+    """A single subtitle cue with timestamps in seconds"""
+
+    start_time: Decimal
+    end_time: Decimal
+    text: str
+    text_normalized: str
+    index: int
+
+    @property
+    def duration(self) -> Decimal:
+        return self.end_time - self.start_time
+
+
+class CompactCue:
+    """Memory-light cue produced by the streaming parser.
+
+    Times are integer milliseconds. ``start_time``/``end_time`` are exposed
+    as ``Decimal`` seconds so a CompactCue can be passed anywhere a
+    SubtitleCue is expected.
+    """
+
+    __slots__ = ("start_ms", "end_ms", "text", "text_normalized", "index")
+
+    def __init__(
+        self,
+        start_ms: int,
+        end_ms: int,
+        text: str,
+        text_normalized: str = "",
+        index: int = 0,
+    ):
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.text = text
+        self.text_normalized = text_normalized
+        self.index = index
+
+    @property
+    def start_time(self) -> Decimal:
+        return Decimal(self.start_ms) / 1000
+
+    @property
+    def end_time(self) -> Decimal:
+        return Decimal(self.end_ms) / 1000
+
+    @property
+    def duration(self) -> Decimal:
+        return Decimal(self.end_ms - self.start_ms) / 1000
+
+    def to_cue(self) -> SubtitleCue:
+        return SubtitleCue(
+            self.start_time, self.end_time, self.text, self.text_normalized, self.index
+        )
+
+    def __eq__(self, other):
+        if not isinstance(other, CompactCue):
+            return NotImplemented
+        return (
+            self.start_ms == other.start_ms
+            and self.end_ms == other.end_ms
+            and self.text == other.text
+            and self.index == other.index
+        )
+
+    def __repr__(self):
+        return (
+            f"CompactCue({self.index}, {self.start_ms}ms-{self.end_ms}ms, "
+            f"{self.text!r})"
+        )
+
+
+class CueBlock:
+    """Array-backed batch of consecutive cues.
+
+    Starts and ends are stored in ``array('q')`` so a block can be handed to
+    NumPy (``np.frombuffer``) or the database writer without per-cue objects.
+    """
+
+    __slots__ = ("starts", "ends", "texts", "normalized", "indices")
+
+    def __init__(self):
+        self.starts = array("q")
+        self.ends = array("q")
+        self.texts: List[str] = []
+        self.normalized: List[str] = []
+        self.indices = array("q")
+
+    def append(self, cue: CompactCue):
+        self.starts.append(cue.start_ms)
+        self.ends.append(cue.end_ms)
+        self.texts.append(cue.text)
+        self.normalized.append(cue.text_normalized)
+        self.indices.append(cue.index)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self) -> Iterator[CompactCue]:
+        for i in range(len(self.starts)):
+            yield CompactCue(
+                self.starts[i],
+                self.ends[i],
+                self.texts[i],
+                self.normalized[i],
+                self.indices[i],
+            )
+
+
+class TextCleaner:
+    """Normalizes subtitle text for alignment and vocabulary extraction.
+
+    Tag and ASS override passes only run when the text contains markup
+    characters, and whitespace is collapsed with split/join. Results are
+    memoized in a
+    bounded LRU keyed on the raw text, since subtitle corpora repeat short
+    lines ("Yes.", "What?") constantly.
+    """
+
+    DEFAULT_CACHE_SIZE = 65536
+
+    HTML_TAG_RE = re.compile(r"<[^>]+>")
+    FORMATTING_RE = re.compile(r"\{[^}]*\}")
+
+    def __init__(self, cache_size: int = DEFAULT_CACHE_SIZE):
+        self._cached_clean = lru_cache(maxsize=cache_size)(self._clean)
+
+    def _clean(self, text: str) -> str:
+        # Order matters: removing a tag can leave a backslash next to an N
+        if "<" in text:
+            text = self.HTML_TAG_RE.sub("", text)
+        if "{" in text:
+            text = self.FORMATTING_RE.sub("", text)
+        if "\\" in text:
+            text = text.replace("\\N", " ").replace("\\n", " ")
+        return " ".join(text.lower().split())
+
+    def clean_text(self, text: Optional[str]) -> str:
+        if not text:
+            return ""
+        return self._cached_clean(text)
+
+    def clean_many(self, texts: Iterable[Optional[str]]) -> List[str]:
+        """Clean a batch of texts, sharing the memo across the batch"""
+        cached = self._cached_clean
+        return [cached(text) if text else "" for text in texts]
+
+    def cache_info(self) -> Dict:
+        """Hit/miss counters for the normalization cache"""
+        info = self._cached_clean.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            "hits": info.hits,
+            "misses": info.misses,
+            "size": info.currsize,
+            "max_size": info.maxsize,
+            "hit_rate": round(info.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def clear_cache(self):
+        self._cached_clean.cache_clear()
+
+    def __reduce__(self):
+        # The memo is per process; pickling (e.g. to pool workers) starts empty
+        return type(self), (self._cached_clean.cache_info().maxsize,)
+
+
+# --- Streaming parser -------------------------------------------------------
+
+_TIMING_RE = re.compile(
+    r"^\s*((?:\d+:)?\d{1,2}:\d{2}[,.]\d{1,3})\s*-->\s*((?:\d+:)?\d{1,2}:\d{2}[,.]\d{1,3})"
+)
+_ASS_OVERRIDE_RE = re.compile(r"\{[^}]*\}")
+# SRT/VTT styling (<i>, <font ...>, <c.yellow>); pysubs2 drops anything in angle brackets too
+_MARKUP_TAG_RE = re.compile(r"<[^>]+>")
+
+
+def _plain_text(text: str) -> str:
+    """Display text without markup, matching pysubs2's plaintext"""
+    text = _ASS_OVERRIDE_RE.sub("", text)
+    return text.replace("\\N", "\n").replace("\\n", "\n").replace("\\h", " ").strip()
+
+
+def parse_timestamp_ms(value: str) -> int:
+    """Parse an SRT/VTT/ASS timestamp into integer milliseconds"""
+    parts = value.strip().replace(",", ".").split(":")
+    seconds, _, fraction = parts[-1].partition(".")
+    ms = int(seconds) * 1000 + int((fraction + "000")[:3])
+    multiplier = 60_000
+    for part in reversed(parts[:-1]):
+        ms += int(part) * multiplier
+        multiplier *= 60
+    return ms
+
+
+def _decode_line(raw: bytes, encoding: str) -> str:
+    try:
+        return raw.decode(encoding)
+    except UnicodeDecodeError:
+        return raw.decode("cp1252", errors="replace")
+
+
+def _iter_file_lines(file_path: Path, encoding: Optional[str] = None) -> Iterator[str]:
+    """Yield decoded lines from a memory-mapped subtitle file"""
+    with open(file_path, "rb") as f:
+        head = f.read(4)
+        if not head:
+            return
+        if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+            # UTF-16 cannot be split on raw newline bytes; the text layer
+            # still reads incrementally.
+            f.seek(0)
+            with open(file_path, "r", encoding="utf-16", newline=None) as text:
+                for line in text:
+                    yield line.rstrip("\r\n")
+            return
+
+        f.seek(0)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if head.startswith(codecs.BOM_UTF8):
+                mm.seek(len(codecs.BOM_UTF8))
+            encoding = encoding or "utf-8"
+            for raw in iter(mm.readline, b""):
+                yield _decode_line(raw, encoding).rstrip("\r\n")
+
+
+def _timed_cue(start_ms: int, end_ms: int, text_lines: List[str]) -> Iterator[Tuple[int, int, str]]:
+    text = _plain_text(_MARKUP_TAG_RE.sub("", "\n".join(text_lines)))
+    if text:
+        yield start_ms, end_ms, text
+
+
+def _iter_timed_text(lines: Iterable[str]) -> Iterator[Tuple[int, int, str]]:
+    """Parse SRT/VTT style blocks into (start_ms, end_ms, text) tuples.
+
+    Blank lines end a cue, but a timing line always starts a new one, so
+    dumps that were concatenated without separators still parse.
+    """
+    start_ms = end_ms = None
+    text_lines: List[str] = []
+
+    for line in lines:
+        match = _TIMING_RE.match(line)
+        if match:
+            if start_ms is not None:
+                # A bare number right before a timing line is the next
+                # cue's index, not dialogue.
+                if text_lines and text_lines[-1].strip().isdigit():
+                    text_lines.pop()
+                yield from _timed_cue(start_ms, end_ms, text_lines)
+            start_ms = parse_timestamp_ms(match.group(1))
+            end_ms = parse_timestamp_ms(match.group(2))
+            text_lines = []
+        elif not line.strip():
+            if start_ms is not None:
+                yield from _timed_cue(start_ms, end_ms, text_lines)
+            start_ms = end_ms = None
+            text_lines = []
+        elif start_ms is not None:
+            text_lines.append(line.strip())
+
+    if start_ms is not None:
+        yield from _timed_cue(start_ms, end_ms, text_lines)
+
+
+def _iter_ass_events(lines: Iterable[str]) -> Iterator[Tuple[int, int, str]]:
+    """Parse Dialogue lines of an ASS/SSA [Events] section"""
+    in_events = False
+    fields: List[str] = []
+
+    for line in lines:
+        stripped = line.strip()
+        if stripped.startswith("["):
+            in_events = stripped.lower() == "[events]"
+            continue
+        if not in_events:
+            continue
+
+        key, _, value = stripped.partition(":")
+        key = key.lower()
+        if key == "format":
+            fields = [f.strip().lower() for f in value.split(",")]
+        elif key == "dialogue" and fields:
+            values = value.split(",", len(fields) - 1)
+            if len(values) != len(fields):
+                continue
+            event = dict(zip(fields, values))
+            text = _plain_text(event.get("text", ""))
+            if not text:
+                continue
+            yield parse_timestamp_ms(event["start"]), parse_timestamp_ms(event["end"]), text
+
+
+def iter_subtitle_file(
+    file_path: PathLike,
+    encoding: Optional[str] = None,
+    cleaner: Optional[TextCleaner] = None,
+) -> Iterator[CompactCue]:
+    """Lazily parse a subtitle file into CompactCue objects.
+
+    The file is memory-mapped and decoded line by line, so memory use does
+    not depend on the file size.
+    """
+    file_path = Path(file_path)
+    suffix = file_path.suffix.lower()
+    if suffix not in SUPPORTED_FORMATS:
+        raise ValueError(f"Unsupported subtitle format: {suffix}")
+
+    lines = _iter_file_lines(file_path, encoding)
+    events = _iter_ass_events(lines) if suffix in (".ass", ".ssa") else _iter_timed_text(lines)
+
+    index = 0
+    for start_ms, end_ms, text in events:
+        index += 1
+        normalized = cleaner.clean_text(text) if cleaner else ""
+        yield CompactCue(start_ms, end_ms, text, normalized, index)
+
+
+def iter_cue_blocks(cues: Iterable[CompactCue], block_size: int = 1024) -> Iterator[CueBlock]:
+    """Group a cue stream into array-backed blocks of at most block_size cues"""
+    block = CueBlock()
+    for cue in cues:
+        block.append(cue)
+        if len(block) >= block_size:
+            yield block
+            block = CueBlock()
+    if len(block):
+        yield block
+
+
+class SubtitleProcessor:
+    """Parses, retimes and aligns subtitle files"""
+
+    def __init__(self, cleaner: Optional[TextCleaner] = None, retime: bool = True):
+        self.cleaner = cleaner or TextCleaner()
+        self.retime_enabled = retime
+
+    def parse_subtitle_file(
+        self, file_path: PathLike, encoding: Optional[str] = None
+    ) -> List[SubtitleCue]:
+        """Parse a subtitle file into a list of SubtitleCue objects"""
+        file_path = Path(file_path)
+        if file_path.suffix.lower() not in SUPPORTED_FORMATS:
+            raise ValueError(f"Unsupported subtitle format: {file_path.suffix}")
+
+        import pysubs2  # only the parsing path needs it
+
+        subs = pysubs2.load(str(file_path), encoding=encoding or "utf-8")
+
+        cues = []
+        for event in subs:
+            if event.is_comment:
+                continue
+            text = event.plaintext.strip()
+            if not text:
+                continue
+            cues.append(
+                SubtitleCue(
+                    start_time=Decimal(event.start) / 1000,
+                    end_time=Decimal(event.end) / 1000,
+                    text=text,
+                    text_normalized=self.cleaner.clean_text(text),
+                    index=len(cues) + 1,
+                )
+            )
+        return cues
+
+    def stream_subtitle_file(
+        self, file_path: PathLike, encoding: Optional[str] = None
+    ) -> Iterator[CompactCue]:
+        """Streaming counterpart of parse_subtitle_file.
+
+        Yields CompactCue objects with integer-millisecond times and
+        normalized text as soon as each cue has been read.
+        """
+        return iter_subtitle_file(file_path, encoding=encoding, cleaner=self.cleaner)
+
+    def retime(self, en_cues: List, de_cues: List) -> Tuple[List, Optional["Retiming"]]:
+        """Move de_cues onto the EN timeline when the tracks are offset or drift apart.
+
+        Returns the (possibly retimed) DE cues and the estimate, which is
+        None when retiming is disabled. See cinefluent.retiming.
+        """
+        if not self.retime_enabled:
+            return de_cues, None
+        from .retiming import estimate_retiming, retime_cues  # NumPy is for ingestion only
+
+        retiming = estimate_retiming(
+            [cue_ms(cue)[0] for cue in en_cues], [cue_ms(cue)[0] for cue in de_cues]
+        )
+        return retime_cues(de_cues, retiming), retiming
+
+    def align_subtitles(
+        self,
+        en_cues: List[SubtitleCue],
+        de_cues: List[SubtitleCue],
+        min_score: float = MIN_ALIGNMENT_SCORE,
+    ) -> List[Tuple[SubtitleCue, SubtitleCue, float]]:
+        """Align EN and DE cues into (en, de, score) tuples.
+
+        Uses the monotonic sweep + banded DP engine, so cost is roughly
+        linear in the number of cues. When one line is split across two
+        cues in the other language, each half is returned as its own tuple
+        sharing the merged group's score.
+        """
+        return MonotonicAligner(min_score=min_score).align(en_cues, de_cues)
+
+
+class SubtitleValidator:
+    """Sanity checks for parsed cues and aligned pairs"""
+
+    MAX_CUE_DURATION = Decimal("10.0")
+    MAX_ISSUE_RATIO = 0.1
+
+    def validate_cues(self, cues: List[SubtitleCue]) -> Dict:
+        if not cues:
+            return {"valid": False, "count": 0, "issues": [], "error": "No subtitle cues found"}
+
+        issues = []
+        previous = None
+        for cue in cues:
+            if cue.end_time <= cue.start_time:
+                issues.append(f"Cue {cue.index}: end time before start time")
+            elif cue.end_time - cue.start_time > self.MAX_CUE_DURATION:
+                issues.append(f"Cue {cue.index}: unusually long duration")
+            if not cue.text.strip():
+                issues.append(f"Cue {cue.index}: empty text")
+            if previous is not None and cue.start_time < previous.start_time:
+                issues.append(f"Cue {cue.index}: out of order")
+            previous = cue
+
+        return {
+            "valid": len(issues) <= len(cues) * self.MAX_ISSUE_RATIO,
+            "count": len(cues),
+            "issues": issues,
+        }
+
+    def validate_alignment(
+        self,
+        aligned_pairs: List[Tuple[SubtitleCue, SubtitleCue, float]],
+        retiming: Optional["Retiming"] = None,
+    ) -> Dict:
+        """Summarize pair scores; reports the DE retiming when one was estimated"""
+        extra = {"retiming": retiming.as_dict()} if retiming is not None else {}
+        if not aligned_pairs:
+            return {
+                "valid": False, "count": 0, "quality": "poor", "error": "No aligned pairs", **extra
+            }
+
+        scores = [score for _, _, score in aligned_pairs]
+        average = sum(scores) / len(scores)
+        low_confidence = sum(1 for score in scores if score < 0.5)
+
+        if average >= 0.85:
+            quality = "excellent"
+        elif average >= 0.7:
+            quality = "good"
+        elif average >= 0.5:
+            quality = "fair"
+        else:
+            quality = "poor"
+
+        return {
+            "valid": quality != "poor",
+            "count": len(aligned_pairs),
+            "average_score": round(average, 4),
+            "low_confidence_count": low_confidence,
+            "quality": quality,
+            **extra,
+        }
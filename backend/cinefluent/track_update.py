@@ -0,0 +1,337 @@
+"""
+Incremental updates of one language track
+
+A corrected subtitle file usually changes a handful of lines, so replacing
+it does not delete and re-insert the movie. Instead:
+
+1. The new cues are diffed against the stored track of that language with
+   difflib on their text. Matched lines whose times moved by more than
+   TIMING_TOLERANCE_MS are updates. In a replaced block, the old cues hand
+   their ids to the new ones in order, and the rest are inserts or deletes.
+   Surviving cues keep their subtitle ids.
+2. Only windows around the changes are re-aligned. Each window is widened
+   until no stored pair or cue straddles its edge, so pairs outside the
+   windows stay valid as they are.
+3. A window's new pairs are matched to its stored pairs by (en_id, de_id).
+   A match keeps its pair id and only has its score updated when it
+   changed; the rest are inserted or deleted.
+"""
+
+import uuid
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from decimal import Decimal
+from difflib import SequenceMatcher
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from sqlalchemy import bindparam, delete, insert, select, update
+
+from .alignment import DEFAULT_SLACK_MS
+from .database_models import Subtitle, SubtitlePair
+from .subtitle_processor import CompactCue
+
+# Matched lines whose start and end moved by at most this much are unchanged
+TIMING_TOLERANCE_MS = 5
+# Changes are widened by this much before the window is closed over pairs
+WINDOW_PADDING_MS = DEFAULT_SLACK_MS
+
+Span = Tuple[int, int]
+# (pair_id, en_id, de_id, score)
+PairRow = Tuple[uuid.UUID, uuid.UUID, uuid.UUID, float]
+
+
+@dataclass
+class StoredTrack:
+    """One language's cues in start order, with their subtitle ids.
+
+    Each cue's index is its position, so aligned tuples map back to ids.
+    """
+
+    ids: List[uuid.UUID]
+    cues: List[CompactCue]
+
+
+@dataclass
+class TrackDiff:
+    track: StoredTrack  # the new track; surviving cues keep their ids
+    kept: int = 0
+    updated: List[int] = field(default_factory=list)  # positions in track
+    inserted: List[int] = field(default_factory=list)
+    deleted: List[uuid.UUID] = field(default_factory=list)
+    spans: List[Span] = field(default_factory=list)  # times touched, old and new
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.updated or self.inserted or self.deleted)
+
+
+@dataclass
+class TrackUpdate:
+    diff: TrackDiff
+    windows: List[Span]
+    pairs: List[PairRow]  # every pair of the movie after the update
+    inserted_pairs: List[PairRow] = field(default_factory=list)
+    deleted_pairs: List[uuid.UUID] = field(default_factory=list)
+    rescored_pairs: List[Tuple[uuid.UUID, float]] = field(default_factory=list)
+    kept_pairs: int = 0
+    realigned_cues: int = 0
+
+    @property
+    def changed(self) -> bool:
+        return self.diff.changed or bool(
+            self.inserted_pairs or self.deleted_pairs or self.rescored_pairs
+        )
+
+
+def _ms(value) -> int:
+    return int(round(float(value) * 1000))
+
+
+def _seconds(ms: int) -> Decimal:
+    return Decimal(ms) / 1000
+
+
+def load_track(conn, movie_id: uuid.UUID, lang: str) -> StoredTrack:
+    """The movie's stored cues in one language"""
+    rows = conn.execute(
+        select(
+            Subtitle.id, Subtitle.start_ts, Subtitle.end_ts, Subtitle.text, Subtitle.text_normalized
+        )
+        .where(Subtitle.movie_id == movie_id, Subtitle.lang == lang)
+        .order_by(Subtitle.start_ts, Subtitle.end_ts, Subtitle.id)
+    ).all()
+    return StoredTrack(
+        [row[0] for row in rows],
+        [
+            CompactCue(_ms(start), _ms(end), text, normalized or "", i)
+            for i, (_, start, end, text, normalized) in enumerate(rows)
+        ],
+    )
+
+
+def load_pairs(conn, movie_id: uuid.UUID) -> List[PairRow]:
+    rows = conn.execute(
+        select(
+            SubtitlePair.id, SubtitlePair.en_id, SubtitlePair.de_id, SubtitlePair.alignment_score
+        ).where(SubtitlePair.movie_id == movie_id)
+    )
+    return [
+        (pair_id, en_id, de_id, round(float(score if score is not None else 1), 2))
+        for pair_id, en_id, de_id, score in rows
+    ]
+
+
+def _retimed_within(old: CompactCue, new: CompactCue, tolerance_ms: int) -> bool:
+    return (
+        abs(old.start_ms - new.start_ms) <= tolerance_ms
+        and abs(old.end_ms - new.end_ms) <= tolerance_ms
+    )
+
+
+def diff_track(
+    old: StoredTrack, new_cues: Sequence[CompactCue], tolerance_ms: int = TIMING_TOLERANCE_MS
+) -> TrackDiff:
+    """Match new_cues against the stored track and classify every cue"""
+    new_cues = sorted(new_cues, key=lambda cue: (cue.start_ms, cue.end_ms))
+    matcher = SequenceMatcher(
+        None, [cue.text for cue in old.cues], [cue.text for cue in new_cues], autojunk=False
+    )
+    diff = TrackDiff(StoredTrack([], []))
+    ids, cues = diff.track.ids, diff.track.cues
+
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        for i, j in zip(range(i1, i2), range(j1, j2)):
+            before, after = old.cues[i], new_cues[j]
+            if tag == "equal" and _retimed_within(before, after, tolerance_ms):
+                # Keep the stored times so an unchanged line is not rewritten
+                diff.kept += 1
+                after = CompactCue(
+                    before.start_ms, before.end_ms, after.text, after.text_normalized
+                )
+            else:
+                diff.updated.append(len(cues))
+                diff.spans.append(
+                    (min(before.start_ms, after.start_ms), max(before.end_ms, after.end_ms))
+                )
+            ids.append(old.ids[i])
+            cues.append(after)
+        for j in range(j1 + (i2 - i1), j2):
+            diff.inserted.append(len(cues))
+            diff.spans.append((new_cues[j].start_ms, new_cues[j].end_ms))
+            ids.append(uuid.uuid4())
+            cues.append(new_cues[j])
+        for i in range(i1 + (j2 - j1), i2):
+            diff.deleted.append(old.ids[i])
+            diff.spans.append((old.cues[i].start_ms, old.cues[i].end_ms))
+
+    # Updated times can reorder cues; positions are renumbered to match
+    order = sorted(range(len(cues)), key=lambda k: (cues[k].start_ms, cues[k].end_ms))
+    position = {k: n for n, k in enumerate(order)}
+    diff.track = StoredTrack([ids[k] for k in order], [cues[k] for k in order])
+    for n, cue in enumerate(diff.track.cues):
+        cue.index = n
+    diff.updated = sorted(position[k] for k in diff.updated)
+    diff.inserted = sorted(position[k] for k in diff.inserted)
+    return diff
+
+
+def affected_windows(seeds: Sequence[Span], extents: Sequence[Span]) -> List[Span]:
+    """Close each seed span over the extents that overlap it, transitively.
+
+    Returns the merged windows. No extent overlaps a window without lying
+    inside it.
+    """
+    items = sorted([(lo, hi, True) for lo, hi in seeds] + [(lo, hi, False) for lo, hi in extents])
+    windows: List[Span] = []
+    lo = hi = None
+    seeded = False
+    for start, end, seed in items:
+        if hi is not None and start < hi:
+            hi = max(hi, end)
+            seeded = seeded or seed
+            continue
+        if seeded:
+            windows.append((lo, hi))
+        lo, hi, seeded = start, end, seed
+    if seeded:
+        windows.append((lo, hi))
+    return windows
+
+
+def _overlapping(track: StoredTrack, window: Span) -> List[CompactCue]:
+    lo, hi = window
+    return [cue for cue in track.cues if cue.start_ms < hi and cue.end_ms > lo]
+
+
+def plan_update(
+    tracks: Dict[str, StoredTrack],
+    lang: str,
+    new_cues: Sequence[CompactCue],
+    pairs: Sequence[PairRow],
+    align: Callable[[List, List], List[Tuple]],
+    tolerance_ms: int = TIMING_TOLERANCE_MS,
+    padding_ms: int = WINDOW_PADDING_MS,
+) -> TrackUpdate:
+    """Diff lang's track and re-align the windows the changes touch"""
+    diff = diff_track(tracks[lang], new_cues, tolerance_ms)
+    if not diff.changed:
+        return TrackUpdate(diff, [], list(pairs), kept_pairs=len(pairs))
+
+    after = dict(tracks)
+    after[lang] = diff.track
+    # Stored times of every cue, so a pair still covers a cue it loses
+    spans = {
+        cue_id: (cue.start_ms, cue.end_ms)
+        for track in tracks.values()
+        for cue_id, cue in zip(track.ids, track.cues)
+    }
+    pair_extents = []
+    for _, en_id, de_id, _ in pairs:
+        (en_start, en_end), (de_start, de_end) = spans[en_id], spans[de_id]
+        pair_extents.append((min(en_start, de_start), max(en_end, de_end)))
+    cue_extents = [(cue.start_ms, cue.end_ms) for track in after.values() for cue in track.cues]
+    seeds = [(lo - padding_ms, hi + padding_ms) for lo, hi in diff.spans]
+    windows = affected_windows(seeds, pair_extents + cue_extents)
+    starts = [lo for lo, _ in windows]
+
+    stored = {}
+    result = TrackUpdate(diff, windows, [])
+    for pair, (lo, hi) in zip(pairs, pair_extents):
+        # Windows are closed over pairs: a pair overlaps one only by lying inside it
+        n = bisect_right(starts, lo) - 1
+        if n >= 0 and lo < windows[n][1] or n + 1 < len(windows) and hi > starts[n + 1]:
+            stored[pair[1], pair[2]] = pair
+        else:
+            result.pairs.append(pair)
+    result.kept_pairs = len(result.pairs)
+
+    en_ids, de_ids = after["en"].ids, after["de"].ids
+    for window in windows:
+        en_cues, de_cues = _overlapping(after["en"], window), _overlapping(after["de"], window)
+        result.realigned_cues += len(en_cues) + len(de_cues)
+        for en, de, score in align(en_cues, de_cues):
+            key = (en_ids[en.index], de_ids[de.index])
+            score = round(score, 2)
+            previous = stored.pop(key, None)
+            if previous is None:
+                pair = (uuid.uuid4(), key[0], key[1], score)
+                result.inserted_pairs.append(pair)
+            else:
+                pair = (previous[0], key[0], key[1], score)
+                if previous[3] == score:
+                    result.kept_pairs += 1
+                else:
+                    result.rescored_pairs.append((pair[0], score))
+            result.pairs.append(pair)
+    result.deleted_pairs = [pair[0] for pair in stored.values()]
+    return result
+
+
+def apply_update(conn, movie_id: uuid.UUID, lang: str, plan: TrackUpdate) -> None:
+    """Write a planned update with the fewest row changes"""
+    diff = plan.diff
+    if plan.deleted_pairs:
+        conn.execute(delete(SubtitlePair).where(SubtitlePair.id.in_(plan.deleted_pairs)))
+    if diff.deleted:
+        conn.execute(delete(Subtitle).where(Subtitle.id.in_(diff.deleted)))
+
+    track = diff.track
+    if diff.updated:
+        conn.execute(
+            update(Subtitle)
+            .where(Subtitle.id == bindparam("subtitle_id"))
+            .values(
+                start_ts=bindparam("start"),
+                end_ts=bindparam("end"),
+                text=bindparam("new_text"),
+                text_normalized=bindparam("normalized"),
+            ),
+            [
+                {
+                    "subtitle_id": track.ids[n],
+                    "start": _seconds(track.cues[n].start_ms),
+                    "end": _seconds(track.cues[n].end_ms),
+                    "new_text": track.cues[n].text,
+                    "normalized": track.cues[n].text_normalized,
+                }
+                for n in diff.updated
+            ],
+        )
+    if diff.inserted:
+        conn.execute(
+            insert(Subtitle),
+            [
+                {
+                    "id": track.ids[n],
+                    "movie_id": movie_id,
+                    "lang": lang,
+                    "start_ts": _seconds(track.cues[n].start_ms),
+                    "end_ts": _seconds(track.cues[n].end_ms),
+                    "text": track.cues[n].text,
+                    "text_normalized": track.cues[n].text_normalized,
+                }
+                for n in diff.inserted
+            ],
+        )
+
+    if plan.rescored_pairs:
+        conn.execute(
+            update(SubtitlePair)
+            .where(SubtitlePair.id == bindparam("pair_id"))
+            .values(alignment_score=bindparam("score")),
+            [{"pair_id": pair_id, "score": score} for pair_id, score in plan.rescored_pairs],
+        )
+    if plan.inserted_pairs:
+        conn.execute(
+            insert(SubtitlePair),
+            [
+                {
+                    "id": pair_id,
+                    "movie_id": movie_id,
+                    "en_id": en_id,
+                    "de_id": de_id,
+                    "alignment_score": score,
+                }
+                for pair_id, en_id, de_id, score in plan.inserted_pairs
+            ],
+        )
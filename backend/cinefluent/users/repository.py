@@ -0,0 +1,322 @@
+"""
+Async user repository over the users/streaks tables
+
+Every call is a single round trip: lookups join the user's streak row, and
+registration inserts the user and its streak row in one statement on
+PostgreSQL (one transaction on SQLite). The PostgreSQL implementation
+runs on an asyncpg pool, which prepares and caches each statement per
+connection; the SQLite one runs a small connection pool on worker threads
+and is meant for local development and tests.
+"""
+
+import asyncio
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import date, datetime
+from typing import Callable, Dict, Optional, Sequence, TypeVar
+
+from .. import settings
+from ..metrics import REGISTRY
+
+T = TypeVar("T")
+
+DEFAULT_POOL_SIZE = 10
+
+USER_COLUMNS = """
+    u.id, u.email, u.password_hash, u.is_premium, u.created_at,
+    COALESCE(s.current_streak, 0), COALESCE(s.longest_streak, 0), s.last_active
+"""
+
+# users.email is UNIQUE, so both lookups are index probes
+SELECT_USER_SQL = """
+    SELECT {columns}
+    FROM users u
+    LEFT JOIN streaks s ON s.user_id = u.id
+    WHERE u.{key} = {param}
+"""
+
+PG_CREATE_USER_SQL = """
+    WITH new_user AS (
+        INSERT INTO users (id, email, password_hash, is_premium, created_at)
+        VALUES ($1, $2, $3, FALSE, $4)
+        ON CONFLICT (email) DO NOTHING
+        RETURNING id, email, password_hash, is_premium, created_at
+    ), new_streak AS (
+        INSERT INTO streaks (user_id, current_streak, longest_streak, created_at)
+        SELECT id, 0, 0, created_at FROM new_user
+    )
+    SELECT id, email, password_hash, is_premium, created_at FROM new_user
+"""
+
+
+class DuplicateEmailError(Exception):
+    """Raised when registering an email that already has an account"""
+
+
+class TimedPool:
+    """asyncpg pool whose one-shot queries are timed as db_query.
+
+    Everything else (acquire, close, ...) passes straight through; queries
+    on an acquired connection are not timed.
+    """
+
+    TIMED = frozenset({"execute", "executemany", "fetch", "fetchrow", "fetchval"})
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._query = REGISTRY.timer("db_query")
+
+    def __getattr__(self, name):
+        attr = getattr(self._pool, name)
+        if name not in self.TIMED:
+            return attr
+
+        async def timed(*args, **kwargs):
+            with self._query.time():
+                return await attr(*args, **kwargs)
+
+        return timed
+
+
+@dataclass
+class UserRecord:
+    """A user row joined with its streak"""
+
+    id: uuid.UUID
+    email: str
+    password_hash: str
+    is_premium: bool
+    created_at: datetime
+    current_streak: int = 0
+    longest_streak: int = 0
+    last_active: Optional[date] = None
+
+    def as_dict(self) -> Dict:
+        return asdict(self)
+
+
+class UserRepository:
+    """Base class; one instance per process, shared by all requests"""
+
+    dialect = None
+
+    async def connect(self):
+        raise NotImplementedError
+
+    async def close(self):
+        raise NotImplementedError
+
+    async def get_by_email(self, email: str) -> Optional[UserRecord]:
+        raise NotImplementedError
+
+    async def get_by_id(self, user_id: uuid.UUID) -> Optional[UserRecord]:
+        raise NotImplementedError
+
+    async def create(self, email: str, password_hash: str) -> UserRecord:
+        """Insert a user and its streak row; raises DuplicateEmailError"""
+        raise NotImplementedError
+
+    async def count_words(self, user_id: uuid.UUID) -> int:
+        """Number of words the user has studied (their user_vocab rows).
+
+        Kept out of the lookups above: only the profile shows it, and every
+        login and principal cache miss would otherwise pay for the count.
+        """
+        raise NotImplementedError
+
+    async def update_password_hash(self, user_id: uuid.UUID, old_hash: str, new_hash: str) -> bool:
+        """Swap the stored hash if it is still old_hash; returns whether it changed"""
+        raise NotImplementedError
+
+    async def ping(self):
+        """Round trip to the database; raises if it is unreachable"""
+        raise NotImplementedError
+
+
+class PostgresUserRepository(UserRepository):
+    """asyncpg connection pool"""
+
+    dialect = "postgresql"
+
+    def __init__(self, dsn: str, min_size: int = 2, max_size: int = DEFAULT_POOL_SIZE):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.pool = None
+
+    async def connect(self):
+        try:
+            import asyncpg
+        except ImportError as e:
+            raise RuntimeError("PostgresUserRepository requires asyncpg") from e
+        self.pool = TimedPool(await asyncpg.create_pool(
+            self.dsn, min_size=self.min_size, max_size=self.max_size
+        ))
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def ping(self):
+        await self.pool.fetchval("SELECT 1")
+
+    async def _fetch_user(self, key: str, value) -> Optional[UserRecord]:
+        row = await self.pool.fetchrow(
+            SELECT_USER_SQL.format(columns=USER_COLUMNS, key=key, param="$1"), value
+        )
+        return UserRecord(*row) if row else None
+
+    async def get_by_email(self, email):
+        return await self._fetch_user("email", email)
+
+    async def get_by_id(self, user_id):
+        return await self._fetch_user("id", user_id)
+
+    async def create(self, email, password_hash):
+        row = await self.pool.fetchrow(
+            PG_CREATE_USER_SQL, uuid.uuid4(), email, password_hash, datetime.utcnow()
+        )
+        if row is None:
+            raise DuplicateEmailError(email)
+        return UserRecord(*row)
+
+    async def count_words(self, user_id):
+        return await self.pool.fetchval("SELECT COUNT(*) FROM user_vocab WHERE user_id = $1", user_id)
+
+    async def update_password_hash(self, user_id, old_hash, new_hash):
+        status = await self.pool.execute(
+            "UPDATE users SET password_hash = $1 WHERE id = $2 AND password_hash = $3",
+            new_hash, user_id, old_hash,
+        )
+        return status == "UPDATE 1"
+
+
+class SQLiteUserRepository(UserRepository):
+    """sqlite3 connections checked out from a queue and used on worker threads.
+
+    Expects the schema created by DatabaseManager.create_tables(), which
+    stores UUIDs as 32-character hex strings.
+    """
+
+    dialect = "sqlite"
+
+    def __init__(self, path: str, pool_size: int = 4):
+        self.path = path or ":memory:"
+        # Separate connections to :memory: would be separate databases
+        self.pool_size = 1 if self.path == ":memory:" else pool_size
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._connections: Optional[asyncio.Queue] = None
+        self._pool_wait = REGISTRY.timer("db_pool_wait")
+        self._query = REGISTRY.timer("db_query")
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5.0)
+        if self.path != ":memory:":
+            conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    async def connect(self):
+        self._executor = ThreadPoolExecutor(self.pool_size, thread_name_prefix="sqlite-users")
+        self._connections = asyncio.Queue()
+        for _ in range(self.pool_size):
+            self._connections.put_nowait(self._open())
+
+    async def close(self):
+        if self._connections is None:
+            return
+        while not self._connections.empty():
+            self._connections.get_nowait().close()
+        self._executor.shutdown()
+        self._connections = None
+
+    async def run(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        """Call fn(connection) on a pooled connection, off the event loop"""
+        started = time.perf_counter()
+        conn = await self._connections.get()
+        self._pool_wait.observe(time.perf_counter() - started)
+        try:
+            with self._query.time():
+                return await asyncio.get_running_loop().run_in_executor(self._executor, fn, conn)
+        finally:
+            self._connections.put_nowait(conn)
+
+    async def ping(self):
+        await self.run(lambda conn: conn.execute("SELECT 1").fetchone())
+
+    @staticmethod
+    def _record(row: Sequence) -> UserRecord:
+        values = list(row)
+        values[0] = uuid.UUID(values[0])
+        values[3] = bool(values[3])
+        values[4] = datetime.fromisoformat(values[4])
+        if len(values) > 7 and values[7] is not None:
+            values[7] = date.fromisoformat(values[7])
+        return UserRecord(*values)
+
+    async def _fetch_user(self, key: str, value) -> Optional[UserRecord]:
+        sql = SELECT_USER_SQL.format(columns=USER_COLUMNS, key=key, param="?")
+        row = await self.run(lambda conn: conn.execute(sql, (value,)).fetchone())
+        return self._record(row) if row else None
+
+    async def get_by_email(self, email):
+        return await self._fetch_user("email", email)
+
+    async def get_by_id(self, user_id):
+        return await self._fetch_user("id", user_id.hex)
+
+    async def create(self, email, password_hash):
+        user_id = uuid.uuid4().hex
+        created_at = datetime.utcnow().isoformat(" ")
+
+        def insert(conn: sqlite3.Connection):
+            with conn:
+                rows = conn.execute(
+                    """
+                    INSERT INTO users (id, email, password_hash, is_premium, created_at)
+                    VALUES (?, ?, ?, 0, ?)
+                    ON CONFLICT (email) DO NOTHING
+                    RETURNING id, email, password_hash, is_premium, created_at
+                    """,
+                    (user_id, email, password_hash, created_at),
+                ).fetchall()
+                if rows:
+                    conn.execute(
+                        "INSERT INTO streaks (user_id, current_streak, longest_streak, created_at)"
+                        " VALUES (?, 0, 0, ?)",
+                        (user_id, created_at),
+                    )
+                return rows
+
+        rows = await self.run(insert)
+        if not rows:
+            raise DuplicateEmailError(email)
+        return self._record(rows[0])
+
+    async def count_words(self, user_id):
+        sql = "SELECT COUNT(*) FROM user_vocab WHERE user_id = ?"
+        return (await self.run(lambda conn: conn.execute(sql, (user_id.hex,)).fetchone()))[0]
+
+    async def update_password_hash(self, user_id, old_hash, new_hash):
+        def update(conn: sqlite3.Connection):
+            with conn:
+                return conn.execute(
+                    "UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?",
+                    (new_hash, user_id.hex, old_hash),
+                ).rowcount
+
+        return await self.run(update) == 1
+
+
+def create_user_repository(database_url: Optional[str] = None) -> UserRepository:
+    """Pick the repository for DATABASE_URL's backend; call connect() before use"""
+    backend, target = settings.split_database_url(settings.database_url(database_url))
+    if backend == "postgresql":
+        return PostgresUserRepository(target)
+    if backend == "sqlite":
+        return SQLiteUserRepository(target)
+    raise ValueError(f"No user repository for {backend} databases")
@@ -0,0 +1,146 @@
+"""
+Ingest-time vocabulary extraction
+
+Tokenizes each track's normalized text, upserts the unique words into
+vocab in bulk and stores a per-movie frequency table (movie_vocab) whose
+rank column gives lesson and quiz generation a ready-made frequency order.
+"""
+
+import re
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import delete, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .database_models import MovieVocab, Vocab
+
+# Letters only, keeping in-word apostrophes ("don't", "geht's")
+WORD_RE = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)*")
+MAX_WORD_LENGTH = 100  # vocab.word is VARCHAR(100)
+# Keeps IN (...) lists under SQLite's bound-parameter limit
+LOOKUP_CHUNK_SIZE = 500
+
+
+def tokenize(text_normalized: str) -> List[str]:
+    return [w for w in WORD_RE.findall(text_normalized) if len(w) <= MAX_WORD_LENGTH]
+
+
+def count_words(cues: Iterable) -> Counter:
+    """Word frequencies over the normalized text of a track"""
+    counts: Counter = Counter()
+    for cue in cues:
+        counts.update(tokenize(cue.text_normalized or ""))
+    return counts
+
+
+def _upsert_statement(dialect_name: str, rows: List[Dict]):
+    if dialect_name == "postgresql":
+        return postgresql.insert(Vocab).values(rows).on_conflict_do_nothing(
+            index_elements=["word", "lang"]
+        )
+    if dialect_name == "sqlite":
+        return sqlite.insert(Vocab).values(rows).on_conflict_do_nothing(
+            index_elements=["word", "lang"]
+        )
+    raise ValueError(f"Vocabulary upsert not supported for {dialect_name}")
+
+
+def upsert_words(conn, lang: str, words: Sequence[str]) -> Dict[str, uuid.UUID]:
+    """Insert missing words into vocab and return word -> vocab id"""
+    ids: Dict[str, uuid.UUID] = {}
+    words = sorted(set(words))
+    for start in range(0, len(words), LOOKUP_CHUNK_SIZE):
+        chunk = words[start:start + LOOKUP_CHUNK_SIZE]
+        conn.execute(
+            _upsert_statement(
+                conn.dialect.name,
+                [{"id": uuid.uuid4(), "word": word, "lang": lang} for word in chunk],
+            )
+        )
+        result = conn.execute(
+            select(Vocab.word, Vocab.id).where(Vocab.lang == lang, Vocab.word.in_(chunk))
+        )
+        ids.update(result.all())
+    return ids
+
+
+def rank_rows(movie_id: uuid.UUID, lang: str, counts: Counter, ids: Dict[str, uuid.UUID]) -> List[Dict]:
+    """movie_vocab rows ranked by descending frequency (ties broken alphabetically)"""
+    ordered = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    return [
+        {
+            "movie_id": movie_id,
+            "vocab_id": ids[word],
+            "lang": lang,
+            "frequency": frequency,
+            "rank": rank,
+        }
+        for rank, (word, frequency) in enumerate(ordered, start=1)
+    ]
+
+
+class VocabularyStage:
+    """Post-load ingestion stage filling vocab and movie_vocab"""
+
+    name = "vocabulary"
+
+    def run(self, conn, staged: Sequence) -> None:
+        per_lang: Dict[str, List[Tuple[uuid.UUID, Counter]]] = {"en": [], "de": []}
+        for item in staged:
+            per_lang["en"].append((item.movie_id, count_words(item.processed.en_cues)))
+            per_lang["de"].append((item.movie_id, count_words(item.processed.de_cues)))
+
+        rows = []
+        for lang, movies in per_lang.items():
+            all_words = set()
+            for _, counts in movies:
+                all_words.update(counts)
+            ids = upsert_words(conn, lang, all_words)
+            for movie_id, counts in movies:
+                rows.extend(rank_rows(movie_id, lang, counts, ids))
+
+        if rows:
+            conn.execute(insert(MovieVocab), rows)
+
+    def refresh(self, conn, staged: Sequence) -> None:
+        """Recount movies whose subtitles changed in place"""
+        conn.execute(
+            delete(MovieVocab).where(MovieVocab.movie_id.in_([item.movie_id for item in staged]))
+        )
+        self.run(conn, staged)
+
+
+@dataclass
+class MovieFrequencies:
+    """A movie's vocabulary for one language, in frequency-rank order"""
+
+    vocab_ids: List[uuid.UUID]
+    words: List[str]
+    frequencies: np.ndarray
+
+    def top(self, n: int) -> List[str]:
+        return self.words[:n]
+
+    def coverage(self, n: int) -> float:
+        """Share of all word occurrences covered by the n most frequent words"""
+        total = int(self.frequencies.sum())
+        return float(self.frequencies[:n].sum()) / total if total else 0.0
+
+
+def load_frequencies(session, movie_id: uuid.UUID, lang: str) -> MovieFrequencies:
+    result = session.execute(
+        select(MovieVocab.vocab_id, Vocab.word, MovieVocab.frequency)
+        .join(Vocab, Vocab.id == MovieVocab.vocab_id)
+        .where(MovieVocab.movie_id == movie_id, MovieVocab.lang == lang)
+        .order_by(MovieVocab.rank)
+    )
+    rows = result.all()
+    return MovieFrequencies(
+        [row[0] for row in rows],
+        [row[1] for row in rows],
+        np.fromiter((row[2] for row in rows), dtype=np.int32, count=len(rows)),
+    )
@@ -0,0 +1,469 @@
+"""
+Inverted index from words to subtitle_pairs
+
+Maps (language, word) to posting lists of subtitle pair ids so lessons can
+be built around a target word without scanning subtitles.text.
+
+The index is a directory of immutable segment files plus a small JSON
+manifest. Each ingestion batch appends one segment; replaced movies are
+tombstoned in the manifest until compact() rewrites everything into a
+single segment. A tombstone only covers the segments that existed when it
+was written, so a movie re-indexed under the same id stays searchable.
+Segments are memory-mapped read-only, so every API worker on a host
+shares the same page-cache copy.
+
+Segment layout (little endian, arrays 8-byte aligned):
+
+    header      magic, version, doc/movie/term counts, section offsets
+    movies      n_movies x 16-byte UUID
+    movie_docs  (n_movies + 1) x u32  first doc id of each movie
+    docs        n_docs x 16-byte subtitle_pairs UUID (grouped by movie)
+    term_offs   (n_terms + 1) x u32   into term_blob
+    term_blob   sorted b"<lang>\\0<word>" keys
+    post_offs   (n_terms + 1) x u64   into post_blob
+    post_width  n_terms x u8          bytes per delta (1, 2 or 4)
+    post_blob   delta-encoded sorted doc ids
+"""
+
+import json
+import mmap
+import os
+import struct
+import uuid
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+
+from .database_models import Subtitle, SubtitlePair
+from .vocabulary import tokenize
+
+PathLike = Union[str, Path]
+
+INDEX_DIR_ENV = "CINEFLUENT_INDEX_DIR"
+MANIFEST_NAME = "manifest.json"
+SEGMENT_MAGIC = b"CFWI"
+SEGMENT_VERSION = 1
+LANGS = ("en", "de")
+
+_HEADER = struct.Struct("<4sIIII8Q")
+_WIDTH_DTYPES = {1: np.dtype("<u1"), 2: np.dtype("<u2"), 4: np.dtype("<u4")}
+
+# (movie_id, pair_id, en_text_normalized, de_text_normalized)
+IndexDoc = Tuple[uuid.UUID, uuid.UUID, str, str]
+
+
+def _segment_number(name: str) -> int:
+    return int(name[4:10])
+
+
+def _term_key(lang: str, word: str) -> bytes:
+    return f"{lang}\0{word}".encode("utf-8")
+
+
+def _pad(buf: bytearray):
+    buf.extend(b"\0" * (-len(buf) % 8))
+
+
+def write_segment(
+    path: PathLike,
+    movie_docs: Sequence[Tuple[uuid.UUID, Sequence[uuid.UUID]]],
+    postings: Dict[bytes, np.ndarray],
+):
+    """Write one segment file from per-movie doc lists and term postings.
+
+    movie_docs lists (movie_id, [pair_id, ...]) in doc-id order; postings
+    maps term keys to sorted doc-id arrays.
+    """
+    movie_ids = [movie_id for movie_id, _ in movie_docs]
+    doc_starts = np.zeros(len(movie_docs) + 1, dtype="<u4")
+    doc_starts[1:] = np.cumsum([len(pairs) for _, pairs in movie_docs])
+    terms = sorted(postings)
+
+    body = bytearray(_HEADER.size)
+    _pad(body)
+    offsets = []
+
+    offsets.append(len(body))
+    for movie_id in movie_ids:
+        body += movie_id.bytes
+    _pad(body)
+
+    offsets.append(len(body))
+    body += doc_starts.tobytes()
+    _pad(body)
+
+    offsets.append(len(body))
+    for _, pairs in movie_docs:
+        for pair_id in pairs:
+            body += pair_id.bytes
+    _pad(body)
+
+    term_offsets = np.zeros(len(terms) + 1, dtype="<u4")
+    term_offsets[1:] = np.cumsum([len(term) for term in terms])
+    offsets.append(len(body))
+    body += term_offsets.tobytes()
+    _pad(body)
+    offsets.append(len(body))
+    body += b"".join(terms)
+    _pad(body)
+
+    encoded = []
+    widths = np.zeros(len(terms), dtype="<u1")
+    for t, term in enumerate(terms):
+        docs = np.asarray(postings[term], dtype=np.int64)
+        deltas = np.diff(docs, prepend=0)
+        width = 1 if deltas.max(initial=0) < 1 << 8 else 2 if deltas.max() < 1 << 16 else 4
+        widths[t] = width
+        encoded.append(deltas.astype(_WIDTH_DTYPES[width]).tobytes())
+    post_offsets = np.zeros(len(terms) + 1, dtype="<u8")
+    post_offsets[1:] = np.cumsum([len(chunk) for chunk in encoded])
+
+    offsets.append(len(body))
+    body += post_offsets.tobytes()
+    offsets.append(len(body))
+    body += widths.tobytes()
+    _pad(body)
+    offsets.append(len(body))
+    body += b"".join(encoded)
+
+    _HEADER.pack_into(
+        body, 0, SEGMENT_MAGIC, SEGMENT_VERSION,
+        int(doc_starts[-1]), len(movie_ids), len(terms), *offsets,
+    )
+
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(body)
+    os.replace(tmp, path)
+
+
+def build_postings(docs: Iterable[IndexDoc]) -> Tuple[List[Tuple[uuid.UUID, List[uuid.UUID]]], Dict[bytes, np.ndarray]]:
+    """Group docs by movie and build term -> sorted doc-id postings"""
+    by_movie: Dict[uuid.UUID, List[Tuple[uuid.UUID, str, str]]] = {}
+    for movie_id, pair_id, en_text, de_text in docs:
+        by_movie.setdefault(movie_id, []).append((pair_id, en_text, de_text))
+
+    movie_docs = []
+    postings: Dict[bytes, List[int]] = {}
+    doc_id = 0
+    for movie_id, rows in by_movie.items():
+        movie_docs.append((movie_id, [pair_id for pair_id, _, _ in rows]))
+        for _, en_text, de_text in rows:
+            for lang, text in (("en", en_text), ("de", de_text)):
+                for word in set(tokenize(text or "")):
+                    postings.setdefault(_term_key(lang, word), []).append(doc_id)
+            doc_id += 1
+
+    return movie_docs, {term: np.asarray(ids, dtype=np.int64) for term, ids in postings.items()}
+
+
+class IndexSegment:
+    """Read-only memory-mapped view of one segment file"""
+
+    def __init__(self, path: PathLike):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, n_docs, n_movies, n_terms, *offsets = _HEADER.unpack_from(self._mm, 0)
+        if magic != SEGMENT_MAGIC or version != SEGMENT_VERSION:
+            raise ValueError(f"{self.path} is not a word index segment")
+        (movies_off, movie_docs_off, docs_off, term_offs_off,
+         term_blob_off, post_offs_off, widths_off, post_blob_off) = offsets
+
+        self.n_docs = n_docs
+        self.n_terms = n_terms
+        self._docs_off = docs_off
+        self._term_blob_off = term_blob_off
+        self._post_blob_off = post_blob_off
+        self._term_offsets = np.frombuffer(self._mm, "<u4", n_terms + 1, term_offs_off)
+        self._post_offsets = np.frombuffer(self._mm, "<u8", n_terms + 1, post_offs_off)
+        self._widths = np.frombuffer(self._mm, "<u1", n_terms, widths_off)
+        self._doc_starts = np.frombuffer(self._mm, "<u4", n_movies + 1, movie_docs_off)
+        self.movie_ids = [
+            uuid.UUID(bytes=self._mm[movies_off + 16 * i:movies_off + 16 * (i + 1)])
+            for i in range(n_movies)
+        ]
+        self._movie_ordinals = {movie_id: i for i, movie_id in enumerate(self.movie_ids)}
+
+    def close(self):
+        # Views into the map must be released before it can be closed
+        self._term_offsets = self._post_offsets = self._widths = self._doc_starts = None
+        self._mm.close()
+
+    def term(self, t: int) -> bytes:
+        start = self._term_blob_off + int(self._term_offsets[t])
+        return self._mm[start:self._term_blob_off + int(self._term_offsets[t + 1])]
+
+    def _find(self, key: bytes) -> int:
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.term(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < self.n_terms and self.term(lo) == key else -1
+
+    def postings_at(self, t: int) -> np.ndarray:
+        width = int(self._widths[t])
+        start = int(self._post_offsets[t])
+        count = (int(self._post_offsets[t + 1]) - start) // width
+        deltas = np.frombuffer(
+            self._mm, _WIDTH_DTYPES[width], count, self._post_blob_off + start
+        )
+        return np.cumsum(deltas, dtype=np.int64)
+
+    def postings(self, lang: str, word: str) -> np.ndarray:
+        t = self._find(_term_key(lang, word))
+        if t < 0:
+            return np.empty(0, dtype=np.int64)
+        return self.postings_at(t)
+
+    def movie_range(self, movie_id: uuid.UUID) -> Optional[Tuple[int, int]]:
+        i = self._movie_ordinals.get(movie_id)
+        if i is None:
+            return None
+        return int(self._doc_starts[i]), int(self._doc_starts[i + 1])
+
+    def pair_id(self, doc_id: int) -> uuid.UUID:
+        start = self._docs_off + 16 * doc_id
+        return uuid.UUID(bytes=self._mm[start:start + 16])
+
+
+def _restrict(docs: np.ndarray, ranges: List[Tuple[int, int]], keep: bool) -> np.ndarray:
+    """Keep (or drop) doc ids falling inside the given [start, end) ranges"""
+    mask = np.zeros(len(docs), dtype=bool)
+    for start, end in ranges:
+        lo, hi = np.searchsorted(docs, [start, end])
+        mask[lo:hi] = True
+    return docs[mask] if keep else docs[~mask]
+
+
+class WordIndex:
+    """Segmented, memory-mapped word -> subtitle pair index"""
+
+    def __init__(self, index_dir: PathLike):
+        self.index_dir = Path(index_dir)
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self._manifest_mtime = None
+        self._segments: Dict[str, IndexSegment] = {}
+        # movie id -> first segment number the tombstone does not cover
+        self._deleted: Dict[uuid.UUID, int] = {}
+        self._next_segment = 1
+        self.refresh()
+
+    # -- manifest ---------------------------------------------------------
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.index_dir / MANIFEST_NAME
+
+    def refresh(self):
+        """Pick up segments written by another process since the last load"""
+        try:
+            mtime = self.manifest_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._manifest_mtime:
+            return
+
+        manifest = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+        names = manifest["segments"]
+        for name in list(self._segments):
+            if name not in names:
+                self._segments.pop(name).close()
+        for name in names:
+            if name not in self._segments:
+                self._segments[name] = IndexSegment(self.index_dir / name)
+        self._segments = {name: self._segments[name] for name in names}
+        self._next_segment = manifest["next_segment"]
+        deleted = manifest["deleted_movies"]
+        if isinstance(deleted, list):
+            # Older manifests tombstone a movie in every segment
+            deleted = dict.fromkeys(deleted, self._next_segment)
+        self._deleted = {uuid.UUID(movie_id): before for movie_id, before in deleted.items()}
+        self._manifest_mtime = mtime
+
+    def _save_manifest(self, segments: List[str]):
+        data = {
+            "version": SEGMENT_VERSION,
+            "segments": segments,
+            "deleted_movies": {
+                str(movie_id): before for movie_id, before in sorted(self._deleted.items())
+            },
+            "next_segment": self._next_segment,
+        }
+        tmp = self.manifest_path.with_name(MANIFEST_NAME + ".tmp")
+        tmp.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(tmp, self.manifest_path)
+        self._manifest_mtime = None
+        self.refresh()
+
+    def close(self):
+        for segment in self._segments.values():
+            segment.close()
+        self._segments = {}
+
+    def _tombstoned(self, name: str) -> List[uuid.UUID]:
+        """Movies deleted from the named segment"""
+        number = _segment_number(name)
+        return [movie_id for movie_id, before in self._deleted.items() if number < before]
+
+    # -- writes -----------------------------------------------------------
+
+    def _write_new_segment(self, movie_docs, postings) -> str:
+        name = f"seg-{self._next_segment:06d}.cfwi"
+        write_segment(self.index_dir / name, movie_docs, postings)
+        self._next_segment += 1
+        return name
+
+    def _replace_segments(self, name: str):
+        old = [stale for stale in self._segments if stale != name]
+        self._deleted = {}
+        self._save_manifest([name])
+        for stale in old:
+            (self.index_dir / stale).unlink(missing_ok=True)
+
+    def add(self, docs: Iterable[IndexDoc]) -> Optional[str]:
+        """Index a batch of pairs as a new segment"""
+        self.refresh()
+        movie_docs, postings = build_postings(docs)
+        if not movie_docs:
+            return None
+        name = self._write_new_segment(movie_docs, postings)
+        self._save_manifest(list(self._segments) + [name])
+        return name
+
+    def replace_all(self, docs: Iterable[IndexDoc]) -> str:
+        """Replace the whole index with a single segment built from docs"""
+        self.refresh()
+        name = self._write_new_segment(*build_postings(docs))
+        self._replace_segments(name)
+        return name
+
+    def delete_movies(self, movie_ids: Iterable[uuid.UUID]):
+        self.refresh()
+        self._deleted.update(dict.fromkeys(movie_ids, self._next_segment))
+        self._save_manifest(list(self._segments))
+
+    def compact(self) -> Optional[str]:
+        """Merge all segments into one, dropping deleted movies"""
+        self.refresh()
+        movie_docs = []
+        merged: Dict[bytes, List[np.ndarray]] = {}
+        base = 0
+        for name, segment in self._segments.items():
+            remap = np.full(segment.n_docs, -1, dtype=np.int64)
+            deleted = set(self._tombstoned(name))
+            for movie_id in segment.movie_ids:
+                if movie_id in deleted:
+                    continue
+                start, end = segment.movie_range(movie_id)
+                remap[start:end] = np.arange(base, base + end - start)
+                movie_docs.append((movie_id, [segment.pair_id(d) for d in range(start, end)]))
+                base += end - start
+            for t in range(segment.n_terms):
+                docs = remap[segment.postings_at(t)]
+                docs = docs[docs >= 0]
+                if len(docs):
+                    merged.setdefault(segment.term(t), []).append(docs)
+
+        name = self._write_new_segment(
+            movie_docs,
+            {term: np.sort(np.concatenate(parts)) for term, parts in merged.items()},
+        )
+        self._replace_segments(name)
+        return name
+
+    # -- queries ----------------------------------------------------------
+
+    def search(
+        self,
+        words: Sequence[str],
+        lang: str,
+        mode: str = "and",
+        movie_ids: Optional[Iterable[uuid.UUID]] = None,
+        limit: Optional[int] = None,
+    ) -> List[uuid.UUID]:
+        """Pair ids whose `lang` side contains all ("and") or any ("or") of words"""
+        if mode not in ("and", "or"):
+            raise ValueError("mode must be 'and' or 'or'")
+        if lang not in LANGS:
+            raise ValueError(f"Unsupported language: {lang}")
+        words = [w for word in words for w in tokenize(word.lower())]
+        if not words:
+            return []
+        movie_ids = set(movie_ids) if movie_ids is not None else None
+
+        results: List[uuid.UUID] = []
+        for name, segment in self._segments.items():
+            lists = [segment.postings(lang, word) for word in words]
+            if mode == "and":
+                docs = lists[0]
+                for other in lists[1:]:
+                    docs = np.intersect1d(docs, other, assume_unique=True)
+            else:
+                docs = np.unique(np.concatenate(lists))
+            if not len(docs):
+                continue
+
+            if movie_ids is not None:
+                ranges = [r for r in map(segment.movie_range, movie_ids) if r]
+                docs = _restrict(docs, ranges, keep=True)
+            deleted = self._tombstoned(name) if self._deleted else []
+            if deleted:
+                ranges = [r for r in map(segment.movie_range, deleted) if r]
+                docs = _restrict(docs, ranges, keep=False)
+
+            for doc_id in docs.tolist():
+                results.append(segment.pair_id(doc_id))
+                if limit is not None and len(results) >= limit:
+                    return results
+        return results
+
+
+def load_index_docs(conn, movie_ids: Optional[Sequence[uuid.UUID]] = None) -> List[IndexDoc]:
+    """Fetch (movie, pair, en text, de text) rows for indexing"""
+    en = aliased(Subtitle)
+    de = aliased(Subtitle)
+    query = (
+        select(SubtitlePair.movie_id, SubtitlePair.id, en.text_normalized, de.text_normalized)
+        .join(en, en.id == SubtitlePair.en_id)
+        .join(de, de.id == SubtitlePair.de_id)
+        .order_by(SubtitlePair.movie_id, en.start_ts, de.start_ts)
+    )
+    if movie_ids is not None:
+        query = query.where(SubtitlePair.movie_id.in_(movie_ids))
+    return [tuple(row) for row in conn.execute(query)]
+
+
+def rebuild_index(conn, index_dir: PathLike) -> WordIndex:
+    """Rebuild the whole index from subtitle_pairs as a single segment"""
+    index = WordIndex(index_dir)
+    index.replace_all(load_index_docs(conn))
+    return index
+
+
+class WordIndexStage:
+    """Post-load ingestion stage appending the new movies as one segment"""
+
+    name = "word_index"
+
+    def __init__(self, index_dir: PathLike):
+        self.index = WordIndex(index_dir)
+
+    def run(self, conn, staged: Sequence) -> None:
+        self.index.add(load_index_docs(conn, [item.movie_id for item in staged]))
+
+    def refresh(self, conn, staged: Sequence) -> None:
+        """Re-index movies whose pairs changed in place"""
+        movie_ids = [item.movie_id for item in staged]
+        self.index.delete_movies(movie_ids)
+        self.index.add(load_index_docs(conn, movie_ids))
+
+    def delete(self, conn, movie_ids: Sequence[uuid.UUID]) -> None:
+        self.index.delete_movies(movie_ids)
@@ -1,5 +1,6 @@
 -- Create cinefluent database schema
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
 
 -- Movies table
 CREATE TABLE movies (
@@ -7,6 +8,10 @@ CREATE TABLE movies (
     title VARCHAR(255) NOT NULL,
     year INTEGER,
     imdb_id VARCHAR(20),
+    language VARCHAR(5) NOT NULL DEFAULT 'de',
+    difficulty VARCHAR(16),
+    title_key VARCHAR(255) NOT NULL,
+    vocab_size INTEGER NOT NULL DEFAULT 0,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -52,6 +57,42 @@ CREATE TABLE vocab (
     UNIQUE(word, lang)
 );
 
+-- Per-movie word frequencies, filled at ingest
+CREATE TABLE movie_vocab (
+    movie_id UUID NOT NULL REFERENCES movies(id) ON DELETE CASCADE,
+    vocab_id UUID NOT NULL REFERENCES vocab(id) ON DELETE CASCADE,
+    lang VARCHAR(5) NOT NULL,
+    frequency INTEGER NOT NULL,
+    rank INTEGER NOT NULL, -- 1 = most frequent word of the movie in this language
+    PRIMARY KEY (movie_id, vocab_id)
+);
+
+-- Scenes: runs of subtitle pairs without long pauses, each served as one lesson
+CREATE TABLE scenes (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    movie_id UUID NOT NULL REFERENCES movies(id) ON DELETE CASCADE,
+    ordinal INTEGER NOT NULL, -- 1-based position in the movie
+    start_ts DECIMAL(10, 3) NOT NULL,
+    end_ts DECIMAL(10, 3) NOT NULL,
+    pair_count INTEGER NOT NULL,
+    bundle BYTEA NOT NULL, -- gzip-compressed JSON lesson, served as stored
+    etag VARCHAR(64) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(movie_id, ordinal)
+);
+
+-- Offline packs: a movie's pairs as one binary download, full (base_version 0) or a delta
+CREATE TABLE movie_packs (
+    movie_id UUID NOT NULL REFERENCES movies(id) ON DELETE CASCADE,
+    version INTEGER NOT NULL, -- bumped whenever the pairs change
+    base_version INTEGER NOT NULL, -- 0 for the full pack
+    pair_count INTEGER NOT NULL,
+    body BYTEA NOT NULL, -- binary pack, served as stored
+    etag VARCHAR(64) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (movie_id, version, base_version)
+);
+
 -- User vocabulary progress
 CREATE TABLE user_vocab (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -61,6 +102,12 @@ CREATE TABLE user_vocab (
     mastered BOOLEAN DEFAULT FALSE,
     first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    stability DOUBLE PRECISION NOT NULL DEFAULT 0,
+    difficulty DOUBLE PRECISION NOT NULL DEFAULT 0,
+    reps INTEGER NOT NULL DEFAULT 0,
+    lapses INTEGER NOT NULL DEFAULT 0,
+    due_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_review TIMESTAMP,
     UNIQUE(user_id, vocab_id)
 );
 
@@ -70,21 +117,72 @@ CREATE TABLE streaks (
     current_streak INTEGER DEFAULT 0,
     longest_streak INTEGER DEFAULT 0,
     last_active DATE,
+    timezone VARCHAR(64) NOT NULL DEFAULT 'UTC', -- IANA zone deciding when the user's day rolls over
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Append-only activity stream, folded into the rollups below
+CREATE TABLE activity_events (
+    id BIGSERIAL PRIMARY KEY,
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    kind VARCHAR(32) NOT NULL,
+    amount INTEGER NOT NULL,
+    occurred_at TIMESTAMP NOT NULL,
+    rolled_up BOOLEAN NOT NULL DEFAULT FALSE
+);
+
+-- Per-user activity per local day, per local week (starting Monday) and in total
+CREATE TABLE user_daily_activity (
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    lessons_completed INTEGER NOT NULL DEFAULT 0,
+    study_seconds INTEGER NOT NULL DEFAULT 0,
+    words_learned INTEGER NOT NULL DEFAULT 0,
+    movies_started INTEGER NOT NULL DEFAULT 0,
+    movies_completed INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day)
+);
+
+CREATE TABLE user_weekly_activity (
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    week_start DATE NOT NULL,
+    lessons_completed INTEGER NOT NULL DEFAULT 0,
+    study_seconds INTEGER NOT NULL DEFAULT 0,
+    words_learned INTEGER NOT NULL DEFAULT 0,
+    movies_started INTEGER NOT NULL DEFAULT 0,
+    movies_completed INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, week_start)
+);
+
+CREATE TABLE user_progress (
+    user_id UUID PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    lessons_completed INTEGER NOT NULL DEFAULT 0,
+    study_seconds INTEGER NOT NULL DEFAULT 0,
+    words_learned INTEGER NOT NULL DEFAULT 0,
+    movies_started INTEGER NOT NULL DEFAULT 0,
+    movies_completed INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Create indices for performance
+CREATE INDEX idx_movies_title_key ON movies(title_key, id);
+CREATE INDEX idx_movies_filters ON movies(language, difficulty, title_key, id);
+CREATE INDEX idx_movies_title_trgm ON movies USING gin (title_key gin_trgm_ops);
 CREATE INDEX idx_subtitles_movie_lang ON subtitles(movie_id, lang);
 CREATE INDEX idx_subtitles_timestamps ON subtitles(start_ts, end_ts);
 CREATE INDEX idx_subtitle_pairs_movie ON subtitle_pairs(movie_id);
 CREATE INDEX idx_user_vocab_user ON user_vocab(user_id);
 CREATE INDEX idx_user_vocab_mastered ON user_vocab(user_id, mastered);
+CREATE INDEX idx_user_vocab_due ON user_vocab(user_id, due_at);
 CREATE INDEX idx_vocab_word_lang ON vocab(word, lang);
+CREATE INDEX idx_movie_vocab_rank ON movie_vocab(movie_id, lang, rank);
+CREATE INDEX idx_activity_events_pending ON activity_events(id) WHERE NOT rolled_up;
 
 -- Insert sample data for testing
-INSERT INTO movies (title, year, imdb_id) VALUES 
-('Inception', 2010, 'tt1375666'),
-('Interstellar', 2014, 'tt0816692');
+-- title_key is cinefluent.movies.catalog.title_key(title)
+INSERT INTO movies (title, title_key, year, imdb_id) VALUES 
+('Inception', 'inception', 2010, 'tt1375666'),
+('Interstellar', 'interstellar', 2014, 'tt0816692');
 
 -- Create a view for leaderboards
 CREATE OR REPLACE VIEW leaderboard AS
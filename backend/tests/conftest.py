@@ -0,0 +1,57 @@
+"""
+Shared fixtures for the API endpoint tests
+"""
+
+from pathlib import Path
+
+import pytest
+
+from cinefluent.database_models import DatabaseManager
+from cinefluent.ingestion_service import IngestionService
+
+DATA_DIR = Path(__file__).parent.parent
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """A SQLite file with the full schema"""
+    path = tmp_path / "api.db"
+    db = DatabaseManager(f"sqlite:///{path}")
+    db.create_tables()
+    db.engine.dispose()
+    return path
+
+
+@pytest.fixture
+def elysium(db_path):
+    """Ingest the bundled test_en.srt/test_de.srt pair into db_path; returns the ingest result"""
+    db = DatabaseManager(f"sqlite:///{db_path}")
+    result = IngestionService(db).ingest_movie(
+        "Elysium", DATA_DIR / "test_en.srt", DATA_DIR / "test_de.srt"
+    )
+    db.engine.dispose()
+    return result
+
+
+@pytest.fixture
+def sqlite_app(db_path, monkeypatch):
+    """The API app pointed at db_path; each TestClient block starts and stops it"""
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{db_path}")
+    monkeypatch.setenv("CINEFLUENT_BCRYPT_ROUNDS", "4")
+
+    from run_fixed_api import app
+    return app
+
+
+@pytest.fixture
+def auth_headers():
+    """Register an account through the API and return its bearer headers"""
+
+    def register(client, email="ida@example.com", password="password123"):
+        response = client.post(
+            "/api/v1/auth/register",
+            json={"email": email, "password": password, "confirm_password": password},
+        )
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    return register
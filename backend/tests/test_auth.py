@@ -0,0 +1,271 @@
+"""
+Tests for the user repository and the auth endpoints
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+from cinefluent.auth.passwords import HasherBusy, PasswordHasher, hash_cost
+from cinefluent.auth.principal_cache import PrincipalCache, _dump, _load
+from cinefluent.database_models import DatabaseManager
+from cinefluent.users.repository import (
+    DuplicateEmailError,
+    PostgresUserRepository,
+    SQLiteUserRepository,
+    UserRecord,
+    create_user_repository,
+)
+
+
+class TestUserRepository:
+    """SQLite implementation of the async user repository"""
+
+    def setup_method(self):
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        DatabaseManager(f"sqlite:///{self.db_path}").create_tables()
+        self.repo = SQLiteUserRepository(self.db_path)
+
+    def teardown_method(self):
+        os.unlink(self.db_path)
+
+    async def test_create_and_lookup(self):
+        await self.repo.connect()
+        try:
+            user = await self.repo.create("anna@example.com", "hash")
+            assert user.current_streak == 0
+
+            by_email = await self.repo.get_by_email("anna@example.com")
+            by_id = await self.repo.get_by_id(user.id)
+            assert by_email == by_id
+            assert by_email.id == user.id
+            assert by_email.password_hash == "hash"
+            assert by_email.longest_streak == 0 and by_email.last_active is None
+
+            assert await self.repo.get_by_email("nobody@example.com") is None
+            assert await self.repo.get_by_id(uuid.uuid4()) is None
+
+            with pytest.raises(DuplicateEmailError):
+                await self.repo.create("anna@example.com", "other")
+        finally:
+            await self.repo.close()
+
+    def test_factory(self):
+        assert isinstance(create_user_repository(f"sqlite:///{self.db_path}"), SQLiteUserRepository)
+        repo = create_user_repository("postgresql+psycopg2://u:p@db:5432/cinefluent")
+        assert isinstance(repo, PostgresUserRepository)
+        assert repo.dsn == "postgresql://u:p@db:5432/cinefluent"
+        with pytest.raises(ValueError):
+            create_user_repository("mysql://u:p@db/cinefluent")
+
+
+class TestPasswordHasher:
+    """Bounded hashing executor"""
+
+    async def test_hash_verify_rehash(self):
+        hasher = PasswordHasher(rounds=4, workers=1, max_queue=0)
+        try:
+            hashed = await hasher.hash("password123")
+            assert hash_cost(hashed) == 4
+            assert await hasher.verify("password123", hashed)
+            assert not await hasher.verify("wrong", hashed)
+            assert not hasher.needs_rehash(hashed)
+            assert PasswordHasher(rounds=5, workers=1).needs_rehash(hashed)
+
+            metrics = hasher.metrics()
+            assert metrics["hash_latency"]["count"] == 3
+            assert metrics["queue_wait"]["count"] == 3
+            assert metrics["pending"] == 0
+        finally:
+            hasher.close()
+
+    async def test_rejects_when_full(self):
+        hasher = PasswordHasher(rounds=4, workers=1, max_queue=1)
+        release = threading.Event()
+        try:
+            blocked = [asyncio.ensure_future(hasher._submit(release.wait)) for _ in range(2)]
+            await asyncio.sleep(0)
+            with pytest.raises(HasherBusy):
+                await hasher.hash("password123")
+            assert hasher.metrics()["rejected"] == 1
+
+            release.set()
+            await asyncio.gather(*blocked)
+            assert await hasher.hash("password123")
+        finally:
+            release.set()
+            hasher.close()
+
+
+class TestPrincipalCache:
+    """Local tier of the token -> principal cache"""
+
+    def make_user(self):
+        return UserRecord(uuid.uuid4(), "c@example.com", "hash", False, datetime.utcnow())
+
+    async def test_expiry_and_bound(self):
+        cache = PrincipalCache(max_entries=2, ttl=60, redis_url="")
+        user = self.make_user()
+        await cache.put("expired", user, time.time() - 1)
+        assert await cache.get("expired") is None
+
+        await cache.put("a", user, time.time() + 30)
+        await cache.put("b", user, time.time() + 30)
+        assert await cache.get("a") is user
+        await cache.put("c", user, time.time() + 30)
+        # "b" was least recently used
+        assert await cache.get("b") is None
+        assert await cache.get("a") is user and await cache.get("c") is user
+        assert cache.stats()["entries"] == 2
+
+    def test_shared_entries_omit_password_hash(self):
+        user = self.make_user()
+        raw = _dump(user, time.time() + 30)
+        assert "password_hash" not in json.loads(raw)["user"] and "hash" not in raw
+
+        _, loaded = _load(raw)
+        assert loaded.id == user.id and loaded.email == user.email
+        assert loaded.password_hash == ""
+
+    async def test_invalidation(self):
+        cache = PrincipalCache(redis_url="")
+        user, other = self.make_user(), self.make_user()
+        exp = time.time() + 30
+        await cache.put("a", user, exp)
+        await cache.put("b", user, exp)
+        await cache.put("c", other, exp)
+
+        await cache.invalidate_user(user.id)
+        assert await cache.get("a") is None and await cache.get("b") is None
+        assert await cache.get("c") is other
+
+        await cache.revoke("c", exp)
+        assert await cache.get("c") is None
+        assert await cache.is_revoked("c")
+        assert not await cache.is_revoked("a")
+
+    async def test_unreachable_redis(self):
+        cache = PrincipalCache(redis_url="redis://127.0.0.1:1")
+        await cache.connect()
+        # Without the invalidation channel the cache runs local-only
+        assert cache.stats()["redis"] is False and cache.stats()["redis_errors"] == 1
+
+        import redis.asyncio as redis
+
+        cache.redis = redis.from_url("redis://127.0.0.1:1")
+        try:
+            user = self.make_user()
+            exp = time.time() + 30
+            assert await cache.get("a") is None
+            await cache.put("a", user, exp)
+            assert await cache.get("a") is user
+            await cache.invalidate_user(user.id)
+            assert await cache.get("a") is None
+            await cache.revoke("a", exp)
+            assert await cache.is_revoked("a")
+            assert not await cache.is_revoked("b")
+        finally:
+            await cache.close()
+
+
+class TestAuthEndpoints:
+    """Register, login and /me against a file-backed database"""
+
+    def register(self, client, email="ben@example.com", password="password123"):
+        return client.post(
+            "/api/v1/auth/register",
+            json={"email": email, "password": password, "confirm_password": password},
+        )
+
+    def test_register_login_me(self, sqlite_app):
+        with TestClient(sqlite_app) as client:
+            assert self.register(client).status_code == 200
+            assert self.register(client).status_code == 400
+
+            response = client.post(
+                "/api/v1/auth/login", json={"email": "ben@example.com", "password": "wrongpass1"}
+            )
+            assert response.status_code == 401
+
+            response = client.post(
+                "/api/v1/auth/login", json={"email": "ben@example.com", "password": "password123"}
+            )
+            assert response.status_code == 200
+            token = response.json()["access_token"]
+
+            me = client.get("/api/v1/auth/me", headers={"Authorization": f"Bearer {token}"})
+            assert me.status_code == 200
+            assert me.json()["email"] == "ben@example.com"
+            assert me.json()["current_streak"] == 0
+
+            bad = client.get("/api/v1/auth/me", headers={"Authorization": "Bearer garbage"})
+            assert bad.status_code == 401
+
+    def test_users_survive_restart(self, sqlite_app):
+        with TestClient(sqlite_app) as client:
+            assert self.register(client).status_code == 200
+
+        with TestClient(sqlite_app) as client:
+            response = client.post(
+                "/api/v1/auth/login", json={"email": "ben@example.com", "password": "password123"}
+            )
+            assert response.status_code == 200
+
+    def test_workers_share_no_state(self, sqlite_app):
+        from cinefluent.api.main import create_app
+
+        # Two apps stand in for two worker processes on the same database
+        first, second = create_app(), create_app()
+        with TestClient(first) as a, TestClient(second) as b:
+            token = self.register(a).json()["access_token"]
+            me = b.get("/api/v1/auth/me", headers={"Authorization": f"Bearer {token}"})
+            assert me.status_code == 200 and me.json()["email"] == "ben@example.com"
+            response = b.post(
+                "/api/v1/auth/login", json={"email": "ben@example.com", "password": "password123"}
+            )
+            assert response.status_code == 200
+
+    def test_rehash_on_login(self, sqlite_app):
+        with TestClient(sqlite_app) as client:
+            assert self.register(client).status_code == 200
+            client.app.state.hasher.rounds = 5
+            response = client.post(
+                "/api/v1/auth/login", json={"email": "ben@example.com", "password": "password123"}
+            )
+            assert response.status_code == 200
+
+            user = client.portal.call(client.app.state.users.get_by_email, "ben@example.com")
+            assert hash_cost(user.password_hash) == 5
+            assert client.get("/health").json()["password_hasher"]["hash_latency"]["count"] == 3
+
+    def test_login_busy(self, sqlite_app):
+        with TestClient(sqlite_app) as client:
+            assert self.register(client).status_code == 200
+            client.app.state.hasher.limit = 0
+            response = client.post(
+                "/api/v1/auth/login", json={"email": "ben@example.com", "password": "password123"}
+            )
+            assert response.status_code == 503
+            assert response.headers["Retry-After"] == "1"
+
+    def test_principal_cache_and_logout(self, sqlite_app):
+        with TestClient(sqlite_app) as client:
+            token = self.register(client).json()["access_token"]
+            headers = {"Authorization": f"Bearer {token}"}
+
+            for _ in range(3):
+                assert client.get("/api/v1/auth/me", headers=headers).status_code == 200
+            stats = client.app.state.principals.stats()
+            assert stats["hits"] == 2 and stats["misses"] == 1
+
+            assert client.post("/api/v1/auth/logout", headers=headers).status_code == 200
+            assert client.get("/api/v1/auth/me", headers=headers).status_code == 401
@@ -0,0 +1,64 @@
+"""
+Tests for the benchmark harness: corpus generator, load driver and baselines
+"""
+
+from benchmarks.baseline import compare
+from benchmarks.corpus import film_tracks, write_corpus
+from benchmarks.load import run_load_async
+from benchmarks.startup import check_budgets, run_startup
+from cinefluent.directory_ingest import discover_pairs
+from cinefluent.ingestion_service import process_subtitle_files
+
+
+class TestCorpus:
+    def test_films_are_deterministic_and_alignable(self, tmp_path):
+        assert film_tracks(7, 50) == film_tracks(7, 50)
+        assert film_tracks(7, 50) != film_tracks(8, 50)
+
+        write_corpus(tmp_path, 3, cues_per_film=80)
+        pairs = discover_pairs(tmp_path)
+        assert sorted(key for key, _ in pairs) == [f"film_0000{i}/film_0000{i}" for i in range(3)]
+
+        movie = pairs[0][1]
+        processed = process_subtitle_files(movie.en_file, movie.de_file)
+        assert len(processed.en_cues) == 80
+        assert processed.alignment["quality"] in ("excellent", "good")
+
+
+class TestBaseline:
+    def test_compare_flags_regressions(self):
+        baseline = {"results": {"micro": {
+            "align": {"p50_ms": 10.0, "p95_ms": 12.0, "throughput_per_s": 100.0},
+            "tiny": {"p50_ms": 0.01},
+        }}}
+        current = {"results": {"micro": {
+            "align": {"p50_ms": 11.0, "p95_ms": 20.0, "throughput_per_s": 60.0},
+            "tiny": {"p50_ms": 0.05},
+            "new": {"p50_ms": 5.0},
+        }}}
+        regressions = compare(current, baseline, threshold=0.25)
+        assert {(r.benchmark, r.metric) for r in regressions} == {
+            ("align", "p95_ms"), ("align", "throughput_per_s")
+        }
+        assert str(regressions[0]) == "micro/align p95_ms: 12 -> 20 (+67%)"
+        assert compare(current, baseline, threshold=1.0) == []
+
+
+class TestLoad:
+    async def test_in_process_run(self):
+        results = await run_load_async(concurrency=2, requests=4, routes=["health", "lesson"], cues=60)
+        assert set(results) == {"health", "lesson"}
+        for summary in results.values():
+            assert summary["count"] == 4 and summary["errors"] == 0
+            assert summary["p50_ms"] <= summary["p99_ms"]
+
+
+class TestStartup:
+    def test_cold_start_phases_and_budgets(self):
+        results = run_startup(repeat=1)
+        assert results["heavy_modules"] == []
+        assert results["cold_start"]["count"] == 1
+        assert results["import_api"]["p50_ms"] <= results["cold_start"]["p50_ms"]
+
+        slow = dict(results, import_api={"p50_ms": 10_000.0}, heavy_modules=["numpy"])
+        assert len(check_budgets(slow)) == 2
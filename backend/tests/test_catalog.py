@@ -0,0 +1,188 @@
+"""
+Tests for the movie catalog: keyset pages, filters, search and progress
+"""
+
+import os
+import re
+import sqlite3
+import tempfile
+import uuid
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+from cinefluent.database_models import DatabaseManager, Movie, MovieVocab, UserVocab, Vocab
+from cinefluent.movies.catalog import (
+    InvalidCursorError,
+    SQLiteMovieCatalog,
+    TrigramIndex,
+    decode_cursor,
+    encode_cursor,
+    title_key,
+)
+from cinefluent.movies.metadata import rate_difficulty
+from cinefluent.users.repository import SQLiteUserRepository
+
+TITLES = [
+    ("Finding Nemo", "de", "beginner"),
+    ("Toy Story", "de", "beginner"),
+    ("Das Boot", "de", "advanced"),
+    ("Amélie", "fr", "intermediate"),
+    ("Lola rennt", "de", "intermediate"),
+    ("Good Bye, Lenin!", "de", "intermediate"),
+    ("Toy Story 2", "de", "beginner"),
+]
+
+
+def test_title_key_and_index():
+    assert title_key("Good Bye, Lenin!") == "good bye lenin"
+    assert title_key("  AMÉLIE ") == "amelie"
+
+    ids = [uuid.uuid4() for _ in TITLES]
+    index = TrigramIndex(
+        [(movie_id, title_key(title), lang, level) for movie_id, (title, lang, level) in zip(ids, TITLES)]
+    )
+    assert [movie_id for _, movie_id in index.search("findng nemo")] == [ids[0]]
+    assert index.search("nemmo")[0][1] == ids[0]
+    assert {movie_id for _, movie_id in index.search("toy story")} == {ids[1], ids[6]}
+    assert index.search("toy story", difficulty="advanced") == []
+    assert index.search("amelie", language="de") == []
+    assert index.search("zzz") == [] and index.search("!!") == []
+
+
+def test_cursors():
+    movie_id = uuid.uuid4()
+    assert decode_cursor(encode_cursor("browse", "toy story", movie_id), "browse") == ("toy story", movie_id)
+    assert decode_cursor(encode_cursor("search", 0.75, movie_id), "search") == (0.75, movie_id)
+    for bad in ("", "garbage", encode_cursor("search", 0.5, movie_id)):
+        with pytest.raises(InvalidCursorError):
+            decode_cursor(bad, "browse")
+
+
+def test_seed_movies_carry_title_keys():
+    init_sql = (Path(__file__).parent.parent / "sql" / "init.sql").read_text(encoding="utf-8")
+    seed = re.search(r"INSERT INTO movies \(title, title_key, [^)]*\) VALUES(.*?);", init_sql, re.S)
+    rows = re.findall(r"\('([^']*)', '([^']*)'", seed.group(1))
+    assert rows and all(key == title_key(title) for title, key in rows)
+
+
+def test_rate_difficulty():
+    assert rate_difficulty([50, 30, 20]) == "beginner"
+    assert rate_difficulty([1] * 300, common_words=200) == "intermediate"
+    assert rate_difficulty([1] * 1000, common_words=200) == "advanced"
+    assert rate_difficulty([]) == "beginner"
+
+
+class TestSQLiteCatalog:
+    def setup_method(self):
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.db = DatabaseManager(f"sqlite:///{self.db_path}")
+        self.db.create_tables()
+        self.movie_ids = {}
+        with self.db.get_session() as session:
+            for title, language, difficulty in TITLES:
+                movie = Movie(title=title, language=language, difficulty=difficulty)
+                session.add(movie)
+                session.flush()
+                self.movie_ids[title] = movie.id
+        self.users = SQLiteUserRepository(self.db_path)
+        self.catalog = SQLiteMovieCatalog(self.users)
+
+    def teardown_method(self):
+        self.db.engine.dispose()
+        os.unlink(self.db_path)
+
+    async def test_keyset_pages_and_filters(self):
+        await self.users.connect()
+        try:
+            user = await self.users.create("ida@example.com", "hash")
+            titles, cursor = [], None
+            while True:
+                page = await self.catalog.page(user.id, limit=3, cursor=cursor)
+                titles.extend(entry.title for entry in page.entries)
+                cursor = page.next_cursor
+                if cursor is None:
+                    break
+            assert titles == sorted((t for t, _, _ in TITLES), key=title_key)
+
+            page = await self.catalog.page(user.id, limit=10, language="de", difficulty="beginner")
+            assert [entry.title for entry in page.entries] == ["Finding Nemo", "Toy Story", "Toy Story 2"]
+            assert page.next_cursor is None
+
+            with pytest.raises(InvalidCursorError):
+                await self.catalog.page(user.id, cursor="not-a-cursor")
+        finally:
+            await self.users.close()
+
+    async def test_search_pages_and_refreshes(self):
+        await self.users.connect()
+        try:
+            user = await self.users.create("ida@example.com", "hash")
+            page = await self.catalog.page(user.id, query="Lenin")
+            assert [entry.title for entry in page.entries] == ["Good Bye, Lenin!"]
+
+            first = await self.catalog.page(user.id, limit=1, query="toy stroy")
+            second = await self.catalog.page(user.id, limit=1, query="toy stroy", cursor=first.next_cursor)
+            assert {first.entries[0].title, second.entries[0].title} == {"Toy Story", "Toy Story 2"}
+            assert second.next_cursor is None
+
+            with self.db.get_session() as session:
+                session.add(Movie(title="Nemo Returns"))
+            self.catalog.check_interval = 0
+            page = await self.catalog.page(user.id, query="nemo")
+            assert {entry.title for entry in page.entries} == {"Finding Nemo", "Nemo Returns"}
+        finally:
+            await self.users.close()
+
+    async def test_progress_for_the_page(self):
+        await self.users.connect()
+        try:
+            user = await self.users.create("ida@example.com", "hash")
+            nemo = self.movie_ids["Finding Nemo"]
+            with self.db.get_session() as session:
+                words = [Vocab(word=w, lang="de") for w in ("fisch", "meer", "vater", "hai")]
+                session.add_all(words)
+                session.flush()
+                for rank, vocab in enumerate(words, start=1):
+                    session.add(MovieVocab(movie_id=nemo, vocab_id=vocab.id, lang="de", frequency=5, rank=rank))
+                session.query(Movie).filter(Movie.id == nemo).update({"vocab_size": len(words)})
+                session.add(UserVocab(user_id=user.id, vocab_id=words[0].id))
+
+            page = await self.catalog.page(user.id, query="nemo")
+            entry = page.entries[0].as_dict()
+            assert (entry["words_known"], entry["vocab_size"], entry["progress"]) == (1, 4, 25)
+            assert entry["id"] == str(nemo)
+        finally:
+            await self.users.close()
+
+    def test_browse_uses_the_index(self):
+        conn = sqlite3.connect(self.db_path)
+        plan = conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM movies m WHERE m.language = 'de' AND m.difficulty = 'beginner'"
+            " AND (m.title_key, m.id) > ('a', '0') ORDER BY m.title_key, m.id LIMIT 21"
+        ).fetchall()
+        conn.close()
+        details = " ".join(row[-1] for row in plan)
+        assert "idx_movies_filters" in details
+        assert "TEMP B-TREE" not in details
+
+
+class TestCatalogEndpoint:
+    def test_ingested_movie_is_listed(self, elysium, sqlite_app, auth_headers):
+        with TestClient(sqlite_app) as client:
+            headers = auth_headers(client)
+
+            movies = client.get("/api/v1/movies", headers=headers).json()["movies"]
+            assert len(movies) == 1
+            elysium = movies[0]
+            assert elysium["title"] == "Elysium" and elysium["language"] == "de"
+            assert elysium["difficulty"] in ("beginner", "intermediate", "advanced")
+            assert elysium["vocab_size"] > 0 and elysium["scene_count"] > 0
+            assert elysium["progress"] == 0
+
+            found = client.get("/api/v1/movies", params={"q": "elysum"}, headers=headers).json()
+            assert [movie["id"] for movie in found["movies"]] == [elysium["id"]]
+            assert client.get("/api/v1/movies", params={"difficulty": "expert"}, headers=headers).status_code == 422
+            assert client.get("/api/v1/movies", params={"cursor": "nope"}, headers=headers).status_code == 400
@@ -0,0 +1,129 @@
+"""
+Tests for the per-movie cue index and the playback-window endpoint
+"""
+
+import asyncio
+import json
+import random
+import uuid
+from decimal import Decimal
+
+from fastapi.testclient import TestClient
+
+from cinefluent.movies.cues import CueIndex, CueStore, encode_window
+
+
+def test_overlapping_matches_a_scan():
+    rng = random.Random(7)
+    cues = []
+    for n in range(300):
+        start = rng.randrange(0, 600_000_000)
+        cues.append((start, start + rng.randrange(1, 8_000_000), str(n).encode()))
+    # One long cue that overlaps everything after it
+    cues.append((1_000_000, 500_000_000, b"long"))
+    index = CueIndex(cues)
+
+    for _ in range(200):
+        start = rng.randrange(0, 610_000_000)
+        end = start + rng.randrange(1, 30_000_000)
+        expected = sorted((s, e, f) for s, e, f in cues if s < end and e > start)
+        assert index.overlapping(start, end) == [f for _, _, f in expected]
+    assert index.overlapping(0, 1_000_000) == [f for s, _, f in sorted(cues) if s < 1_000_000]
+    assert CueIndex([]).overlapping(0, 10) == []
+
+
+def test_rows_and_window_encoding():
+    pair_id = uuid.uuid4()
+    index = CueIndex.from_rows([
+        (pair_id.hex, 1.5, 3.25, 1.4, 3.0, "Hello", "Hallo"),
+        (uuid.uuid4(), Decimal("10.000"), Decimal("12.000"), Decimal("10.100"), Decimal("12.500"), "Bye", "Tschüss"),
+    ])
+    movie_id = uuid.uuid4()
+    body = json.loads(encode_window(movie_id, 0, 2_000_000, index.overlapping(0, 2_000_000)))
+    assert body == {
+        "movie_id": str(movie_id),
+        "from": 0,
+        "to": 2_000_000,
+        "cues": [{
+            "pair_id": str(pair_id), "start_us": 1_400_000, "end_us": 3_250_000,
+            "english": "Hello", "german": "Hallo",
+        }],
+    }
+    assert [json.loads(f)["end_us"] for f in index.overlapping(3_250_000, 10_000_001)] == [12_500_000]
+
+
+class CountingCueStore(CueStore):
+    def __init__(self, movies, **kwargs):
+        super().__init__(None, **kwargs)
+        self.movies = movies
+        self.loads = 0
+
+    async def _load(self, movie_id):
+        self.loads += 1
+        await asyncio.sleep(0.01)
+        return self.movies.get(movie_id)
+
+
+async def test_store_loads_once_and_evicts():
+    movies = {uuid.uuid4(): [(uuid.uuid4(), 0.0, 1.0, 0.0, 1.0, "a", "b")] for _ in range(3)}
+    first, second, third = movies
+    store = CountingCueStore(movies, max_movies=2)
+
+    windows = await asyncio.gather(*(store.window(first, 0, 500_000) for _ in range(5)))
+    assert store.loads == 1 and all(len(window) == 1 for window in windows)
+    assert await store.window(uuid.uuid4(), 0, 1) is None
+
+    # Lookups of unknown ids are not cached, so they cannot evict real indexes
+    for _ in range(4):
+        assert await store.window(uuid.uuid4(), 0, 1) is None
+    loads = store.loads
+    await store.window(first, 0, 1)
+    assert store.loads == loads and store.stats()["movies"] == 1
+
+    await store.window(second, 0, 1)
+    await store.window(third, 0, 1)
+    assert store.stats()["movies"] == 2
+    loads = store.loads
+    await store.window(first, 0, 1)
+    assert store.loads == loads + 1
+
+    # A new content generation rebuilds the index
+    await store.window(first, 0, 1, generation=1)
+    assert store.loads == loads + 2
+    await store.window(first, 0, 1, generation=1)
+    assert store.loads == loads + 2
+
+
+class TestCuesEndpoint:
+    def test_playback_window(self, elysium, sqlite_app, auth_headers):
+        with TestClient(sqlite_app) as client:
+            headers = auth_headers(client)
+            movie_id = elysium["movie_id"]
+            url = f"/api/v1/movies/{movie_id}/cues"
+
+            everything = client.get(url, params={"from": 0, "to": 600_000_000}, headers=headers).json()["cues"]
+            assert everything and all(cue["english"] and cue["german"] for cue in everything)
+            assert [cue["start_us"] for cue in everything] == sorted(cue["start_us"] for cue in everything)
+
+            cue = everything[1]
+            response = client.get(url, params={"from": cue["start_us"], "to": cue["start_us"] + 1}, headers=headers)
+            assert cue in response.json()["cues"]
+            assert all(
+                c["start_us"] <= cue["start_us"] < c["end_us"] for c in response.json()["cues"]
+            )
+            repeat = client.get(
+                url,
+                params={"from": cue["start_us"], "to": cue["start_us"] + 1},
+                headers={**headers, "If-None-Match": response.headers["etag"]},
+            )
+            assert repeat.status_code == 304
+            assert sqlite_app.state.cues.stats()["misses"] == 1
+
+            assert client.get(url, params={"from": 5, "to": 5}, headers=headers).status_code == 400
+            assert client.get(url, params={"from": 0, "to": 10**12}, headers=headers).status_code == 400
+            assert client.get(url, params={"from": -1, "to": 5}, headers=headers).status_code == 422
+            for missing in (uuid.uuid4(), "not-a-uuid"):
+                response = client.get(
+                    f"/api/v1/movies/{missing}/cues", params={"from": 0, "to": 5}, headers=headers
+                )
+                assert response.status_code == 404
@@ -0,0 +1,267 @@
+"""
+Tests for the leaderboard and the activity rollups
+"""
+
+import random
+import uuid
+from datetime import date, datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from cinefluent.gamification.activity import (
+    ActivityAggregator,
+    ActivityEvent,
+    InvalidTimezoneError,
+    SQLiteActivityStore,
+    StreakState,
+    fold_events,
+)
+from cinefluent.gamification.leaderboard import (
+    LeaderboardService,
+    LocalLeaderboard,
+    OrderStatisticTree,
+    SQLiteScoreSource,
+    encode_score,
+)
+from cinefluent.users.repository import SQLiteUserRepository
+
+
+class TestLeaderboard:
+    """Order-statistic tree and the in-process board"""
+
+    def test_tree_matches_sorted_list(self):
+        rng = random.Random(7)
+        tree, keys = OrderStatisticTree(), []
+        for _ in range(2000):
+            key = rng.randrange(500)
+            if key in keys and rng.random() < 0.5:
+                keys.remove(key)
+                tree.remove(key)
+            elif key not in keys:
+                keys.append(key)
+                tree.insert(key)
+        keys.sort()
+        assert len(tree) == len(keys)
+        assert [tree.select(i) for i in range(len(keys))] == keys
+        for i, key in enumerate(keys):
+            assert tree.rank(key) == i
+
+    async def test_local_board(self):
+        board = LocalLeaderboard()
+        users = [uuid.uuid4() for _ in range(6)]
+        await board.update(
+            (user_id, f"user{i}", encode_score(i % 3, i)) for i, user_id in enumerate(users)
+        )
+        assert await board.size() == 6
+
+        top = await board.top(0, 3)
+        assert [entry.name for entry in top] == ["user5", "user2", "user4"]
+        assert top[0].longest_streak == 2 and top[0].mastered == 5
+        assert [entry.rank for entry in await board.top(4, 10)] == [5, 6]
+
+        # A score change moves the user without touching anyone else
+        await board.update([(users[0], "user0", encode_score(9, 0))])
+        assert (await board.rank(users[0])).rank == 1
+        assert (await board.rank(users[5])).rank == 2
+        around = await board.around(users[2], 1)
+        assert [entry.name for entry in around] == ["user5", "user2", "user4"]
+
+        await board.remove(users[0])
+        assert await board.rank(users[0]) is None
+        assert await board.size() == 5
+        await board.replace_all([])
+        assert await board.top(0, 10) == []
+
+    async def test_ties_order_like_redis(self):
+        # ZREVRANGE returns members with equal scores in descending lexicographic order
+        board = LocalLeaderboard()
+        users = [uuid.uuid4() for _ in range(8)]
+        await board.update((user_id, "tied", encode_score(3, 1)) for user_id in users)
+        expected = sorted(users, key=str, reverse=True)
+        assert [entry.user_id for entry in await board.top(0, 8)] == expected
+        for rank, user_id in enumerate(expected, 1):
+            assert (await board.rank(user_id)).rank == rank
+
+    @staticmethod
+    async def set_longest_streak(users, user_id, days):
+        def update(conn):
+            with conn:
+                conn.execute(
+                    "UPDATE streaks SET longest_streak = ? WHERE user_id = ?", (days, user_id.hex)
+                )
+
+        await users.run(update)
+
+    async def test_service_reads_sql(self, db_path):
+        users = SQLiteUserRepository(db_path)
+        await users.connect()
+        try:
+            ana = await users.create("ana@example.com", "hash")
+            ben = await users.create("ben@example.com", "hash")
+            await self.set_longest_streak(users, ben.id, 4)
+            service = LeaderboardService(LocalLeaderboard(), SQLiteScoreSource(users))
+            assert await service.rebuild() == 2
+            assert [e.name for e in await service.board.top(0, 10)] == ["ben", "ana"]
+
+            await self.set_longest_streak(users, ana.id, 6)
+            await service.refresh([ana.id])
+            me = await service.board.rank(ana.id)
+            assert me.rank == 1 and me.longest_streak == 6
+        finally:
+            await users.close()
+
+
+class TestActivity:
+    """Event folding, streaks and the SQLite activity store"""
+
+    def test_streak_days(self):
+        streak = StreakState()
+        for day in (1, 2, 2, 3):
+            streak = streak.advance(date(2024, 3, day))
+        assert (streak.current, streak.longest) == (3, 3)
+        # A late event for an earlier day changes nothing
+        assert streak.advance(date(2024, 3, 1)) == streak
+        assert streak.current_on(date(2024, 3, 4)) == 3
+        assert streak.current_on(date(2024, 3, 5)) == 0
+        streak = streak.advance(date(2024, 3, 6))
+        assert (streak.current, streak.longest) == (1, 3)
+
+        assert StreakState().folded_since() is None
+        tokyo = StreakState(1, 1, date(2024, 3, 6), "Asia/Tokyo")
+        assert tokyo.folded_since() == datetime(2024, 3, 5, 15)
+
+    def test_fold_uses_local_days(self):
+        user_id = uuid.uuid4()
+        # 23:30 UTC on Sunday is already Monday in Berlin
+        late = datetime(2024, 3, 3, 23, 30)
+        events = [
+            (user_id, ActivityEvent("study_time", 600, late)),
+            (user_id, ActivityEvent("lesson_completed", 1, late - timedelta(hours=2))),
+        ]
+        rollup = fold_events(events, {user_id: StreakState(timezone="Europe/Berlin")})
+        assert set(rollup.daily) == {(user_id, date(2024, 3, 3)), (user_id, date(2024, 3, 4))}
+        assert set(rollup.weekly) == {(user_id, date(2024, 2, 26)), (user_id, date(2024, 3, 4))}
+        assert rollup.totals[user_id]["study_seconds"] == 600
+        assert rollup.streaks[user_id].current == 2
+
+        utc = fold_events(events, {})
+        assert set(utc.daily) == {(user_id, date(2024, 3, 3))}
+        assert utc.streaks[user_id].current == 1
+
+    async def test_store_rollups(self, db_path):
+        users = SQLiteUserRepository(db_path)
+        await users.connect()
+        try:
+            user = await users.create("jo@example.com", "hash")
+            store = SQLiteActivityStore(users)
+            await store.set_timezone(user.id, "America/New_York")
+            with pytest.raises(InvalidTimezoneError):
+                await store.set_timezone(user.id, "Mars/Olympus")
+
+            now = datetime.utcnow()
+            await store.append(user.id, [
+                ActivityEvent("lesson_completed", 1, now - timedelta(days=1)),
+                ActivityEvent("study_time", 900, now),
+                ActivityEvent("words_learned", 4, now),
+            ])
+            folded = []
+
+            async def on_fold(user_ids):
+                folded.append(user_ids)
+
+            aggregator = ActivityAggregator(store, batch_size=2, on_fold=on_fold)
+            assert await aggregator.run_once() == {user.id}
+            assert aggregator.batches == 2 and len(folded) == 2
+            assert await store.aggregate() == set()
+
+            progress = await store.progress(user.id)
+            assert progress.totals["lessons_completed"] == 1
+            assert progress.totals["study_seconds"] == 900
+            assert progress.this_week(now)["study_seconds"] == 900
+            assert progress.streak.longest == 2
+            assert progress.streak.current_on(progress.today(now)) == 2
+            assert progress.streak.timezone == "America/New_York"
+            assert [counters["words_learned"] for _, counters in progress.recent] == [4, 0]
+
+            # Folding again later only adds the new events
+            await store.append(user.id, [ActivityEvent("study_time", 60, now)])
+            await aggregator.close()
+            assert (await store.progress(user.id)).totals["study_seconds"] == 960
+        finally:
+            await users.close()
+
+
+class TestLeaderboardEndpoints:
+    def test_pages_and_rank(self, sqlite_app, auth_headers):
+        with TestClient(sqlite_app) as client:
+            registered = {name: auth_headers(client, f"{name}@example.com") for name in ("gus", "hal", "ida")}
+            headers = registered["hal"]
+
+            page = client.get("/api/v1/gamification/leaderboard?limit=2", headers=headers).json()
+            assert page["total"] == 3
+            assert len(page["entries"]) == 2
+            assert "@" not in page["entries"][0]["name"]
+
+            me = client.get("/api/v1/gamification/leaderboard/me?radius=1", headers=headers).json()
+            assert me["me"]["name"] == "hal"
+            assert 2 <= len(me["around"]) <= 3
+            assert me["me"] in me["around"]
+
+    def test_activity_progress(self, sqlite_app, auth_headers):
+        with TestClient(sqlite_app) as client:
+            headers = auth_headers(client, "kim@example.com")
+            assert client.put(
+                "/api/v1/gamification/timezone", headers=headers, json={"timezone": "Asia/Tokyo"}
+            ).status_code == 200
+            assert client.put(
+                "/api/v1/gamification/timezone", headers=headers, json={"timezone": "Nowhere/Land"}
+            ).status_code == 422
+
+            response = client.post(
+                "/api/v1/gamification/activity",
+                headers=headers,
+                json={"events": [{"kind": "study_time", "amount": 1200}, {"kind": "movie_started"}]},
+            )
+            assert response.status_code == 202
+            bad = client.post(
+                "/api/v1/gamification/activity", headers=headers, json={"events": [{"kind": "sleeping"}]}
+            )
+            assert bad.status_code == 422
+            answers = {"answers": [{"question_id": "q2", "answer": "Hola"}]}
+            submit = client.post("/api/v1/quiz/7/submit", headers=headers, json=answers)
+            assert submit.json()["correct_answers"] == 1
+
+        # Shutdown folds whatever the aggregator had not picked up yet
+        with TestClient(sqlite_app) as client:
+            progress = client.get("/api/v1/gamification/progress", headers=headers).json()
+            assert progress["total_study_time_minutes"] == 20
+            assert progress["weekly_progress"] == 20
+            assert progress["movies_started"] == 1
+            assert progress["total_lessons_completed"] == 1
+            # A quiz alone teaches no new words until its answers reach user_vocab
+            assert progress["words_learned"] == 0
+            assert progress["current_streak"] == 1
+            assert progress["recent_activity"][0]["study_time_minutes"] == 20
+
+            streak = client.get("/api/v1/gamification/streak", headers=headers).json()
+            assert streak["current_streak"] == 1 and streak["timezone"] == "Asia/Tokyo"
+
+            # Backdating past the offline window is refused; within it, events are
+            # clamped to the last folded day so they cannot extend the streak backwards
+            def started(hours_ago):
+                occurred_at = (datetime.utcnow() - timedelta(hours=hours_ago)).isoformat()
+                return client.post(
+                    "/api/v1/gamification/activity",
+                    headers=headers,
+                    json={"events": [{"kind": "movie_started", "occurred_at": occurred_at}]},
+                ).status_code
+
+            assert started(72) == 422
+            assert started(30) == 202
+
+        with TestClient(sqlite_app) as client:
+            progress = client.get("/api/v1/gamification/progress", headers=headers).json()
+            assert progress["movies_started"] == 2
+            assert (progress["current_streak"], progress["longest_streak"]) == (1, 1)
+            assert len(progress["recent_activity"]) == 1
@@ -0,0 +1,386 @@
+"""
+Tests for lesson content, the review scheduler and the learning endpoints
+"""
+
+import os
+import sqlite3
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+from cinefluent.database_models import DatabaseManager, Scene, Vocab
+from cinefluent.ingestion_service import IngestionService
+from cinefluent.learning.answer_buffer import AnswerBuffer
+from cinefluent.learning.reviews import ReviewItem, SQLiteReviewStore, UnknownVocabError
+from cinefluent.learning.scheduler import AGAIN, EASY, GOOD, HARD, CardState, review
+from cinefluent.response_cache import CachedBody, ResponseCache, encode_json
+from cinefluent.scenes import SceneStage
+from cinefluent.users.repository import SQLiteUserRepository
+from cinefluent.vocabulary import VocabularyStage
+
+
+class TestResponseCache:
+    """In-process tier of the response cache"""
+
+    async def test_generation_invalidation(self):
+        cache = ResponseCache(max_entries=2, redis_url="")
+        await cache.connect()
+        assert await cache.get("/movies") is None
+        entry = await cache.set("/movies", encode_json({"movies": []}))
+        assert (await cache.get("/movies")).etag == entry.etag
+
+        await cache.invalidate()
+        assert await cache.get("/movies") is None
+        assert cache.stats()["generation"] == 1
+
+        for key in ("/a", "/b", "/c"):
+            await cache.set(key, b"{}")
+        assert await cache.get("/a") is None
+        assert cache.stats()["entries"] == 2
+
+    async def test_unreachable_redis(self):
+        cache = ResponseCache(redis_url="redis://127.0.0.1:1")
+        await cache.connect()
+        try:
+            assert await cache.get("/movies") is None
+            entry = await cache.set("/movies", b"{}")
+            assert (await cache.get("/movies")).etag == entry.etag
+            await cache.invalidate()
+            assert await cache.get("/movies") is None
+            assert cache.stats()["generation"] == 1
+            assert cache.stats()["redis_errors"] >= 4
+        finally:
+            await cache.close()
+
+    def test_etag_matching(self):
+        entry = CachedBody(encode_json({"title": "Café"}))
+        assert entry.etag.startswith('"') and entry.etag.endswith('"')
+        assert entry.matches(entry.etag)
+        assert entry.matches(f'"other", {entry.etag}')
+        assert entry.matches("*")
+        assert not entry.matches('"other"')
+        assert not entry.matches(None)
+        assert CachedBody(encode_json({"title": "Cafe"})).etag != entry.etag
+
+
+class TestScheduler:
+    """FSRS-style card updates"""
+
+    def test_first_reviews(self):
+        now = datetime(2024, 1, 1)
+        good = review(CardState(), GOOD, now)
+        assert good.reps == 1 and good.lapses == 0
+        assert good.due_at - now == timedelta(days=4)
+
+        again = review(CardState(), AGAIN, now)
+        assert again.lapses == 1
+        assert again.due_at - now == timedelta(minutes=10)
+
+        easy = review(CardState(), EASY, now)
+        assert easy.stability > good.stability > review(CardState(), HARD, now).stability
+        assert easy.difficulty < good.difficulty
+
+    def test_intervals_grow_until_lapse(self):
+        now = datetime(2024, 1, 1)
+        card = review(CardState(), GOOD, now)
+        intervals = []
+        for _ in range(4):
+            now = card.due_at
+            card = review(card, GOOD, now)
+            intervals.append(card.due_at - now)
+        assert intervals == sorted(intervals) and intervals[0] < intervals[-1]
+        assert card.mastered
+
+        failed = review(card, AGAIN, card.due_at)
+        assert failed.stability < card.stability
+        assert failed.lapses == 1 and not failed.mastered
+
+    def test_invalid_rating(self):
+        with pytest.raises(ValueError):
+            review(CardState(), 5, datetime(2024, 1, 1))
+
+
+class TestReviewStore:
+    """Due queue and batch reviews on SQLite"""
+
+    def setup_method(self):
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.db = DatabaseManager(f"sqlite:///{self.db_path}")
+        self.db.create_tables()
+        self.vocab_ids = [uuid.uuid4() for _ in range(5)]
+        with self.db.get_session() as session:
+            for i, vocab_id in enumerate(self.vocab_ids):
+                session.add(Vocab(id=vocab_id, word=f"wort{i}", lang="de"))
+        self.users = SQLiteUserRepository(self.db_path)
+
+    def teardown_method(self):
+        os.unlink(self.db_path)
+
+    async def test_due_queue(self):
+        await self.users.connect()
+        try:
+            user = await self.users.create("eva@example.com", "hash")
+            store = SQLiteReviewStore(self.users)
+            now = datetime.utcnow()
+            past = now - timedelta(hours=1)
+
+            result = await store.apply_reviews(
+                user.id,
+                [ReviewItem(v, AGAIN, past) for v in self.vocab_ids[:3]]
+                + [ReviewItem(self.vocab_ids[3], GOOD, past), ReviewItem(self.vocab_ids[0], AGAIN, past - timedelta(minutes=1))],
+                now,
+            )
+            states = result.states
+            assert len(states) == 4
+            assert result.mastered == result.newly_mastered == set()
+            assert states[self.vocab_ids[0]].reps == 2
+
+            due = await store.due(user.id, now, 10)
+            assert len(due) == 3
+            assert [card.state.due_at for card in due] == sorted(card.state.due_at for card in due)
+            assert {card.word for card in due} == {"wort0", "wort1", "wort2"}
+            assert len(await store.due(user.id, now, 2)) == 2
+
+            with pytest.raises(UnknownVocabError):
+                await store.apply_reviews(user.id, [ReviewItem(uuid.uuid4(), GOOD)], now)
+
+            seen = await self.users.run(
+                lambda conn: conn.execute(
+                    "SELECT seen_count FROM user_vocab WHERE vocab_id = ?", (self.vocab_ids[0].hex,)
+                ).fetchone()
+            )
+            assert seen[0] == 2
+        finally:
+            await self.users.close()
+
+    async def test_mastered_is_sticky(self):
+        await self.users.connect()
+        try:
+            user = await self.users.create("gil@example.com", "hash")
+            store = SQLiteReviewStore(self.users)
+            now = datetime.utcnow()
+            quizzed, strong = self.vocab_ids[:2]
+            await store.apply_reviews(user.id, [ReviewItem(quizzed, GOOD), ReviewItem(strong, GOOD)], now)
+
+            def promote(conn):
+                with conn:
+                    # The quiz path marked one card mastered; the other is one review from it
+                    conn.execute("UPDATE user_vocab SET mastered = 1 WHERE vocab_id = ?", (quizzed.hex,))
+                    conn.execute(
+                        "UPDATE user_vocab SET stability = 20 WHERE vocab_id = ?", (strong.hex,)
+                    )
+
+            await self.users.run(promote)
+            later = now + timedelta(days=20)
+            result = await store.apply_reviews(
+                user.id, [ReviewItem(quizzed, AGAIN, later), ReviewItem(strong, EASY, later)], later
+            )
+            assert not result.states[quizzed].mastered
+            assert result.mastered == {quizzed, strong}
+            assert result.newly_mastered == {strong}
+
+            # A lapse on a mastered card keeps the flag and changes nothing for the leaderboard
+            result = await store.apply_reviews(user.id, [ReviewItem(strong, AGAIN, later)], later)
+            assert result.mastered == {strong} and result.newly_mastered == set()
+            rows = await self.seen_rows()
+            assert rows[quizzed.hex][1] == 1 and rows[strong.hex][1] == 1
+        finally:
+            await self.users.close()
+
+    async def seen_rows(self):
+        return await self.users.run(
+            lambda conn: dict(
+                (row[0], row[1:])
+                for row in conn.execute("SELECT vocab_id, seen_count, mastered FROM user_vocab")
+            )
+        )
+
+    async def test_answer_buffer(self):
+        await self.users.connect()
+        try:
+            user = await self.users.create("finn@example.com", "hash")
+            buffer = AnswerBuffer(SQLiteReviewStore(self.users), max_pending=100)
+            first, second = self.vocab_ids[:2]
+
+            buffer.record(user.id, [first, second, uuid.uuid4()], correct=True)
+            buffer.record(user.id, [first], correct=True)
+            assert buffer.pending == 3
+            # The unknown vocab id is dropped by the upsert's join
+            assert await buffer.flush() == 3
+            rows = await self.seen_rows()
+            assert rows == {first.hex: (2, 0), second.hex: (1, 0)}
+
+            for _ in range(3):
+                buffer.record(user.id, [first, second], correct=True)
+            buffer.record(user.id, [second], correct=False)
+            buffer.start()
+            await buffer.close()
+            rows = await self.seen_rows()
+            # first reached five sightings on a correct answer; second's last answer was wrong
+            assert rows == {first.hex: (5, 1), second.hex: (5, 0)}
+
+            metrics = buffer.metrics()
+            assert metrics["pending"] == 0
+            assert metrics["flushes"] == 2
+            assert metrics["flush_size"]["max"] == 3
+            assert metrics["flush_lag"]["count"] == 2
+        finally:
+            await self.users.close()
+
+    def test_due_query_uses_index(self):
+        from cinefluent.learning.reviews import CARD_COLUMNS, DUE_SQL
+
+        conn = sqlite3.connect(self.db_path)
+        plan = conn.execute(
+            "EXPLAIN QUERY PLAN " + DUE_SQL.format(columns=CARD_COLUMNS, p1="?", p2="?", p3="?"),
+            ("x", "y", 1),
+        ).fetchall()
+        conn.close()
+        details = " ".join(row[-1] for row in plan)
+        assert "idx_user_vocab_due" in details
+        assert "TEMP B-TREE" not in details
+
+
+class TestCachedEndpoints:
+    """Conditional GETs against the cached routes"""
+
+    def test_conditional_get(self, sqlite_app, auth_headers):
+        with TestClient(sqlite_app) as client:
+            headers = auth_headers(client)
+            first = client.get("/api/v1/quiz/7", headers=headers)
+            assert first.status_code == 200
+            assert first.json()["quiz_id"] == "quiz_7"
+            etag = first.headers["ETag"]
+
+            again = client.get("/api/v1/quiz/7", headers={**headers, "If-None-Match": etag})
+            assert again.status_code == 304
+            assert again.headers["ETag"] == etag
+            assert again.content == b""
+
+            assert client.get("/api/v1/quiz/7").status_code in (401, 403)
+
+            # The per-user catalog is not shared through the cache but still revalidates
+            movies = client.get("/api/v1/movies", headers=headers)
+            assert movies.json() == {"movies": [], "next_cursor": None}
+            movie_etag = movies.headers["ETag"]
+            assert movie_etag != etag
+            again = client.get("/api/v1/movies", headers={**headers, "If-None-Match": movie_etag})
+            assert again.status_code == 304
+
+            stats = client.app.state.responses.stats()
+            assert stats["hits"] == 1 and stats["misses"] == 1
+
+    def test_lesson_bundles(self, db_path, sqlite_app, auth_headers):
+        data_dir = Path(__file__).parent.parent
+        service = IngestionService(
+            DatabaseManager(f"sqlite:///{db_path}"), stages=[VocabularyStage(), SceneStage(gap_ms=300)]
+        )
+        service.ingest_movie("Elysium", data_dir / "test_en.srt", data_dir / "test_de.srt")
+        with DatabaseManager(f"sqlite:///{db_path}").get_session() as session:
+            scenes = session.query(Scene).order_by(Scene.ordinal).all()
+            lesson_id = str(scenes[-1].id)
+
+        with TestClient(sqlite_app) as client:
+            headers = auth_headers(client)
+            lesson = client.get(f"/api/v1/lessons/{lesson_id}", headers=headers)
+            assert lesson.status_code == 200
+            assert lesson.headers["Content-Encoding"] == "gzip"
+            body = lesson.json()
+            assert body["lesson_id"] == lesson_id
+            assert (body["scene_number"], body["total_scenes"]) == (3, 3)
+            assert len(body["subtitle_pairs"]) == 2
+            assert {"en", "de"} == {word["lang"] for word in body["vocabulary"]}
+
+            again = client.get(
+                f"/api/v1/lessons/{lesson_id}", headers={**headers, "If-None-Match": lesson.headers["ETag"]}
+            )
+            assert again.status_code == 304
+
+            plain = client.get(
+                f"/api/v1/lessons/{lesson_id}", headers={**headers, "Accept-Encoding": "identity"}
+            )
+            assert "Content-Encoding" not in plain.headers
+            assert plain.json() == body
+            assert plain.headers["ETag"] != lesson.headers["ETag"]
+
+            assert client.get("/api/v1/lessons/7", headers=headers).status_code == 404
+            assert client.get(f"/api/v1/lessons/{uuid.uuid4()}", headers=headers).status_code == 404
+
+    def test_review_endpoints(self, db_path, sqlite_app, auth_headers):
+        vocab_id = uuid.uuid4()
+        with DatabaseManager(f"sqlite:///{db_path}").get_session() as session:
+            session.add(Vocab(id=vocab_id, word="haus", lang="de"))
+
+        with TestClient(sqlite_app) as client:
+            headers = auth_headers(client)
+            assert client.get("/api/v1/vocabulary/review", headers=headers).json()["count"] == 0
+
+            reviewed_at = (datetime.utcnow() - timedelta(hours=1)).isoformat() + "Z"
+            response = client.post(
+                "/api/v1/vocabulary/review",
+                headers=headers,
+                json={"reviews": [{"vocab_id": str(vocab_id), "rating": 1, "reviewed_at": reviewed_at}]},
+            )
+            assert response.status_code == 200
+            assert response.json()["reviewed"] == 1
+
+            due = client.get("/api/v1/vocabulary/review?limit=5", headers=headers).json()
+            assert due["count"] == 1 and due["cards"][0]["word"] == "haus"
+            assert client.get("/api/v1/auth/me", headers=headers).json()["words_learned"] == 1
+
+            response = client.post(
+                "/api/v1/vocabulary/review",
+                headers=headers,
+                json={"reviews": [{"vocab_id": str(uuid.uuid4()), "rating": 3}]},
+            )
+            assert response.status_code == 404
+            bad = client.post(
+                "/api/v1/vocabulary/review",
+                headers=headers,
+                json={"reviews": [{"vocab_id": str(vocab_id), "rating": 7}]},
+            )
+            assert bad.status_code == 422
+
+    def test_quiz_answers_flushed_on_shutdown(self, db_path, sqlite_app, auth_headers):
+        vocab_id = uuid.uuid4()
+        with DatabaseManager(f"sqlite:///{db_path}").get_session() as session:
+            session.add(Vocab(id=vocab_id, word="sheriff", lang="en"))
+
+        with TestClient(sqlite_app) as client:
+            headers = auth_headers(client)
+            response = client.post(
+                "/api/v1/quiz/7/answer",
+                headers=headers,
+                json={"question_id": "q1", "answer": "Sheriff", "vocab_ids": [str(vocab_id)]},
+            )
+            assert response.json()["correct"] is True
+            # A submission with one bad entry is rejected before any answer is buffered
+            rejected = [
+                [{"question_id": "q1", "answer": "Sheriff", "vocab_ids": [str(vocab_id)]}, {}],
+                [
+                    {"question_id": "q1", "answer": "Sheriff", "vocab_ids": [str(vocab_id)]},
+                    {"question_id": "q2", "answer": "Hola", "vocab_ids": ["not-a-uuid"]},
+                ],
+            ]
+            for answers, code in zip(rejected, (404, 422)):
+                bad = client.post("/api/v1/quiz/7/submit", headers=headers, json={"answers": answers})
+                assert bad.status_code == code
+            submit = client.post(
+                "/api/v1/quiz/7/submit",
+                headers=headers,
+                json={"answers": [{"question_id": "q2", "answer": "Adiós", "vocab_ids": [str(vocab_id)]}]},
+            )
+            assert submit.json()["correct_answers"] == 0
+            assert client.post(
+                "/api/v1/quiz/7/answer", headers=headers, json={"question_id": "q9", "answer": "x"}
+            ).status_code == 404
+
+        conn = sqlite3.connect(db_path)
+        row = conn.execute("SELECT seen_count, mastered FROM user_vocab").fetchone()
+        conn.close()
+        assert row == (2, 0)
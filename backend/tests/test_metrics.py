@@ -0,0 +1,136 @@
+"""
+Tests for the metrics registry, the request middleware and /metrics
+"""
+
+import logging
+import re
+
+from fastapi.testclient import TestClient
+
+from cinefluent.log_queue import QueueLogging
+from cinefluent.metrics import MetricFamily, MetricsRegistry, timer
+
+
+def sample(text: str, name: str, **labels) -> float:
+    """Value of the series name{labels...} in an exposition, or 0.0"""
+    for line in text.splitlines():
+        series, _, value = line.rpartition(" ")
+        if not series.startswith(name + "{") and series != name:
+            continue
+        found = dict(re.findall(r'(\w+)="([^"]*)"', series[len(name):]))
+        if found == {key: str(value) for key, value in labels.items()}:
+            return float(value)
+    return 0.0
+
+
+class TestRegistry:
+    def test_histogram_buckets_are_cumulative(self):
+        registry = MetricsRegistry()
+        latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0), route="/a")
+        for value in (0.05, 0.1, 0.5, 3.0):
+            latency.observe(value)
+
+        text = registry.render()
+        assert "# TYPE cinefluent_latency_seconds histogram" in text
+        assert sample(text, "cinefluent_latency_seconds_bucket", route="/a", le="0.1") == 2
+        assert sample(text, "cinefluent_latency_seconds_bucket", route="/a", le="1.0") == 3
+        assert sample(text, "cinefluent_latency_seconds_bucket", route="/a", le="+Inf") == 4
+        assert sample(text, "cinefluent_latency_seconds_count", route="/a") == 4
+        assert sample(text, "cinefluent_latency_seconds_sum", route="/a") == 3.65
+
+    def test_counters_timers_and_collectors(self):
+        registry = MetricsRegistry()
+        registry.counter("jobs_total", "Jobs", result="ok").inc()
+        registry.counter("jobs_total", "Jobs", result="ok").inc(2)
+        with timer("parse", registry):
+            pass
+        registry.register_collector(
+            "test", lambda: [MetricFamily("queue_depth", "gauge", "Depth").add(7, queue='a"b')]
+        )
+
+        text = registry.render()
+        assert sample(text, "cinefluent_jobs_total", result="ok") == 3
+        assert sample(text, "cinefluent_operation_duration_seconds_count", operation="parse") == 1
+        assert 'cinefluent_queue_depth{queue="a\\"b"} 7' in text
+
+        registry.unregister_collector("test")
+        assert "queue_depth" not in registry.render()
+
+    def test_kind_mismatch(self):
+        registry = MetricsRegistry()
+        registry.counter("things")
+        try:
+            registry.gauge("things")
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("gauge registered over a counter")
+
+
+class TestQueueLogging:
+    def test_records_reach_original_handlers(self):
+        records = []
+
+        class Collect(logging.Handler):
+            def emit(self, record):
+                records.append(record.getMessage())
+
+        root = logging.getLogger()
+        handler = Collect()
+        root.addHandler(handler)
+        queued = QueueLogging(level="INFO")
+        try:
+            queued.start()
+            assert handler not in root.handlers
+            logging.getLogger("cinefluent.test").info("hello %s", "queue")
+            queued.stop()
+            assert handler in root.handlers
+            assert records == ["hello queue"]
+        finally:
+            root.removeHandler(handler)
+
+    def test_full_queue_drops(self):
+        queued = QueueLogging(max_size=1)
+        record = logging.makeLogRecord({"msg": "x"})
+        queued.handler.emit(record)
+        queued.handler.emit(record)
+        assert queued.dropped == 1
+
+
+class TestMetricsEndpoint:
+    def test_routes_timers_and_caches(self, sqlite_app, auth_headers):
+        with TestClient(sqlite_app) as client:
+            before = client.get("/metrics").text
+            route = "/api/v1/auth/me"
+            headers = auth_headers(client, "mia@example.com")
+            for _ in range(3):
+                client.get(route, headers=headers)
+            client.get(route)
+            client.get("/no/such/route")
+
+            health = client.get("/health").json()
+            assert health["database"]["status"] == "connected"
+
+            response = client.get("/metrics")
+            assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+            text = response.text
+
+            def delta(name, **labels):
+                return sample(text, name, **labels) - sample(before, name, **labels)
+
+            requests = "cinefluent_http_requests_total"
+            assert delta(requests, method="GET", route=route, status="200") == 3
+            assert delta(requests, method="GET", route=route, status="401") == 1
+            assert delta(requests, method="GET", route="unmatched", status="404") == 1
+            assert delta(
+                "cinefluent_http_request_duration_seconds_count", method="GET", route=route
+            ) == 4
+            # This scrape is still being served
+            assert sample(text, "cinefluent_http_requests_in_flight") == 1
+
+            timers = "cinefluent_operation_duration_seconds_count"
+            assert delta(timers, operation="bcrypt_hash") == 1
+            assert delta(timers, operation="jwt_decode") == 1
+            assert delta(timers, operation="db_query") >= 2
+            assert sample(text, "cinefluent_cache_lookups_total", cache="principal", result="hit") == 2
+            assert sample(text, "cinefluent_cache_lookups_total", cache="principal", result="miss") == 1
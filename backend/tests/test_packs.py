@@ -0,0 +1,182 @@
+"""
+Tests for offline packs: the binary format, versioned deltas and the download endpoint
+"""
+
+import os
+import sqlite3
+import tempfile
+import uuid
+import zlib
+from dataclasses import replace
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+from cinefluent.database_models import DatabaseManager, MoviePack
+from cinefluent.ingestion_service import IngestionService
+from cinefluent.movies.packs import RangeNotSatisfiable, byte_range
+from cinefluent.offline_packs import (
+    DELTA,
+    FULL,
+    Pack,
+    PackFormatError,
+    PackPair,
+    apply_delta,
+    build_packs,
+    decode_pack,
+    diff_pairs,
+    encode_pack,
+)
+
+DATA_DIR = Path(__file__).parent.parent
+
+
+def make_pairs(n):
+    return [
+        PackPair(
+            uuid.uuid4(), 1000 * i, 1000 * i + 900, 1000 * i - 40, 1000 * i + 950,
+            "Yes." if i % 3 else f"Line {i}", "Ja." if i % 3 else f"Zeile {i} – schön", 80 + i % 20,
+        )
+        for i in range(n)
+    ]
+
+
+def test_round_trip_and_delta():
+    pairs = make_pairs(50)
+    body = encode_pack(Pack(1, list(reversed(pairs))))
+    assert body[:4] == b"CFPK" and body[5] == FULL
+    decoded = decode_pack(body)
+    assert decoded.version == 1 and decoded.pairs == pairs and decoded.removed == []
+    # Repeated lines are stored once: the payload starts with the string count
+    texts = {pair.english for pair in pairs} | {pair.german for pair in pairs}
+    assert zlib.decompress(body[16:])[0] == len(texts)
+
+    changed = pairs[1:]
+    changed[5] = replace(changed[5], german="Korrigiert")
+    changed.append(PackPair(uuid.uuid4(), 99_000, 99_500, 99_000, 99_600, "New", "Neu", 100))
+    upserts, removed = diff_pairs(pairs, changed)
+    assert removed == [pairs[0].pair_id] and len(upserts) == 2
+
+    delta = decode_pack(encode_pack(Pack(2, upserts, 1, removed)))
+    assert delta.kind == DELTA and delta.base_version == 1
+    assert apply_delta(pairs, delta) == changed
+
+    for broken in (b"", b"nope" * 10, body[:30], body[:5] + b"\x02" + body[6:]):
+        with pytest.raises(PackFormatError):
+            decode_pack(broken)
+
+
+def test_byte_range():
+    assert byte_range(None, 100) is None
+    assert byte_range("bytes=0-9", 100) == (0, 9)
+    assert byte_range("bytes=90-", 100) == (90, 99)
+    assert byte_range("bytes=-10", 100) == (90, 99)
+    assert byte_range("bytes=50-500", 100) == (50, 99)
+    assert byte_range("bytes=0-1,5-6", 100) is None
+    assert byte_range("items=0-1", 100) is None
+    for unsatisfiable in ("bytes=100-", "bytes=5-2", "bytes=-0"):
+        with pytest.raises(RangeNotSatisfiable):
+            byte_range(unsatisfiable, 100)
+
+
+def edit_german_line(db_path, text):
+    """Change one DE cue in place, as a corrected subtitle file would"""
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute(
+            "UPDATE subtitles SET text = ? WHERE id = (SELECT de_id FROM subtitle_pairs LIMIT 1)", (text,)
+        )
+    conn.close()
+
+
+class TestPackVersions:
+    def setup_method(self):
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.db = DatabaseManager(f"sqlite:///{self.db_path}")
+        self.db.create_tables()
+        self.service = IngestionService(self.db)
+        result = self.service.ingest_movie("Elysium", DATA_DIR / "test_en.srt", DATA_DIR / "test_de.srt")
+        self.movie_id = uuid.UUID(result["movie_id"])
+        self.pairs = result["pairs"]
+
+    def teardown_method(self):
+        self.db.engine.dispose()
+        os.unlink(self.db_path)
+
+    def packs(self):
+        with self.db.get_session() as session:
+            return {
+                (row.version, row.base_version): decode_pack(row.body)
+                for row in session.query(MoviePack).filter(MoviePack.movie_id == self.movie_id)
+            }
+
+    def test_rebuilds_keep_deltas(self):
+        packs = self.packs()
+        assert list(packs) == [(1, 0)] and len(packs[1, 0].pairs) == self.pairs
+
+        with self.db.engine.begin() as conn:
+            assert build_packs(conn, [self.movie_id]) == 0
+        for version in range(2, 6):
+            edit_german_line(self.db_path, f"Fassung {version}")
+            with self.db.engine.begin() as conn:
+                assert build_packs(conn, [self.movie_id]) == 1
+
+        packs = self.packs()
+        assert sorted(packs) == [(3, 0), (4, 0), (5, 0), (5, 2), (5, 3), (5, 4)]
+        latest = packs[5, 0].pairs
+        assert apply_delta(packs[4, 0].pairs, packs[5, 4]) == latest
+        assert apply_delta(packs[3, 0].pairs, packs[5, 3]) == latest
+        assert len(packs[5, 4].pairs) == 1 and packs[5, 4].removed == []
+
+        with self.db.engine.begin() as conn:
+            self.service.delete_movies(conn, [self.movie_id])
+        assert self.packs() == {}
+
+
+class TestPackEndpoint:
+    def test_download_resume_and_delta(self, db_path, elysium, sqlite_app, auth_headers):
+        # A corrected line gives the movie a second version with a delta from the first
+        edit_german_line(db_path, "Korrigiert")
+        db = DatabaseManager(f"sqlite:///{db_path}")
+        with db.engine.begin() as conn:
+            build_packs(conn, [uuid.UUID(elysium["movie_id"])])
+        db.engine.dispose()
+
+        with TestClient(sqlite_app) as client:
+            headers = auth_headers(client)
+            url = f"/api/v1/movies/{elysium['movie_id']}/pack"
+
+            full = client.get(url, headers=headers)
+            assert full.status_code == 200
+            assert full.headers["content-type"] == "application/vnd.cinefluent.pack"
+            assert full.headers["accept-ranges"] == "bytes"
+            assert (full.headers["x-pack-version"], full.headers["x-pack-base-version"]) == ("2", "0")
+            pack = decode_pack(full.content)
+            assert pack.version == 2 and pack.pairs
+            etag = full.headers["etag"]
+
+            head = client.get(url, headers={**headers, "Range": "bytes=0-9"})
+            tail = client.get(url, headers={**headers, "Range": "bytes=10-", "If-Range": etag})
+            assert (head.status_code, tail.status_code) == (206, 206)
+            assert head.content + tail.content == full.content
+            assert tail.headers["content-range"] == f"bytes 10-{len(full.content) - 1}/{len(full.content)}"
+            stale = client.get(url, headers={**headers, "Range": "bytes=10-", "If-Range": '"old"'})
+            assert stale.status_code == 200 and stale.content == full.content
+            beyond = client.get(url, headers={**headers, "Range": f"bytes={len(full.content)}-"})
+            assert beyond.status_code == 416
+            assert beyond.headers["content-range"] == f"bytes */{len(full.content)}"
+
+            assert client.get(url, headers={**headers, "If-None-Match": etag}).status_code == 304
+
+            delta = client.get(url, params={"since": 1}, headers=headers)
+            assert delta.headers["x-pack-base-version"] == "1"
+            assert len(delta.content) < len(full.content)
+            assert [pair.german for pair in decode_pack(delta.content).pairs] == ["Korrigiert"]
+            assert client.get(url, params={"since": 2}, headers=headers).status_code == 204
+            # No delta from an unknown version: the full pack
+            assert client.get(url, params={"since": 7}, headers=headers).content == full.content
+
+            for missing in (uuid.uuid4(), "not-a-uuid"):
+                assert client.get(f"/api/v1/movies/{missing}/pack", headers=headers).status_code == 404
@@ -5,17 +5,33 @@ Test suite for cinefluent Stage 1 - Subtitle Processing Engine
 import pytest
 import tempfile
 import os
+import gzip
+import json
+import random
+import re
 import sys
 from pathlib import Path
 from decimal import Decimal
 from unittest.mock import Mock, patch
 import uuid
 
-# Import from the installed cinefluent package
-from cinefluent.subtitle_processor import SubtitleProcessor, SubtitleCue, TextCleaner, SubtitleValidator
-from cinefluent.database_models import Movie, Subtitle, SubtitlePair, DatabaseManager
-from cinefluent.ingestion_service import IngestionService
+import numpy as np
 
+# Import from the installed cinefluent package
+from cinefluent.subtitle_processor import (
+    CompactCue, SubtitleCue, SubtitleProcessor, SubtitleValidator, TextCleaner,
+    iter_cue_blocks, iter_subtitle_file,
+)
+from cinefluent.database_models import DatabaseManager, Movie, MovieVocab, Scene, Subtitle, SubtitlePair, Vocab
+from cinefluent.ingestion_service import IngestionService, MovieFiles
+from cinefluent.bulk_loader import PostgresCopyWriter
+from cinefluent.directory_ingest import discover_pairs, ingest_directory
+from cinefluent.vocabulary import VocabularyStage, load_frequencies, tokenize
+from cinefluent.word_index import WordIndex, WordIndexStage
+from cinefluent.realign import align_tracks, realign_catalog
+from cinefluent.scenes import SceneStage, segment_scenes
+from cinefluent.retiming import MIN_CORRECTION_MS, Retiming, estimate_retiming
+from benchmarks.corpus import film_tracks
 
 class TestTextCleaner:
     """Test cases for text cleaning functionality"""
@@ -47,6 +63,38 @@ class TestTextCleaner:
         assert self.cleaner.clean_text("") == ""
         assert self.cleaner.clean_text(None) == ""
 
+    def test_line_breaks(self):
+        text = "{\\i1}It\u2019s<b>\u00a0ok</b>\\Nreally"
+        assert self.cleaner.clean_text(text) == "it\u2019s ok really"
+
+    def test_matches_regex_chain(self):
+        def reference(text):
+            text = re.sub(r"<[^>]+>", "", text)
+            text = re.sub(r"\{[^}]*\}", "", text)
+            text = text.replace("\\N", " ").replace("\\n", " ")
+            return re.sub(r"\s+", " ", text.lower()).strip()
+
+        rng = random.Random(3)
+        alphabet = ["<", ">", "{", "}", "\\", "N", "n", "i", " ", "\n", "\u00a0", "\u2019", "\u200b", "A"]
+        texts = ["".join(rng.choice(alphabet) for _ in range(rng.randrange(1, 12))) for _ in range(5000)]
+        texts += ["\\<i>N", "{a<b}c>", "<i>Hi</i>\\n{\\an8}There"]
+        assert self.cleaner.clean_many(texts) == [reference(text) for text in texts]
+
+    def test_clean_many_uses_cache(self):
+        texts = ["Yes.", "<i>What?</i>", "Yes.", None, "Yes."]
+
+        cleaned = self.cleaner.clean_many(texts)
+
+        assert cleaned == ["yes.", "what?", "yes.", "", "yes."]
+        info = self.cleaner.cache_info()
+        assert (info["hits"], info["misses"], info["size"]) == (2, 2, 2)
+        assert info["hit_rate"] == 0.5
+
+    def test_cache_is_bounded(self):
+        cleaner = TextCleaner(cache_size=2)
+        cleaner.clean_many(["a", "b", "c"])
+        assert cleaner.cache_info()["size"] == 2
+
 
 class TestSubtitleProcessor:
     """Test cases for subtitle processing"""
@@ -84,7 +132,111 @@ This is a test.
             assert cues[1].end_time == Decimal('6.0')
         finally:
             os.unlink(file_path)
-    
+
+    def test_stream_matches_parse(self):
+        file_path = Path(__file__).parent.parent / "test_en.srt"
+
+        parsed = self.processor.parse_subtitle_file(file_path)
+        streamed = list(self.processor.stream_subtitle_file(file_path))
+
+        assert len(streamed) == len(parsed)
+        for full, compact in zip(parsed, streamed):
+            assert compact.start_time == full.start_time
+            assert compact.end_time == full.end_time
+            assert compact.text == full.text
+            assert compact.text_normalized == full.text_normalized
+
+    def test_stream_strips_markup_like_parse(self):
+        srt_content = """1
+00:00:01,000 --> 00:00:02,000
+<i>Hello</i> {\\an8}there
+
+2
+00:00:03,000 --> 00:00:04,000
+<font color="#ff0000">Red</font> <b>bold</b>
+<u>second</u> line
+
+3
+00:00:05,000 --> 00:00:06,000
+{\\i1}Only tags{\\i0}\\Nnext\\hword
+
+4
+00:00:07,000 --> 00:00:08,000
+<i></i>
+
+5
+00:00:09,000 --> 00:00:10,000
+Plain line
+"""
+        file_path = self.create_test_srt_file(srt_content)
+        try:
+            parsed = self.processor.parse_subtitle_file(file_path)
+            streamed = list(self.processor.stream_subtitle_file(file_path))
+
+            assert [c.text for c in streamed] == [c.text for c in parsed]
+            assert [c.text_normalized for c in streamed] == [c.text_normalized for c in parsed]
+            assert [c.start_ms for c in streamed] == [1000, 3000, 5000, 9000]
+            assert streamed[0].text == "Hello there"
+        finally:
+            os.unlink(file_path)
+
+    def test_stream_concatenated_srt(self):
+        # Second file glued on without a blank line, index restarting at 1
+        srt_content = """1
+00:00:01,000 --> 00:00:03,000
+Hello, world!
+1
+01:00:04,500 --> 01:00:06,000
+Second file
+"""
+
+        file_path = self.create_test_srt_file(srt_content)
+        try:
+            cues = list(iter_subtitle_file(file_path))
+
+            assert [c.text for c in cues] == ["Hello, world!", "Second file"]
+            assert cues[1].start_ms == 3_604_500
+            assert cues[1].end_ms == 3_606_000
+            assert cues[1].index == 2
+        finally:
+            os.unlink(file_path)
+
+    def test_stream_vtt_and_ass(self):
+        vtt = "WEBVTT\n\nintro\n00:01.000 --> 00:03.250 align:start\n<i>Hallo</i>\n\nNOTE ignored\n\n00:00:04.000 --> 00:00:06.000\nWelt\n"
+        ass = (
+            "[Script Info]\nTitle: test\n\n[Events]\n"
+            "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n"
+            "Dialogue: 0,0:00:01.00,0:00:03.25,Default,,0,0,0,,{\\an8}Hello, there\\Nfriend\n"
+        )
+        paths = []
+        try:
+            for suffix, content in ((".vtt", vtt), (".ass", ass)):
+                fd, path = tempfile.mkstemp(suffix=suffix)
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(content)
+                paths.append(path)
+
+            vtt_cues = list(iter_subtitle_file(paths[0]))
+            ass_cues = list(iter_subtitle_file(paths[1], cleaner=TextCleaner()))
+
+            assert [(c.start_ms, c.end_ms) for c in vtt_cues] == [(1000, 3250), (4000, 6000)]
+            assert vtt_cues[0].text == "Hallo"
+            assert ass_cues[0].text == "Hello, there\nfriend"
+            assert ass_cues[0].text_normalized == "hello, there friend"
+            assert ass_cues[0].end_time == Decimal("3.25")
+        finally:
+            for path in paths:
+                os.unlink(path)
+
+    def test_cue_blocks(self):
+        cues = [CompactCue(i * 1000, i * 1000 + 500, f"cue {i}", index=i) for i in range(5)]
+
+        blocks = list(iter_cue_blocks(iter(cues), block_size=2))
+
+        assert [len(b) for b in blocks] == [2, 2, 1]
+        assert list(blocks[1].starts) == [2000, 3000]
+        assert list(blocks[2]) == cues[4:]
+
     def test_align_perfect_match(self):
         en_cues = [
             SubtitleCue(Decimal('1.0'), Decimal('3.0'), "Hello", "hello", 1),
@@ -103,6 +255,405 @@ This is a test.
         assert aligned[1][2] > 0.7
 
 
+class TestMonotonicAligner:
+    """Test cases for the sweep + banded DP alignment engine"""
+
+    def setup_method(self):
+        self.processor = SubtitleProcessor()
+
+    def test_split_line_merged(self):
+        en_cues = [
+            SubtitleCue(Decimal('1.0'), Decimal('5.0'), "I never said she stole my money", "i never said she stole my money", 1),
+            SubtitleCue(Decimal('6.0'), Decimal('8.0'), "Goodbye", "goodbye", 2)
+        ]
+        de_cues = [
+            SubtitleCue(Decimal('1.0'), Decimal('3.0'), "Ich habe nie gesagt,", "ich habe nie gesagt,", 1),
+            SubtitleCue(Decimal('3.0'), Decimal('5.0'), "dass sie mein Geld stahl", "dass sie mein geld stahl", 2),
+            SubtitleCue(Decimal('6.0'), Decimal('8.0'), "Tschüss", "tschüss", 3)
+        ]
+
+        aligned = self.processor.align_subtitles(en_cues, de_cues)
+
+        assert [(en.index, de.index) for en, de, _ in aligned] == [(1, 1), (1, 2), (2, 3)]
+        assert aligned[0][2] == aligned[1][2] > 0.9
+
+    def test_unmatched_cues_skipped(self):
+        en_cues = [
+            SubtitleCue(Decimal('1.0'), Decimal('3.0'), "Hello", "hello", 1),
+            SubtitleCue(Decimal('50.0'), Decimal('52.0'), "Nobody", "nobody", 2),
+            SubtitleCue(Decimal('100.0'), Decimal('102.0'), "Bye", "bye", 3)
+        ]
+        de_cues = [
+            SubtitleCue(Decimal('1.0'), Decimal('3.0'), "Hallo", "hallo", 1),
+            SubtitleCue(Decimal('100.0'), Decimal('102.0'), "Tschüss", "tschüss", 2)
+        ]
+
+        aligned = self.processor.align_subtitles(en_cues, de_cues)
+
+        assert [(en.index, de.index) for en, de, _ in aligned] == [(1, 1), (3, 2)]
+
+    def test_feature_length_alignment(self):
+        count = 2000
+        en_cues = [CompactCue(i * 3000, i * 3000 + 2500, f"line {i}", f"line {i}", i) for i in range(count)]
+        de_cues = [CompactCue(i * 3000 + 120, i * 3000 + 2600, f"zeile {i}", f"zeile {i}", i) for i in range(count)]
+
+        aligned = self.processor.align_subtitles(en_cues, de_cues)
+
+        assert len(aligned) == count
+        assert all(en.index == de.index for en, de, _ in aligned)
+        assert SubtitleValidator().validate_alignment(aligned)['quality'] == 'excellent'
+
+
+class TestRetiming:
+    """Test cases for offset and framerate-drift estimation before alignment"""
+
+    def setup_method(self):
+        self.processor = SubtitleProcessor()
+
+    def write_film(self, directory, **drift):
+        en_text, de_text = film_tracks(7, 400, **drift)
+        en_path, de_path = Path(directory) / "film.en.srt", Path(directory) / "film.de.srt"
+        en_path.write_text(en_text, encoding="utf-8")
+        de_path.write_text(de_text, encoding="utf-8")
+        return en_path, de_path
+
+    @pytest.mark.parametrize("scale, offset_ms", [(1.0, 2500), (1.0, -9000), (25 / 23.976, 1500), (24 / 25, 0)])
+    def test_estimates_offset_and_drift(self, scale, offset_ms):
+        rng = np.random.default_rng(3)
+        en = np.cumsum(rng.uniform(800, 6000, 800)).astype(int)
+        kept = en[rng.random(len(en)) > 0.1]
+        # DE timed for another release: its times map onto EN as de * scale + offset_ms
+        de = np.concatenate([(kept - offset_ms) / scale, rng.uniform(0, en[-1] / scale, 50)])
+        de = np.rint(de + rng.normal(0, 120, len(de))).astype(int)
+
+        retiming = estimate_retiming(en, de[de > 0])
+
+        assert retiming.applied
+        assert abs(retiming.scale - scale) < 1e-4
+        assert abs(retiming.offset_ms - offset_ms) < 60
+        assert retiming.confidence > 0.8
+
+    def test_synced_tracks_left_alone(self, tmp_path):
+        en_path, de_path = self.write_film(tmp_path)
+        en_cues = list(self.processor.stream_subtitle_file(en_path))
+        de_cues = list(self.processor.stream_subtitle_file(de_path))
+
+        retimed, retiming = self.processor.retime(en_cues, de_cues)
+
+        assert not retiming.applied and retimed == de_cues
+        assert abs(retiming.offset_ms) < MIN_CORRECTION_MS
+        assert estimate_retiming([0, 1000], [0, 1000]) == Retiming()
+        assert SubtitleProcessor(retime=False).retime(en_cues, de_cues) == (de_cues, None)
+
+    def test_retiming_restores_alignment(self, tmp_path):
+        en_path, de_path = self.write_film(tmp_path, de_scale=23.976 / 25, de_offset_ms=-1200)
+        en_cues = self.processor.parse_subtitle_file(en_path)
+        de_cues = self.processor.parse_subtitle_file(de_path)
+        validator = SubtitleValidator()
+
+        drifted = validator.validate_alignment(self.processor.align_subtitles(en_cues, de_cues))
+        retimed, retiming = self.processor.retime(en_cues, de_cues)
+        report = validator.validate_alignment(self.processor.align_subtitles(en_cues, retimed), retiming)
+
+        assert isinstance(retimed[0], SubtitleCue)
+        assert report["average_score"] > drifted["average_score"] + 0.2
+        assert report["quality"] == "excellent"
+        assert report["retiming"]["applied"] and abs(report["retiming"]["scale"] - 25 / 23.976) < 1e-4
+
+    def test_ingest_stores_retimed_track(self, tmp_path):
+        en_path, de_path = self.write_film(tmp_path, de_offset_ms=4000)
+        db = DatabaseManager(f"sqlite:///{tmp_path / 'retime.db'}")
+        db.create_tables()
+        try:
+            result = IngestionService(db).ingest_movie("Drifted", en_path, de_path)
+            assert result["alignment"]["retiming"]["applied"]
+            assert abs(result["alignment"]["retiming"]["offset_ms"] + 4000) < 60
+            assert result["alignment"]["quality"] == "excellent"
+            with db.get_session() as session:
+                first_de = session.query(Subtitle).filter_by(lang="de").order_by(Subtitle.start_ts).first()
+                first_en = session.query(Subtitle).filter_by(lang="en").order_by(Subtitle.start_ts).first()
+                # Stored on the EN timeline, not 4 s late
+                assert abs(first_de.start_ts - first_en.start_ts) < 1
+        finally:
+            db.engine.dispose()
+
+
+class TestBatchRealign:
+    """Test cases for catalog realignment"""
+
+    def test_spans_match_engine(self):
+        en = (["e1", "e2"], [1000, 6000], [5000, 8000], ["a" * 31, "b" * 7])
+        de = (["d1", "d2", "d3"], [1000, 3000, 6000], [3000, 5000, 8000], ["c" * 20, "d" * 10, "e" * 7])
+
+        aligned = align_tracks(en, de)
+
+        assert [(en_id, de_id) for en_id, de_id, _ in aligned] == [("e1", "d1"), ("e1", "d2"), ("e2", "d3")]
+        assert aligned[0][2] == aligned[1][2] > 0.9
+        assert aligned[2][2] == 1.0
+
+    def test_offset_tracks_match_align_subtitles(self):
+        # DE runs 1.5 s late, so every cue overlaps two in the other track
+        en_cues = [CompactCue(i * 3000, i * 3000 + 2500, f"line {i}", f"line {i}", i) for i in range(200)]
+        de_cues = [
+            CompactCue(i * 3000 + 1500, i * 3000 + 4000, f"zeile {i}", f"zeile {i}", i) for i in range(200)
+        ]
+        expected = SubtitleProcessor().align_subtitles(en_cues, de_cues)
+
+        def spans(cues):
+            return (
+                [cue.index for cue in cues],
+                [cue.start_ms for cue in cues],
+                [cue.end_ms for cue in cues],
+                [cue.text_normalized for cue in cues],
+            )
+
+        aligned = align_tracks(spans(en_cues), spans(de_cues))
+
+        assert [(i, j, score) for i, j, score in aligned] == [
+            (en.index, de.index, score) for en, de, score in expected
+        ]
+        assert max(score for _, _, score in aligned) < 0.6
+
+    def test_realign_catalog(self):
+        fd, db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        try:
+            db = DatabaseManager(f"sqlite:///{db_path}")
+            db.create_tables()
+            service = IngestionService(db)
+            data_dir = Path(__file__).parent.parent
+            for title in ("Elysium", "Elysium 2"):
+                service.ingest_movie(title, data_dir / "test_en.srt", data_dir / "test_de.srt")
+
+            with db.get_session() as session:
+                pairs = {pair.id: (pair.en_id, pair.de_id) for pair in session.query(SubtitlePair)}
+                scene_ids = {scene.id for scene in session.query(Scene)}
+                # A score from an older aligner, which realignment corrects in place
+                stale_id = next(iter(pairs))
+                session.query(SubtitlePair).filter_by(id=stale_id).update({"alignment_score": 0.1})
+
+            summary = realign_catalog(db, workers=2, batch_size=3)
+
+            assert summary["pairs"] == 8 and summary["workers"] == 2
+            assert summary["changes"] == {"kept": 7, "rescored": 1, "inserted": 0, "deleted": 0}
+            with db.get_session() as session:
+                # Pair ids, and the scene ids derived from them, survive a realignment
+                assert {pair.id: (pair.en_id, pair.de_id) for pair in session.query(SubtitlePair)} == pairs
+                assert {scene.id for scene in session.query(Scene)} == scene_ids
+                assert session.get(SubtitlePair, stale_id).alignment_score > Decimal("0.1")
+        finally:
+            os.unlink(db_path)
+
+
+class TestBulkIngestion:
+    """Test cases for the staging-table bulk loader (SQLite stand-in)"""
+
+    def setup_method(self):
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.db = DatabaseManager(f"sqlite:///{self.db_path}")
+        self.db.create_tables()
+        self.data_dir = Path(__file__).parent.parent
+
+    def teardown_method(self):
+        self.db.engine.dispose()
+        os.unlink(self.db_path)
+
+    def test_ingest_movies_resolves_pairs(self):
+        fd, empty = tempfile.mkstemp(suffix='.srt')
+        os.close(fd)
+        try:
+            results = IngestionService(self.db).ingest_movies(
+                [
+                    MovieFiles("Elysium", self.data_dir / "test_en.srt", self.data_dir / "test_de.srt", 2013),
+                    MovieFiles("Broken", empty, self.data_dir / "test_de.srt"),
+                    MovieFiles("Missing", self.data_dir / "missing_en.srt", self.data_dir / "test_de.srt"),
+                    MovieFiles("Notes", self.data_dir / "test_en.srt", self.data_dir / "requirements.txt"),
+                ],
+                defer_indexes=True,
+            )
+        finally:
+            os.unlink(empty)
+
+        assert results[0]["pairs"] == 4
+        assert "No subtitle cues found" in results[1]["error"]
+        # Unreadable files and unsupported formats skip the movie, not the batch
+        assert [result["title"] for result in results[2:]] == ["Missing", "Notes"]
+        assert "error" in results[2]
+        assert "Unsupported subtitle format" in results[3]["error"]
+
+        with self.db.get_session() as session:
+            assert session.query(Movie).count() == 1
+            assert session.query(Subtitle).count() == 8
+            pairs = session.query(SubtitlePair).all()
+            assert len(pairs) == 4
+            for pair in pairs:
+                assert pair.en_subtitle.lang == "en"
+                assert pair.de_subtitle.lang == "de"
+                assert pair.en_subtitle.start_ts == pair.de_subtitle.start_ts
+
+        index_names = {
+            row[0] for row in self.db.engine.connect().exec_driver_sql(
+                "SELECT name FROM sqlite_master WHERE type = 'index'"
+            )
+        }
+        assert {"idx_subtitles_movie_lang", "idx_subtitle_pairs_movie"} <= index_names
+
+    def test_vocabulary_extracted(self):
+        service = IngestionService(self.db)
+        first = service.ingest_movie("Elysium", self.data_dir / "test_en.srt", self.data_dir / "test_de.srt")
+        service.ingest_movie("Elysium 2", self.data_dir / "test_en.srt", self.data_dir / "test_de.srt")
+
+        with self.db.get_session() as session:
+            en_words = session.query(Vocab).filter(Vocab.lang == "en").count()
+            assert en_words == len(set(tokenize(
+                "in the year the very wealthy live on a man-made space station "
+                "while the rest of the population resides on a ruined earth"
+            )))
+            assert session.query(MovieVocab).filter(MovieVocab.lang == "en").count() == 2 * en_words
+
+            frequencies = load_frequencies(session, uuid.UUID(first["movie_id"]), "en")
+            assert frequencies.top(2) == ["the", "a"]
+            assert list(frequencies.frequencies[:2]) == [4, 2]
+            assert 0 < frequencies.coverage(2) < 1
+
+    def test_tokenize(self):
+        assert tokenize("don't stop, it's 2154 -- man-made") == ["don't", "stop", "it's", "man", "made"]
+
+    def test_word_index(self):
+        with tempfile.TemporaryDirectory() as index_dir:
+            stage = WordIndexStage(index_dir)
+            service = IngestionService(self.db, stages=[VocabularyStage(), stage])
+            first = service.ingest_movie("Elysium", self.data_dir / "test_en.srt", self.data_dir / "test_de.srt")
+            second = service.ingest_movie("Elysium 2", self.data_dir / "test_en.srt", self.data_dir / "test_de.srt")
+            first_id, second_id = uuid.UUID(first["movie_id"]), uuid.UUID(second["movie_id"])
+
+            index = WordIndex(index_dir)
+            with self.db.get_session() as session:
+                station_pair = session.query(SubtitlePair).join(
+                    Subtitle, Subtitle.id == SubtitlePair.en_id
+                ).filter(
+                    SubtitlePair.movie_id == first_id, Subtitle.text.like("%space station%")
+                ).one()
+
+            assert index.search(["Space", "station"], "en", movie_ids=[first_id]) == [station_pair.id]
+            assert len(index.search(["space", "earth"], "en")) == 0
+            assert len(index.search(["space", "earth"], "en", mode="or")) == 4
+            assert len(index.search(["the"], "en", limit=3)) == 3
+
+            with self.db.engine.begin() as conn:
+                service.delete_movies(conn, [second_id])
+            index.refresh()
+            assert len(index.search(["space", "earth"], "en", mode="or")) == 2
+
+            index.compact()
+            assert len(index._segments) == 1
+            assert index.search(["space"], "en") == [station_pair.id]
+            index.close()
+            stage.index.close()
+
+    def test_segment_scenes(self):
+        starts = np.array([0, 1000, 1500, 9000, 9500, 20000])
+        ends = np.array([900, 8000, 2000, 9400, 9900, 21000])
+        # The long second pair bridges the gap before 9000
+        assert segment_scenes(starts, ends, gap_ms=4000) == [(0, 5), (5, 6)]
+        assert segment_scenes(starts, ends, gap_ms=4000, max_pairs=2) == [(0, 1), (1, 3), (3, 5), (5, 6)]
+        assert segment_scenes(np.array([]), np.array([])) == []
+
+    def test_scene_bundles(self):
+        service = IngestionService(self.db, stages=[VocabularyStage(), SceneStage(gap_ms=300)])
+        result = service.ingest_movie("Elysium", self.data_dir / "test_en.srt", self.data_dir / "test_de.srt")
+        movie_id = uuid.UUID(result["movie_id"])
+
+        with self.db.get_session() as session:
+            scenes = session.query(Scene).filter(Scene.movie_id == movie_id).order_by(Scene.ordinal).all()
+            assert [scene.pair_count for scene in scenes] == [1, 1, 2]
+            lesson = json.loads(gzip.decompress(scenes[1].bundle))
+            assert lesson["lesson_id"] == str(scenes[1].id)
+            assert lesson["subtitle_pairs"][0]["english"].startswith("the very wealthy")
+            assert lesson["start_time"] == 4.0
+            en_words = [word["word"] for word in lesson["vocabulary"] if word["lang"] == "en"]
+            assert en_words[0] == "the"
+
+        realign_catalog(self.db, [movie_id], workers=1)
+        with self.db.get_session() as session:
+            pair_ids = {str(pair_id) for pair_id, in session.query(SubtitlePair.id)}
+            for scene in session.query(Scene).all():
+                lesson = json.loads(gzip.decompress(scene.bundle))
+                assert {pair["pair_id"] for pair in lesson["subtitle_pairs"]} <= pair_ids
+
+        with self.db.engine.begin() as conn:
+            service.delete_movies(conn, [movie_id])
+        with self.db.get_session() as session:
+            assert session.query(Scene).count() == 0
+
+    def test_copy_streams_csv(self):
+        copied = []
+
+        def copy_expert(sql, stream):
+            # psycopg2 pulls the COPY payload in fixed-size reads
+            copied.append((sql, b"".join(iter(lambda: stream.read(5), b""))))
+
+        conn = Mock()
+        conn.connection.cursor.return_value.copy_expert.side_effect = copy_expert
+        writer = PostgresCopyWriter(conn)
+        movie_id = uuid.uuid4()
+        cues = [CompactCue(1000, 2500, 'Say "hi"', 'say "hi"', 1), CompactCue(3000, 4000, "x,y", "x,y", 2)]
+
+        assert writer.copy_subtitles(movie_id, "en", iter(cues)) == 2
+
+        sql, data = copied[0]
+        assert sql.startswith("COPY stage_subtitles (id, movie_id, lang, cue_index,")
+        rows = data.decode().splitlines()
+        assert len(rows) == 2
+        assert rows[0].endswith(f',{movie_id},en,1,1.000,2.500,"Say ""hi""","say ""hi"""')
+        assert rows[1].endswith(f',{movie_id},en,2,3.000,4.000,"x,y","x,y"')
+
+
+class TestDirectoryIngestion:
+    """Test cases for upload-dir discovery and manifest skipping"""
+
+    def setup_method(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name) / "drop"
+        data_dir = Path(__file__).parent.parent
+        en = (data_dir / "test_en.srt").read_text(encoding="utf-8")
+        de = (data_dir / "test_de.srt").read_text(encoding="utf-8")
+        for rel in ("Elysium/en.srt", "Elysium/de.srt", "misc/Space_Station.en.srt",
+                    "misc/Space_Station.de.srt", "misc/Orphan.en.srt"):
+            path = self.root / rel
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(de if "de." in rel else en, encoding="utf-8")
+        self.db = DatabaseManager(f"sqlite:///{self.tmp.name}/test.db")
+        self.db.create_tables()
+
+    def teardown_method(self):
+        self.db.engine.dispose()
+        self.tmp.cleanup()
+
+    def test_discover_pairs(self):
+        pairs = discover_pairs(self.root)
+
+        assert sorted(movie.title for _, movie in pairs) == ["Elysium", "Space Station"]
+
+    def test_manifest_skips_unchanged(self):
+        service = IngestionService(self.db)
+
+        first = ingest_directory(service, self.root, workers=2)
+        second = ingest_directory(service, self.root, workers=2)
+        (self.root / "misc/Space_Station.de.srt").write_text(
+            "1\n00:00:01,000 --> 00:00:03,500\nIm Jahr 2154\n", encoding="utf-8"
+        )
+        third = ingest_directory(service, self.root, workers=1)
+
+        assert (first["ingested"], first["skipped"]) == (2, 0)
+        assert (second["ingested"], second["skipped"]) == (0, 2)
+        assert (third["ingested"], third["skipped"]) == (1, 1)
+        with self.db.get_session() as session:
+            assert session.query(Movie).count() == 2
+            assert session.query(Subtitle).count() == 13
+
+
 class TestSubtitleValidator:
     """Test cases for subtitle validation"""
     
@@ -0,0 +1,163 @@
+"""
+Tests for incremental track updates: cue diffing, re-alignment windows and stable pair ids
+"""
+
+import shutil
+import tempfile
+import uuid
+from pathlib import Path
+
+import pytest
+
+from benchmarks.corpus import film_tracks
+from cinefluent.database_models import DatabaseManager, MoviePack, Scene, Subtitle, SubtitlePair
+from cinefluent.ingestion_service import IngestionError, IngestionService, default_stages
+from cinefluent.offline_packs import decode_pack
+from cinefluent.subtitle_processor import CompactCue, SubtitleProcessor
+from cinefluent.track_update import StoredTrack, affected_windows, diff_track
+from cinefluent.word_index import WordIndex, WordIndexStage
+
+
+def stored(*cues):
+    return StoredTrack(
+        [uuid.uuid4() for _ in cues],
+        [
+            CompactCue(start, end, text, text.lower(), i)
+            for i, (start, end, text) in enumerate(cues)
+        ],
+    )
+
+
+def write_srt(path, cues):
+    def stamp(ms):
+        seconds, millis = divmod(ms, 1000)
+        return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d},{millis:03d}"
+
+    path.write_text(
+        "".join(
+            f"{n}\n{stamp(cue.start_ms)} --> {stamp(cue.end_ms)}\n{cue.text}\n\n"
+            for n, cue in enumerate(cues, 1)
+        ),
+        encoding="utf-8",
+    )
+
+
+def test_diff_keeps_ids_of_surviving_cues():
+    old = stored((0, 900, "Eins"), (1000, 1900, "Zwei"), (2000, 2900, "Drei"), (3000, 3900, "Vier"))
+    new = [
+        CompactCue(0, 902, "Eins"),           # within the timing tolerance
+        CompactCue(1000, 1900, "Zwei!"),      # text corrected
+        CompactCue(3400, 3900, "Vier"),       # retimed
+        CompactCue(4000, 4500, "Fünf"),       # new line; "Drei" is gone
+    ]
+    diff = diff_track(old, new)
+
+    assert diff.kept == 1
+    assert diff.track.ids[:3] == [old.ids[0], old.ids[1], old.ids[3]]
+    assert diff.track.cues[0].end_ms == 900  # unchanged lines keep their stored times
+    assert diff.updated == [1, 2] and diff.inserted == [3] and diff.deleted == [old.ids[2]]
+    assert [cue.index for cue in diff.track.cues] == [0, 1, 2, 3]
+    assert (2000, 2900) in diff.spans and (3000, 3900) in diff.spans
+    assert not diff_track(old, [CompactCue(c.start_ms, c.end_ms, c.text) for c in old.cues]).changed
+
+
+def test_windows_close_over_overlapping_extents():
+    extents = [(0, 100), (90, 200), (300, 400), (1000, 1100), (1050, 1300)]
+    assert affected_windows([(150, 160)], extents) == [(0, 200)]
+    assert affected_windows([(150, 160), (1200, 1210)], extents) == [(0, 200), (1000, 1300)]
+    # Touching is not overlapping
+    assert affected_windows([(200, 300)], extents) == [(200, 300)]
+    assert affected_windows([], extents) == []
+
+
+class TestUpdateTrack:
+    def setup_method(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        en_text, de_text = film_tracks(11, 300, de_scale=23.976 / 25, de_offset_ms=900)
+        (self.tmp / "film.en.srt").write_text(en_text, encoding="utf-8")
+        (self.tmp / "film.de.srt").write_text(de_text, encoding="utf-8")
+        self.db = DatabaseManager(f"sqlite:///{self.tmp / 'update.db'}")
+        self.db.create_tables()
+        self.index_dir = self.tmp / "index"
+        stages = default_stages() + [WordIndexStage(self.index_dir)]
+        self.service = IngestionService(self.db, stages=stages)
+        result = self.service.ingest_movie(
+            "Drift", self.tmp / "film.en.srt", self.tmp / "film.de.srt"
+        )
+        self.movie_id = uuid.UUID(result["movie_id"])
+
+    def teardown_method(self):
+        self.db.engine.dispose()
+        for stage in self.service.stages:
+            if isinstance(stage, WordIndexStage):
+                stage.index.close()
+        shutil.rmtree(self.tmp)
+
+    def pair_ids(self):
+        with self.db.get_session() as session:
+            pairs = session.query(SubtitlePair).filter_by(movie_id=self.movie_id)
+            return {pair.id for pair in pairs}
+
+    def scene_etags(self):
+        with self.db.get_session() as session:
+            return {scene.id: scene.etag for scene in session.query(Scene).filter_by(movie_id=self.movie_id)}
+
+    def test_corrected_file_rewrites_only_what_changed(self):
+        before = self.pair_ids()
+        scenes_before = self.scene_etags()
+        # The corrected file is timed like the original one, not like the stored track
+        cues = list(SubtitleProcessor().stream_subtitle_file(self.tmp / "film.de.srt"))
+        cues[40] = CompactCue(cues[40].start_ms, cues[40].end_ms, "Raumschiff korrigiert")
+        del cues[120]
+        cues[200].end_ms += 800
+        write_srt(self.tmp / "fixed.de.srt", cues)
+
+        result = self.service.update_track(self.movie_id, "de", self.tmp / "fixed.de.srt")
+
+        assert result["cues"] == {"kept": len(cues) - 2, "updated": 2, "inserted": 0, "deleted": 1}
+        assert result["alignment"]["retiming"]["applied"]
+        assert result["realigned_cues"] < 40
+        after = self.pair_ids()
+        assert len(before - after) == result["pairs"]["deleted"] <= 2
+        assert len(after - before) == result["pairs"]["inserted"] <= 2
+        assert len(before & after) >= len(before) - 2
+
+        with self.db.get_session() as session:
+            corrected = session.query(Subtitle).filter_by(text="Raumschiff korrigiert").one()
+            assert session.query(SubtitlePair).filter_by(de_id=corrected.id).count() == 1
+            packs = {
+                (row.version, row.base_version): decode_pack(row.body)
+                for row in session.query(MoviePack).filter_by(movie_id=self.movie_id)
+            }
+        assert sorted(packs) == [(1, 0), (2, 0), (2, 1)]
+
+        # Lessons keep their ids; only scenes around the edits, or whose words moved in
+        # the movie's frequency ranking, get new bundles
+        scenes_after = self.scene_etags()
+        assert scenes_after and len(scenes_before.keys() & scenes_after.keys()) >= len(scenes_before) - 1
+        rewritten = [sid for sid, etag in scenes_after.items() if scenes_before.get(sid) != etag]
+        assert 0 < len(rewritten) < len(scenes_after) // 2
+        assert 0 < len(packs[2, 1].pairs) < 6
+
+        index = WordIndex(self.index_dir)
+        assert len(index.search(["korrigiert"], "de")) == 1
+        # The movie's first segment is tombstoned, so no pair is found twice
+        hits = index.search([cues[0].text.split()[0].strip("-").lower()], "de")
+        assert hits and len(hits) == len(set(hits)) and set(hits) <= after
+        index.close()
+
+        # Uploading the same file again changes nothing
+        again = self.service.update_track(self.movie_id, "de", self.tmp / "fixed.de.srt")
+        assert again["cues"]["kept"] == len(cues) and again["pairs"]["kept"] == len(after)
+        assert self.pair_ids() == after
+        assert self.scene_etags() == scenes_after
+
+    def test_rejects_unknown_movies_and_languages(self):
+        with pytest.raises(IngestionError):
+            self.service.update_track(uuid.uuid4(), "en", self.tmp / "film.en.srt")
+        with pytest.raises(ValueError):
+            self.service.update_track(self.movie_id, "fr", self.tmp / "film.en.srt")
+        empty = self.tmp / "empty.srt"
+        empty.write_text("", encoding="utf-8")
+        with pytest.raises(IngestionError):
+            self.service.update_track(self.movie_id, "en", empty)